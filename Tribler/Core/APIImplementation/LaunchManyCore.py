@@ -9,11 +9,12 @@ import os
 import sys
 import time as timemod
 from glob import iglob
+from itertools import islice
 from threading import Event, enumerate as enumerate_threads
 from traceback import print_exc
 
 from twisted.internet import reactor
-from twisted.internet.defer import Deferred, inlineCallbacks, DeferredList
+from twisted.internet.defer import Deferred, inlineCallbacks, DeferredList, succeed
 from twisted.internet.task import LoopingCall
 from twisted.internet.threads import deferToThread
 from twisted.python.threadable import isInIOThread
@@ -41,6 +42,12 @@ from Tribler.community.tunnel.tunnel_community import TunnelSettings
 from Tribler.dispersy.taskmanager import TaskManager
 from Tribler.dispersy.util import blockingCallFromThread, blocking_call_on_reactor_thread
 
+# Number of checkpointed downloads that are resumed per reactor iteration at startup
+RESUME_PAGE_SIZE = 20
+
+# Maximum number of seconds to wait at shutdown for the resume data of the stopped downloads
+SHUTDOWN_RESUME_DATA_TIMEOUT = 5
+
 
 class TriblerLaunchMany(TaskManager):
 
@@ -54,6 +61,8 @@ class TriblerLaunchMany(TaskManager):
         self.state_cb_count = 0
         self.previous_active_downloads = []
         self.download_states_lc = None
+        # The number of downloads and the duration of the last invocation of the download states callback
+        self.download_states_stats = {'num_downloads': 0, 'duration': 0.0}
         self.get_peer_list = []
 
         self._logger = logging.getLogger(self.__class__.__name__)
@@ -70,6 +79,9 @@ class TriblerLaunchMany(TaskManager):
         # modules
         self.torrent_store = None
         self.metadata_store = None
+        self.resume_store = None
+        # The number of checkpoints of all downloads that are in progress, which flush the resume store when they finish
+        self.checkpoints_in_progress = 0
         self.rtorrent_handler = None
         self.tftp_handler = None
         self.api_manager = None
@@ -112,8 +124,10 @@ class TriblerLaunchMany(TaskManager):
             if sys.platform == 'darwin':
                 os.environ['SSL_CERT_FILE'] = os.path.join(get_lib_path(), 'root_certs_mac.pem')
 
+            from Tribler.Core.leveldbstore import LevelDbStore
+            self.resume_store = LevelDbStore(self.session.get_resume_store_dir())
+
             if self.session.config.get_torrent_store_enabled():
-                from Tribler.Core.leveldbstore import LevelDbStore
                 self.torrent_store = LevelDbStore(self.session.config.get_torrent_store_dir())
 
             if self.session.config.get_metadata_enabled():
@@ -337,7 +351,7 @@ class TriblerLaunchMany(TaskManager):
 
         if self.session.config.get_libtorrent_enabled():
             from Tribler.Core.Libtorrent.LibtorrentMgr import LibtorrentMgr
-            self.ltmgr = LibtorrentMgr(self.session)
+            self.ltmgr = LibtorrentMgr(self.session, torrent_store=self.torrent_store)
             self.ltmgr.initialize()
             for port, protocol in self.upnp_ports:
                 self.ltmgr.add_upnp_mapping(port, protocol)
@@ -553,15 +567,21 @@ class TriblerLaunchMany(TaskManager):
 
     def _invoke_states_cb(self, callback):
         """
-        Invoke the download states callback with a list of the download states.
+        Invoke the download states callback with a list of the download states. The states are taken from the
+        cache of the LibtorrentMgr, which only rebuilds the states of the downloads whose status changed.
         """
+        start_time = timemod.time()
         dslist = []
         for d in self.downloads.values():
             d.set_moreinfo_stats(True in self.get_peer_list or d.get_def().get_infohash() in
                                  self.get_peer_list)
-            ds = d.network_get_state(None, False)
+            ds = self.ltmgr.get_download_state(d) if self.ltmgr else d.network_get_state(None, False)
             dslist.append(ds)
 
+        duration = timemod.time() - start_time
+        self.download_states_stats = {'num_downloads': len(dslist), 'duration': duration}
+        self._logger.debug("Collected the states of %d downloads in %.3f seconds", len(dslist), duration)
+
         def on_cb_done(new_get_peer_list):
             self.get_peer_list = new_get_peer_list
 
@@ -629,32 +649,68 @@ class TriblerLaunchMany(TaskManager):
 
         def do_load_checkpoint():
             with self.session_lock:
-                for i, filename in enumerate(iglob(os.path.join(self.session.get_downloads_pstate_dir(), '*.state'))):
-                    self.resume_download(filename, setupDelay=i * 0.1)
+                self.migrate_download_pstates()
+                infohashes = [binascii.unhexlify(hexinfohash) for hexinfohash in set(self.resume_store)]
+            self.resume_downloads(iter(infohashes))
 
         if self.initComplete:
             do_load_checkpoint()
         else:
             self.register_task("load_checkpoint", reactor.callLater(1, do_load_checkpoint))
 
+    def migrate_download_pstates(self):
+        """
+        Move the downloads that were checkpointed to a .state file each into the resume store, in a single write.
+        Called with the session_lock held.
+        """
+        filenames = list(iglob(os.path.join(self.session.get_downloads_pstate_dir(), '*.state')))
+        if not filenames:
+            return
+
+        migrated = []
+        for filename in filenames:
+            hexinfohash = os.path.basename(filename)[:-6]
+            try:
+                binascii.unhexlify(hexinfohash)
+                if hexinfohash not in self.resume_store:
+                    with open(filename, 'rb') as pstate_file:
+                        self.resume_store[hexinfohash] = pstate_file.read()
+                migrated.append(filename)
+            except (TypeError, IOError):
+                self._logger.exception("tlm: could not migrate checkpoint %s", filename)
+        self.resume_store.flush()
+
+        for filename in migrated:
+            os.remove(filename)
+        self._logger.info("tlm: migrated %d checkpoints to the resume store", len(migrated))
+
+    def resume_downloads(self, infohashes):
+        """
+        Resume the checkpointed downloads a page at a time, so the reactor stays responsive while they are added.
+        :param infohashes: an iterator over the infohashes of the downloads that are not resumed yet
+        """
+        with self.session_lock:
+            page = list(islice(infohashes, RESUME_PAGE_SIZE))
+            for infohash in page:
+                self.resume_download(infohash)
+
+        if len(page) == RESUME_PAGE_SIZE:
+            self.register_task("resume_downloads", reactor.callLater(0, self.resume_downloads, infohashes))
+
     def load_download_pstate_noexc(self, infohash):
         """ Called by any thread, assume session_lock already held """
         try:
-            basename = binascii.hexlify(infohash) + '.state'
-            filename = os.path.join(self.session.get_downloads_pstate_dir(), basename)
-            if os.path.exists(filename):
-                return self.load_download_pstate(filename)
-            else:
-                self._logger.info("%s not found", basename)
-
+            return self.load_download_pstate(infohash)
+        except KeyError:
+            self._logger.info("%s not found", binascii.hexlify(infohash))
         except Exception:
             self._logger.exception("Exception while loading pstate: %s", infohash)
 
-    def resume_download(self, filename, setupDelay=0):
+    def resume_download(self, infohash, setupDelay=0):
         tdef = dscfg = pstate = None
 
         try:
-            pstate = self.load_download_pstate(filename)
+            pstate = self.load_download_pstate(infohash)
 
             # SWIFTPROC
             metainfo = pstate.get('state', 'metainfo')
@@ -671,10 +727,6 @@ class TriblerLaunchMany(TaskManager):
 
         except:
             # pstate is invalid or non-existing
-            _, file = os.path.split(filename)
-
-            infohash = binascii.unhexlify(file[:-6])
-
             torrent_data = self.torrent_store.get(infohash)
             if torrent_data:
                 try:
@@ -705,10 +757,11 @@ class TriblerLaunchMany(TaskManager):
                 except Exception as e:
                     self._logger.exception("tlm: load check_point: exception while adding download %s", tdef)
             else:
-                self._logger.info("tlm: removing checkpoint %s destdir is %s", filename, dscfg.get_dest_dir())
-                os.remove(filename)
+                self._logger.info("tlm: removing checkpoint %s destdir is %s",
+                                  binascii.hexlify(infohash), dscfg.get_dest_dir())
+                self.resume_store.pop(binascii.hexlify(infohash), None)
         else:
-            self._logger.info("tlm: could not resume checkpoint %s %s %s", filename, tdef, dscfg)
+            self._logger.info("tlm: could not resume checkpoint %s %s %s", binascii.hexlify(infohash), tdef, dscfg)
 
     def checkpoint_downloads(self):
         """
@@ -720,31 +773,54 @@ class TriblerLaunchMany(TaskManager):
         downloads = self.downloads.values()
         deferred_list = []
         self._logger.debug("tlm: checkpointing %s downloads", len(downloads))
+        self.checkpoints_in_progress += 1
         for download in downloads:
             deferred_list.append(download.checkpoint())
 
-        return DeferredList(deferred_list)
+        def on_checkpointed(result):
+            # Write the pstates of all downloads to disk in a single batch
+            self.checkpoints_in_progress -= 1
+            if self.resume_store is not None:
+                self.resume_store.flush()
+            return result
+
+        return DeferredList(deferred_list).addCallback(on_checkpointed)
 
     def shutdown_downloads(self):
         """
         Shutdown all downloads in Tribler.
+        :return: a Deferred that fires when the resume data of the stopped downloads has been saved, or after
+        SHUTDOWN_RESUME_DATA_TIMEOUT seconds
         """
-        for download in self.downloads.values():
+        downloads = self.downloads.values()
+        for download in downloads:
             download.stop()
 
+        # Stopping a running download requests its resume data, wait for it before the resume store is closed
+        pending = [download.save_resume_data() for download in downloads if download.deferreds_resume]
+        if not pending:
+            return succeed(None)
+
+        saved = Deferred()
+        timeout_call = reactor.callLater(SHUTDOWN_RESUME_DATA_TIMEOUT, saved.callback, None)
+
+        def on_saved(_):
+            if timeout_call.active():
+                timeout_call.cancel()
+                saved.callback(None)
+
+        DeferredList(pending, consumeErrors=True).addCallback(on_saved)
+        return saved
+
     def remove_pstate(self, infohash):
         def do_remove():
             if not self.download_exists(infohash):
-                dlpstatedir = self.session.get_downloads_pstate_dir()
-
                 # Remove checkpoint
                 hexinfohash = binascii.hexlify(infohash)
                 try:
-                    basename = hexinfohash + '.state'
-                    filename = os.path.join(dlpstatedir, basename)
-                    self._logger.debug("remove pstate: removing dlcheckpoint entry %s", filename)
-                    if os.access(filename, os.F_OK):
-                        os.remove(filename)
+                    self._logger.debug("remove pstate: removing dlcheckpoint entry %s", hexinfohash)
+                    if self.resume_store is not None:
+                        self.resume_store.pop(hexinfohash, None)
                 except:
                     # Show must go on
                     self._logger.exception("Could not remove state")
@@ -847,6 +923,8 @@ class TriblerLaunchMany(TaskManager):
         self.mainline_dht = None
 
         if self.torrent_store is not None:
+            if self.ltmgr is not None:
+                self.ltmgr.metainfo_cache.store = None
             yield self.torrent_store.close()
         self.torrent_store = None
 
@@ -877,16 +955,29 @@ class TriblerLaunchMany(TaskManager):
             self.ltmgr.shutdown()
             self.ltmgr = None
 
-    def save_download_pstate(self, infohash, pstate):
-        """ Called by network thread """
+        # Close the resume store after the downloads have been checkpointed for the last time and their resume data
+        # has been saved when they were stopped
+        if self.resume_store is not None:
+            self.resume_store.close()
+            self.resume_store = None
 
-        self.downloads[infohash].pstate_for_restart = pstate
-
-        self.register_task("save_pstate %f" % timemod.clock(),
-                           self.downloads[infohash].save_resume_data())
-
-    def load_download_pstate(self, filename):
-        """ Called by any thread """
+    def save_download_pstate(self, infohash, pstate):
+        """
+        Write the pstate of a download to the resume store. While all downloads are checkpointed, the store buffers the
+        write until the checkpoint is done, otherwise it is written to disk right away.
+        """
+        if self.resume_store is None:
+            self._logger.warning("tlm: not saving pstate of %s, the resume store is closed", binascii.hexlify(infohash))
+            return
+        self.resume_store[binascii.hexlify(infohash)] = pstate.write_string()
+        if not self.checkpoints_in_progress:
+            self.resume_store.flush()
+
+    def load_download_pstate(self, infohash):
+        """
+        Called by any thread
+        :raises KeyError: if the download has not been checkpointed
+        """
         pstate = CallbackConfigParser()
-        pstate.read_file(filename)
+        pstate.read_string(self.resume_store[binascii.hexlify(infohash)])
         return pstate
@@ -5,6 +5,11 @@ Author(s): Jelle Roozenburg
 """
 import logging
 import threading
+from collections import defaultdict, deque
+from time import time
+
+from twisted.internet import reactor
+from twisted.python.threadable import isInIOThread
 
 from Tribler.Core.simpledefs import (NTFY_TORRENTS, NTFY_PLAYLISTS, NTFY_COMMENTS,
                                      NTFY_MODIFICATIONS, NTFY_MODERATIONS, NTFY_MARKINGS, NTFY_MYPREFERENCES,
@@ -20,6 +25,11 @@ from Tribler.Core.simpledefs import (NTFY_TORRENTS, NTFY_PLAYLISTS, NTFY_COMMENT
                                      NTFY_MARKET_IOM_INPUT_REQUIRED, NTFY_MARKET_ON_PAYMENT_RECEIVED,
                                      NTFY_MARKET_ON_PAYMENT_SENT)
 
+# Maximum number of calls to asynchronous observers queued by threads other than the reactor thread.
+DEFAULT_MAX_QUEUE_SIZE = 10000
+# Maximum time a notifying thread waits for room in a full queue before the event is dropped.
+DEFAULT_MAX_QUEUE_WAIT = 1.0
+
 
 class Notifier(object):
 
@@ -32,15 +42,29 @@ class Notifier(object):
                 NTFY_MARKET_ON_ASK_TIMEOUT, NTFY_MARKET_ON_BID_TIMEOUT, NTFY_MARKET_ON_TRANSACTION_COMPLETE,
                 NTFY_MARKET_ON_PAYMENT_RECEIVED, NTFY_MARKET_ON_PAYMENT_SENT, NTFY_MARKET_IOM_INPUT_REQUIRED]
 
-    def __init__(self):
+    def __init__(self, max_queue_size=DEFAULT_MAX_QUEUE_SIZE, max_queue_wait=DEFAULT_MAX_QUEUE_WAIT):
         self._logger = logging.getLogger(self.__class__.__name__)
 
+        self.max_queue_size = max_queue_size
+        self.max_queue_wait = max_queue_wait
+
         self.observers = []
+        # Observers indexed by (subject, changeType), so notify only visits the interested observers
+        self.subscriptions = defaultdict(list)
         self.observerscache = {}
         self.observertimers = {}
         self.observerLock = threading.Lock()
 
-    def add_observer(self, func, subject, changeTypes=[NTFY_UPDATE, NTFY_INSERT, NTFY_DELETE], id=None, cache=0):
+        # Calls made from threads other than the reactor thread are queued and dispatched on the reactor thread
+        self._queue = deque()
+        self._queue_condition = threading.Condition(self.observerLock)
+        self._drain_scheduled = False
+
+        self._stats = {"notifications": 0, "dispatched": 0, "dropped": 0, "coalesced": 0,
+                       "max_queue_depth": 0, "total_dispatch_latency": 0.0, "max_dispatch_latency": 0.0}
+
+    def add_observer(self, func, subject, changeTypes=[NTFY_UPDATE, NTFY_INSERT, NTFY_DELETE], id=None, cache=0,
+                     asynchronous=False):
         """
         Add observer function which will be called upon certain event
         Example:
@@ -49,79 +73,160 @@ class Notifier(object):
         addObserver(NTFY_TORRENTS, [NTFY_SEARCH_RESULT], 'a_search_id') -> get
                     callbacks when peer-searchresults of of search
                     with id=='a_search_id' come in
+        If cache is set, the events are coalesced and the observer is called with the list of events at most once
+        every cache seconds.
+        If asynchronous is set, the observer is always called on the reactor thread: events notified by other threads
+        are queued instead of calling the observer in the notifying thread.
         """
         assert isinstance(changeTypes, list)
         assert subject in self.SUBJECTS, 'Subject %s not in SUBJECTS' % subject
 
-        obs = (func, subject, changeTypes, id, cache)
-        self.observerLock.acquire()
-        self.observers.append(obs)
-        self.observerLock.release()
+        obs = (func, subject, changeTypes, id, cache, asynchronous)
+        with self.observerLock:
+            self.observers.append(obs)
+            for changeType in changeTypes:
+                self.subscriptions[(subject, changeType)].append(obs)
 
     def remove_observer(self, func):
         """ Remove all observers with function func
         """
         with self.observerLock:
-            i = 0
-            while i < len(self.observers):
-                ofunc = self.observers[i][0]
-                if ofunc == func:
-                    del self.observers[i]
+            self.observers = [obs for obs in self.observers if obs[0] != func]
+            for key, observers in self.subscriptions.items():
+                observers = [obs for obs in observers if obs[0] != func]
+                if observers:
+                    self.subscriptions[key] = observers
                 else:
-                    i += 1
+                    del self.subscriptions[key]
+
+            self.observerscache.pop(func, None)
+            timer = self.observertimers.pop(func, None)
+            if timer is not None and timer.active():
+                timer.cancel()
 
     def remove_observers(self):
         with self.observerLock:
             for timer in self.observertimers.values():
-                timer.cancel()
+                if timer.active():
+                    timer.cancel()
             self.observerscache = {}
             self.observertimers = {}
             self.observers = []
+            self.subscriptions = defaultdict(list)
+            self._queue.clear()
+            self._queue_condition.notify_all()
 
     def notify(self, subject, changeType, obj_id, *args):
         """
-        Notify all interested observers about an event with threads from the pool
+        Notify all interested observers about an event.
+        Observers are called directly in the notifying thread, except for asynchronous observers notified outside the
+        reactor thread. Their calls are queued in a bounded queue that is drained on the reactor thread, so a slow
+        observer does not stall the notifying thread. If the queue is full, the notifying thread waits at most
+        max_queue_wait seconds for it to drain before the event is dropped for them, which is counted and logged.
+        Observers with a cache get their events coalesced and delivered by a single reactor call.
         """
-        tasks = []
         assert subject in self.SUBJECTS, 'Subject %s not in SUBJECTS' % subject
 
         args = [subject, changeType, obj_id] + list(args)
+        in_io_thread = isInIOThread()
 
-        self.observerLock.acquire()
-        for ofunc, osubject, ochangeTypes, oid, cache in self.observers:
-            try:
-                if (subject == osubject and
-                    changeType in ochangeTypes and
-                        (oid is None or oid == obj_id)):
-
-                    if not cache:
+        tasks = []
+        queued_tasks = []
+        with self.observerLock:
+            self._stats["notifications"] += 1
+            for ofunc, _, _, oid, cache, asynchronous in self.subscriptions.get((subject, changeType), ()):
+                if oid is not None and oid != obj_id:
+                    continue
+
+                if not cache:
+                    if asynchronous and not in_io_thread:
+                        queued_tasks.append(ofunc)
+                    else:
                         tasks.append(ofunc)
+                elif ofunc in self.observerscache:
+                    self.observerscache[ofunc].append(args)
+                    self._stats["coalesced"] += 1
+                else:
+                    self.observerscache[ofunc] = [args]
+                    if in_io_thread:
+                        self._start_cache_timer(ofunc, cache)
                     else:
-                        if ofunc not in self.observerscache:
-                            def doQueue(ofunc):
-                                self.observerLock.acquire()
-                                if ofunc in self.observerscache:
-                                    events = self.observerscache[ofunc]
-                                    del self.observerscache[ofunc]
-                                    del self.observertimers[ofunc]
-                                else:
-                                    events = []
-                                self.observerLock.release()
-
-                                if events:
-                                    ofunc(events)
-
-                            t = threading.Timer(cache, doQueue, (ofunc,))
-                            t.setName("Notifier-timer-%s" % subject)
-                            t.start()
-
-                            self.observerscache[ofunc] = []
-                            self.observertimers[ofunc] = t
-
-                        self.observerscache[ofunc].append(args)
-            except:
-                self._logger.exception("OIDs were %s %s", repr(oid), repr(obj_id))
+                        reactor.callFromThread(self._start_cache_timer, ofunc, cache)
+
+            if queued_tasks:
+                self._enqueue(queued_tasks, args)
 
-        self.observerLock.release()
         for task in tasks:
             task(*args)  # call observer function in this thread
+
+    def _start_cache_timer(self, ofunc, cache):
+        with self.observerLock:
+            if ofunc in self.observerscache and ofunc not in self.observertimers:
+                self.observertimers[ofunc] = reactor.callLater(cache, self._flush_cache, ofunc)
+
+    def _flush_cache(self, ofunc):
+        with self.observerLock:
+            events = self.observerscache.pop(ofunc, [])
+            self.observertimers.pop(ofunc, None)
+
+        if events:
+            ofunc(events)
+
+    def _enqueue(self, tasks, args):
+        """
+        Queue the observer calls for an event. Should be called while holding the observerLock.
+        """
+        deadline = time() + self.max_queue_wait
+        while len(self._queue) >= self.max_queue_size:
+            remaining = deadline - time()
+            if remaining <= 0:
+                self._stats["dropped"] += len(tasks)
+                self._logger.warning("Notifier queue is full, dropping event %s %s for %d observers (%d dropped in "
+                                     "total)", args[0], args[1], len(tasks), self._stats["dropped"])
+                return
+            self._queue_condition.wait(remaining)
+
+        notify_time = time()
+        for task in tasks:
+            self._queue.append((task, args, notify_time))
+        self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], len(self._queue))
+
+        if not self._drain_scheduled:
+            self._drain_scheduled = True
+            reactor.callFromThread(self._drain_queue)
+
+    def _drain_queue(self):
+        """
+        Call the observers of all events that were queued before this drain started, on the reactor thread.
+        """
+        with self.observerLock:
+            self._drain_scheduled = False
+            calls = list(self._queue)
+            self._queue.clear()
+            self._queue_condition.notify_all()
+
+        for task, args, notify_time in calls:
+            latency = time() - notify_time
+            self._stats["dispatched"] += 1
+            self._stats["total_dispatch_latency"] += latency
+            self._stats["max_dispatch_latency"] = max(self._stats["max_dispatch_latency"], latency)
+            try:
+                task(*args)
+            except:
+                self._logger.exception("Observer %s failed on event %s %s", repr(task), args[0], args[1])
+
+    def get_stats(self):
+        """
+        Return statistics about the notifications: the number of events, the number of queued observer calls that
+        were dispatched or dropped, the number of events coalesced for cached observers, the queue depth and the
+        latency between notifying and calling an observer from the queue.
+        """
+        with self.observerLock:
+            stats = dict(self._stats)
+            stats["observers"] = len(self.observers)
+            stats["queue_depth"] = len(self._queue)
+            stats["cached_events"] = sum(len(events) for events in self.observerscache.itervalues())
+
+        total_latency = stats.pop("total_dispatch_latency")
+        stats["avg_dispatch_latency"] = total_latency / stats["dispatched"] if stats["dispatched"] else 0.0
+        return stats
@@ -3,9 +3,9 @@ SqlitecacheDBHanler.
 
 Author(s): Jie Yang
 """
+import base64
 import json
 import logging
-import math
 import os
 import threading
 from collections import OrderedDict, defaultdict
@@ -16,9 +16,13 @@ from pprint import pformat
 from struct import unpack_from
 from time import time
 from traceback import print_exc
+from twisted.internet.defer import DeferredLock, succeed
 from twisted.internet.task import LoopingCall
+from twisted.internet.threads import deferToThread
 
+from Tribler.Core.CacheDB.bm25 import BM25Scorer, top_k_indices
 from Tribler.Core.CacheDB.sqlitecachedb import bin2str, str2bin
+from Tribler.Core.CacheDB.term_index import TermIndex, rank_suggestions
 from Tribler.Core.TorrentDef import TorrentDef
 from Tribler.Core.Utilities.search_utils import split_into_keywords, filter_keywords
 from Tribler.Core.Utilities.tracker_utils import get_uniformed_tracker_url
@@ -34,6 +38,37 @@ VOTECAST_FLUSH_DB_INTERVAL = 15
 
 DEFAULT_ID_CACHE_SIZE = 1024 * 5
 
+# Number of torrents returned when searching on behalf of a remote peer, and number of rows fetched to select them from,
+# since duplicates and torrents in spam or deleted channels are only dropped after the query.
+REMOTE_SEARCH_NAMES_LIMIT = 25
+REMOTE_SEARCH_NAMES_FETCH_LIMIT = 250
+
+# Maximum number of values bound in a single IN (...) clause, SQLite allows at most 999 variables per statement
+MAX_SQL_VARIABLES = 500
+
+# Number of terms and torrent names considered when making search suggestions
+SUGGESTION_MAX_TERMS = 10
+SUGGESTION_MAX_CANDIDATES = 250
+
+
+def encode_search_continuation_token(num_seeders, relevance, torrent_id):
+    """
+    Encode the sort key of the last torrent in a page of search results into an opaque continuation token.
+    """
+    return base64.urlsafe_b64encode(json.dumps([num_seeders, relevance, torrent_id]))
+
+
+def decode_search_continuation_token(token):
+    """
+    Decode a continuation token into the sort key of the last torrent in the previous page of search results.
+    :raises ValueError: if the token is invalid.
+    """
+    try:
+        num_seeders, relevance, torrent_id = json.loads(base64.urlsafe_b64decode(str(token)))
+    except (TypeError, ValueError):
+        raise ValueError("Invalid continuation token: %r" % token)
+    return num_seeders, relevance, torrent_id
+
 
 class LimitedOrderedDict(OrderedDict):
 
@@ -76,6 +111,25 @@ class BasicDBHandler(TaskManager):
     def getAll(self, value_name, where=None, group_by=None, having=None, order_by=None, limit=None, offset=None, conj=u"AND", **kw):
         return self._db.getAll(self.table_name, value_name, where=where, group_by=group_by, having=having, order_by=order_by, limit=limit, offset=offset, conj=conj, **kw)
 
+    def get_one_async(self, value_name, where=None, conj=u"AND", **kw):
+        return self._db.get_one_async(self.table_name, value_name, where=where, conj=conj, **kw)
+
+    def get_all_async(self, value_name, where=None, group_by=None, having=None, order_by=None, limit=None,
+                      offset=None, conj=u"AND", **kw):
+        return self._db.get_all_async(self.table_name, value_name, where=where, group_by=group_by, having=having,
+                                      order_by=order_by, limit=limit, offset=offset, conj=conj, **kw)
+
+    def _fetchall_in_chunks(self, sql, values):
+        """
+        Run a query with an IN (%s) clause for all values, split in chunks that stay within the SQLite variable limit.
+        """
+        values = list(values)
+        results = []
+        for index in xrange(0, len(values), MAX_SQL_VARIABLES):
+            chunk = values[index:index + MAX_SQL_VARIABLES]
+            results.extend(self._db.fetchall(sql % u",".join(u"?" * len(chunk)), chunk))
+        return results
+
 
 class PeerDBHandler(BasicDBHandler):
 
@@ -164,8 +218,7 @@ class PeerDBHandler(BasicDBHandler):
         if 'name' in value:
             value['name'] = dunno2unicode(value['name'])
         if peer_id is not None:
-            where = u'peer_id == %d' % peer_id
-            self._db.update('Peer', where, **value)
+            self._db.update('Peer', u'peer_id == ?', (peer_id,), **value)
         else:
             self._db.insert_or_ignore('Peer', permid=bin2str(permid), **value)
 
@@ -227,6 +280,17 @@ class TorrentDBHandler(BasicDBHandler):
         # to incoming remote torrents without doing a full text search.
         self.latest_matchinfo_torrent = None
 
+        self.bm25_scorer = BM25Scorer(column_weights=self.session.config.get_search_bm25_column_weights(),
+                                      k1=self.session.config.get_search_bm25_k1(),
+                                      b=self.session.config.get_search_bm25_b())
+
+        # Index of the terms in torrent names, used for search suggestions and autocompletion. It is loaded from the
+        # database in the background on first use and kept up to date by _indexTorrent.
+        self.term_index = TermIndex()
+        self._term_index_lock = DeferredLock()
+
+        self._ingest_stats = {"batches": 0, "torrents": 0, "time": 0.0, "last_batch_torrents_per_second": 0.0}
+
     def initialize(self, *args, **kwargs):
         super(TorrentDBHandler, self).initialize(*args, **kwargs)
         self.category = self.session.lm.category
@@ -261,10 +325,8 @@ class TorrentDBHandler(BasicDBHandler):
             else:
                 to_select.append(bin2str(infohash))
 
-        parameters = '?,' * len(to_select)
-        parameters = parameters[:-1]
-        sql_stmt = u"SELECT torrent_id, infohash FROM Torrent WHERE infohash IN (%s)" % parameters
-        torrents = self._db.fetchall(sql_stmt, to_select)
+        sql_stmt = u"SELECT torrent_id, infohash FROM Torrent WHERE infohash IN (%s)"
+        torrents = self._fetchall_in_chunks(sql_stmt, to_select)
         for torrent_id, infohash in torrents:
             self.infohash_id[str2bin(infohash)] = torrent_id
 
@@ -311,47 +373,160 @@ class TorrentDBHandler(BasicDBHandler):
             self.notifier.notify(NTFY_TORRENTS, NTFY_INSERT, infohash)
 
     def addExternalTorrentNoDef(self, infohash, name, files, trackers, timestamp, extra_info={}):
-        if not self.hasTorrent(infohash):
-            metainfo = {'info': {}, 'encoding': 'utf_8'}
-            metainfo['info']['name'] = name.encode('utf_8')
-            metainfo['info']['piece length'] = -1
-            metainfo['info']['pieces'] = ''
-
-            if len(files) > 1:
-                files_as_dict = []
-                for filename, file_length in files:
-                    filename = filename.encode('utf_8')
-                    files_as_dict.append({'path': [filename], 'length': file_length})
-                metainfo['info']['files'] = files_as_dict
-
-            elif len(files) == 1:
-                metainfo['info']['length'] = files[0][1]
-            else:
-                return
+        self.add_external_torrents_no_def([(infohash, name, files, trackers, timestamp, extra_info)])
 
-            if len(trackers) > 0:
-                metainfo['announce'] = trackers[0]
-                metainfo['announce-list'] = [list(trackers)]
-            else:
-                metainfo['nodes'] = []
-
-            metainfo['creation date'] = timestamp
+    def add_external_torrents_no_def(self, torrents):
+        """
+        Add a batch of torrents of which only the name, files and trackers are known, i.e. torrents received from
+        Dispersy. The batch is ingested in stages: the infohashes are deduplicated in memory, the torrents we already
+        collected are looked up with a single query, and the torrents, their files, trackers and full text index
+        rows are written with executemany, so they end up in the same transaction. A single notification is fired
+        for the whole batch.
+        :param torrents: a list of (infohash, name, files, trackers, timestamp, extra_info) tuples.
+        :return: a dictionary mapping the infohashes of the added torrents to their torrent ids.
+        """
+        start_time = time()
 
-            try:
-                torrentdef = TorrentDef.load_from_dict(metainfo)
-                torrentdef.infohash = infohash
+        # Stage 1: deduplicate and drop the torrents that have no files or that we already collected
+        records = OrderedDict()
+        for infohash, name, files, trackers, timestamp, extra_info in torrents:
+            if files and infohash not in records:
+                records[infohash] = (name, files, trackers, timestamp, extra_info)
 
-                torrent_id = self._addTorrentToDB(torrentdef, extra_info)
-                if self._rtorrent_handler:
-                    self._rtorrent_handler.notify_possible_torrent_infohash(infohash)
+        for infohash in self._get_collected_infohashes(records.keys()):
+            del records[infohash]
 
-                insert_files = [(torrent_id, unicode(path), length) for path, length in files]
-                sql_insert_files = "INSERT OR IGNORE INTO TorrentFiles (torrent_id, path, length) VALUES (?,?,?)"
-                self._db.executemany(sql_insert_files, insert_files)
+        # Stage 2: validate the metainfo and create the database rows
+        torrentdefs = OrderedDict()
+        database_dicts = {}
+        for infohash, (name, files, trackers, timestamp, extra_info) in records.iteritems():
+            try:
+                torrentdef = self._create_torrent_def_no_def(infohash, name, files, trackers, timestamp)
+                database_dicts[infohash] = self._get_database_dict(torrentdef, extra_info)
+                torrentdefs[infohash] = torrentdef
             except:
-                self._logger.error("Could not create a TorrentDef instance %r %r %r %r %r %r", infohash, timestamp, name, files, trackers, extra_info)
+                self._logger.error("Could not create a TorrentDef instance %r %r %r %r %r %r",
+                                   infohash, timestamp, name, files, trackers, extra_info)
                 print_exc()
 
+        if not torrentdefs:
+            return {}
+
+        # Stage 3: write the torrents, their files, trackers and full text index rows
+        torrent_ids = self._insert_or_update_torrents(database_dicts)
+
+        to_index = []
+        insert_files = []
+        tracker_mappings = {}
+        for infohash, torrentdef in torrentdefs.iteritems():
+            torrent_id = torrent_ids[infohash]
+            swarmname = torrentdef.get_name_as_unicode()
+            if not torrentdef.is_multifile_torrent():
+                swarmname, _ = os.path.splitext(swarmname)
+            to_index.append((torrent_id, swarmname, torrentdef.get_files()))
+            insert_files.extend((torrent_id, unicode(path), length) for path, length in records[infohash][1])
+            tracker_mappings[torrent_id] = self._get_torrent_tracker_set(torrentdef)
+
+        self._index_torrents(to_index)
+        self._db.executemany(u"INSERT OR IGNORE INTO TorrentFiles (torrent_id, path, length) VALUES (?,?,?)",
+                             insert_files)
+        self._add_torrent_tracker_mappings(tracker_mappings)
+
+        if self._rtorrent_handler:
+            for infohash in torrentdefs:
+                self._rtorrent_handler.notify_possible_torrent_infohash(infohash)
+
+        self._record_ingest(len(torrentdefs), time() - start_time)
+        self.notifier.notify(NTFY_TORRENTS, NTFY_INSERT, None, torrentdefs.keys())
+        return dict((infohash, torrent_ids[infohash]) for infohash in torrentdefs)
+
+    @staticmethod
+    def _create_torrent_def_no_def(infohash, name, files, trackers, timestamp):
+        metainfo = {'info': {}, 'encoding': 'utf_8'}
+        metainfo['info']['name'] = name.encode('utf_8')
+        metainfo['info']['piece length'] = -1
+        metainfo['info']['pieces'] = ''
+
+        if len(files) > 1:
+            files_as_dict = []
+            for filename, file_length in files:
+                filename = filename.encode('utf_8')
+                files_as_dict.append({'path': [filename], 'length': file_length})
+            metainfo['info']['files'] = files_as_dict
+        else:
+            metainfo['info']['length'] = files[0][1]
+
+        if len(trackers) > 0:
+            metainfo['announce'] = trackers[0]
+            metainfo['announce-list'] = [list(trackers)]
+        else:
+            metainfo['nodes'] = []
+
+        metainfo['creation date'] = timestamp
+
+        torrentdef = TorrentDef.load_from_dict(metainfo)
+        torrentdef.infohash = infohash
+        return torrentdef
+
+    def _get_collected_infohashes(self, infohashes):
+        """
+        Return the subset of infohashes of the torrents we already collected, using a single query.
+        """
+        collected = set(infohash for infohash in infohashes if infohash in self.existed_torrents)
+        to_select = [bin2str(infohash) for infohash in infohashes if infohash not in collected]
+        sql = u"SELECT infohash FROM CollectedTorrent WHERE infohash IN (%s)"
+        for infohash, in self._fetchall_in_chunks(sql, to_select):
+            infohash = str2bin(infohash)
+            self.existed_torrents.add(infohash)
+            collected.add(infohash)
+        return collected
+
+    def _insert_or_update_torrents(self, database_dicts):
+        """
+        Insert or update the Torrent rows of a batch of torrents, given as a dictionary mapping infohashes to the
+        database dictionaries of the torrents. Rows are written with one executemany per set of columns.
+        :return: a dictionary mapping the infohashes to their torrent ids.
+        """
+        torrent_ids = self.getTorrentIDS(database_dicts.keys())
+
+        inserts = defaultdict(list)
+        updates = defaultdict(list)
+        for infohash, database_dict in database_dicts.iteritems():
+            torrent_id = torrent_ids[infohash]
+            if torrent_id is None:  # not in database
+                columns = tuple(sorted(database_dict))
+                inserts[columns].append(tuple(database_dict[column] for column in columns))
+            else:  # infohash in db, no need to update it
+                columns = tuple(sorted(column for column in database_dict if column != "infohash"))
+                updates[columns].append(tuple(database_dict[column] for column in columns) + (torrent_id,))
+
+        for columns, values in inserts.iteritems():
+            sql = u"INSERT INTO Torrent (%s) VALUES (%s)" % (u", ".join(columns), u",".join(u"?" * len(columns)))
+            self._db.executemany(sql, values)
+
+        for columns, values in updates.iteritems():
+            sql = u"UPDATE Torrent SET %s WHERE torrent_id = ?" % u", ".join(u"%s = ?" % column for column in columns)
+            self._db.executemany(sql, values)
+
+        inserted = [infohash for infohash, torrent_id in torrent_ids.iteritems() if torrent_id is None]
+        if inserted:
+            torrent_ids.update(self.getTorrentIDS(inserted))
+        return torrent_ids
+
+    def _record_ingest(self, num_torrents, duration):
+        self._ingest_stats["batches"] += 1
+        self._ingest_stats["torrents"] += num_torrents
+        self._ingest_stats["time"] += duration
+        self._ingest_stats["last_batch_torrents_per_second"] = num_torrents / duration if duration > 0 else 0.0
+
+    def get_ingest_stats(self):
+        """
+        Return statistics about the torrents added in batches, including the ingest rate in torrents per second.
+        """
+        stats = dict(self._ingest_stats)
+        stats["torrents_per_second"] = stats["torrents"] / stats["time"] if stats["time"] > 0 else 0.0
+        return stats
+
     def addOrGetTorrentID(self, infohash):
         assert isinstance(infohash, str), "INFOHASH has invalid type: %s" % type(infohash)
         assert len(infohash) == INFOHASH_LENGTH, "INFOHASH has invalid length: %d" % len(infohash)
@@ -420,8 +595,7 @@ class TorrentDBHandler(BasicDBHandler):
 
         else:  # infohash in db
             del database_dict["infohash"]  # no need for infohash, its already stored
-            where = "torrent_id = %d" % torrent_id
-            self._db.update('Torrent', where=where, **database_dict)
+            self._db.update('Torrent', where=u"torrent_id = ?", where_args=(torrent_id,), **database_dict)
 
         if not torrentdef.is_multifile_torrent():
             swarmname, _ = os.path.splitext(swarmname)
@@ -431,6 +605,30 @@ class TorrentDBHandler(BasicDBHandler):
         return torrent_id
 
     def _indexTorrent(self, torrent_id, swarmname, files):
+        self._index_torrents([(torrent_id, swarmname, files)])
+
+    def _index_torrents(self, torrents):
+        """
+        Write the full text index rows of a batch of (torrent_id, swarmname, files) tuples.
+        """
+        values = [self._get_full_text_index_values(torrent_id, swarmname, files)
+                  for torrent_id, swarmname, files in torrents]
+        if not values:
+            return
+
+        try:
+            # INSERT OR REPLACE not working for fts3 table
+            self._db.executemany(u"DELETE FROM FullTextIndex WHERE rowid = ?", [(value[0],) for value in values])
+            self._db.executemany(
+                u"INSERT INTO FullTextIndex (rowid, swarmname, filenames, fileextensions) VALUES(?,?,?,?)", values)
+            for value in values:
+                self.term_index.add_swarmname(value[1])
+        except:
+            # this will fail if the fts3 module cannot be found
+            print_exc()
+
+    @staticmethod
+    def _get_full_text_index_values(torrent_id, swarmname, files):
         # Niels: new method for indexing, replaces invertedindex
         # Making sure that swarmname does not include extension for single file torrents
         swarm_keywords = " ".join(split_into_keywords(swarmname))
@@ -451,20 +649,17 @@ class TorrentDBHandler(BasicDBHandler):
             filenames.sort(cmp=popSort, reverse=True)
             filenames = filenames[:1000]
 
-        values = (torrent_id, swarm_keywords, " ".join(filenames), " ".join(fileextensions))
-        try:
-            # INSERT OR REPLACE not working for fts3 table
-            self._db.execute_write(u"DELETE FROM FullTextIndex WHERE rowid = ?", (torrent_id,))
-            self._db.execute_write(
-                u"INSERT INTO FullTextIndex (rowid, swarmname, filenames, fileextensions) VALUES(?,?,?,?)", values)
-        except:
-            # this will fail if the fts3 module cannot be found
-            print_exc()
+        return torrent_id, swarm_keywords, " ".join(filenames), " ".join(fileextensions)
 
     # ------------------------------------------------------------
     # Adds the trackers of a given torrent into the database.
     # ------------------------------------------------------------
     def _addTorrentTracker(self, torrent_id, torrentdef, extra_info={}):
+        # add trackers in batch
+        self.addTorrentTrackerMappingInBatch(torrent_id, list(self._get_torrent_tracker_set(torrentdef)))
+
+    @staticmethod
+    def _get_torrent_tracker_set(torrentdef):
         # Set add_all to True if you want to put all multi-trackers into db.
         # In the current version (4.2) only the main tracker is used.
 
@@ -491,8 +686,7 @@ class TorrentDBHandler(BasicDBHandler):
                     if tracker_url:
                         new_tracker_set.add(tracker_url)
 
-        # add trackers in batch
-        self.addTorrentTrackerMappingInBatch(torrent_id, list(new_tracker_set))
+        return new_tracker_set
 
     def updateTorrent(self, infohash, notify=True, **kw):  # watch the schema of database
         if 'seeder' in kw:
@@ -506,20 +700,16 @@ class TorrentDBHandler(BasicDBHandler):
 
         if len(kw) > 0:
             infohash_str = bin2str(infohash)
-            where = "infohash='%s'" % infohash_str
-            self._db.update(self.table_name, where, **kw)
+            self._db.update(self.table_name, u"infohash = ?", (infohash_str,), **kw)
 
         if notify:
             self.notifier.notify(NTFY_TORRENTS, NTFY_UPDATE, infohash)
 
     def on_torrent_collect_response(self, infohashes):
-        infohash_list = [(bin2str(infohash)) for infohash in infohashes]
-
-        i_parameters = u"?," * len(infohash_list)
-        i_parameters = i_parameters[:-1]
+        infohash_list = list(OrderedDict.fromkeys(bin2str(infohash) for infohash in infohashes))
 
-        sql = u"SELECT torrent_id, infohash FROM Torrent WHERE infohash in (%s)" % i_parameters
-        results = self._db.fetchall(sql, infohash_list)
+        sql = u"SELECT torrent_id, infohash FROM Torrent WHERE infohash IN (%s)"
+        results = self._fetchall_in_chunks(sql, infohash_list)
 
         info_dict = {}
         for torrent_id, infohash in results:
@@ -539,12 +729,18 @@ class TorrentDBHandler(BasicDBHandler):
     def on_search_response(self, torrents):
         status = u'unknown'
 
-        torrents = [(bin2str(torrent[0]), torrent[1], torrent[2], torrent[3], torrent[4][0],
-                     torrent[5]) for torrent in torrents]
-        infohash = [(torrent[0],) for torrent in torrents]
+        start_time = time()
 
-        sql = u"SELECT torrent_id, infohash, is_collected, name FROM Torrent WHERE infohash == ?"
-        results = self._db.executemany(sql, infohash) or []
+        # Deduplicate the infohashes in the response, keeping the first result for every torrent
+        unique_torrents = OrderedDict()
+        for torrent in torrents:
+            infohash = bin2str(torrent[0])
+            if infohash not in unique_torrents:
+                unique_torrents[infohash] = (infohash, torrent[1], torrent[2], torrent[3], torrent[4][0], torrent[5])
+        torrents = unique_torrents.values()
+
+        sql = u"SELECT torrent_id, infohash, is_collected, name FROM Torrent WHERE infohash IN (%s)"
+        results = self._fetchall_in_chunks(sql, unique_torrents.keys())
 
         infohash_tid = {}
 
@@ -591,15 +787,15 @@ class TorrentDBHandler(BasicDBHandler):
             try:
                 self._db.executemany(sql, insert)
 
-                were_inserted = [(inserted[5],) for inserted in insert]
-                sql = u"SELECT torrent_id, name FROM Torrent WHERE infohash == ?"
-                to_be_indexed = to_be_indexed + list(self._db.executemany(sql, were_inserted))
+                were_inserted = [inserted[5] for inserted in insert]
+                sql = u"SELECT torrent_id, name FROM Torrent WHERE infohash IN (%s)"
+                to_be_indexed = to_be_indexed + self._fetchall_in_chunks(sql, were_inserted)
             except:
                 print_exc()
                 self._logger.error(u"infohashes: %s", insert)
 
-        for torrent_id, swarmname in to_be_indexed:
-            self._indexTorrent(torrent_id, swarmname, [])
+        self._index_torrents([(torrent_id, swarmname, []) for torrent_id, swarmname in to_be_indexed])
+        self._record_ingest(len(torrents), time() - start_time)
 
     def getTorrentCheckRetries(self, torrent_id):
         sql = u"SELECT tracker_check_retries FROM Torrent WHERE torrent_id = ?"
@@ -618,32 +814,38 @@ class TorrentDBHandler(BasicDBHandler):
         # notify
         self.notifier.notify(NTFY_TORRENTS, NTFY_UPDATE, infohash)
 
-    def addTorrentTrackerMapping(self, torrent_id, tracker):
-        self.addTorrentTrackerMappingInBatch(torrent_id, [tracker, ])
-
-    def addTorrentTrackerMappingInBatch(self, torrent_id, tracker_list):
-        if not tracker_list:
+    def _add_torrent_tracker_mappings(self, tracker_mappings):
+        """
+        Map torrents to their trackers, given as a dictionary of torrent ids to lists of trackers. Unknown trackers are
+        looked up with a single query and added to the tracker manager.
+        """
+        all_trackers = set(chain.from_iterable(tracker_mappings.itervalues()))
+        if not all_trackers:
             return
 
-        parameters = u"?," * len(tracker_list)
-        parameters = parameters[:-1]
-        sql = u"SELECT tracker FROM TrackerInfo WHERE tracker IN (%s)" % parameters
-
-        found_tracker_list = self._db.fetchall(sql, tuple(tracker_list))
-        found_tracker_list = [tracker[0] for tracker in found_tracker_list]
+        sql = u"SELECT tracker FROM TrackerInfo WHERE tracker IN (%s)"
+        found_trackers = set(tracker for tracker, in self._fetchall_in_chunks(sql, all_trackers))
 
         # update tracker info
-        not_found_tracker_list = [tracker for tracker in tracker_list if tracker not in found_tracker_list]
-        for tracker in not_found_tracker_list:
-            if self.session.lm.tracker_manager is not None:
+        if self.session.lm.tracker_manager is not None:
+            for tracker in all_trackers - found_trackers:
                 self.session.lm.tracker_manager.add_tracker(tracker)
 
         # update torrent-tracker mapping
         sql = 'INSERT OR IGNORE INTO TorrentTrackerMapping(torrent_id, tracker_id)'\
             + ' VALUES(?, (SELECT tracker_id FROM TrackerInfo WHERE tracker = ?))'
-        new_mapping_list = [(torrent_id, tracker) for tracker in tracker_list]
-        if new_mapping_list:
-            self._db.executemany(sql, new_mapping_list)
+        new_mapping_list = [(torrent_id, tracker) for torrent_id, tracker_list in tracker_mappings.iteritems()
+                            for tracker in tracker_list]
+        self._db.executemany(sql, new_mapping_list)
+
+    def addTorrentTrackerMapping(self, torrent_id, tracker):
+        self.addTorrentTrackerMappingInBatch(torrent_id, [tracker, ])
+
+    def addTorrentTrackerMappingInBatch(self, torrent_id, tracker_list):
+        if not tracker_list:
+            return
+
+        self._add_torrent_tracker_mappings({torrent_id: tracker_list})
 
         # add trackers into the torrent file if it has been collected
         if not self.session.config.get_torrent_store_enabled() or self.session.lm.torrent_store is None:
@@ -867,110 +1069,210 @@ class TorrentDBHandler(BasicDBHandler):
         self._logger.info("Erased %d torrents", deleted)
         return deleted
 
-    def search_in_local_torrents_db(self, query, keys=None):
+    def search_in_local_torrents_db(self, query, keys=None, offset=0, limit=None):
         """
         Search in the local database for torrents matching a specific query. This method also assigns a relevance
         score to each torrent, based on the name, files and file extensions.
         The algorithm is based on BM25. The document length factor is regarded since our "documents" are very small
         (often a few keywords).
         See https://en.wikipedia.org/wiki/Okapi_BM25 for more information about BM25.
+        The results are ordered by descending relevance. If a limit is given, only the results in the page starting at
+        offset are returned.
         """
-        search_results = []
-        keys_str = ", ".join(keys)
         keywords = split_into_keywords(query, to_filter_stopwords=True)
-        infohash_index = keys.index('infohash')
+        results = self._db.fetchall(self._get_local_torrents_search_sql(keys), (" OR ".join(keywords),))
+        return self._score_local_torrents_search_results(results, keys, keywords, offset, limit)
 
+    def search_in_local_torrents_db_async(self, query, keys=None, offset=0, limit=None):
+        """
+        Asynchronous version of search_in_local_torrents_db. The full text search runs off the reactor thread.
+        :return: a Deferred that fires with the scored search results.
+        """
+        keywords = split_into_keywords(query, to_filter_stopwords=True)
+        return self._db.fetchall_async(self._get_local_torrents_search_sql(keys), (" OR ".join(keywords),))\
+            .addCallback(self._score_local_torrents_search_results, keys, keywords, offset, limit)
+
+    @staticmethod
+    def _get_local_torrents_search_sql(keys):
         # This query gets torrents matching speciifc keywords. The matchinfo object is also returned. For more
         # information about the returned matchinfo parameters, see https://www.sqlite.org/fts3.html#matchinfo.
-        results = self._db.fetchall("SELECT DISTINCT %s, Matchinfo(FullTextIndex, 'pcnalx') "
-                                    "FROM Torrent T, FullTextIndex "
-                                    "LEFT OUTER JOIN _ChannelTorrents C ON T.torrent_id = C.torrent_id "
-                                    "WHERE t.name IS NOT NULL AND t.torrent_id = FullTextIndex.rowid "
-                                    "AND C.deleted_at IS NULL AND FullTextIndex MATCH ?"
-                                    % keys_str, (" OR ".join(keywords),))
+        return "SELECT DISTINCT %s, Matchinfo(FullTextIndex, 'pcnalx') " \
+               "FROM Torrent T, FullTextIndex " \
+               "LEFT OUTER JOIN _ChannelTorrents C ON T.torrent_id = C.torrent_id " \
+               "WHERE t.name IS NOT NULL AND t.torrent_id = FullTextIndex.rowid " \
+               "AND C.deleted_at IS NULL AND FullTextIndex MATCH ?" % ", ".join(keys)
+
+    def _score_local_torrents_search_results(self, results, keys, keywords, offset=0, limit=None):
+        if not results:
+            return []
 
-        for result in results:
-            result = list(result)  # We convert the result to a mutable list since we have to decode the infohash
-            result[infohash_index] = str2bin(result[infohash_index])
-            matchinfo = result[len(keys)]  # The matchinfo is the last element in the results tuple
-            self.latest_matchinfo_torrent = matchinfo, keywords
-            num_phrases, num_cols, num_rows = unpack_from('III', matchinfo)
+        matchinfo_index = len(keys)  # The matchinfo is the last element in the results tuple
+        self.latest_matchinfo_torrent = results[-1][matchinfo_index], keywords
 
-            unpack_str = 'I' * (3 * num_cols * num_phrases)
-            matchinfo = unpack_from('I' * 9 + unpack_str, matchinfo)[9:]
+        # All rows are scored in a single pass, only the rows in the requested page are converted afterwards.
+        scores = self.bm25_scorer.score([result[matchinfo_index] for result in results])
 
-            scores = []
+        search_results = []
+        infohash_index = keys.index('infohash')
+        for result_index in top_k_indices(scores, limit, offset):
+            result = list(results[result_index])  # We convert the result to a mutable list to decode the infohash
+            result[infohash_index] = str2bin(result[infohash_index])
+            search_results.append(result + [float(scores[result_index])])
 
-            for col_ind in xrange(num_cols):
-                score = 0
-                for phrase_ind in xrange(num_phrases):
-                    # Fetch info about the current matching term. This number is fetched from the matchinfo object.
-                    # See https://www.sqlite.org/fts3.html#matchinfo for info about the offset calculation.
-                    base_term_offset = 3 * (col_ind + phrase_ind * num_cols)
-                    rows_with_term = matchinfo[base_term_offset + 2]
-                    term_freq = matchinfo[base_term_offset]
+        return search_results
 
-                    inv_doc_freq = math.log((num_rows - rows_with_term + 0.5) / (rows_with_term + 0.5), 2)
-                    right_side = ((term_freq * (1.2 + 1)) / (term_freq + 1.2))
+    def searchNames(self, kws, local=True, keys=None, doSort=True, offset=0, limit=None, continuation_token=None):
+        """
+        Search the local database for torrents with names or files matching the given keywords.
+        Results are ordered by number of seeders and relevance in SQL. If a limit is given, only one page of
+        matching torrents is fetched, starting at offset and, if a continuation token is given, after the last torrent
+        of the page the token was returned with. Remote searches are limited to REMOTE_SEARCH_NAMES_LIMIT results.
+        """
+        return self.search_names_page(kws, local, keys, doSort, offset, limit, continuation_token)[0]
 
-                    score += inv_doc_freq * right_side
+    def search_names_async(self, kws, local=True, keys=None, doSort=True, offset=0, limit=None,
+                           continuation_token=None):
+        """
+        Asynchronous version of searchNames. Both the full text search and the lookup of the channels the matching
+        torrents are in run off the reactor thread.
+        :return: a Deferred that fires with the list of search results.
+        """
+        return self.search_names_page_async(kws, local, keys, doSort, offset, limit, continuation_token)\
+            .addCallback(lambda page: page[0])
 
-                scores.append(score)
+    def search_names_page(self, kws, local=True, keys=None, doSort=True, offset=0, limit=None,
+                          continuation_token=None):
+        """
+        Like searchNames, but also returns the continuation token that can be passed to fetch the next page.
+        Pages may contain fewer than limit results if torrents from spam channels or duplicates are dropped.
+        :return: a tuple with the list of search results and the continuation token, which is None on the last page.
+        """
+        assert 'infohash' in keys
 
-            # Our score is 80% dependent on matching in the name of the torrent, 10% on the names of the files in the
-            # torrent and 10% on the extensions of files in the torrent.
-            extended_result = result + [0.8 * scores[0] + 0.1 * scores[1] + 0.1 * scores[2]]
-            search_results.append(extended_result)
+        sql, bindings, page_limit = self._get_search_names_sql(kws, local, keys, doSort, offset, limit,
+                                                               continuation_token)
+        rows = self._db.fetchall(sql, bindings)
+        results, next_token = self._split_search_names_rows(rows, page_limit)
 
-        return search_results
+        channel_ids = self._get_search_names_channel_ids(results)
+        channels = self.channelcast_db.getChannels(channel_ids) if channel_ids else []
+        results = self._merge_search_names_results(results, channels, kws, keys)
+        return self._limit_search_names_page(results, next_token, local, limit)
 
-    def searchNames(self, kws, local=True, keys=None, doSort=True):
+    def search_names_page_async(self, kws, local=True, keys=None, doSort=True, offset=0, limit=None,
+                                continuation_token=None):
+        """
+        Asynchronous version of search_names_page.
+        :return: a Deferred that fires with a tuple of the search results and the continuation token.
+        """
         assert 'infohash' in keys
-        assert not doSort or ('num_seeders' in keys or 'T.num_seeders' in keys)
 
-        infohash_index = keys.index('infohash')
-        num_seeders_index = keys.index('num_seeders') if 'num_seeders' in keys else -1
+        sql, bindings, page_limit = self._get_search_names_sql(kws, local, keys, doSort, offset, limit,
+                                                               continuation_token)
+
+        def on_channels(channels, results, next_token):
+            results = self._merge_search_names_results(results, channels, kws, keys)
+            return self._limit_search_names_page(results, next_token, local, limit)
+
+        def on_torrents(rows):
+            results, next_token = self._split_search_names_rows(rows, page_limit)
+            channel_ids = self._get_search_names_channel_ids(results)
+            if not channel_ids:
+                return on_channels([], results, next_token)
+            return self.channelcast_db.get_channels_async(channel_ids).addCallback(on_channels, results, next_token)
+
+        return self._db.fetchall_async(sql, bindings).addCallback(on_torrents)
 
-        if num_seeders_index == -1:
-            doSort = False
+    @staticmethod
+    def _get_search_names_sql(kws, local, keys, doSort, offset, limit, continuation_token):
+        """
+        Build the full text search query of searchNames. The matching torrents are ordered and paged in a subquery,
+        so SQLite only has to keep one page of rows in memory. Every returned row starts with the sort key of the
+        torrent and the deletion time of the channel torrent, followed by the requested keys, the channel id and the
+        matchinfo object.
+        :return: a tuple with the query, its bindings and the effective limit.
+        """
+        if not local and limit is None:
+            limit = REMOTE_SEARCH_NAMES_FETCH_LIMIT
 
-        values = ", ".join(keys)
-        mainsql = "SELECT " + values + ", C.channel_id, Matchinfo(FullTextIndex) FROM"
-        if local:
-            mainsql += " Torrent T"
+        if doSort:
+            sort_columns = ["COALESCE(T.num_seeders, 0)", "COALESCE(T.relevance, 0)"]
         else:
-            mainsql += " CollectedTorrent T"
+            sort_columns = ["0", "0"]
 
-        mainsql += """, FullTextIndex
-                    LEFT OUTER JOIN _ChannelTorrents C ON T.torrent_id = C.torrent_id
-                    WHERE t.name IS NOT NULL AND t.torrent_id = FullTextIndex.rowid AND C.deleted_at IS NULL AND FullTextIndex MATCH ?
-                    """
+        innersql = "SELECT T.*, %s AS sort_seeders, %s AS sort_relevance, Matchinfo(FullTextIndex) AS matchinfo " \
+                   "FROM %s T, FullTextIndex " \
+                   "WHERE T.name IS NOT NULL AND T.torrent_id = FullTextIndex.rowid AND FullTextIndex MATCH ?" \
+                   % (sort_columns[0], sort_columns[1], "Torrent" if local else "CollectedTorrent")
+        bindings = [" ".join(filter_keywords(kws))]
 
         if not local:
-            mainsql += "AND T.secret is not 1 LIMIT 250"
+            innersql += " AND T.secret IS NOT 1"
+
+        if continuation_token:
+            seeders, relevance, torrent_id = decode_search_continuation_token(continuation_token)
+            innersql += " AND (%(s)s < ? OR (%(s)s = ? AND (%(r)s < ? OR (%(r)s = ? AND T.torrent_id > ?))))" \
+                        % {'s': sort_columns[0], 'r': sort_columns[1]}
+            bindings += [seeders, seeders, relevance, relevance, torrent_id]
+
+        innersql += " ORDER BY %s DESC, %s DESC, T.torrent_id" % tuple(sort_columns)
+        if limit is not None:
+            innersql += " LIMIT ? OFFSET ?"
+            bindings += [limit, offset]
+        elif offset:
+            innersql += " LIMIT -1 OFFSET ?"
+            bindings.append(offset)
+
+        # Torrents that are only in channels they have been deleted from are filtered afterwards, so that the page
+        # boundaries are not affected by it.
+        mainsql = "SELECT T.sort_seeders, T.sort_relevance, T.torrent_id, C.deleted_at, %s, C.channel_id, " \
+                  "T.matchinfo FROM (%s) T LEFT OUTER JOIN _ChannelTorrents C ON T.torrent_id = C.torrent_id " \
+                  "ORDER BY T.sort_seeders DESC, T.sort_relevance DESC, T.torrent_id" % (", ".join(keys), innersql)
+        return mainsql, tuple(bindings), limit
 
-        query = " ".join(filter_keywords(kws))
-        not_negated = [kw for kw in filter_keywords(kws) if kw[0] != '-']
+    @staticmethod
+    def _split_search_names_rows(rows, limit):
+        """
+        Create the continuation token that points just after the last torrent in the page returned by the
+        searchNames query, and strip the sort key from the rows. Rows of deleted channel torrents are dropped.
+        """
+        rows = list(rows)
+        next_token = None
+        if limit is not None and rows and len(set(row[2] for row in rows)) >= limit:
+            next_token = encode_search_continuation_token(*rows[-1][:3])
+        return [row[4:] for row in rows if row[3] is None], next_token
 
-        results = self._db.fetchall(mainsql, (query,))
+    @staticmethod
+    def _limit_search_names_page(results, next_token, local, limit):
+        """
+        Cut the results of a remote search without an explicit limit to REMOTE_SEARCH_NAMES_LIMIT, after the duplicates
+        and the torrents in spam channels have been dropped. Remote peers do not page, so they get no token.
+        """
+        if local or limit is not None:
+            return results, next_token
+        return results[:REMOTE_SEARCH_NAMES_LIMIT], None
 
-        channels = set()
-        channel_dict = {}
-        for result in results:
-            if result[-2]:
-                channels.add(result[-2])
+    @staticmethod
+    def _get_search_names_channel_ids(results):
+        return set(result[-2] for result in results if result[-2])
 
-        if len(channels) > 0:
-            # results are tuples of (id, str(dispersy_cid), name, description,
-            # nr_torrents, nr_favorites, nr_spam, my_vote, modified, id ==
-            # self._channel_id)
-            for channel in self.channelcast_db.getChannels(channels):
-                if channel[1] != '-1':
-                    channel_dict[channel[0]] = channel
+    def _merge_search_names_results(self, results, channels, kws, keys):
+        infohash_index = keys.index('infohash')
+
+        not_negated = [kw for kw in filter_keywords(kws) if kw[0] != '-']
+
+        # channels are tuples of (id, str(dispersy_cid), name, description,
+        # nr_torrents, nr_favorites, nr_spam, my_vote, modified, id ==
+        # self._channel_id)
+        channel_dict = {}
+        for channel in channels:
+            if channel[1] != '-1':
+                channel_dict[channel[0]] = channel
 
         myChannelId = self.channelcast_db._channel_id or 0
 
-        result_dict = {}
+        # The results are already ordered by the query, which should be preserved while merging
+        result_dict = OrderedDict()
 
         # step 1, merge torrents keep one with best channel
         for result in results:
@@ -1008,11 +1310,8 @@ class TorrentDBHandler(BasicDBHandler):
 
 
         # step 2, fix all dict fields
-        dont_sort_list = []
         results = [list(result) for result in result_dict.values()]
-        for index in xrange(len(results) - 1, -1, -1):
-            result = results[index]
-
+        for result in results:
             result[infohash_index] = str2bin(result[infohash_index])
 
             matches = {'swarmname': set(), 'filenames': set(), 'fileextensions': set()}
@@ -1040,88 +1339,78 @@ class TorrentDBHandler(BasicDBHandler):
             channel = channel_dict.get(result[-2], (result[-2], None, '', '', 0, 0, 0, 0, 0, False))
             result.extend(channel)
 
-            if doSort and result[num_seeders_index] <= 0:
-                dont_sort_list.append((index, result))
-
-        if doSort:
-            # Remove the items with 0 seeders from the results list so the sort is faster, append them to the
-            # results list afterwards.
-            for index, result in dont_sort_list:
-                results.pop(index)
-
-            def compare(a, b):
-                return cmp(a[num_seeders_index], b[num_seeders_index])
-            results.sort(compare, reverse=True)
-
-            for index, result in dont_sort_list:
-                results.append(result)
-
-        if not local:
-            results = results[:25]
-
         return results
 
-    def getAutoCompleteTerms(self, keyword, max_terms, limit=100):
-        sql = "SELECT swarmname FROM FullTextIndex WHERE swarmname MATCH ? LIMIT ?"
-        result = self._db.fetchall(sql, ('"%s*"' % keyword, limit))
+    def _load_term_index(self):
+        """
+        Start loading the term index in the background, if it is not loaded yet. Until then, there are no search
+        suggestions or completions, since loading the index of a large database takes too long to wait for.
+        """
+        if not self.term_index.loaded and not self._term_index_lock.locked:
+            self._load_term_index_async().addErrback(
+                lambda failure: self._logger.error("Failed to load the term index: %s", failure.getErrorMessage()))
+
+    def _load_term_index_async(self):
+        if self.term_index.loaded:
+            return succeed(None)
+        # Only one load runs at a time, later callers wait for it and find the index loaded
+        return self._term_index_lock.run(self._load_term_index_locked)
+
+    def _load_term_index_locked(self):
+        if self.term_index.loaded:
+            return succeed(None)
+
+        def on_failure(failure):
+            self.term_index.abort_loading()
+            return failure
+
+        self.term_index.begin_loading()
+        # SQLite keeps the number of documents every term appears in, column 0 being the swarmname. Building the index
+        # still takes a while for a large database, so it is not done on the reactor thread.
+        return self._db.fetchall_async(u"SELECT term, documents FROM FullTextIndexTerms WHERE col = 0")\
+            .addCallback(lambda term_frequencies: deferToThread(self.term_index.load, term_frequencies))\
+            .addErrback(on_failure)
+
+    def getAutoCompleteTerms(self, keyword, max_terms):
+        """
+        Return completions of the last term in the keyword, based on the terms in the names of the known torrents.
+        Returns no completions while the term index is being loaded.
+        """
+        self._load_term_index()
+        return self._get_autocomplete_terms(keyword, max_terms)
 
-        all_terms = set()
-        for line, in result:
-            if len(all_terms) >= max_terms:
-                break
-            i1 = line.find(keyword)
-            i2 = line.find(' ', i1 + len(keyword))
-            all_terms.add(line[i1:i2] if i2 >= 0 else line[i1:])
+    def get_autocomplete_terms_async(self, keyword, max_terms):
+        """
+        Asynchronous version of getAutoCompleteTerms.
+        :return: a Deferred that fires with the list of completion terms.
+        """
+        return self._load_term_index_async().addCallback(lambda _: self._get_autocomplete_terms(keyword, max_terms))
 
-        if keyword in all_terms:
-            all_terms.remove(keyword)
-        if '' in all_terms:
-            all_terms.remove('')
+    def _get_autocomplete_terms(self, keyword, max_terms):
+        keywords = split_into_keywords(keyword)
+        if not keywords:
+            return []
 
-        return list(all_terms)
+        preceding = u" ".join(keywords[:-1])
+        return [u"%s %s" % (preceding, term) if preceding else term
+                for term in self.term_index.get_completions(keywords[-1], max_terms)]
 
     def getSearchSuggestion(self, keywords, limit=1):
-        match = [keyword.lower() for keyword in keywords if len(keyword) > 3]
-
-        def lev(a, b):
-            "Calculates the Levenshtein distance between a and b."
-            n, m = len(a), len(b)
-            if n > m:
-                # Make sure n <= m, to use O(min(n,m)) space
-                a, b = b, a
-                n, m = m, n
-
-            current = range(n + 1)
-            for i in range(1, m + 1):
-                previous, current = current, [i] + [0] * n
-                for j in range(1, n + 1):
-                    add, delete = previous[j] + 1, current[j - 1] + 1
-                    change = previous[j - 1]
-                    if a[j - 1] != b[i - 1]:
-                        change = change + 1
-                    current[j] = min(add, delete, change)
-
-            return current[n]
-
-        def levcollate(s1, s2):
-            l1 = sum(sorted([lev(a, b) for a in s1.split() for b in match])[:len(match)])
-            l2 = sum(sorted([lev(a, b) for a in s2.split() for b in match])[:len(match)])
-
-            # return -1 if s1<s2, +1 if s1>s2 else 0
-            if l1 < l2:
-                return -1
-            if l1 > l2:
-                return 1
-            return 0
+        """
+        Return the names of the torrents that are closest, in terms of edit distance, to the given keywords.
+        The terms that are most similar to the keywords are looked up in the term index, after which only the torrents
+        containing those terms are ranked. Returns no suggestions while the term index is being loaded.
+        """
+        self._load_term_index()
 
-        cursor = self._db.get_cursor()
-        connection = cursor.getconnection()
-        connection.createcollation("leven", levcollate)
+        match = [keyword.lower() for keyword in keywords if len(keyword) > 3]
+        terms = self.term_index.get_suggestion_terms(match, SUGGESTION_MAX_TERMS)
+        if not terms:
+            return []
 
-        sql = "SELECT swarmname FROM FullTextIndex WHERE swarmname MATCH ? ORDER By swarmname collate leven ASC LIMIT ?"
-        results = self._db.fetchall(sql, (' OR '.join(['*%s*' % m for m in match]), limit))
-        connection.createcollation("leven", None)
-        return [result[0] for result in results]
+        sql = u"SELECT swarmname FROM FullTextIndex WHERE swarmname MATCH ? LIMIT ?"
+        results = self._db.fetchall(sql, (u" OR ".join(terms), SUGGESTION_MAX_CANDIDATES))
+        return rank_suggestions([result[0] for result in results], match, limit)
 
 
 class MyPreferenceDBHandler(BasicDBHandler):
@@ -1158,10 +1447,9 @@ class MyPreferenceDBHandler(BasicDBHandler):
     def getMyPrefStats(self, torrent_id=None):
         value_name = ('torrent_id', 'destination_path',)
         if torrent_id is not None:
-            where = 'torrent_id == %s' % torrent_id
+            res = self.getAll(value_name, torrent_id=torrent_id)
         else:
-            where = None
-        res = self.getAll(value_name, where)
+            res = self.getAll(value_name)
         mypref_stats = {}
         for torrent_id, destination_path in res:
             mypref_stats[torrent_id] = destination_path
@@ -1211,7 +1499,7 @@ class MyPreferenceDBHandler(BasicDBHandler):
         if not isinstance(destdir, basestring):
             self._logger.info('DESTDIR IS NOT STRING: %s', destdir)
             return
-        self._db.update(self.table_name, 'torrent_id=%d' % torrent_id, destination_path=destdir)
+        self._db.update(self.table_name, u'torrent_id = ?', (torrent_id,), destination_path=destdir)
 
 
 class VoteCastDBHandler(BasicDBHandler):
@@ -1333,6 +1621,17 @@ class VoteCastDBHandler(BasicDBHandler):
                 self.my_votes[channel_id] = vote
         return self.my_votes
 
+    def get_my_votes_async(self):
+        """
+        Asynchronous version of getMyVotes. Votes that are not cached yet are read off the reactor thread, the result
+        is not cached since it may miss votes that were not committed yet.
+        :return: a Deferred that fires with a dictionary of channel id to my vote.
+        """
+        if self.my_votes:
+            return succeed(self.my_votes)
+        return self._db.fetchall_async("SELECT channel_id, vote FROM ChannelVotes WHERE voter_id ISNULL")\
+            .addCallback(dict)
+
 
 class ChannelCastDBHandler(BasicDBHandler):
 
@@ -1480,6 +1779,7 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
         torrent_ids, inserted = self.torrent_db.addOrGetTorrentIDSReturn(infohashes)
 
         insert_data = []
+        to_be_added = []
         updated_channels = {}
 
         for i, torrent in enumerate(torrentlist):
@@ -1488,20 +1788,26 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
 
             # if new or not yet collected
             if infohash in inserted:
-                self.torrent_db.addExternalTorrentNoDef(
-                    infohash, name, files, trackers, timestamp, {'dispersy_id': dispersy_id})
+                to_be_added.append((infohash, name, files, trackers, timestamp, {'dispersy_id': dispersy_id}))
 
             insert_data.append((dispersy_id, torrent_id, channel_id, peer_id, name, timestamp))
             updated_channels[channel_id] = updated_channels.get(channel_id, 0) + 1
 
+        self.torrent_db.add_external_torrents_no_def(to_be_added)
+
         if len(insert_data) > 0:
             sql_insert_torrent = "INSERT INTO _ChannelTorrents (dispersy_id, torrent_id, channel_id, peer_id, name, time_stamp) VALUES (?,?,?,?,?,?)"
             self._db.executemany(sql_insert_torrent, insert_data)
 
+        # Look up the ids of all new channel torrents at once
+        sql = u"SELECT id, channel_id, torrent_id FROM ChannelTorrents WHERE torrent_id IN (%s)"
+        channel_torrent_ids = dict(((channel_id, torrent_id), channel_torrent_id) for channel_torrent_id, channel_id,
+                                   torrent_id in self._fetchall_in_chunks(sql, set(torrent_ids)))
+
         updated_channel_torrent_dict = defaultdict(list)
-        for torrent in torrentlist:
+        for i, torrent in enumerate(torrentlist):
             channel_id, dispersy_id, peer_id, infohash, timestamp, name, files, trackers = torrent
-            channel_torrent_id = self.get_channel_torrent_id(channel_id, infohash)
+            channel_torrent_id = channel_torrent_ids.get((channel_id, torrent_ids[i]))
             updated_channel_torrent_dict[channel_id].append({u'info_hash': infohash,
                                                              u'channel_torrent_id': channel_torrent_id})
 
@@ -2297,8 +2603,24 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
         """
         Searches for matching channels against a given query in the database.
         """
-        search_results = []
         keywords = split_into_keywords(query, to_filter_stopwords=True)
+        sql, bindings = self._get_local_channels_search_sql(keywords)
+        results = self._db.fetchall(sql, bindings)
+        return self._score_local_channels_search_results(results, keywords)
+
+    def search_in_local_channels_db_async(self, query):
+        """
+        Asynchronous version of search_in_local_channels_db.
+        :return: a Deferred that fires with the scored search results.
+        """
+        keywords = split_into_keywords(query, to_filter_stopwords=True)
+        sql, bindings = self._get_local_channels_search_sql(keywords)
+        return self.votecast_db.get_my_votes_async().addCallback(
+            lambda my_votes: self._db.fetchall_async(sql, bindings).addCallback(
+                self._score_local_channels_search_results, keywords, my_votes))
+
+    @staticmethod
+    def _get_local_channels_search_sql(keywords):
         sql = "SELECT id, dispersy_cid, name, description, nr_torrents, nr_favorite, nr_spam, modified " \
               "FROM Channels WHERE "
         for _ in xrange(len(keywords)):
@@ -2306,9 +2628,12 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
         sql = sql[:-4]
 
         bindings = list(chain.from_iterable(['%%%s%%' % keyword] * 2 for keyword in keywords))
-        results = self._db.fetchall(sql, bindings)
+        return sql, bindings
 
-        my_votes = self.votecast_db.getMyVotes()
+    def _score_local_channels_search_results(self, results, keywords, my_votes=None):
+        search_results = []
+        if my_votes is None:
+            my_votes = self.votecast_db.getMyVotes()
 
         for result in results:
             my_vote = my_votes.get(result[0], 0)
@@ -2344,6 +2669,21 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
             "')"
         return self._getChannels(sql)
 
+    def get_channels_async(self, channel_ids):
+        """
+        Asynchronous version of getChannels.
+        :return: a Deferred that fires with the list of channels.
+        """
+        if self.votecast_db is None:
+            return succeed([])
+
+        parameters = u",".join(u"?" * len(channel_ids))
+        sql = "Select id, name, description, dispersy_cid, modified, nr_torrents, nr_favorite, nr_spam " + \
+              "FROM Channels WHERE id IN (" + parameters + ")"
+        return self.votecast_db.get_my_votes_async().addCallback(
+            lambda my_votes: self._db.fetchall_async(sql, list(channel_ids)).addCallback(self._fix_channels,
+                                                                                          my_votes=my_votes))
+
     def getChannelsByCID(self, channel_cids):
         parameters = '?,' * len(channel_cids)
         parameters = parameters[:-1]
@@ -2406,10 +2746,13 @@ ORDER BY CMD.time_stamp DESC LIMIT ?;
         if self.votecast_db is None:
             return []
 
-        channels = []
         results = self._db.fetchall(sql, args)
+        return self._fix_channels(results, cmpF=cmpF, includeSpam=includeSpam)
 
-        my_votes = self.votecast_db.getMyVotes()
+    def _fix_channels(self, results, cmpF=None, includeSpam=True, my_votes=None):
+        channels = []
+        if my_votes is None:
+            my_votes = self.votecast_db.getMyVotes()
         for id, name, description, dispersy_cid, modified, nr_torrents, nr_favorites, nr_spam in results:
             my_vote = my_votes.get(id, 0)
             if not includeSpam and my_vote < 0:
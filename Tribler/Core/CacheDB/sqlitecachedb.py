@@ -6,9 +6,15 @@ Author(s): Jie Yang
 import logging
 import os
 from apsw import CantOpenError, SQLError
+from Queue import Queue
 from base64 import encodestring, decodestring
-from threading import currentThread, RLock
+from collections import OrderedDict
+from threading import currentThread, local, Lock, RLock
+from time import time
+from twisted.internet import reactor
+from twisted.internet.threads import deferToThread, deferToThreadPool
 from twisted.python.threadable import isInIOThread
+from twisted.python.threadpool import ThreadPool
 
 import apsw
 
@@ -26,6 +32,31 @@ DB_FILE_RELATIVE_PATH = os.path.join(DB_DIR_NAME, DB_FILE_NAME)
 DB_SCRIPT_ABSOLUTE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), DB_SCRIPT_NAME)
 
 DEFAULT_BUSY_TIMEOUT = 10000
+DEFAULT_READ_POOL_SIZE = 4
+
+# Number of SQL statements built by the helper methods that are kept, and number of prepared statements apsw keeps
+# per connection.
+DEFAULT_STATEMENT_CACHE_SIZE = 256
+
+# Group commit: the open transaction is committed as soon as either this many rows have been written to it, or the
+# first uncommitted write is this many seconds old.
+DEFAULT_COMMIT_MAX_ROWS = 5000
+DEFAULT_COMMIT_MAX_DELAY = 5.0
+
+# The WAL is checkpointed in the background once this many rows have been committed since the last checkpoint, or
+# when the last checkpoint is this many seconds old.
+DEFAULT_CHECKPOINT_MAX_ROWS = 50000
+DEFAULT_CHECKPOINT_INTERVAL = 300.0
+
+# The writer thread executes large batches in chunks of this many rows and releases the write lock between them, so
+# the reactor never waits for more than a chunk. A group commit that falls in the middle of a batch is retried after
+# this many seconds, so a batch always ends up in a single transaction.
+WRITER_CHUNK_SIZE = 500
+WRITER_BATCH_COMMIT_RETRY = 0.05
+
+# Read-only view on the number of torrents every term in the full text index appears in, which SQLite maintains along
+# with the index itself. Temporary tables are private to a connection, so it is created on every connection.
+TEMP_TABLES_SCRIPT = u"CREATE VIRTUAL TABLE temp.FullTextIndexTerms USING fts4aux(main, FullTextIndex);"
 
 forceDBThread = call_on_reactor_thread
 forceAndReturnDBThread = blocking_call_on_reactor_thread
@@ -43,26 +74,111 @@ def str2bin(str_data):
     return decodestring(str_data)
 
 
+class StatementCache(object):
+    """
+    LRU cache of the SQL statements built by the SQLiteCacheDB helper methods, keyed by a normalized description of
+    the statement template (table, columns, operators, clauses). Besides saving the string building, the helpers
+    always produce the same SQL text for the same template, so the statement cache of apsw gets hits as well.
+    """
+
+    def __init__(self, size=DEFAULT_STATEMENT_CACHE_SIZE):
+        self._size = size
+        self._statements = OrderedDict()
+        self._lock = Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, build, *args):
+        """
+        Returns the statement for the given key, calling build(*args) to create it if it is not in the cache.
+        """
+        with self._lock:
+            sql = self._statements.pop(key, None)
+            if sql is not None:
+                self.hits += 1
+                self._statements[key] = sql
+                return sql
+
+        sql = build(*args)
+        with self._lock:
+            self.misses += 1
+            if key not in self._statements and len(self._statements) >= self._size:
+                self._statements.popitem(last=False)
+                self.evictions += 1
+            self._statements[key] = sql
+        return sql
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {"size": len(self._statements),
+                "capacity": self._size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": float(self.hits) / lookups if lookups else 0.0}
+
+
 class SQLiteCacheDB(TaskManager):
 
-    def __init__(self, db_path, db_script_path=DB_SCRIPT_ABSOLUTE_PATH, busytimeout=DEFAULT_BUSY_TIMEOUT):
+    def __init__(self, db_path, db_script_path=DB_SCRIPT_ABSOLUTE_PATH, busytimeout=DEFAULT_BUSY_TIMEOUT,
+                 read_pool_size=DEFAULT_READ_POOL_SIZE, commit_max_rows=DEFAULT_COMMIT_MAX_ROWS,
+                 commit_max_delay=DEFAULT_COMMIT_MAX_DELAY):
         super(SQLiteCacheDB, self).__init__()
 
         self._logger = logging.getLogger(self.__class__.__name__)
 
-        self._cursor_lock = RLock()
-        self._cursor_table = {}
+        # Every thread gets its own cursor, bound through a thread local so the lock is only taken to register a new
+        # cursor (or when starting and stopping the thread pools).
+        self._lock = RLock()
+        self._thread_local = local()
+        self._cursors = []
+        self._statement_cache = StatementCache()
 
         self._connection = None
         self.sqlite_db_path = db_path
         self.db_script_path = db_script_path
         self._busytimeout = busytimeout  # busytimeout is in milliseconds
 
+        # Thread pools and read-only connections used by the asynchronous (Deferred-returning) API
+        self._read_pool_size = read_pool_size
+        self._write_pool = None
+        self._read_pool = None
+        self._read_connections = Queue()
+        self._shutdown_trigger = None
+        self._pending_async_writes = 0
+        # Whether the open transaction holds asynchronous writes, which the asynchronous reads have to see
+        self._async_writes_uncommitted = False
+        # Whether the writer thread is in the middle of a batch that it executes in chunks
+        self._writer_batch_running = False
+        # Serializes the statements on the main connection between the reactor and the writer thread, so a commit
+        # never ends up in the middle of a write and no write ends up between a COMMIT and the next BEGIN.
+        self._write_lock = RLock()
+
         self._version = None
 
         self._should_commit = False
         self._show_execute = False
 
+        # Group commit and WAL checkpoint bookkeeping
+        self._commit_max_rows = commit_max_rows
+        self._commit_max_delay = commit_max_delay
+        self._in_transaction = False
+        self._group_commit_call = None
+        self._pending_rows = 0
+        self._rows_since_checkpoint = 0
+        self._last_checkpoint_time = time()
+        self._checkpoint_running = False
+
+        self._num_commits = 0
+        self._num_rows_committed = 0
+        self._total_commit_latency = 0.0
+        self._max_commit_latency = 0.0
+        self._last_commit_latency = 0.0
+        self._num_checkpoints = 0
+        self._num_frames_checkpointed = 0
+
     @property
     def version(self):
         """The version of this database."""
@@ -88,13 +204,15 @@ class SQLiteCacheDB(TaskManager):
     @blocking_call_on_reactor_thread
     def close(self):
         """
-        Cancels all pending tasks and closes all cursors. Then, it closes the connection.
+        Cancels all pending tasks, stops the thread pools and closes all cursors. Then, it closes the connection.
         """
         self.cancel_all_pending_tasks()
-        with self._cursor_lock:
-            for cursor in self._cursor_table.itervalues():
+        self._stop_thread_pools()
+        with self._lock:
+            for cursor in self._cursors:
                 cursor.close()
-            self._cursor_table = {}
+            self._cursors = []
+            self._thread_local = local()
             self._connection.close()
             self._connection = None
 
@@ -118,7 +236,7 @@ class SQLiteCacheDB(TaskManager):
 
         # create connection
         try:
-            self._connection = apsw.Connection(self.sqlite_db_path)
+            self._connection = apsw.Connection(self.sqlite_db_path, statementcachesize=DEFAULT_STATEMENT_CACHE_SIZE)
             self._connection.setbusytimeout(self._busytimeout)
         except CantOpenError as e:
             msg = u"Failed to open connection to %s: %s" % (self.sqlite_db_path, e)
@@ -153,6 +271,11 @@ class SQLiteCacheDB(TaskManager):
         # Enabling WAL on every starup
         cursor.execute(u"PRAGMA journal_mode = WAL;")
 
+        # The WAL is checkpointed in the background (see _maybe_checkpoint) instead of by whichever commit happens to
+        # cross the autocheckpoint threshold on the reactor thread.
+        if not is_in_memory:
+            cursor.execute(u"PRAGMA wal_autocheckpoint = 0;")
+
         # create tables if this is a new database
         if is_new_db and self.db_script_path is not None:
             self._logger.info(u"Initializing new database...")
@@ -184,16 +307,78 @@ class SQLiteCacheDB(TaskManager):
             except (StopIteration, SQLError) as e:
                 msg = u"Failed to load database version: %s" % e
                 raise CorruptedDatabaseError(msg)
+
+            cursor.execute(TEMP_TABLES_SCRIPT)
         else:
             self._version = 1
 
     def get_cursor(self):
-        thread_name = currentThread().getName()
+        thread_local = self._thread_local
+        cursor = getattr(thread_local, 'cursor', None)
+        if cursor is None:
+            with self._lock:
+                cursor = thread_local.cursor = self._connection.cursor()
+                self._cursors.append(cursor)
+        return cursor
+
+    def _start_thread_pools(self):
+        """
+        Starts the thread pools used by the asynchronous database API. They are started on first use so a database
+        that is only used synchronously does not spawn any threads.
+
+        All writes are serialized on a single writer thread that shares the main connection, and thus the currently
+        open transaction. The write lock keeps its statements apart from the ones the reactor executes on the main
+        connection, including the commits. Reads are spread over a pool of threads, each query borrowing one of the
+        read-only connections. An in-memory database cannot be shared between connections, so in that case the reads
+        are executed by the writer thread as well.
+        """
+        with self._lock:
+            if self._write_pool is not None:
+                return
+
+            self._write_pool = ThreadPool(minthreads=1, maxthreads=1, name="SQLiteCacheDB-writer")
+            self._write_pool.start()
+
+            if self._read_pool_size > 0 and self.sqlite_db_path != u":memory:":
+                for _ in xrange(self._read_pool_size):
+                    self._read_connections.put(self._open_read_connection())
+
+                self._read_pool = ThreadPool(minthreads=1, maxthreads=self._read_pool_size,
+                                             name="SQLiteCacheDB-reader")
+                self._read_pool.start()
+
+            self._shutdown_trigger = reactor.addSystemEventTrigger('during', 'shutdown', self._stop_thread_pools)
 
-        with self._cursor_lock:
-            if thread_name not in self._cursor_table:
-                self._cursor_table[thread_name] = self._connection.cursor()
-            return self._cursor_table[thread_name]
+    def _stop_thread_pools(self):
+        """
+        Stops the thread pools, waiting for the queries that are still queued, and closes the read-only connections.
+        """
+        with self._lock:
+            if self._write_pool is None:
+                return
+
+            reactor.removeSystemEventTrigger(self._shutdown_trigger)
+            self._shutdown_trigger = None
+
+            for pool in (self._read_pool, self._write_pool):
+                if pool is not None:
+                    pool.stop()
+            self._read_pool = self._write_pool = None
+
+            while not self._read_connections.empty():
+                self._read_connections.get_nowait().close()
+
+    def _open_read_connection(self):
+        """
+        Opens a read-only connection to the database. Since the database runs in WAL mode, readers never block the
+        writer and only see committed data.
+        """
+        connection = apsw.Connection(self.sqlite_db_path, flags=apsw.SQLITE_OPEN_READONLY,
+                                     statementcachesize=DEFAULT_STATEMENT_CACHE_SIZE)
+        connection.setbusytimeout(self._busytimeout)
+        if self.db_script_path is not None:
+            connection.cursor().execute(TEMP_TABLES_SCRIPT)
+        return connection
 
     @blocking_call_on_reactor_thread
     def initial_begin(self):
@@ -205,6 +390,8 @@ class SQLiteCacheDB(TaskManager):
             self._logger.exception(u"Failed to begin the first transaction")
             raise
         self._should_commit = False
+        self._in_transaction = True
+        self._pending_rows = 0
 
     @blocking_call_on_reactor_thread
     def write_version(self, version):
@@ -219,31 +406,136 @@ class SQLiteCacheDB(TaskManager):
     @call_on_reactor_thread
     def commit_now(self, vacuum=False, exiting=False):
         if self._should_commit and isInIOThread():
-            try:
-                self._logger.info(u"Start committing...")
-                self.execute(u"COMMIT;")
-            except:
-                self._logger.exception(u"COMMIT FAILED")
-                raise
-            self._should_commit = False
+            if self.is_pending_task_active(u"group commit"):
+                self.cancel_pending_task(u"group commit")
 
-            if vacuum:
-                self._logger.info(u"Start vacuuming...")
-                self.execute(u"VACUUM;")
+            # The COMMIT and the next BEGIN are one step for the writer thread, so no async write ends up in between
+            with self._write_lock:
+                if self._writer_batch_running and not exiting:
+                    self._group_commit_call = self.register_task(
+                        u"group commit", reactor.callLater(WRITER_BATCH_COMMIT_RETRY, self.commit_now, vacuum))
+                    return
 
-            if not exiting:
                 try:
-                    self._logger.info(u"Beginning another transaction...")
-                    self.execute(u"BEGIN;")
+                    self._logger.debug(u"Start committing...")
+                    start_time = time()
+                    self.execute(u"COMMIT;")
                 except:
-                    self._logger.exception(u"Failed to execute BEGIN")
+                    self._logger.exception(u"COMMIT FAILED")
                     raise
-            else:
-                self._logger.info(u"Exiting, not beginning another transaction")
+                self._should_commit = False
+                self._async_writes_uncommitted = False
+                self._record_commit(time() - start_time)
+
+                if vacuum:
+                    self._logger.info(u"Start vacuuming...")
+                    self.execute(u"VACUUM;")
+
+                if not exiting:
+                    try:
+                        self._logger.info(u"Beginning another transaction...")
+                        self.execute(u"BEGIN;")
+                    except:
+                        self._logger.exception(u"Failed to execute BEGIN")
+                        raise
+                else:
+                    self._logger.info(u"Exiting, not beginning another transaction")
+                    self._in_transaction = False
+
+            if not exiting:
+                self._maybe_checkpoint()
 
         elif vacuum:
             self.execute(u"VACUUM;")
 
+    def _register_write(self, rows=1):
+        """
+        Accounts for rows written to the open transaction and makes sure it gets committed in time.
+        """
+        self._should_commit = True
+        self._pending_rows += rows
+        if self._in_transaction:
+            self._schedule_group_commit()
+
+    @call_on_reactor_thread
+    def _schedule_group_commit(self):
+        """
+        Makes sure a commit is scheduled at the latency deadline of the oldest uncommitted write, or right away once
+        the row budget is exhausted. The commit itself always runs from its own reactor call so it never ends up in
+        the middle of a caller that is still iterating over a cursor.
+        """
+        delay = 0 if self._pending_rows >= self._commit_max_rows else self._commit_max_delay
+        if not self.is_pending_task_active(u"group commit"):
+            self._group_commit_call = self.register_task(u"group commit",
+                                                         reactor.callLater(delay, self.commit_now))
+        elif delay == 0 and self._group_commit_call.getTime() > reactor.seconds():
+            self._group_commit_call.reset(0)
+
+    def _record_commit(self, latency):
+        self._num_commits += 1
+        self._num_rows_committed += self._pending_rows
+        self._rows_since_checkpoint += self._pending_rows
+        self._pending_rows = 0
+
+        self._total_commit_latency += latency
+        self._last_commit_latency = latency
+        self._max_commit_latency = max(self._max_commit_latency, latency)
+
+    def _maybe_checkpoint(self):
+        """
+        Starts a passive WAL checkpoint in a background thread if enough rows have been committed since the last
+        checkpoint, or if the last checkpoint is too old.
+        """
+        if self.sqlite_db_path == u":memory:" or self._checkpoint_running or not self._rows_since_checkpoint:
+            return
+
+        if self._rows_since_checkpoint < DEFAULT_CHECKPOINT_MAX_ROWS \
+                and time() - self._last_checkpoint_time < DEFAULT_CHECKPOINT_INTERVAL:
+            return
+
+        def on_checkpoint_done(frames_checkpointed):
+            self._checkpoint_running = False
+            self._num_checkpoints += 1
+            self._num_frames_checkpointed += frames_checkpointed
+            self._logger.debug(u"WAL checkpoint done, %d frames checkpointed", frames_checkpointed)
+
+        def on_checkpoint_error(failure):
+            self._checkpoint_running = False
+            self._logger.error(u"WAL checkpoint failed: %s", failure.getErrorMessage())
+
+        self._checkpoint_running = True
+        self._rows_since_checkpoint = 0
+        self._last_checkpoint_time = time()
+        deferToThread(self._checkpoint_wal).addCallbacks(on_checkpoint_done, on_checkpoint_error)
+
+    def _checkpoint_wal(self):
+        """
+        Copies the committed frames of the WAL back into the database, using a dedicated connection so neither the
+        writer nor the readers are blocked. This method is executed in a background thread.
+        :return: the number of checkpointed frames
+        """
+        connection = apsw.Connection(self.sqlite_db_path)
+        try:
+            connection.setbusytimeout(self._busytimeout)
+            _, _, frames_checkpointed = next(connection.cursor().execute(u"PRAGMA wal_checkpoint(PASSIVE);"))
+            return max(frames_checkpointed, 0)
+        finally:
+            connection.close()
+
+    def get_commit_stats(self):
+        """
+        Returns statistics about the group commits and WAL checkpoints of this database.
+        """
+        return {"commits": self._num_commits,
+                "rows_committed": self._num_rows_committed,
+                "pending_rows": self._pending_rows,
+                "avg_rows_per_commit": float(self._num_rows_committed) / self._num_commits if self._num_commits else 0,
+                "avg_commit_latency": self._total_commit_latency / self._num_commits if self._num_commits else 0,
+                "max_commit_latency": self._max_commit_latency,
+                "last_commit_latency": self._last_commit_latency,
+                "checkpoints": self._num_checkpoints,
+                "frames_checkpointed": self._num_frames_checkpointed}
+
     def clean_db(self, vacuum=False, exiting=False):
         self.execute_write(u"DELETE FROM TorrentFiles WHERE torrent_id IN (SELECT torrent_id FROM CollectedTorrent)")
         self.execute_write(u"DELETE FROM Torrent WHERE name IS NULL"
@@ -259,8 +551,21 @@ class SQLiteCacheDB(TaskManager):
 
     @blocking_call_on_reactor_thread
     def execute(self, sql, args=None):
-        cur = self.get_cursor()
+        with self._write_lock:
+            return self._execute(self.get_cursor(), sql, args)
 
+    @blocking_call_on_reactor_thread
+    def executemany(self, sql, args=None):
+        with self._write_lock:
+            result = self._executemany(self.get_cursor(), sql, args)
+        self._register_write(self._count_rows(args))
+        return result
+
+    @staticmethod
+    def _count_rows(args):
+        return len(args) if isinstance(args, (list, tuple)) else 1
+
+    def _execute(self, cur, sql, args=None):
         if self._show_execute:
             thread_name = currentThread().getName()
             self._logger.info(u"===%s===\n%s\n-----\n%s\n======\n", thread_name, sql, args)
@@ -282,11 +587,7 @@ class SQLiteCacheDB(TaskManager):
 
             raise msg
 
-    @blocking_call_on_reactor_thread
-    def executemany(self, sql, args=None):
-        self._should_commit = True
-
-        cur = self.get_cursor()
+    def _executemany(self, cur, sql, args=None):
         if self._show_execute:
             thread_name = currentThread().getName()
             self._logger.info(u"===%s===\n%s\n-----\n%s\n======\n", thread_name, sql, args)
@@ -309,25 +610,25 @@ class SQLiteCacheDB(TaskManager):
         return self.execute(sql, args)
 
     def execute_write(self, sql, args=None):
-        self._should_commit = True
-
         self.execute(sql, args)
+        self._register_write()
 
     def insert_or_ignore(self, table_name, **argv):
-        if len(argv) == 1:
-            sql = u'INSERT OR IGNORE INTO %s (%s) VALUES (?);' % (table_name, argv.keys()[0])
-        else:
-            questions = '?,' * len(argv)
-            sql = u'INSERT OR IGNORE INTO %s %s VALUES (%s);' % (table_name, tuple(argv.keys()), questions[:-1])
-        self.execute_write(sql, argv.values())
+        self._insert(u"INSERT OR IGNORE", table_name, argv)
 
     def insert(self, table_name, **argv):
-        if len(argv) == 1:
-            sql = u'INSERT INTO %s (%s) VALUES (?);' % (table_name, argv.keys()[0])
-        else:
-            questions = '?,' * len(argv)
-            sql = u'INSERT INTO %s %s VALUES (%s);' % (table_name, tuple(argv.keys()), questions[:-1])
-        self.execute_write(sql, argv.values())
+        self._insert(u"INSERT", table_name, argv)
+
+    def _insert(self, verb, table_name, argv):
+        # Columns are always listed in the same order, so every insert into a table with the same set of columns
+        # results in the same SQL and thus in a hit in the statement cache of apsw.
+        columns = tuple(sorted(argv))
+        sql = self._statement_cache.get((verb, table_name, columns), self._build_insert_sql, verb, table_name, columns)
+        self.execute_write(sql, [argv[column] for column in columns])
+
+    @staticmethod
+    def _build_insert_sql(verb, table_name, columns):
+        return u'%s INTO %s (%s) VALUES (%s);' % (verb, table_name, u",".join(columns), u",".join(u"?" * len(columns)))
 
     # TODO: may remove this, only used by test_sqlitecachedb.py
     def insertMany(self, table_name, values, keys=None):
@@ -340,35 +641,52 @@ class SQLiteCacheDB(TaskManager):
             sql = u'INSERT INTO %s %s VALUES (%s);' % (table_name, tuple(keys), questions[:-1])
         self.executemany(sql, values)
 
-    def update(self, table_name, where=None, **argv):
+    def update(self, table_name, where=None, where_args=None, **argv):
+        """ Values in argv are either a value, or a tuple of (operator, value). Parameters of the where clause are
+            passed separately in where_args so the statement can be reused.
+        """
         assert len(argv) > 0, 'NO VALUES TO UPDATE SPECIFIED'
         if len(argv) > 0:
-            sql = u'UPDATE %s SET ' % table_name
-            arg = []
-            for k, v in argv.iteritems():
-                if isinstance(v, tuple):
-                    sql += u'%s %s ?,' % (k, v[0])
-                    arg.append(v[1])
-                else:
-                    sql += u'%s=?,' % k
-                    arg.append(v)
-            sql = sql[:-1]
-            if where is not None:
-                sql += u' WHERE %s' % where
+            columns = tuple(sorted(argv))
+            operators = tuple(argv[k][0] if isinstance(argv[k], tuple) else None for k in columns)
+            sql = self._statement_cache.get((u"UPDATE", table_name, columns, operators, where),
+                                             self._build_update_sql, table_name, columns, operators, where)
+
+            arg = [argv[k][1] if isinstance(argv[k], tuple) else argv[k] for k in columns]
+            if where_args:
+                arg.extend(where_args)
             self.execute_write(sql, arg)
 
+    @staticmethod
+    def _build_update_sql(table_name, columns, operators, where):
+        assignments = []
+        for k, operator in zip(columns, operators):
+            if operator is not None:
+                assignments.append(u'%s %s ?' % (k, operator))
+            else:
+                assignments.append(u'%s=?' % k)
+
+        sql = u'UPDATE %s SET %s' % (table_name, u",".join(assignments))
+        if where is not None:
+            sql += u' WHERE %s' % where
+        return sql
+
     def delete(self, table_name, **argv):
-        sql = u'DELETE FROM %s WHERE ' % table_name
-        arg = []
-        for k, v in argv.iteritems():
-            if isinstance(v, tuple):
-                sql += u'%s %s ? AND ' % (k, v[0])
-                arg.append(v[1])
+        columns = tuple(sorted(argv))
+        operators = tuple(argv[k][0] if isinstance(argv[k], tuple) else None for k in columns)
+        sql = self._statement_cache.get((u"DELETE", table_name, columns, operators),
+                                         self._build_delete_sql, table_name, columns, operators)
+        self.execute_write(sql, [argv[k][1] if isinstance(argv[k], tuple) else argv[k] for k in columns])
+
+    @staticmethod
+    def _build_delete_sql(table_name, columns, operators):
+        conditions = []
+        for k, operator in zip(columns, operators):
+            if operator is not None:
+                conditions.append(u'%s %s ?' % (k, operator))
             else:
-                sql += u'%s=? AND ' % k
-                arg.append(v)
-        sql = sql[:-5]
-        self.execute_write(sql, arg)
+                conditions.append(u'%s=?' % k)
+        return u'DELETE FROM %s WHERE %s' % (table_name, u" AND ".join(conditions))
 
     # -------- Read Operations --------
     def size(self, table_name):
@@ -381,15 +699,16 @@ class SQLiteCacheDB(TaskManager):
         find = self.execute_read(sql, args)
         if not find:
             return
+        return self._fetchone_result(sql, list(find))
+
+    def _fetchone_result(self, sql, find):
+        if len(find) > 0:
+            if len(find) > 1:
+                self._logger.debug(
+                    u"FetchONE resulted in many more rows than one, consider putting a LIMIT 1 in the sql statement %s, %s", sql, len(find))
+            find = find[0]
         else:
-            find = list(find)
-            if len(find) > 0:
-                if len(find) > 1:
-                    self._logger.debug(
-                        u"FetchONE resulted in many more rows than one, consider putting a LIMIT 1 in the sql statement %s, %s", sql, len(find))
-                find = find[0]
-            else:
-                return
+            return
         if len(find) > 1:
             return find
         else:
@@ -407,89 +726,67 @@ class SQLiteCacheDB(TaskManager):
     def getOne(self, table_name, value_name, where=None, conj=u"AND", **kw):
         """ value_name could be a string, a tuple of strings, or '*'
         """
-        if isinstance(value_name, tuple):
-            value_names = u",".join(value_name)
-        elif isinstance(value_name, list):
-            value_names = u",".join(value_name)
-        else:
-            value_names = value_name
-
-        if isinstance(table_name, tuple):
-            table_names = u",".join(table_name)
-        elif isinstance(table_name, list):
-            table_names = u",".join(table_name)
-        else:
-            table_names = table_name
-
-        sql = u'SELECT %s FROM %s' % (value_names, table_names)
-
-        if where or kw:
-            sql += u' WHERE '
-        if where:
-            sql += where
-            if kw:
-                sql += u' %s ' % conj
-        if kw:
-            arg = []
-            for k, v in kw.iteritems():
-                if isinstance(v, tuple):
-                    operator = v[0]
-                    arg.append(v[1])
-                else:
-                    operator = "="
-                    arg.append(v)
-                sql += u' %s %s ? ' % (k, operator)
-                sql += conj
-            sql = sql[:-len(conj)]
-        else:
-            arg = None
-
-        # print >> sys.stderr, 'SQL: %s %s' % (sql, arg)
+        sql, arg = self._get_one_sql(table_name, value_name, where=where, conj=conj, **kw)
         return self.fetchone(sql, arg)
 
+    def _get_one_sql(self, table_name, value_name, where=None, conj=u"AND", **kw):
+        return self._get_all_sql(table_name, value_name, where=where, conj=conj, **kw)
+
     def getAll(self, table_name, value_name, where=None, group_by=None, having=None, order_by=None, limit=None,
                offset=None, conj=u"AND", **kw):
         """ value_name could be a string, or a tuple of strings
             order by is represented as order_by
             group by is represented as group_by
         """
-        if isinstance(value_name, tuple):
-            value_names = u",".join(value_name)
-        elif isinstance(value_name, list):
-            value_names = u",".join(value_name)
-        else:
-            value_names = value_name
+        sql, arg = self._get_all_sql(table_name, value_name, where=where, group_by=group_by, having=having,
+                                     order_by=order_by, limit=limit, offset=offset, conj=conj, **kw)
+        try:
+            return self.fetchall(sql, arg) or []
+        except Exception as msg:
+            self._logger.exception(u"Wrong getAll sql statement: %s", sql)
+            raise Exception(msg)
 
-        if isinstance(table_name, tuple):
-            table_names = u",".join(table_name)
-        elif isinstance(table_name, list):
-            table_names = u",".join(table_name)
-        else:
-            table_names = table_name
+    def _get_all_sql(self, table_name, value_name, where=None, group_by=None, having=None, order_by=None, limit=None,
+                     offset=None, conj=u"AND", **kw):
+        """
+        Returns the (cached) SELECT statement and its parameters for getOne/getAll.
+        """
+        if isinstance(value_name, list):
+            value_name = tuple(value_name)
+        if isinstance(table_name, list):
+            table_name = tuple(table_name)
+
+        columns = tuple(sorted(kw))
+        operators = tuple(kw[k][0] if isinstance(kw[k], tuple) else u"=" for k in columns)
+        has_limit = limit is not None
+        has_offset = offset is not None
+
+        key = (u"SELECT", table_name, value_name, where, conj, columns, operators, group_by, having, order_by,
+               has_limit, has_offset)
+        sql = self._statement_cache.get(key, self._build_select_sql, table_name, value_name, where, conj, columns,
+                                        operators, group_by, having, order_by, has_limit, has_offset)
+
+        arg = [kw[k][1] if isinstance(kw[k], tuple) else kw[k] for k in columns]
+        if has_limit:
+            arg.append(limit)
+        if has_offset:
+            arg.append(offset)
+
+        return sql, arg or None
+
+    @staticmethod
+    def _build_select_sql(table_name, value_name, where, conj, columns, operators, group_by, having, order_by,
+                          has_limit, has_offset):
+        value_names = u",".join(value_name) if isinstance(value_name, tuple) else value_name
+        table_names = u",".join(table_name) if isinstance(table_name, tuple) else table_name
 
         sql = u'SELECT %s FROM %s' % (value_names, table_names)
 
-        if where or kw:
-            sql += u' WHERE '
+        conditions = [u'%s %s ?' % (k, operator) for k, operator in zip(columns, operators)]
         if where:
-            sql += where
-            if kw:
-                sql += u' %s ' % conj
-        if kw:
-            arg = []
-            for k, v in kw.iteritems():
-                if isinstance(v, tuple):
-                    operator = v[0]
-                    arg.append(v[1])
-                else:
-                    operator = u"="
-                    arg.append(v)
-
-                sql += u' %s %s ?' % (k, operator)
-                sql += conj
-            sql = sql[:-len(conj)]
-        else:
-            arg = None
+            conditions.insert(0, where)
+        if conditions:
+            sql += u' WHERE ' + (u' %s ' % conj).join(conditions)
 
         if group_by is not None:
             sql += u' GROUP BY ' + group_by
@@ -498,13 +795,104 @@ class SQLiteCacheDB(TaskManager):
         if order_by is not None:
             # you should add desc after order_by to reversely sort, i.e, 'last_seen desc' as order_by
             sql += u' ORDER BY ' + order_by
-        if limit is not None:
-            sql += u' LIMIT %d' % limit
-        if offset is not None:
-            sql += u' OFFSET %d' % offset
+        if has_limit:
+            sql += u' LIMIT ?'
+        if has_offset:
+            sql += u' OFFSET ?'
 
+        return sql
+
+    def get_statement_cache_stats(self):
+        """
+        Returns the size and hit rate of the statement cache.
+        """
+        return self._statement_cache.get_stats()
+
+    # -------- Asynchronous Operations --------
+    # These methods never block the reactor: they return a Deferred that fires with the result on the reactor thread.
+    # Writes are queued on the writer thread, reads are executed on a read-only connection. Since read-only
+    # connections only see committed data, reads are sent to the writer thread (which shares the open transaction)
+    # as long as there are uncommitted asynchronous writes, so callers always read their own asynchronous writes.
+    # Writes that the reactor made synchronously show up in asynchronous reads once they are committed, at most
+    # commit_max_delay seconds later. This way an asynchronous read only holds the write lock, and thus blocks the
+    # reactor, right after asynchronous writes.
+
+    def execute_write_async(self, sql, args=None):
+        return self._defer_write(self._execute_on_writer, sql, args, 1)
+
+    def executemany_async(self, sql, args=None):
+        return self._defer_write(self._executemany_on_writer, sql, args, self._count_rows(args))
+
+    def fetchall_async(self, sql, args=None):
+        self._start_thread_pools()
+        if self._async_writes_uncommitted or self._pending_async_writes or self._read_pool is None:
+            return self._defer_to_writer(self._fetchall_on_writer, sql, args)
+        return deferToThreadPool(reactor, self._read_pool, self._fetchall_on_reader, sql, args)
+
+    def fetchone_async(self, sql, args=None):
+        return self.fetchall_async(sql, args).addCallback(lambda find: self._fetchone_result(sql, find))
+
+    def get_one_async(self, table_name, value_name, where=None, conj=u"AND", **kw):
+        sql, arg = self._get_one_sql(table_name, value_name, where=where, conj=conj, **kw)
+        return self.fetchone_async(sql, arg)
+
+    def get_all_async(self, table_name, value_name, where=None, group_by=None, having=None, order_by=None,
+                      limit=None, offset=None, conj=u"AND", **kw):
+        sql, arg = self._get_all_sql(table_name, value_name, where=where, group_by=group_by, having=having,
+                                     order_by=order_by, limit=limit, offset=offset, conj=conj, **kw)
+        return self.fetchall_async(sql, arg)
+
+    def _defer_write(self, func, sql, args, rows):
+        """
+        Queues a write on the writer thread. The rows only count towards the group commit once they have actually
+        been written to the open transaction.
+        """
+        def on_written(result):
+            self._register_write(rows)
+            self._pending_async_writes -= 1
+            self._async_writes_uncommitted = True
+            return result
+
+        # Reads go through the writer thread from now on, until the write has been committed
+        self._should_commit = True
+        self._async_writes_uncommitted = True
+        self._pending_async_writes += 1
+        return self._defer_to_writer(func, sql, args).addBoth(on_written)
+
+    def _defer_to_writer(self, func, *args):
+        self._start_thread_pools()
+        return deferToThreadPool(reactor, self._write_pool, func, *args)
+
+    def _execute_on_writer(self, sql, args):
+        with self._write_lock:
+            self._execute(self.get_cursor(), sql, args)
+
+    def _executemany_on_writer(self, sql, args):
+        if not isinstance(args, (list, tuple)) or len(args) <= WRITER_CHUNK_SIZE:
+            with self._write_lock:
+                self._executemany(self.get_cursor(), sql, args)
+            return
+
+        # The reactor may execute its own statements between the chunks, but commit_now waits for the whole batch
+        self._writer_batch_running = True
         try:
-            return self.fetchall(sql, arg) or []
-        except Exception as msg:
-            self._logger.exception(u"Wrong getAll sql statement: %s", sql)
-            raise Exception(msg)
+            for start in xrange(0, len(args), WRITER_CHUNK_SIZE):
+                with self._write_lock:
+                    self._executemany(self.get_cursor(), sql, args[start:start + WRITER_CHUNK_SIZE])
+        finally:
+            self._writer_batch_running = False
+
+    def _fetchall_on_writer(self, sql, args):
+        with self._write_lock:
+            return list(self._execute(self.get_cursor(), sql, args) or [])
+
+    def _fetchall_on_reader(self, sql, args):
+        connection = self._read_connections.get()
+        try:
+            cursor = connection.cursor()
+            try:
+                return list(self._execute(cursor, sql, args) or [])
+            finally:
+                cursor.close()
+        finally:
+            self._read_connections.put(connection)
@@ -0,0 +1,235 @@
+"""
+In-memory index over the terms in the names of torrents, used for search suggestions and autocompletion.
+"""
+import heapq
+import threading
+from bisect import bisect_left, insort
+from collections import defaultdict
+
+# Maximum edit distance between a keyword and a term to consider the term a suggestion for the keyword.
+DEFAULT_MAX_DISTANCE = 2
+
+# Maximum number of terms, sharing the most trigrams with a keyword, for which the edit distance is computed.
+MAX_SIMILAR_CANDIDATES = 200
+
+
+def levenshtein_distance(a, b, max_distance=None):
+    """
+    Calculates the Levenshtein distance between a and b.
+    If max_distance is given, the computation stops as soon as the distance is known to exceed it, in which case
+    max_distance + 1 is returned.
+    """
+    n, m = len(a), len(b)
+    if n > m:
+        # Make sure n <= m, to use O(min(n,m)) space
+        a, b = b, a
+        n, m = m, n
+
+    if max_distance is not None and m - n > max_distance:
+        return max_distance + 1
+
+    current = range(n + 1)
+    for i in range(1, m + 1):
+        previous, current = current, [i] + [0] * n
+        for j in range(1, n + 1):
+            add, delete = previous[j] + 1, current[j - 1] + 1
+            change = previous[j - 1]
+            if a[j - 1] != b[i - 1]:
+                change = change + 1
+            current[j] = min(add, delete, change)
+
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+
+    return current[n]
+
+
+def get_trigrams(term):
+    """
+    Return the set of trigrams of a term, padded so the start and end of the term get their own trigrams.
+    """
+    padded = "  %s " % term
+    return set(padded[i:i + 3] for i in xrange(len(padded) - 2))
+
+
+def rank_suggestions(swarmnames, keywords, limit):
+    """
+    Order swarmnames by the sum of the smallest edit distances between their terms and the keywords, and return the
+    best ones. Swarmnames with an equal distance keep their original order.
+    """
+    distances = {}
+
+    def distance(term, keyword):
+        if (term, keyword) not in distances:
+            distances[term, keyword] = levenshtein_distance(term, keyword)
+        return distances[term, keyword]
+
+    def score(swarmname):
+        return sum(sorted([distance(term, keyword) for term in swarmname.split() for keyword in keywords])
+                   [:len(keywords)])
+
+    return sorted(swarmnames, key=score)[:limit]
+
+
+class TermIndex(object):
+    """
+    Keeps track of the number of torrents every term in a torrent name appears in. Terms can be looked up by prefix,
+    using a sorted list of terms, and by edit distance, using a trigram inverted index.
+
+    The index is loaded once from the term frequencies that SQLite keeps for the full text index, so nothing has to be
+    tokenized or counted at startup, and then maintained incrementally when torrents are indexed. Since torrents that
+    are re-indexed afterwards are counted again, the frequencies are approximate until the next load.
+    """
+
+    def __init__(self, max_distance=DEFAULT_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.loaded = False
+
+        self._loading = False
+        self._pending_swarmnames = []
+        self._lock = threading.RLock()
+        self._term_frequencies = {}
+        self._sorted_terms = []
+        self._trigram_terms = defaultdict(set)
+
+    def begin_loading(self):
+        """
+        Start collecting the names of newly indexed torrents, to add them once the index is loaded. Call this before
+        reading the names of the indexed torrents from the database, so torrents indexed in the meantime are not missed.
+        """
+        with self._lock:
+            if not self.loaded:
+                self._loading = True
+
+    def load(self, term_frequencies):
+        """
+        Load the index from an iterable of (term, frequency) tuples, with the number of torrents every term appears in.
+        The index is built without holding the lock, so this can be called from any thread, after which the names of
+        torrents that were indexed since begin_loading was called are added.
+        """
+        with self._lock:
+            if self.loaded:
+                return
+            self._loading = True
+
+        try:
+            frequencies = {}
+            trigram_terms = defaultdict(set)
+            for term, frequency in term_frequencies:
+                frequencies[term] = frequencies.get(term, 0) + frequency
+                for trigram in get_trigrams(term):
+                    trigram_terms[trigram].add(term)
+            sorted_terms = sorted(frequencies)
+        except:
+            self.abort_loading()
+            raise
+
+        with self._lock:
+            self._term_frequencies = frequencies
+            self._sorted_terms = sorted_terms
+            self._trigram_terms = trigram_terms
+            for swarmname in self._pending_swarmnames:
+                self._add_terms(swarmname)
+            self._pending_swarmnames = []
+            self._loading = False
+            self.loaded = True
+
+    def abort_loading(self):
+        """
+        Stop collecting the names of newly indexed torrents, after loading the index failed.
+        """
+        with self._lock:
+            self._loading = False
+            self._pending_swarmnames = []
+
+    def add_swarmname(self, swarmname):
+        """
+        Add the terms in the name of a newly indexed torrent. Ignored until the index is being loaded, since the
+        torrent will then be read from the database. This method does not wait for the index to be loaded.
+        """
+        with self._lock:
+            if self._loading:
+                self._pending_swarmnames.append(swarmname)
+            elif self.loaded:
+                self._add_terms(swarmname)
+
+    def _add_terms(self, swarmname):
+        for term in set((swarmname or u"").split()):
+            if term in self._term_frequencies:
+                self._term_frequencies[term] += 1
+                continue
+
+            self._term_frequencies[term] = 1
+            insort(self._sorted_terms, term)
+            for trigram in get_trigrams(term):
+                self._trigram_terms[trigram].add(term)
+
+    def get_frequency(self, term):
+        return self._term_frequencies.get(term, 0)
+
+    def get_completions(self, prefix, max_terms):
+        """
+        Return the terms starting with prefix, most frequent first. The prefix itself is not returned.
+        """
+        with self._lock:
+            completions = []
+            index = bisect_left(self._sorted_terms, prefix)
+            while index < len(self._sorted_terms) and self._sorted_terms[index].startswith(prefix):
+                if self._sorted_terms[index] != prefix:
+                    completions.append(self._sorted_terms[index])
+                index += 1
+
+            completions.sort(key=lambda term: (-self._term_frequencies[term], term))
+            return completions[:max_terms]
+
+    def get_similar_terms(self, keyword, max_distance=None):
+        """
+        Return a dictionary with the terms within max_distance edits of keyword and their edit distance.
+        Candidate terms are those sharing enough trigrams with the keyword, since every edit changes at most three of
+        them. Only the MAX_SIMILAR_CANDIDATES candidates sharing the most trigrams are verified by computing their
+        edit distance, which bounds the cost of a lookup in a large index.
+        """
+        if max_distance is None:
+            max_distance = self.max_distance
+
+        keyword_trigrams = get_trigrams(keyword)
+
+        with self._lock:
+            shared_trigrams = defaultdict(int)
+            for trigram in keyword_trigrams:
+                for term in self._trigram_terms.get(trigram, ()):
+                    shared_trigrams[term] += 1
+
+        # A keyword of length l has l + 1 trigrams, of which every edit changes at most three
+        min_shared = len(keyword) + 1 - 3 * max_distance
+        candidates = [(num_shared, term) for term, num_shared in shared_trigrams.iteritems()
+                      if num_shared >= min_shared]
+
+        similar_terms = {}
+        for _, term in heapq.nlargest(MAX_SIMILAR_CANDIDATES, candidates):
+            distance = levenshtein_distance(term, keyword, max_distance)
+            if distance <= max_distance:
+                similar_terms[term] = distance
+        return similar_terms
+
+    def get_suggestion_terms(self, keywords, max_terms):
+        """
+        Return the terms that best match any of the keywords, either because they start with a keyword or because
+        they are within a few edits of it. Closer and more frequent terms come first.
+        """
+        distances = {}
+        for keyword in keywords:
+            for term, distance in self.get_similar_terms(keyword).iteritems():
+                distances[term] = min(distance, distances.get(term, distance))
+            for term in self.get_completions(keyword, max_terms):
+                distance = len(term) - len(keyword)
+                distances[term] = min(distance, distances.get(term, distance))
+            if keyword in self._term_frequencies:
+                distances[keyword] = 0
+
+        return sorted(distances, key=lambda term: (distances[term], -self.get_frequency(term), term))[:max_terms]
+
+    def get_stats(self):
+        with self._lock:
+            return {"loaded": self.loaded, "terms": len(self._term_frequencies),
+                    "trigrams": len(self._trigram_terms)}
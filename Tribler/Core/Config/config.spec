@@ -16,6 +16,9 @@ enabled = boolean(default=True)
 
 [search_community]
 enabled = boolean(default=True)
+bm25_column_weights = float_list(default=list(0.8, 0.1, 0.1))
+bm25_k1 = float(default=1.2)
+bm25_b = float(default=0.0)
 
 [tunnel_community]
 enabled = boolean(default=True)
@@ -67,6 +70,7 @@ max_connections_download = integer(default=-1)
 max_download_rate = integer(default=0)
 max_upload_rate = integer(default=0)
 utp = boolean(default=True)
+max_metainfo_requests = integer(min=1, default=10)
 
 anon_listen_port = integer(min=-1, max=65536, default=-1)
 anon_proxy_type = integer(min=0, max=5, default=0)
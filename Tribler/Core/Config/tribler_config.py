@@ -395,6 +395,23 @@ class TriblerConfig(object):
         """
         return self.config['libtorrent'].as_int('max_download_rate')
 
+    def set_libtorrent_max_metainfo_requests(self, value):
+        """
+        Sets the maximum number of metainfo lookups that run at the same time, apart from lookups for the GUI.
+
+        :param value: the new maximum number of concurrent metainfo lookups
+        :return:
+        """
+        self.config['libtorrent']['max_metainfo_requests'] = value
+
+    def get_libtorrent_max_metainfo_requests(self):
+        """
+        Gets the maximum number of metainfo lookups that run at the same time, apart from lookups for the GUI.
+
+        :return: the maximum number of concurrent metainfo lookups
+        """
+        return self.config['libtorrent'].as_int('max_metainfo_requests')
+
     # Mainline DHT
 
     def set_mainline_dht_enabled(self, value):
@@ -556,6 +573,24 @@ class TriblerConfig(object):
     def get_torrent_search_enabled(self):
         return self.config['search_community']['enabled']
 
+    def set_search_bm25_column_weights(self, value):
+        self.config['search_community']['bm25_column_weights'] = value
+
+    def get_search_bm25_column_weights(self):
+        return self.config['search_community']['bm25_column_weights']
+
+    def set_search_bm25_k1(self, value):
+        self.config['search_community']['bm25_k1'] = value
+
+    def get_search_bm25_k1(self):
+        return self.config['search_community']['bm25_k1']
+
+    def set_search_bm25_b(self, value):
+        self.config['search_community']['bm25_b'] = value
+
+    def get_search_bm25_b(self):
+        return self.config['search_community']['bm25_b']
+
     # AllChannel Community
 
     def set_channel_search_enabled(self, mode):
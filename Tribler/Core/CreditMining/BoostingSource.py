@@ -263,7 +263,7 @@ class ChannelSource(BoostingSource):
                 self._logger.debug("Registering check torrent function")
                 task_call.start(self.check_torrent_interval, now=True)
 
-    def _on_database_updated(self, dummy_subject, dummy_change_type, dummy_infohash):
+    def _on_database_updated(self, dummy_subject, dummy_change_type, dummy_infohash, *dummy_args):
         self.database_updated = True
 
     def get_source_text(self):
@@ -105,6 +105,14 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
 
     """ Download subclass that represents a libtorrent download."""
 
+    # Name of the alert type -> name of the method that handles it
+    alert_handlers = {alert_type: 'on_' + alert_type for alert_type in (
+        'tracker_reply_alert', 'tracker_error_alert', 'tracker_warning_alert', 'metadata_received_alert',
+        'file_renamed_alert', 'performance_alert', 'torrent_checked_alert', 'torrent_finished_alert',
+        'save_resume_data_alert', 'save_resume_data_failed_alert')}
+    logged_alert_categories = frozenset([lt.alert.category_t.error_notification,
+                                         lt.alert.category_t.performance_warning])
+
     def __init__(self, session, tdef):
         super(LibtorrentDownloadImpl, self).__init__()
 
@@ -131,6 +139,8 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
         self.dlstates = [DLSTATUS_WAITING4HASHCHECK, DLSTATUS_HASHCHECKING, DLSTATUS_METADATA, DLSTATUS_DOWNLOADING,
                          DLSTATUS_SEEDING, DLSTATUS_SEEDING, DLSTATUS_ALLOCATING_DISKSPACE, DLSTATUS_HASHCHECKING]
         self.dlstate = DLSTATUS_WAITING4HASHCHECK
+        # The last torrent_status of the handle
+        self.lt_status = None
         self.length = 0
         self.progress = 0.0
         self.curspeeds = {DOWNLOAD: 0.0, UPLOAD: 0.0}  # bytes/s
@@ -303,7 +313,9 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
             atp["hops"] = self.get_hops()
 
             if share_mode:
-                atp["flags"] = lt.add_torrent_params_flags_t.flag_share_mode
+                # Setting the flags replaces the default ones, keep the subscription to the state updates
+                atp["flags"] = lt.add_torrent_params_flags_t.flag_share_mode | \
+                    getattr(lt.add_torrent_params_flags_t, 'flag_update_subscribe', 0)
 
             self.set_checkpoint_disabled(checkpoint_disabled)
 
@@ -336,6 +348,7 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
                 atp["url"] = self.tdef.get_url() or "magnet:?xt=urn:btih:" + hexlify(self.tdef.get_infohash())
                 atp["name"] = self.tdef.get_name_as_unicode()
 
+            self.lt_status = None
             self.handle = self.ltmgr.add_torrent(self, atp)
             # assert self.handle.status().share_mode == share_mode
             if self.handle.is_valid():
@@ -525,22 +538,23 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
 
     @checkHandleAndSynchronize()
     def process_alert(self, alert, alert_type):
-        if alert.category() in [lt.alert.category_t.error_notification, lt.alert.category_t.performance_warning]:
+        if alert.category() in self.logged_alert_categories:
             self._logger.debug("LibtorrentDownloadImpl: alert %s with message %s", alert_type, alert)
 
-        alert_types = ('tracker_reply_alert', 'tracker_error_alert', 'tracker_warning_alert', 'metadata_received_alert',
-                       'file_renamed_alert', 'performance_alert', 'torrent_checked_alert', 'torrent_finished_alert',
-                       'save_resume_data_alert', 'save_resume_data_failed_alert')
-
-        if alert_type in alert_types:
-            getattr(self, 'on_' + alert_type)(alert)
-        else:
+        handler = self.alert_handlers.get(alert_type)
+        if handler:
+            getattr(self, handler)(alert)
+        elif not self.ltmgr.state_updates_enabled:
             self.update_lt_stats()
 
+    @checkHandleAndSynchronize()
+    def on_state_update(self, status):
+        self.update_lt_stats(status)
+
     def on_save_resume_data_alert(self, alert):
         """
         Callback for the alert that contains the resume data of a specific download.
-        This resume data will be written to a file on disk.
+        This resume data will be written to the resume store of the session.
         """
         resume_data = alert.resume_data
 
@@ -548,13 +562,9 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
         self.pstate_for_restart.set('state', 'engineresumedata', resume_data)
         self._logger.debug("%s get resume data %s", hexlify(resume_data['info-hash']), resume_data)
 
-        # save it to file
-        basename = hexlify(resume_data['info-hash']) + '.state'
-        filename = os.path.join(self.session.get_downloads_pstate_dir(), basename)
+        self._logger.debug("tlm: network checkpointing: %s", hexlify(resume_data['info-hash']))
 
-        self._logger.debug("tlm: network checkpointing: to file %s", filename)
-
-        self.pstate_for_restart.write_file(filename)
+        self.session.lm.save_download_pstate(resume_data['info-hash'], self.pstate_for_restart)
 
         # fire callback for all deferreds_resume
         for deferred_r in self.deferreds_resume:
@@ -680,9 +690,12 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
                 self.set_byte_priority([(self.get_vod_fileindex(), 0, -1)], 1)
                 self.endbuffsize = 0
 
-    def update_lt_stats(self):
-        """ Update libtorrent stats and check if the download should be stopped."""
-        status = self.handle.status()
+    def update_lt_stats(self, status=None):
+        """ Update libtorrent stats from a torrent_status, or the status of the handle, and check if the download
+        should be stopped."""
+        if status is None:
+            status = self.handle.status()
+        self.lt_status = status
         self.dlstate = self.dlstates[status.state] if not status.paused else DLSTATUS_STOPPED
         self.dlstate = DLSTATUS_STOPPED_ON_ERROR if self.dlstate == DLSTATUS_STOPPED and status.error else self.dlstate
         if self.get_mode() == DLMODE_VOD:
@@ -895,7 +908,7 @@ class LibtorrentDownloadImpl(DownloadConfigInterface, TaskManager):
 
     @checkHandleAndSynchronize()
     def network_create_statistics_reponse(self):
-        status = self.handle.status()
+        status = self.lt_status if self.lt_status is not None else self.handle.status()
         numTotSeeds = status.num_complete if status.num_complete >= 0 else status.list_seeds
         numTotPeers = status.num_incomplete if status.num_incomplete >= 0 else status.list_peers
         numleech = max(status.num_peers - status.num_seeds, 0)  # When anon downloading, this might become negative
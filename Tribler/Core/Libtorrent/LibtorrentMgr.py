@@ -6,12 +6,12 @@ Author(s): Egbert Bouman
 import binascii
 import logging
 import os
-import random
 import tempfile
 import threading
 import time
 from binascii import hexlify
-from copy import deepcopy
+from collections import defaultdict, deque
+from heapq import heappop, heappush
 from shutil import rmtree
 from urllib import url2pathname
 
@@ -21,24 +21,30 @@ from twisted.internet.defer import succeed, fail
 from twisted.python.failure import Failure
 
 from Tribler.Core.DownloadConfig import DefaultDownloadStartupConfig
+from Tribler.Core.Libtorrent.metainfo_cache import MetainfoCache
 from Tribler.Core.TorrentDef import TorrentDef, TorrentDefNoMetainfo
 from Tribler.Core.Utilities.torrent_utils import get_info_from_handle
 from Tribler.Core.Utilities.utilities import parse_magnetlink, fix_torrent
 from Tribler.Core.exceptions import DuplicateDownloadException, TorrentFileException
-from Tribler.Core.simpledefs import (NTFY_INSERT, NTFY_MAGNET_CLOSE, NTFY_MAGNET_GOT_PEERS, NTFY_MAGNET_STARTED,
-                                     NTFY_REACHABLE, NTFY_TORRENTS)
+from Tribler.Core.simpledefs import (METAINFO_PRIORITY_GUI, NTFY_INSERT, NTFY_MAGNET_CLOSE, NTFY_MAGNET_GOT_PEERS,
+                                     NTFY_MAGNET_STARTED, NTFY_REACHABLE, NTFY_TORRENTS)
 from Tribler.Core.version import version_id
 from Tribler.dispersy.taskmanager import LoopingCall, TaskManager
 from Tribler.dispersy.util import blocking_call_on_reactor_thread, call_on_reactor_thread
 
 LTSTATE_FILENAME = "lt.state"
-METAINFO_CACHE_PERIOD = 5 * 60
 DHT_CHECK_RETRIES = 1
+# Maximum number of alerts that are processed in one reactor iteration
+ALERT_BATCH_SIZE = 200
+# Number of seconds of the first attempt of a metainfo lookup, every next attempt takes twice as long
+METAINFO_ATTEMPT_TIMEOUT = 15
+# Number of seconds before the second attempt of a metainfo lookup, doubled for every next attempt
+METAINFO_RETRY_DELAY = 5
 
 
 class LibtorrentMgr(TaskManager):
 
-    def __init__(self, tribler_session):
+    def __init__(self, tribler_session, torrent_store=None):
         super(LibtorrentMgr, self).__init__()
         self._logger = logging.getLogger(self.__class__.__name__)
 
@@ -59,7 +65,30 @@ class LibtorrentMgr(TaskManager):
         self.metadata_tmpdir = None
         self.metainfo_requests = {}
         self.metainfo_lock = threading.RLock()
-        self.metainfo_cache = {}
+        self.metainfo_cache = MetainfoCache(torrent_store)
+        # Heap of (priority, sequence number, infohash) of the lookups that wait for room in the window
+        self.metainfo_queue = []
+        self.metainfo_sequence = 0
+        # The infohashes of the lookups that have a handle in the session
+        self.metainfo_active = set()
+        self.max_metainfo_requests = 10
+        self.metainfo_fetch_times = deque()
+        self.metainfo_stats = {'succeeded': 0, 'timed_out': 0, 'retries': 0, 'joined': 0}
+
+        # Libtorrent 1.0 and newer can report the statuses of the torrents that changed, instead of being asked for
+        # the status of every torrent
+        self.state_updates_enabled = hasattr(lt.session, 'post_torrent_updates')
+        # infohash -> (torrent_status, DownloadState), the state of a download as of its last reported status
+        self.download_states = {}
+
+        # Alerts that libtorrent handed over and that still have to be processed
+        self.alerts = deque()
+        self.alerts_notified = False
+        self.process_alerts_call = None
+        # Alerts that are handled by the manager itself, by the name of their type
+        self.alert_handlers = {'state_update_alert': self.on_state_update_alert}
+        # alert type -> [number of alerts, seconds spent processing them]
+        self.alert_stats = defaultdict(lambda: [0, 0.0])
 
         self.process_alerts_lc = self.register_task("process_alerts", LoopingCall(self._task_process_alerts))
         self.check_reachability_lc = self.register_task("check_reachability", LoopingCall(self._check_reachability))
@@ -71,18 +100,20 @@ class LibtorrentMgr(TaskManager):
 
         # make temporary directory for metadata collecting through DHT
         self.metadata_tmpdir = tempfile.mkdtemp(suffix=u'tribler_metainfo_tmpdir')
+        self.max_metainfo_requests = self.tribler_session.config.get_libtorrent_max_metainfo_requests()
 
         # register tasks
         self.process_alerts_lc.start(1, now=False)
         self.check_reachability_lc.start(5, now=True)
         self._schedule_next_check(5, DHT_CHECK_RETRIES)
-
-        self.register_task(u'task_cleanup_metacache',
-                           LoopingCall(self._task_cleanup_metainfo_cache)).start(60, now=True)
+        self.register_task("check_metainfo_requests",
+                           LoopingCall(self._task_check_metainfo_requests)).start(1, now=False)
 
     @blocking_call_on_reactor_thread
     def shutdown(self):
         self.cancel_all_pending_tasks()
+        # The alerts that were not processed yet are invalid once their session is gone
+        self.alerts.clear()
 
         # remove all upnp mapping
         for upnp_handle in self.upnp_mapping_dict.itervalues():
@@ -140,12 +171,17 @@ class LibtorrentMgr(TaskManager):
             ltsession.add_extension(lt.create_smart_ban_plugin)
 
         ltsession.set_settings(settings)
-        ltsession.set_alert_mask(lt.alert.category_t.stats_notification |
+        # With state updates the stats alerts are not needed to keep the downloads up to date
+        stats_notification = 0 if self.state_updates_enabled else lt.alert.category_t.stats_notification
+        ltsession.set_alert_mask(stats_notification |
                                  lt.alert.category_t.error_notification |
                                  lt.alert.category_t.status_notification |
                                  lt.alert.category_t.storage_notification |
                                  lt.alert.category_t.performance_warning |
                                  lt.alert.category_t.tracker_notification)
+        if hasattr(ltsession, 'set_alert_notify'):
+            # Libtorrent 1.1 and newer let us know when there are alerts, instead of waiting for the next poll
+            ltsession.set_alert_notify(self._on_alert_notify)
 
         # Load proxy settings
         if hops == 0:
@@ -274,6 +310,7 @@ class LibtorrentMgr(TaskManager):
             if infohash in self.metainfo_requests:
                 self._logger.info("killing get_metainfo request for %s", infohash)
                 request_handle = self.metainfo_requests.pop(infohash)['handle']
+                self.metainfo_active.discard(infohash)
                 if request_handle:
                     ltsession.remove_torrent(request_handle, 0)
 
@@ -294,6 +331,7 @@ class LibtorrentMgr(TaskManager):
             if infohash in self.torrents:
                 self.torrents[infohash][1].remove_torrent(handle, int(removecontent))
                 del self.torrents[infohash]
+                self.download_states.pop(infohash, None)
                 self._logger.debug("remove torrent %s", infohash)
             else:
                 self._logger.debug("cannot remove torrent %s because it does not exists", infohash)
@@ -317,34 +355,79 @@ class LibtorrentMgr(TaskManager):
             self._logger.warning("port mapping method not exposed in libtorrent")
 
     def process_alert(self, alert):
-        alert_type = str(type(alert)).split("'")[1].split(".")[-1]
-        handle = getattr(alert, 'handle', None)
-        if handle:
-            if handle.is_valid():
-                infohash = str(handle.info_hash())
-                if infohash in self.torrents:
-                    self.torrents[infohash][0].process_alert(alert, alert_type)
-                elif infohash in self.metainfo_requests:
-                    if isinstance(alert, lt.metadata_received_alert):
-                        self.got_metainfo(infohash)
+        alert_type = type(alert).__name__
+        start_time = time.time()
+
+        handler = self.alert_handlers.get(alert_type)
+        if handler:
+            handler(alert)
+        else:
+            handle = getattr(alert, 'handle', None)
+            if handle:
+                if handle.is_valid():
+                    infohash = str(handle.info_hash())
+                    if infohash in self.torrents:
+                        self.torrents[infohash][0].process_alert(alert, alert_type)
+                    elif infohash in self.metainfo_requests:
+                        # The alert may be for a handle that was removed to try the lookup again later
+                        if alert_type == 'metadata_received_alert' and \
+                                handle == self.metainfo_requests[infohash]['handle']:
+                            self.got_metainfo(infohash)
+                    else:
+                        self._logger.debug("LibtorrentMgr: could not find torrent %s", infohash)
                 else:
-                    self._logger.debug("LibtorrentMgr: could not find torrent %s", infohash)
-            else:
-                self._logger.debug("Alert for invalid torrent")
+                    self._logger.debug("Alert for invalid torrent")
 
-    def get_metainfo(self, infohash_or_magnet, callback, timeout=30, timeout_callback=None, notify=True):
-        if not self.is_dht_ready() and timeout > 5:
-            self._logger.info("DHT not ready, rescheduling get_metainfo")
+        stats = self.alert_stats[alert_type]
+        stats[0] += 1
+        stats[1] += time.time() - start_time
 
-            def schedule_call():
-                random_id = ''.join(random.choice('0123456789abcdef') for _ in xrange(30))
-                self.register_task("schedule_metainfo_lookup_%s" % random_id,
-                                   reactor.callLater(5, lambda i=infohash_or_magnet, c=callback, t=timeout - 5,
-                                                  tcb=timeout_callback, n=notify: self.get_metainfo(i, c, t, tcb, n)))
+    def get_alert_stats(self):
+        """
+        Return the number of alerts of every type that were processed and the seconds spent processing them.
+        """
+        return {alert_type: {'count': count, 'time': duration}
+                for alert_type, (count, duration) in self.alert_stats.iteritems()}
 
-            reactor.callFromThread(schedule_call)
-            return
+    def on_state_update_alert(self, alert):
+        """
+        Hand the statuses of the torrents that changed since the last post_torrent_updates to their downloads.
+        """
+        for status in alert.status:
+            infohash = str(status.info_hash)
+            if infohash in self.torrents:
+                self.torrents[infohash][0].on_state_update(status)
 
+    def get_download_state(self, download):
+        """
+        Return the DownloadState of a download. The state is cached until the download gets a new status from
+        libtorrent, or built every time if the download is not running or its peers are requested.
+        """
+        infohash = hexlify(download.get_def().get_infohash())
+        lt_status, state = self.download_states.get(infohash, (None, None))
+        if state and lt_status is download.lt_status and state.get_download() is download \
+                and download.handle and not download.askmoreinfo:
+            return state
+
+        lt_status = download.lt_status
+        state = download.network_get_state(None, False)
+        if lt_status is not None and download.handle:
+            self.download_states[infohash] = (lt_status, state)
+        return state
+
+    def get_metainfo(self, infohash_or_magnet, callback, timeout=30, timeout_callback=None, notify=True,
+                     max_age=None, priority=METAINFO_PRIORITY_GUI):
+        """
+        Look up the metainfo of a torrent, from the cache or else through the DHT. Concurrent lookups of the same
+        torrent share one request. The callback gets a read-only view of the metainfo that is shared by the callers.
+
+        Lookups wait in a queue by priority until there is room in the window of concurrent lookups. GUI lookups do not
+        wait for the window. The timeout of every lookup includes the time in the queue, so lookups that are queued
+        while the DHT is not ready time out as well.
+        :param max_age: the maximum age in seconds of the peers, seeders and leechers in cached metainfo, or None if the
+        caller does not need them to be up to date
+        :param priority: one of the METAINFO_PRIORITY values, lookups with a lower value are started first
+        """
         magnet = infohash_or_magnet if infohash_or_magnet.startswith('magnet') else None
         infohash_bin = infohash_or_magnet if not magnet else parse_magnetlink(magnet)[1]
         infohash = binascii.hexlify(infohash_bin)
@@ -353,52 +436,164 @@ class LibtorrentMgr(TaskManager):
             return
 
         with self.metainfo_lock:
+            # Cached metainfo does not have to wait for the DHT
+            cache_result = self.metainfo_cache.get(infohash, max_age)
+            if cache_result:
+                callback(cache_result)
+                return
+
             self._logger.debug('get_metainfo %s %s %s', infohash_or_magnet, callback, timeout)
 
-            cache_result = self._get_cached_metainfo(infohash)
-            if cache_result:
-                callback(deepcopy(cache_result))
-
-            elif infohash not in self.metainfo_requests:
-                # Flags = 4 (upload mode), should prevent libtorrent from creating files
-                atp = {'save_path': self.metadata_tmpdir,
-                       'flags': (lt.add_torrent_params_flags_t.flag_duplicate_is_error |
-                                 lt.add_torrent_params_flags_t.flag_upload_mode)}
-                if magnet:
-                    atp['url'] = magnet
-                else:
-                    atp['info_hash'] = lt.big_number(infohash_bin)
-                try:
-                    handle = self.get_session().add_torrent(encode_atp(atp))
-                except TypeError as e:
-                    self._logger.warning("Failed to add torrent with infohash %s, "
-                                         "attempting to use it as it is and hoping for the best",
-                                         hexlify(infohash_bin))
-                    self._logger.warning("Error was: %s", e)
-                    atp['info_hash'] = infohash_bin
-                    handle = self.get_session().add_torrent(encode_atp(atp))
-
-                if notify:
-                    self.notifier.notify(NTFY_TORRENTS, NTFY_MAGNET_STARTED, infohash_bin)
-
-                self.metainfo_requests[infohash] = {'handle': handle,
-                                                    'callbacks': [callback],
-                                                    'timeout_callbacks': [timeout_callback] if timeout_callback else [],
-                                                    'notify': notify}
-
-                def schedule_call():
-                    random_id = ''.join(random.choice('0123456789abcdef') for _ in xrange(30))
-                    self.register_task("schedule_got_metainfo_lookup_%s" % random_id,
-                                       reactor.callLater(timeout, lambda: self.got_metainfo(infohash, timeout=True)))
-
-                reactor.callFromThread(schedule_call)
+            deadline = time.time() + timeout
+            request = self.metainfo_requests.get(infohash)
+            if request is None:
+                request = self.metainfo_requests[infohash] = {'handle': None,
+                                                              'callbacks': [],
+                                                              'timeout_callbacks': [],
+                                                              'notify': notify,
+                                                              'infohash': infohash_bin,
+                                                              'magnet': magnet,
+                                                              'priority': priority,
+                                                              'timeout': timeout,
+                                                              'deadline': deadline,
+                                                              'attempts': 0,
+                                                              'retry_time': None}
+                self._queue_metainfo_request(infohash, request)
             else:
-                self.metainfo_requests[infohash]['notify'] = self.metainfo_requests[infohash]['notify'] and notify
-                callbacks = self.metainfo_requests[infohash]['callbacks']
-                if callback not in callbacks:
-                    callbacks.append(callback)
+                self.metainfo_stats['joined'] += 1
+                request['notify'] = request['notify'] and notify
+                request['magnet'] = request['magnet'] or magnet
+                request['timeout'] = max(request['timeout'], timeout)
+                request['deadline'] = max(request['deadline'], deadline)
+                if priority < request['priority']:
+                    request['priority'] = priority
+                    if not request['handle'] and not request['retry_time']:
+                        self._queue_metainfo_request(infohash, request)
+
+            if callback not in request['callbacks']:
+                request['callbacks'].append(callback)
+            else:
+                self._logger.debug('get_metainfo duplicate detected, ignoring')
+            if timeout_callback and timeout_callback not in request['timeout_callbacks']:
+                request['timeout_callbacks'].append(timeout_callback)
+
+            self._start_metainfo_requests()
+
+    def _queue_metainfo_request(self, infohash, request):
+        # The sequence number keeps the lookups of the same priority in order. Entries of which the priority changed
+        # or that were started in the meantime are skipped when they come up.
+        self.metainfo_sequence += 1
+        heappush(self.metainfo_queue, (request['priority'], self.metainfo_sequence, infohash))
+
+    def _start_metainfo_requests(self):
+        """
+        Start the queued lookups for as long as there is room in the window of concurrent lookups.
+        """
+        if not self.is_dht_ready() or not self.metadata_tmpdir:
+            return
+
+        failed = []
+        with self.metainfo_lock:
+            while self.metainfo_queue:
+                priority, _, infohash = self.metainfo_queue[0]
+                request = self.metainfo_requests.get(infohash)
+                if not self._is_queued_metainfo_request(request, priority):
+                    heappop(self.metainfo_queue)
+                elif priority != METAINFO_PRIORITY_GUI and len(self.metainfo_active) >= self.max_metainfo_requests:
+                    break
                 else:
-                    self._logger.debug('get_metainfo duplicate detected, ignoring')
+                    heappop(self.metainfo_queue)
+                    try:
+                        self._add_metainfo_handle(infohash, request)
+                    except (RuntimeError, TypeError) as e:
+                        self._logger.error("Failed to look up the metainfo of torrent with infohash %s: %s",
+                                           infohash, e)
+                        failed.append(infohash)
+
+            # A lookup that could not be started would never be started again, so it times out right away
+            for infohash in failed:
+                self.got_metainfo(infohash, timeout=True)
+
+    @staticmethod
+    def _is_queued_metainfo_request(request, priority):
+        """
+        Return whether a queue entry with the given priority belongs to a lookup that is still waiting to be started.
+        """
+        return request is not None and not request['handle'] and not request['retry_time'] \
+            and request['priority'] == priority
+
+    def _has_queued_metainfo_requests(self):
+        with self.metainfo_lock:
+            return any(self._is_queued_metainfo_request(self.metainfo_requests.get(infohash), priority)
+                       for priority, _, infohash in self.metainfo_queue)
+
+    def _add_metainfo_handle(self, infohash, request):
+        # Flags = 4 (upload mode), should prevent libtorrent from creating files
+        atp = {'save_path': self.metadata_tmpdir,
+               'flags': (lt.add_torrent_params_flags_t.flag_duplicate_is_error |
+                         lt.add_torrent_params_flags_t.flag_upload_mode)}
+        if request['magnet']:
+            atp['url'] = request['magnet']
+        else:
+            atp['info_hash'] = lt.big_number(request['infohash'])
+        try:
+            handle = self.get_session().add_torrent(encode_atp(atp))
+        except TypeError as e:
+            self._logger.warning("Failed to add torrent with infohash %s, "
+                                 "attempting to use it as it is and hoping for the best", infohash)
+            self._logger.warning("Error was: %s", e)
+            atp['info_hash'] = request['infohash']
+            handle = self.get_session().add_torrent(encode_atp(atp))
+
+        if request['notify'] and not request['attempts']:
+            self.notifier.notify(NTFY_TORRENTS, NTFY_MAGNET_STARTED, request['infohash'])
+
+        now = time.time()
+        request['handle'] = handle
+        request['attempts'] += 1
+        request['attempt_deadline'] = now + METAINFO_ATTEMPT_TIMEOUT * 2 ** (request['attempts'] - 1)
+        self.metainfo_active.add(infohash)
+
+    def _task_check_metainfo_requests(self):
+        """
+        Time out lookups, and put lookups that take long aside while other lookups wait for room in the window.
+        Lookups that are put aside are tried again after a delay that doubles with every attempt.
+        """
+        now = time.time()
+        with self.metainfo_lock:
+            for infohash, request in self.metainfo_requests.items():
+                if now >= request['deadline']:
+                    self.got_metainfo(infohash, timeout=True)
+
+                elif request['handle'] and now >= request['attempt_deadline'] and \
+                        self._has_queued_metainfo_requests():
+                    self.get_session().remove_torrent(request['handle'], 1)
+                    request['handle'] = None
+                    request['retry_time'] = now + METAINFO_RETRY_DELAY * 2 ** (request['attempts'] - 1)
+                    self.metainfo_active.discard(infohash)
+                    self.metainfo_stats['retries'] += 1
+
+                elif request['retry_time'] and now >= request['retry_time']:
+                    request['retry_time'] = None
+                    self._queue_metainfo_request(infohash, request)
+
+        self._start_metainfo_requests()
+
+    def get_metainfo_stats(self):
+        """
+        Return the number of queued and active lookups, the number of lookups that succeeded in the last minute, and
+        the number of lookups that succeeded, timed out, were tried again or were joined by another caller.
+        """
+        with self.metainfo_lock:
+            last_minute = time.time() - 60
+            while self.metainfo_fetch_times and self.metainfo_fetch_times[0] < last_minute:
+                self.metainfo_fetch_times.popleft()
+
+            stats = dict(self.metainfo_stats)
+            stats.update({'queued': len(self.metainfo_requests) - len(self.metainfo_active),
+                          'active': len(self.metainfo_active),
+                          'fetches_per_minute': len(self.metainfo_fetch_times)})
+            return stats
 
     def got_metainfo(self, infohash, timeout=False):
         with self.metainfo_lock:
@@ -410,76 +605,100 @@ class LibtorrentMgr(TaskManager):
                 callbacks = request_dict['callbacks']
                 timeout_callbacks = request_dict['timeout_callbacks']
                 notify = request_dict['notify']
+                self.metainfo_active.discard(infohash)
 
                 self._logger.debug('got_metainfo %s %s %s', infohash, handle, timeout)
 
-                assert handle
-                if handle:
-                    if callbacks and not timeout:
-                        metainfo = {"info": lt.bdecode(get_info_from_handle(handle).metadata())}
-                        trackers = [tracker.url for tracker in get_info_from_handle(handle).trackers()]
-                        peers = []
-                        leechers = 0
-                        seeders = 0
-                        for peer in handle.get_peer_info():
-                            peers.append(peer.ip)
-                            if peer.progress == 1:
-                                seeders += 1
-                            else:
-                                leechers += 1
-
-                        if trackers:
-                            if len(trackers) > 1:
-                                metainfo["announce-list"] = [trackers]
-                            metainfo["announce"] = trackers[0]
+                if handle and callbacks and not timeout:
+                    metainfo = {"info": lt.bdecode(get_info_from_handle(handle).metadata())}
+                    trackers = [tracker.url for tracker in get_info_from_handle(handle).trackers()]
+                    peers = []
+                    leechers = 0
+                    seeders = 0
+                    for peer in handle.get_peer_info():
+                        peers.append(peer.ip)
+                        if peer.progress == 1:
+                            seeders += 1
                         else:
-                            metainfo["nodes"] = []
-                        if peers and notify:
-                            self.notifier.notify(NTFY_TORRENTS, NTFY_MAGNET_GOT_PEERS, infohash_bin, len(peers))
-                        metainfo["initial peers"] = peers
-                        metainfo["leechers"] = leechers
-                        metainfo["seeders"] = seeders
-
-                        self._add_cached_metainfo(infohash, metainfo)
-
-                        for callback in callbacks:
-                            callback(deepcopy(metainfo))
-
-                        # let's not print the hashes of the pieces
-                        debuginfo = deepcopy(metainfo)
-                        del debuginfo['info']['pieces']
-                        self._logger.debug('got_metainfo result %s', debuginfo)
-
-                    elif timeout_callbacks and timeout:
-                        for callback in timeout_callbacks:
-                            callback(infohash_bin)
+                            leechers += 1
+
+                    if trackers:
+                        if len(trackers) > 1:
+                            metainfo["announce-list"] = [trackers]
+                        metainfo["announce"] = trackers[0]
+                    else:
+                        metainfo["nodes"] = []
+                    if peers and notify:
+                        self.notifier.notify(NTFY_TORRENTS, NTFY_MAGNET_GOT_PEERS, infohash_bin, len(peers))
+                    metainfo["initial peers"] = peers
+                    metainfo["leechers"] = leechers
+                    metainfo["seeders"] = seeders
+
+                    metainfo = self.metainfo_cache.add(infohash, metainfo)
+                    self.metainfo_stats['succeeded'] += 1
+                    self.metainfo_fetch_times.append(time.time())
+
+                    for callback in callbacks:
+                        callback(metainfo)
+
+                    # let's not print the hashes of the pieces
+                    debuginfo = dict(metainfo, info={key: value for key, value in metainfo['info'].iteritems()
+                                                     if key != 'pieces'})
+                    self._logger.debug('got_metainfo result %s', debuginfo)
+
+                elif timeout or not handle:
+                    # A lookup without a handle has no metainfo to hand out, its callers should not wait forever
+                    self.metainfo_stats['timed_out'] += 1
+                    for callback in timeout_callbacks:
+                        callback(infohash_bin)
 
                 if handle:
                     self.get_session().remove_torrent(handle, 1)
                     if notify:
                         self.notifier.notify(NTFY_TORRENTS, NTFY_MAGNET_CLOSE, infohash_bin)
 
-    def _get_cached_metainfo(self, infohash):
-        if infohash in self.metainfo_cache:
-            return self.metainfo_cache[infohash]['meta_info']
+        self._start_metainfo_requests()
 
-    def _add_cached_metainfo(self, infohash, metainfo):
-        self.metainfo_cache[infohash] = {'time': time.time(),
-                                         'meta_info': metainfo}
+    def _on_alert_notify(self):
+        """
+        Called by a libtorrent thread when alerts are waiting in a session that had none.
+        """
+        if not self.alerts_notified:
+            self.alerts_notified = True
+            reactor.callFromThread(self._on_alerts_waiting)
+
+    def _on_alerts_waiting(self):
+        # A pending batch pops the new alerts itself once the previous ones are processed
+        if self.process_alerts_call is None:
+            self._process_alerts()
+
+    def _process_alerts(self):
+        """
+        Process the waiting alerts, up to ALERT_BATCH_SIZE at a time so other calls of the reactor get their turn.
+        The sessions are only popped once the previous alerts are processed, since popping invalidates them.
+        """
+        self.process_alerts_call = None
+        if not self.alerts and self.ltsessions:
+            self.alerts_notified = False
+            for ltsession in self.ltsessions.itervalues():
+                if ltsession:
+                    self.alerts.extend(ltsession.pop_alerts())
 
-    def _task_cleanup_metainfo_cache(self):
-        oldest_time = time.time() - METAINFO_CACHE_PERIOD
+        for _ in xrange(min(len(self.alerts), ALERT_BATCH_SIZE)):
+            self.process_alert(self.alerts.popleft())
 
-        for info_hash, values in self.metainfo_cache.items():
-            last_time, metainfo = values
-            if last_time < oldest_time:
-                del self.metainfo_cache[info_hash]
+        if self.alerts or self.alerts_notified:
+            self.process_alerts_call = self.register_task("process_alerts_batch",
+                                                          reactor.callLater(0, self._process_alerts))
 
     def _task_process_alerts(self):
+        # Without alert notifications this is the only moment alerts are popped. With them it is a fallback.
+        if self.process_alerts_call is None:
+            self._process_alerts()
         for ltsession in self.ltsessions.itervalues():
-            if ltsession:
-                for alert in ltsession.pop_alerts():
-                    self.process_alert(alert)
+            if ltsession and self.state_updates_enabled:
+                # The statuses of the torrents that changed arrive as a state_update_alert
+                ltsession.post_torrent_updates()
 
     def _check_reachability(self):
         if self.get_session() and self.get_session().status().has_incoming_connections:
@@ -506,6 +725,7 @@ class LibtorrentMgr(TaskManager):
         else:
             self._logger.info("dht is working enough nodes are found (%d)", self.get_session().status().dht_nodes)
             self.dht_ready = True
+            self._start_metainfo_requests()
 
     def _map_call_on_ltsessions(self, hops, funcname, *args, **kwargs):
         if hops is None:
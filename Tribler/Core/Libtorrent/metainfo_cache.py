@@ -0,0 +1,153 @@
+"""
+Cache of the metainfo that LibtorrentMgr looked up.
+
+The cache keeps the most recently used metainfo in memory, up to a number of bytes, and writes the torrent part of
+every metainfo to the torrent store, so lookups that were done before a restart or that were evicted from memory do not
+have to go to the DHT again. Callers share the cached metainfo and get a read-only view of it instead of a copy.
+"""
+import logging
+import time
+from collections import OrderedDict
+from copy import deepcopy
+
+from libtorrent import bdecode, bencode
+
+# Maximum number of bytes of bencoded metainfo that is kept in memory
+METAINFO_CACHE_SIZE = 16 * 1024 * 1024
+
+# Number of seconds that the peers, seeders and leechers found during a lookup are considered up to date
+SWARM_INFO_MAX_AGE = 5 * 60
+
+# The keys of the metainfo that describe the swarm at the time of the lookup, rather than the torrent
+SWARM_KEYS = ('initial peers', 'leechers', 'seeders')
+
+
+class MetainfoView(dict):
+    """
+    Read-only metainfo dictionary, shared by everyone that looked up the same torrent.
+    """
+
+    def _read_only(self, *_, **__):
+        raise TypeError("cached metainfo is read-only, make a copy with dict() to change it")
+
+    __setitem__ = __delitem__ = clear = pop = popitem = setdefault = update = _read_only
+
+    def __copy__(self):
+        return dict(self)
+
+    def __deepcopy__(self, memo):
+        return deepcopy(dict(self), memo)
+
+
+def freeze_metainfo(metainfo):
+    """
+    Return a read-only view of the metainfo, of which the info dictionary is read-only as well.
+    """
+    view = dict(metainfo)
+    if isinstance(view.get('info'), dict):
+        view['info'] = MetainfoView(view['info'])
+    return MetainfoView(view)
+
+
+class MetainfoCache(object):
+    """
+    Least recently used cache of metainfo by hex infohash, that spills to the torrent store.
+    """
+
+    def __init__(self, store=None, size=METAINFO_CACHE_SIZE):
+        """
+        :param store: the torrent store that metainfo is written to and read from, or None to keep it in memory only
+        :param size: maximum number of bytes of bencoded metainfo in memory
+        """
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.store = store
+        self.size = size
+        self.used = 0
+        # infohash -> (metainfo view, time of the lookup or None if it was read from the store, size)
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.store_hits = 0
+        self.misses = 0
+
+    def __contains__(self, infohash):
+        return infohash in self.entries
+
+    def get(self, infohash, max_age=None):
+        """
+        Return the cached metainfo of a torrent.
+        :param infohash: the hex infohash of the torrent
+        :param max_age: the maximum age in seconds of the swarm info in the metainfo, or None to accept metainfo without
+        up to date swarm info, including metainfo that was read from the store
+        :return: a read-only view of the metainfo, or None if it is not cached
+        """
+        entry = self.entries.pop(infohash, None)
+        if entry:
+            self.entries[infohash] = entry
+            metainfo, lookup_time, _ = entry
+            if max_age is None or (lookup_time is not None and time.time() - lookup_time <= max_age):
+                self.hits += 1
+                return metainfo
+        elif max_age is None:
+            metainfo = self._load(infohash)
+            if metainfo:
+                self.store_hits += 1
+                return metainfo
+
+        self.misses += 1
+        return None
+
+    def add(self, infohash, metainfo):
+        """
+        Cache the metainfo that was just looked up and write its torrent part to the store.
+        :return: the read-only view of the metainfo that is shared with the callers
+        """
+        torrent = {key: value for key, value in metainfo.iteritems() if key not in SWARM_KEYS}
+        data = bencode(torrent)
+
+        if self.store is not None and infohash not in self.store:
+            self.store[infohash] = data
+
+        metainfo = freeze_metainfo(metainfo)
+        self._insert(infohash, metainfo, time.time(), len(data))
+        return metainfo
+
+    def _load(self, infohash):
+        if self.store is None:
+            return None
+
+        data = self.store.get(infohash)
+        if not data:
+            return None
+
+        torrent = bdecode(data)
+        if not isinstance(torrent, dict) or 'info' not in torrent:
+            self._logger.warning("Invalid metainfo of %s in the torrent store", infohash)
+            return None
+
+        metainfo = freeze_metainfo({key: value for key, value in torrent.iteritems() if key not in SWARM_KEYS})
+        self._insert(infohash, metainfo, None, len(data))
+        return metainfo
+
+    def _insert(self, infohash, metainfo, lookup_time, size):
+        old_entry = self.entries.pop(infohash, None)
+        if old_entry:
+            self.used -= old_entry[2]
+
+        self.entries[infohash] = (metainfo, lookup_time, size)
+        self.used += size
+        while self.used > self.size and len(self.entries) > 1:
+            _, (_, _, evicted_size) = self.entries.popitem(last=False)
+            self.used -= evicted_size
+
+    def get_stats(self):
+        """
+        Return the number of lookups that were answered from memory, from the store or not at all, and the memory used.
+        """
+        lookups = self.hits + self.store_hits + self.misses
+        return {'hits': self.hits,
+                'store_hits': self.store_hits,
+                'misses': self.misses,
+                'hit_rate': float(self.hits + self.store_hits) / lookups if lookups else 0.0,
+                'num_entries': len(self.entries),
+                'bytes': self.used}
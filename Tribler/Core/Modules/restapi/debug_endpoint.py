@@ -40,7 +40,8 @@ class DebugCircuitsEndpoint(resource.Resource):
         """
         .. http:get:: /debug/circuits
 
-        A GET request to this endpoint returns information about the built circuits in the tunnel community.
+        A GET request to this endpoint returns information about the built circuits in the tunnel community. The
+        queues lists the relays and exits of this peer with queued or dropped packets because of the rate limits.
 
             **Example request**:
 
@@ -66,7 +67,14 @@ class DebugCircuitsEndpoint(resource.Resource):
                             "host": "39.95.147.20:8965"
                         }],
                         ...
-                    ]
+                    ],
+                    "queues": [{
+                        "id": 5678,
+                        "type": "relay",
+                        "queued_packets": 12,
+                        "queued_bytes": 16800,
+                        "dropped_packets": 3
+                    }, ...]
                 }
         """
         tunnel_community = self.get_tunnel_community()
@@ -85,4 +93,10 @@ class DebugCircuitsEndpoint(resource.Resource):
             item['hops'] = hops_array
             circuits_json.append(item)
 
-        return json.dumps({'circuits': circuits_json})
+        queues_json = []
+        for circuit_id, stats in tunnel_community.scheduler.get_stats().iteritems():
+            item = {'id': circuit_id, 'type': 'exit' if circuit_id in tunnel_community.exit_sockets else 'relay'}
+            item.update(stats)
+            queues_json.append(item)
+
+        return json.dumps({'circuits': circuits_json, 'queues': queues_json})
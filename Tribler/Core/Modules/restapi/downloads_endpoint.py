@@ -163,7 +163,10 @@ class DownloadsEndpoint(DownloadBaseEndpoint):
         downloads = self.session.get_downloads()
         for download in downloads:
             stats = download.network_create_statistics_reponse() or LibtorrentStatisticsResponse(0, 0, 0, 0, 0, 0, 0)
-            state = download.network_get_state(None, get_peers)
+            if get_peers:
+                state = download.network_get_state(None, get_peers)
+            else:
+                state = self.session.lm.ltmgr.get_download_state(download)
 
             # Create files information of the download
             files_completion = dict((name, progress) for name, progress in state.get_files_completion())
@@ -1,6 +1,7 @@
 import json
 import logging
 from twisted.web import http, resource
+from twisted.web.server import NOT_DONE_YET
 
 from Tribler.Core.Utilities.search_utils import split_into_keywords
 from Tribler.Core.exceptions import OperationNotEnabledByConfigurationException
@@ -26,11 +27,13 @@ class SearchEndpoint(resource.Resource):
 
     def render_GET(self, request):
         """
-        .. http:get:: /search?q=(string:query)
+        .. http:get:: /search?q=(string:query)&offset=(int:offset)&limit=(int:limit)
 
         A GET request to this endpoint will create a search. Results are returned over the events endpoint, one by one.
         First, the results available in the local database will be pushed. After that, incoming Dispersy results are
         pushed. The query to this endpoint is passed using the url, i.e. /search?q=pioneer.
+        The local torrent results are ordered by relevance. Optionally, only a page of these results can be requested
+        by passing an offset and a limit.
 
             **Example request**:
 
@@ -63,30 +66,59 @@ class SearchEndpoint(resource.Resource):
             request.setResponseCode(http.BAD_REQUEST)
             return json.dumps({"error": "query parameter missing"})
 
+        try:
+            offset = int(request.args['offset'][0]) if len(request.args.get('offset', [])) > 0 else 0
+            limit = int(request.args['limit'][0]) if len(request.args.get('limit', [])) > 0 else None
+        except ValueError:
+            request.setResponseCode(http.BAD_REQUEST)
+            return json.dumps({"error": "offset and limit should be integers"})
+
+        if offset < 0 or (limit is not None and limit < 0):
+            request.setResponseCode(http.BAD_REQUEST)
+            return json.dumps({"error": "offset and limit should not be negative"})
+
         # Notify the events endpoint that we are starting a new search query
         self.events_endpoint.start_new_query()
 
-        # We first search the local database for torrents and channels
+        # We first search the local database for torrents and channels. These queries do not block the reactor.
         query = unicode(request.args['q'][0], 'utf-8')
         keywords = split_into_keywords(query)
-        results_local_channels = self.channel_db_handler.search_in_local_channels_db(query)
-        results_dict = {"keywords": keywords, "result_list": results_local_channels}
-        self.session.notifier.notify(SIGNAL_CHANNEL, SIGNAL_ON_SEARCH_RESULTS, None, results_dict)
 
-        torrent_db_columns = ['T.torrent_id', 'infohash', 'T.name', 'length', 'category',
-                              'num_seeders', 'num_leechers', 'last_tracker_check']
-        results_local_torrents = self.torrent_db_handler.search_in_local_torrents_db(query, keys=torrent_db_columns)
-        results_dict = {"keywords": keywords, "result_list": results_local_torrents}
-        self.session.notifier.notify(SIGNAL_TORRENT, SIGNAL_ON_SEARCH_RESULTS, None, results_dict)
+        def on_local_channels(results_local_channels):
+            results_dict = {"keywords": keywords, "result_list": results_local_channels}
+            self.session.notifier.notify(SIGNAL_CHANNEL, SIGNAL_ON_SEARCH_RESULTS, None, results_dict)
 
-        # Create remote searches
-        try:
-            self.session.search_remote_torrents(keywords)
-            self.session.search_remote_channels(keywords)
-        except OperationNotEnabledByConfigurationException as exc:
-            self._logger.error(exc)
+            torrent_db_columns = ['T.torrent_id', 'infohash', 'T.name', 'length', 'category',
+                                  'num_seeders', 'num_leechers', 'last_tracker_check']
+            return self.torrent_db_handler.search_in_local_torrents_db_async(query, keys=torrent_db_columns,
+                                                                             offset=offset, limit=limit)
+
+        def on_local_torrents(results_local_torrents):
+            results_dict = {"keywords": keywords, "result_list": results_local_torrents}
+            self.session.notifier.notify(SIGNAL_TORRENT, SIGNAL_ON_SEARCH_RESULTS, None, results_dict)
+
+            # Create remote searches
+            try:
+                self.session.search_remote_torrents(keywords)
+                self.session.search_remote_channels(keywords)
+            except OperationNotEnabledByConfigurationException as exc:
+                self._logger.error(exc)
 
-        return json.dumps({"queried": True})
+            request.write(json.dumps({"queried": True}))
+            request.finish()
+
+        def on_search_error(failure):
+            self._logger.error("Error when searching the local database: %s", failure.getErrorMessage())
+            request.setResponseCode(http.INTERNAL_SERVER_ERROR)
+            request.write(json.dumps({"error": failure.getErrorMessage()}))
+            request.finish()
+
+        self.channel_db_handler.search_in_local_channels_db_async(query)\
+            .addCallback(on_local_channels)\
+            .addCallback(on_local_torrents)\
+            .addErrback(on_search_error)
+
+        return NOT_DONE_YET
 
 
 class SearchCompletionsEndpoint(resource.Resource):
@@ -98,6 +130,7 @@ class SearchCompletionsEndpoint(resource.Resource):
         resource.Resource.__init__(self)
         self.session = session
         self.torrent_db_handler = self.session.open_dbhandler(NTFY_TORRENTS)
+        self._logger = logging.getLogger(self.__class__.__name__)
 
     def render_GET(self, request):
         """
@@ -126,5 +159,17 @@ class SearchCompletionsEndpoint(resource.Resource):
             return json.dumps({"error": "query parameter missing"})
 
         keywords = unicode(request.args['q'][0], 'utf-8').lower()
-        results = self.torrent_db_handler.getAutoCompleteTerms(keywords, max_terms=5)
-        return json.dumps({"completions": results})
+
+        def on_completions(results):
+            request.write(json.dumps({"completions": results}))
+            request.finish()
+
+        def on_completions_error(failure):
+            self._logger.error("Error when looking up search completions: %s", failure.getErrorMessage())
+            request.setResponseCode(http.INTERNAL_SERVER_ERROR)
+            request.write(json.dumps({"error": failure.getErrorMessage()}))
+            request.finish()
+
+        self.torrent_db_handler.get_autocomplete_terms_async(keywords, max_terms=5)\
+            .addCallbacks(on_completions, on_completions_error)
+        return NOT_DONE_YET
@@ -48,13 +48,51 @@ class StatisticsTriblerEndpoint(resource.Resource):
                     "tribler_statistics": {
                         "num_channels": 1234,
                         "database_size": 384923,
+                        "torrent_ingest_stats": {
+                            "batches": 87,
+                            "torrents": 4320,
+                            "time": 1.73,
+                            "torrents_per_second": 2497.1,
+                            "last_batch_torrents_per_second": 3120.4
+                        },
+                        "notifier_stats": {
+                            "observers": 41,
+                            "notifications": 12873,
+                            "dispatched": 3410,
+                            "dropped": 0,
+                            "coalesced": 512,
+                            "queue_depth": 3,
+                            "max_queue_depth": 148,
+                            "cached_events": 7,
+                            "avg_dispatch_latency": 0.0021,
+                            "max_dispatch_latency": 0.087
+                        },
                         "torrent_queue_stats": [{
                             "failed": 2,
                             "total": 9,
                             "type": "TFTP",
                             "pending": 1,
                             "success": 6
-                        }, ...]
+                        }, ...],
+                        "database_commit_stats": {
+                            "commits": 42,
+                            "rows_committed": 18340,
+                            "pending_rows": 12,
+                            "avg_rows_per_commit": 436.7,
+                            "avg_commit_latency": 0.012,
+                            "max_commit_latency": 0.094,
+                            "last_commit_latency": 0.008,
+                            "checkpoints": 1,
+                            "frames_checkpointed": 2311
+                        },
+                        "database_statement_cache_stats": {
+                            "size": 87,
+                            "capacity": 256,
+                            "hits": 93410,
+                            "misses": 87,
+                            "evictions": 0,
+                            "hit_rate": 0.999
+                        }
                     }
                 }
         """
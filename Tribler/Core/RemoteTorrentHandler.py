@@ -16,7 +16,8 @@ from twisted.internet.task import LoopingCall
 
 from Tribler.Core.TFTP.handler import METADATA_PREFIX
 from Tribler.Core.TorrentDef import TorrentDef
-from Tribler.Core.simpledefs import INFOHASH_LENGTH, NTFY_TORRENTS
+from Tribler.Core.simpledefs import (INFOHASH_LENGTH, METAINFO_PRIORITY_BACKGROUND, METAINFO_PRIORITY_CHANNEL,
+                                     NTFY_TORRENTS)
 from Tribler.dispersy.taskmanager import TaskManager
 from Tribler.dispersy.util import call_on_reactor_thread
 
@@ -408,22 +409,19 @@ class TorrentMessageRequester(Requester):
 
 
 class MagnetRequester(Requester):
+    """
+    Requests torrents through magnet links. LibtorrentMgr queues the lookups and limits how many run at the same time.
+    """
 
-    MAX_CONCURRENT = 1
     TIMEOUT = 30.0
 
     def __init__(self, session, remote_torrent_handler, priority):
         super(MagnetRequester, self).__init__(u"magnet_requester", session, remote_torrent_handler, priority)
-        if sys.platform == "darwin":
-            # Mac has just 256 fds per process, be less aggressive
-            self.REQUEST_INTERVAL = 15.0
-
-        if priority <= 1 and not sys.platform == "darwin":
-            self.MAX_CONCURRENT = 3
+        self._metainfo_priority = METAINFO_PRIORITY_CHANNEL if priority else METAINFO_PRIORITY_BACKGROUND
 
         self._torrent_db_handler = session.open_dbhandler(NTFY_TORRENTS)
 
-        self._running_requests = []
+        self._running_requests = set()
 
     @pass_when_stopped
     def add_request(self, infohash, candidate=None, timeout=None):
@@ -438,10 +436,6 @@ class MagnetRequester(Requester):
     @pass_when_stopped
     def _do_request(self):
         while self._pending_request_queue and self.running:
-            if len(self._running_requests) >= self.MAX_CONCURRENT:
-                self._logger.debug(u"max concurrency %s reached, request later", self.MAX_CONCURRENT)
-                return
-
             infohash = self._pending_request_queue.popleft()
             infohash_str = hexlify(infohash)
 
@@ -457,9 +451,11 @@ class MagnetRequester(Requester):
             self._logger.debug(u"requesting %s priority %s through magnet link %s",
                                infohash_str, self._priority, magnetlink)
 
+            # Cached metainfo is handed to the callback right away
+            self._running_requests.add(infohash)
             self._session.lm.ltmgr.get_metainfo(magnetlink, self._success_callback,
-                                                timeout=self.TIMEOUT, timeout_callback=self._failure_callback)
-            self._running_requests.append(infohash)
+                                                timeout=self.TIMEOUT, timeout_callback=self._failure_callback,
+                                                priority=self._metainfo_priority)
 
     @call_on_reactor_thread
     def _success_callback(self, meta_info):
@@ -29,7 +29,7 @@ from Tribler.Core.exceptions import NotYetImplementedException, OperationNotEnab
     DuplicateTorrentFileError
 from Tribler.Core.simpledefs import (NTFY_CHANNELCAST, NTFY_DELETE, NTFY_INSERT, NTFY_MYPREFERENCES, NTFY_PEERS,
                                      NTFY_TORRENTS, NTFY_UPDATE, NTFY_VOTECAST, STATEDIR_DLPSTATE_DIR,
-                                     STATEDIR_WALLET_DIR)
+                                     STATEDIR_RESUME_STORE_DIR, STATEDIR_WALLET_DIR)
 from Tribler.Core.statistics import TriblerStatistics
 from Tribler.dispersy.util import blocking_call_on_reactor_thread
 
@@ -111,6 +111,7 @@ class Session(object):
         create_dir(self.config.get_metadata_store_dir())
         create_in_state_dir(DB_DIR_NAME)
         create_in_state_dir(STATEDIR_DLPSTATE_DIR)
+        create_in_state_dir(STATEDIR_RESUME_STORE_DIR)
         create_in_state_dir(STATEDIR_WALLET_DIR)
 
     def get_ports_in_config(self):
@@ -369,14 +370,15 @@ class Session(object):
     #
     # Notification of events in the Session
     #
-    def add_observer(self, observer_function, subject, change_types=None, object_id=None, cache=0):
+    def add_observer(self, observer_function, subject, change_types=None, object_id=None, cache=0,
+                     asynchronous=False):
         """
         Add an observer function function to the Session. The observer
         function will be called when one of the specified events (changeTypes)
         occurs on the specified subject.
 
-        The function will be called by a popup thread which can be used indefinitely (within reason)
-        by the higher level code. Note that this function is called by any thread and is thread safe.
+        The function will be called by the notifying thread, unless it is asynchronous. Note that this function is
+        called by any thread and is thread safe.
 
         :param observer_function: should accept as its first argument
         the subject, as second argument the changeType, as third argument an
@@ -387,9 +389,12 @@ class Session(object):
         :param object_id: The specific object in the subject to monitor (e.g. a
         specific primary key in a database to monitor for updates.)
         :param cache: the time to bundle/cache events matching this function
+        :param asynchronous: whether the function is always called on the reactor thread. Events notified by other
+        threads are then queued and dispatched on the reactor thread, so the notifying thread is not stalled.
         """
         change_types = change_types or [NTFY_UPDATE, NTFY_INSERT, NTFY_DELETE]
-        self.notifier.add_observer(observer_function, subject, change_types, object_id, cache=cache)
+        self.notifier.add_observer(observer_function, subject, change_types, object_id, cache=cache,
+                                   asynchronous=asynchronous)
 
     def remove_observer(self, function):
         """
@@ -515,13 +520,15 @@ class Session(object):
             """
             self.config.write()
             yield self.checkpoint_downloads()
-            self.lm.shutdown_downloads()
+            yield self.lm.shutdown_downloads()
             self.lm.network_shutdown()
 
             if self.sqlite_db:
                 self.sqlite_db.close()
             self.sqlite_db = None
 
+            self.notifier.remove_observers()
+
         return self.lm.early_shutdown().addCallback(on_early_shutdown_complete)
 
     def has_shutdown(self):
@@ -541,6 +548,14 @@ class Session(object):
         """
         return os.path.join(self.config.get_state_dir(), STATEDIR_DLPSTATE_DIR)
 
+    def get_resume_store_dir(self):
+        """
+        Returns the directory of the store that holds the persistent state and the resume data of the Downloads in
+        this Session. Downloads that were checkpointed to the downloads pstate directory by older versions are moved
+        to this store when the checkpoints are loaded.
+        """
+        return os.path.join(self.config.get_state_dir(), STATEDIR_RESUME_STORE_DIR)
+
     def download_torrentfile(self, infohash=None, user_callback=None, priority=0):
         """
         Try to download the torrent file without a known source. A possible source could be the DHT.
@@ -10,6 +10,7 @@ from twisted.internet.protocol import DatagramProtocol
 from twisted.python.failure import Failure
 from twisted.web.client import Agent, readBody, RedirectAgent, HTTPConnectionPool
 
+from Tribler.Core.Libtorrent.metainfo_cache import SWARM_INFO_MAX_AGE
 from Tribler.Core.Utilities.encoding import add_url_params
 from Tribler.Core.Utilities.tracker_utils import parse_tracker_url
 from Tribler.dispersy.taskmanager import TaskManager
@@ -729,7 +730,8 @@ class FakeDHTSession(TrackerSession):
 
         if self._session:
             self._session.lm.ltmgr.get_metainfo(self.infohash, callback=on_metainfo_received,
-                                                timeout_callback=on_metainfo_timeout, timeout=self.timeout)
+                                                timeout_callback=on_metainfo_timeout, timeout=self.timeout,
+                                                max_age=SWARM_INFO_MAX_AGE)
 
         return self.result_deferred
 
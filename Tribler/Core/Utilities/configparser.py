@@ -6,6 +6,7 @@ Author(s): Egbert Bouman
 import ast
 import codecs
 from ConfigParser import DEFAULTSECT, RawConfigParser
+from io import StringIO
 from threading import RLock
 
 from Tribler.Core.exceptions import OperationNotPossibleAtRuntimeException
@@ -28,6 +29,9 @@ class CallbackConfigParser(RawConfigParser):
         with codecs.open(filename, 'rb', encoding) as fp:
             self.readfp(fp)
 
+    def read_string(self, data, encoding='utf-8'):
+        self.readfp(StringIO(data.decode(encoding)))
+
     def set(self, section, option, new_value):
         with self.lock:
             if self.callback and self.has_section(section) and self.has_option(section, option):
@@ -59,6 +63,14 @@ class CallbackConfigParser(RawConfigParser):
         with codecs.open(filename, 'wb', encoding) as fp:
             self.write(fp)
 
+    def write_string(self, encoding='utf-8'):
+        """
+        Return the config in the format of write_file, for storing it elsewhere than in a file.
+        """
+        fp = StringIO()
+        self.write(fp)
+        return fp.getvalue().encode(encoding)
+
     def write(self, fp):
         with self.lock:
             if self._defaults:
@@ -260,14 +260,15 @@ def create_valid_metainfo(metainfo):
     Creates a valid metainfo dictionary by validating the elements and correcting when possible.
 
     :param metainfo: the metainfo that has to be validated
-    :return: the original metainfo with corrected elements if possible
+    :return: a copy of the metainfo with corrected elements if possible, the metainfo itself is left untouched
     :raise ValueError: if there is a faulty element which cannot be corrected.
     """
-    metainfo_result = metainfo
-
     if not isinstance(metainfo, DictType):
         raise ValueError('metainfo not dict')
 
+    # The metainfo may be shared, for instance by the metainfo cache of LibtorrentMgr
+    metainfo_result = dict(metainfo)
+
     # some .torrent files have a dht:// url in the announce field.
     if ('announce' in metainfo) \
             and (not (is_valid_url(metainfo['announce']) or metainfo['announce'].startswith('dht:'))):
@@ -285,19 +286,19 @@ def create_valid_metainfo(metainfo):
     metainfo_result['initial peers'] = validate_init_peers(metainfo)
     metainfo_result['url-list'] = validate_url_list(metainfo)
     metainfo_result['httpseeds'] = validate_http_seeds(metainfo)
-    metainfo_result['info'] = validate_torrent_info(metainfo)
+    metainfo_result['info'] = dict(validate_torrent_info(metainfo))
 
     # remove elements if None i.e. not valid.
     for key in {'httpseeds', 'url-list', 'nodes', 'initial peers'}:
-        if not metainfo[key]:
-            del metainfo[key]
+        if not metainfo_result[key]:
+            del metainfo_result[key]
 
-    if not ('announce' in metainfo or 'nodes' in metainfo):
+    if not ('announce' in metainfo_result or 'nodes' in metainfo_result):
         # disabling this check, modifying metainfo to allow for ill-formatted torrents
         metainfo_result['nodes'] = []
 
     return dict((key, val) for key, val in metainfo_result.iteritems()
-                if val or (metainfo[key] and metainfo[key] == val))
+                if val or (metainfo_result[key] and metainfo_result[key] == val))
 
 
 def valid_torrent_file(metainfo):
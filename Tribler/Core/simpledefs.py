@@ -33,6 +33,7 @@ DLMODE_VOD = 1
 PERSISTENTSTATE_CURRENTVERSION = 5
 
 STATEDIR_DLPSTATE_DIR = u'dlcheckpoints'
+STATEDIR_RESUME_STORE_DIR = u'resumestore'
 STATEDIR_WALLET_DIR = u'wallet'
 
 # For observer/callback mechanism, see Session.add_observer()
@@ -115,6 +116,11 @@ NTFY_ACT_MEET = 4
 # Infohashes are always 20 byte binary strings
 INFOHASH_LENGTH = 20
 
+# Priorities of metainfo lookups, lookups with a lower value are started first
+METAINFO_PRIORITY_GUI = 0
+METAINFO_PRIORITY_CHANNEL = 1
+METAINFO_PRIORITY_BACKGROUND = 2
+
 
 # SIGNALS (for internal use)
 SIGNAL_ALLCHANNEL_COMMUNITY = 'signal_allchannel_community'
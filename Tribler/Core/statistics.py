@@ -28,6 +28,9 @@ class TriblerStatistics(object):
 
         stats_dict = {"torrents": {"num_collected": torrent_stats[0], "total_size": torrent_total_size,
                                    "num_files": torrent_stats[2]},
+                      "torrent_ingest_stats": torrent_db_handler.get_ingest_stats(),
+                      "notifier_stats": self.session.notifier.get_stats(),
+                      "download_states_stats": self.session.lm.download_states_stats,
 
                       "num_channels": channel_db_handler.getNrChannels(),
                       "database_size": os.path.getsize(
@@ -42,6 +45,15 @@ class TriblerStatistics(object):
             stats_dict["torrent_queue_size_stats"] = torrent_queue_size_stats
             stats_dict["torrent_queue_bandwidth_stats"] = torrent_queue_bandwidth_stats
 
+        if self.session.lm.ltmgr:
+            stats_dict["libtorrent_alert_stats"] = self.session.lm.ltmgr.get_alert_stats()
+            stats_dict["metainfo_cache_stats"] = self.session.lm.ltmgr.metainfo_cache.get_stats()
+            stats_dict["metainfo_request_stats"] = self.session.lm.ltmgr.get_metainfo_stats()
+
+        if self.session.sqlite_db:
+            stats_dict["database_commit_stats"] = self.session.sqlite_db.get_commit_stats()
+            stats_dict["database_statement_cache_stats"] = self.session.sqlite_db.get_statement_cache_stats()
+
         return stats_dict
 
     def get_dispersy_statistics(self):
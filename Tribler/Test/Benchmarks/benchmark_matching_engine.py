@@ -0,0 +1,84 @@
+"""
+Micro-benchmark of the matching engine on synthetic order books.
+
+Fills an order book with asks on a grid of prices and reports how many bid orders per second MatchingEngine.match_order
+matches against it, for order books of increasing size. Every order book is also swept by a single bid that crosses
+all price levels, to measure the cost of walking a deep book.
+Run from the root of the repository:
+
+    python Tribler/Test/Benchmarks/benchmark_matching_engine.py --sizes 1000 10000 100000
+"""
+import argparse
+import random
+import sys
+import time
+from os.path import abspath, dirname, join
+
+sys.path.insert(0, abspath(join(dirname(__file__), "..", "..", "..")))
+
+from Tribler.community.market.core.matching_engine import MatchingEngine, PriceTimeStrategy
+from Tribler.community.market.core.message import TraderId, MessageNumber, MessageId
+from Tribler.community.market.core.message_repository import MemoryMessageRepository
+from Tribler.community.market.core.order import Order, OrderId, OrderNumber
+from Tribler.community.market.core.orderbook import OrderBook
+from Tribler.community.market.core.price import Price
+from Tribler.community.market.core.quantity import Quantity
+from Tribler.community.market.core.tick import Ask
+from Tribler.community.market.core.timeout import Timeout
+from Tribler.community.market.core.timestamp import Timestamp
+
+
+def create_order_book(num_ticks, rnd):
+    order_book = OrderBook(MemoryMessageRepository('0'))
+    timestamp = Timestamp.now()
+    for index in xrange(num_ticks):
+        trader_id = TraderId(str(index % 1000))
+        order_book.insert_ask(Ask(MessageId(trader_id, MessageNumber(str(index))),
+                                  OrderId(trader_id, OrderNumber(index)),
+                                  Price(rnd.randint(1, num_ticks) / 100.0, 'BTC'),
+                                  Quantity(rnd.randint(1, 10), 'MC'), Timeout(3600), timestamp))
+    return order_book
+
+
+def create_bid_order(number, price, quantity):
+    return Order(OrderId(TraderId('ffff'), OrderNumber(number)), Price(price, 'BTC'), Quantity(quantity, 'MC'),
+                 Timeout(3600), Timestamp.now(), False)
+
+
+def benchmark(num_ticks, num_orders, rnd):
+    order_book = create_order_book(num_ticks, rnd)
+    matching_engine = MatchingEngine(PriceTimeStrategy(order_book))
+    max_price = num_ticks / 100.0
+
+    # The orders only reserve quantity for themselves, so the order book stays the same between matches
+    orders = [create_bid_order(index, rnd.uniform(0, max_price), rnd.randint(1, 50)) for index in xrange(num_orders)]
+    num_trades = 0
+    start = time.time()
+    for order in orders:
+        num_trades += len(matching_engine.match_order(order))
+    duration = time.time() - start
+    print "%7d ticks: %8.0f matches/s, %8.0f proposed trades/s" % (num_ticks, num_orders / duration,
+                                                                   num_trades / duration)
+
+    start = time.time()
+    trades = matching_engine.match_order(create_bid_order(num_orders, max_price, 10 * num_ticks))
+    print "%7d ticks: swept the whole book in %.2f s (%d proposed trades)" % (num_ticks, time.time() - start,
+                                                                              len(trades))
+    order_book.cancel_all_pending_tasks()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the matching engine")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000],
+                        help="number of ticks in the order books")
+    parser.add_argument("--orders", type=int, default=1000, help="number of orders to match per order book")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    for size in args.sizes:
+        benchmark(size, args.orders, rnd)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Benchmark of the order book under a stream of ticks.
+
+Replays a number of random asks and bids through OrderBook.insert_ask and OrderBook.insert_bid, then measures the
+lookup of the best prices, walks every price level like the matching engine does and finally removes all ticks.
+Run from the root of the repository:
+
+    python Tribler/Test/Benchmarks/benchmark_orderbook.py --ticks 100000
+"""
+import argparse
+import random
+import sys
+import time
+from os.path import abspath, dirname, join
+
+sys.path.insert(0, abspath(join(dirname(__file__), "..", "..", "..")))
+
+from Tribler.community.market.core.message import TraderId, MessageNumber, MessageId
+from Tribler.community.market.core.message_repository import MemoryMessageRepository
+from Tribler.community.market.core.order import OrderId, OrderNumber
+from Tribler.community.market.core.orderbook import OrderBook
+from Tribler.community.market.core.price import Price
+from Tribler.community.market.core.quantity import Quantity
+from Tribler.community.market.core.tick import Ask, Bid
+from Tribler.community.market.core.timeout import Timeout
+from Tribler.community.market.core.timestamp import Timestamp
+
+
+def create_ticks(num_ticks, num_price_levels, rnd):
+    timestamp = Timestamp.now()
+    for index in xrange(num_ticks):
+        tick_cls = Ask if index % 2 else Bid
+        # Prices are drawn from a fixed grid so several ticks share a price level
+        price = rnd.randint(1, num_price_levels) / 100.0
+        trader_id = TraderId(str(index % 1000))
+        yield tick_cls(MessageId(trader_id, MessageNumber(str(index))), OrderId(trader_id, OrderNumber(index)),
+                       Price(price, 'BTC'), Quantity(rnd.randint(1, 100), 'MC'), Timeout(3600), timestamp)
+
+
+def walk_price_levels(side):
+    """
+    Walk all price levels from the lowest to the highest price with succ_item, as done by the matching engine.
+    """
+    price_level_list = side.get_price_level_list('BTC', 'MC')
+    price = price_level_list.min_key()
+    steps = 1
+    while True:
+        try:
+            price, _ = price_level_list.succ_item(price)
+        except IndexError:
+            return steps
+        steps += 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the insertion and removal of ticks in the order book")
+    parser.add_argument("--ticks", type=int, default=100000, help="number of ticks to insert")
+    parser.add_argument("--price-levels", type=int, default=50000, help="number of distinct prices")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    ticks = list(create_ticks(args.ticks, args.price_levels, rnd))
+    order_book = OrderBook(MemoryMessageRepository('0'))
+
+    start = time.time()
+    for tick in ticks:
+        if isinstance(tick, Ask):
+            order_book.insert_ask(tick)
+        else:
+            order_book.insert_bid(tick)
+    duration = time.time() - start
+    print "Inserted %d ticks in %.2f s (%.0f ticks/s)" % (len(ticks), duration, len(ticks) / duration)
+
+    start = time.time()
+    for _ in xrange(len(ticks)):
+        order_book.get_bid_price('BTC', 'MC')
+        order_book.get_ask_price('BTC', 'MC')
+    duration = time.time() - start
+    print "Best bid/ask lookup: %.2f us" % (1000000 * duration / len(ticks))
+
+    start = time.time()
+    steps = walk_price_levels(order_book.asks) + walk_price_levels(order_book.bids)
+    duration = time.time() - start
+    print "Walked %d price levels in %.2f s" % (steps, duration)
+
+    rnd.shuffle(ticks)
+    start = time.time()
+    for tick in ticks:
+        if isinstance(tick, Ask):
+            order_book.remove_ask(tick.order_id)
+        else:
+            order_book.remove_bid(tick.order_id)
+    duration = time.time() - start
+    print "Removed %d ticks in %.2f s (%.0f ticks/s)" % (len(ticks), duration, len(ticks) / duration)
+
+    order_book.cancel_all_pending_tasks()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Benchmark of the PageRank reputation of the market on a synthetic TradeChain graph.
+
+Generates random trades between peers and compares the time needed to compute the reputation by rebuilding a
+networkx graph from all blocks, as the market did before, with PagerankReputationManager. The latter is measured for
+a computation from scratch and for an incremental update after a number of new blocks arrived.
+Run from the root of the repository:
+
+    python Tribler/Test/Benchmarks/benchmark_reputation.py --blocks 1000000 --peers 50000
+"""
+import argparse
+import random
+import sys
+import time
+from collections import namedtuple
+from os.path import abspath, dirname, join
+
+sys.path.insert(0, abspath(join(dirname(__file__), "..", "..", "..")))
+
+from Tribler.community.market.reputation.pagerank_manager import PagerankReputationManager
+
+SyntheticBlock = namedtuple("SyntheticBlock", ["public_key", "link_public_key", "transaction"])
+
+
+def create_blocks(num_blocks, num_peers, rnd):
+    peers = ["peer%d" % index for index in xrange(num_peers)]
+    blocks = []
+    for _ in xrange(num_blocks):
+        # Some peers trade a lot more than others
+        public_key = peers[min(int(rnd.paretovariate(1.2)) - 1, num_peers - 1)]
+        link_public_key = rnd.choice(peers)
+        blocks.append(SyntheticBlock(public_key, link_public_key, {"asset1_amount": rnd.randint(1, 100),
+                                                                   "asset2_amount": rnd.randint(1, 100)}))
+    return blocks
+
+
+def networkx_pagerank(blocks, own_public_key):
+    """
+    The reputation computation of the market before PagerankReputationManager kept the graph between computations.
+    """
+    import networkx as nx
+
+    nodes = set()
+    graph = nx.Graph()
+    for block in blocks:
+        nodes.add(block.public_key)
+        nodes.add(block.link_public_key)
+        graph.add_edge(block.public_key, block.link_public_key,
+                       attr_dict={'weight': block.transaction["asset1_amount"]})
+        graph.add_edge(block.link_public_key, block.public_key,
+                       attr_dict={'weight': block.transaction["asset2_amount"]})
+
+    personalization_vector = {}
+    for node in nodes:
+        personalization_vector[node] = 0
+    personalization_vector[own_public_key] = 1
+    return nx.pagerank_scipy(graph, personalization=personalization_vector)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PageRank reputation computation of the market")
+    parser.add_argument("--blocks", type=int, default=1000000, help="number of blocks in the graph")
+    parser.add_argument("--peers", type=int, default=50000, help="number of peers in the graph")
+    parser.add_argument("--new-blocks", type=int, default=10000, help="number of blocks of the incremental update")
+    parser.add_argument("--skip-networkx", action="store_true", help="do not run the networkx implementation")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    blocks = create_blocks(args.blocks, args.peers, rnd)
+    new_blocks = create_blocks(args.new_blocks, args.peers, rnd)
+    own_public_key = blocks[0].public_key
+
+    if not args.skip_networkx:
+        start = time.time()
+        expected = networkx_pagerank(blocks, own_public_key)
+        print "networkx:              %7.2f s" % (time.time() - start)
+
+    start = time.time()
+    manager = PagerankReputationManager(blocks)
+    build_duration = time.time() - start
+    start = time.time()
+    reputation = manager.compute(own_public_key)
+    print "sparse, from scratch:  %7.2f s (%.2f s to add the blocks)" % (build_duration + time.time() - start,
+                                                                        build_duration)
+
+    if not args.skip_networkx:
+        print "maximum difference with networkx: %.2e" % max(abs(reputation[public_key] - score)
+                                                             for public_key, score in expected.iteritems())
+
+    start = time.time()
+    manager.add_blocks(new_blocks)
+    manager.compute(own_public_key)
+    print "sparse, %d new blocks: %7.2f s" % (len(new_blocks), time.time() - start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Micro-benchmark of checkpointing and loading the persistent state of downloads at startup.
+
+Checkpoints a number of downloads and loads them again, once the way it was done before, with a .state file per
+download that is written when its resume data comes in and read back through a glob of the checkpoint directory, and
+once the way it is done now, with all pstates in a single LevelDB store that is written in one batch and read back in
+one scan. Besides the time spent on disk, it reports how long it takes until the last download is added to the session:
+before, the downloads were resumed 0.1 seconds apart, now they are resumed a page at a time in consecutive reactor
+iterations. Run from the root of the repository:
+
+    python Tribler/Test/Benchmarks/benchmark_resume_store.py --downloads 100 1000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from binascii import hexlify, unhexlify
+from glob import iglob
+from os.path import abspath, dirname, join
+
+sys.path.insert(0, abspath(join(dirname(__file__), "..", "..", "..")))
+
+from Tribler.Core.APIImplementation.LaunchManyCore import RESUME_PAGE_SIZE
+from Tribler.Core.Utilities.configparser import CallbackConfigParser
+from Tribler.Core.leveldbstore import LevelDbStore
+
+# Delay between resuming two downloads before they were resumed a page at a time
+SETUP_DELAY = 0.1
+
+
+def create_pstate(index, args):
+    infohash = os.urandom(20)
+    pstate = CallbackConfigParser()
+    pstate.add_section('download_defaults')
+    pstate.set('download_defaults', 'saveas', u'/home/user/Downloads')
+    pstate.set('download_defaults', 'hops', 1)
+    pstate.add_section('state')
+    pstate.set('state', 'version', 5)
+    pstate.set('state', 'metainfo', {'info': {'name': 'download %d' % index, 'piece length': 262144,
+                                              'pieces': os.urandom(20 * args.pieces), 'length': 262144 * args.pieces}})
+    pstate.set('state', 'engineresumedata', {'info-hash': infohash, 'file-format': 'libtorrent resume file',
+                                             'pieces': '\x01' * args.pieces, 'peers': os.urandom(6 * 50)})
+    return infohash, pstate
+
+
+def checkpoint_files(state_dir, pstates):
+    for infohash, pstate in pstates:
+        pstate.write_file(os.path.join(state_dir, hexlify(infohash) + '.state'))
+
+
+def load_files(state_dir):
+    loaded = []
+    for filename in iglob(os.path.join(state_dir, '*.state')):
+        pstate = CallbackConfigParser()
+        pstate.read_file(filename)
+        loaded.append((unhexlify(os.path.basename(filename)[:-6]), pstate))
+    return loaded
+
+
+def checkpoint_store(store, pstates):
+    for infohash, pstate in pstates:
+        store[hexlify(infohash)] = pstate.write_string()
+    store.flush()
+
+
+def load_store(store):
+    loaded = []
+    for hexinfohash in set(store):
+        pstate = CallbackConfigParser()
+        pstate.read_string(store[hexinfohash])
+        loaded.append((unhexlify(hexinfohash), pstate))
+    return loaded
+
+
+def benchmark(num_downloads, args):
+    pstates = [create_pstate(index, args) for index in xrange(num_downloads)]
+    tmp_dir = tempfile.mkdtemp(suffix="_resume_store_benchmark")
+    try:
+        state_dir = os.path.join(tmp_dir, "dlcheckpoints")
+        os.makedirs(state_dir)
+
+        start = time.time()
+        checkpoint_files(state_dir, pstates)
+        checkpoint_time = time.time() - start
+        start = time.time()
+        loaded = load_files(state_dir)
+        load_time = time.time() - start
+        assert len(loaded) == num_downloads
+        print "%6d downloads  before  checkpoint %7.3f s  load %7.3f s  last download added after %7.1f s" % (
+            num_downloads, checkpoint_time, load_time, load_time + (num_downloads - 1) * SETUP_DELAY)
+
+        store = LevelDbStore(os.path.join(tmp_dir, "resumestore"))
+        start = time.time()
+        checkpoint_store(store, pstates)
+        checkpoint_time = time.time() - start
+        start = time.time()
+        loaded = load_store(store)
+        load_time = time.time() - start
+        store.close()
+        assert len(loaded) == num_downloads
+        print "%6d downloads  now     checkpoint %7.3f s  load %7.3f s  last download added after %d pages" % (
+            num_downloads, checkpoint_time, load_time, (num_downloads + RESUME_PAGE_SIZE - 1) // RESUME_PAGE_SIZE)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark checkpointing and loading the pstates of downloads")
+    parser.add_argument("--downloads", type=int, nargs="+", default=[100, 1000], help="numbers of downloads")
+    parser.add_argument("--pieces", type=int, default=1000, help="number of pieces per download")
+    args = parser.parse_args()
+
+    for num_downloads in args.downloads:
+        benchmark(num_downloads, args)
+
+
+if __name__ == "__main__":
+    main()
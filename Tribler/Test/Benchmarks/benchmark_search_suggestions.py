@@ -0,0 +1,110 @@
+"""
+Benchmark of search suggestions and autocompletion at the scale of a large local torrent database.
+
+Creates a full text index with a synthetic set of torrent names, loads the term index from it and measures the
+latency of search suggestions for misspelled queries and of autocompletion, as done by TorrentDBHandler.
+Run from the root of the repository:
+
+    python Tribler/Test/Benchmarks/benchmark_search_suggestions.py --torrents 1000000
+"""
+import argparse
+import random
+import sqlite3
+import string
+import sys
+import time
+from bisect import bisect_left
+from os.path import abspath, dirname, join
+
+sys.path.insert(0, abspath(join(dirname(__file__), "..", "..", "..")))
+
+from Tribler.Core.CacheDB.SqliteCacheDBHandler import SUGGESTION_MAX_CANDIDATES, SUGGESTION_MAX_TERMS
+from Tribler.Core.CacheDB.term_index import TermIndex, rank_suggestions
+
+
+def create_vocabulary(size, rnd):
+    vocabulary = set()
+    while len(vocabulary) < size:
+        vocabulary.add("".join(rnd.choice(string.ascii_lowercase) for _ in xrange(rnd.randint(3, 10))))
+    return sorted(vocabulary)
+
+
+def create_swarmnames(num_torrents, vocabulary, rnd):
+    # Term popularity roughly follows a Zipf distribution, like the words in real torrent names.
+    weights = [1.0 / (rank + 1) for rank in xrange(len(vocabulary))]
+    total = sum(weights)
+    cumulative = []
+    acc = 0.0
+    for weight in weights:
+        acc += weight / total
+        cumulative.append(acc)
+
+    for _ in xrange(num_torrents):
+        terms = [vocabulary[min(bisect_left(cumulative, rnd.random()), len(vocabulary) - 1)]
+                 for _ in xrange(rnd.randint(2, 6))]
+        yield (" ".join(terms),)
+
+
+def misspell(term, rnd):
+    index = rnd.randrange(len(term))
+    return term[:index] + rnd.choice(string.ascii_lowercase) + term[index + 1:]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark search suggestions and autocompletion")
+    parser.add_argument("--torrents", type=int, default=1000000, help="number of torrents in the index")
+    parser.add_argument("--vocabulary", type=int, default=200000, help="number of distinct terms")
+    parser.add_argument("--queries", type=int, default=200, help="number of queries to measure")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    vocabulary = create_vocabulary(args.vocabulary, rnd)
+
+    connection = sqlite3.connect(":memory:")
+    connection.execute("CREATE VIRTUAL TABLE FullTextIndex USING fts4(swarmname, filenames, fileextensions)")
+    connection.execute("CREATE VIRTUAL TABLE temp.FullTextIndexTerms USING fts4aux(main, FullTextIndex)")
+    start = time.time()
+    connection.executemany("INSERT INTO FullTextIndex (swarmname) VALUES (?)",
+                           create_swarmnames(args.torrents, vocabulary, rnd))
+    print "Created full text index with %d torrents in %.1f s" % (args.torrents, time.time() - start)
+
+    term_index = TermIndex()
+    start = time.time()
+    term_index.load(connection.execute("SELECT term, documents FROM FullTextIndexTerms WHERE col = 0"))
+    print "Loaded term index in %.1f s: %s" % (time.time() - start, term_index.get_stats())
+
+    start = time.time()
+    for swarmname, in create_swarmnames(10000, vocabulary, rnd):
+        term_index.add_swarmname(swarmname)
+    print "Incremental updates: %.0f torrents/s" % (10000 / (time.time() - start))
+
+    queries = [[misspell(term, rnd) for term in rnd.sample(vocabulary[:10000], 2)] for _ in xrange(args.queries)]
+    latencies = []
+    for keywords in queries:
+        start = time.time()
+        terms = term_index.get_suggestion_terms(keywords, SUGGESTION_MAX_TERMS)
+        if terms:
+            results = connection.execute("SELECT swarmname FROM FullTextIndex WHERE swarmname MATCH ? LIMIT ?",
+                                         (" OR ".join(terms), SUGGESTION_MAX_CANDIDATES)).fetchall()
+            rank_suggestions([result[0] for result in results], keywords, 1)
+        latencies.append(time.time() - start)
+    report("Search suggestion", latencies)
+
+    latencies = []
+    for keywords in queries:
+        start = time.time()
+        term_index.get_completions(keywords[0][:3], 5)
+        latencies.append(time.time() - start)
+    report("Autocompletion", latencies)
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    print "%s latency: mean %.2f ms, median %.2f ms, p99 %.2f ms" % (
+        name, 1000 * sum(latencies) / len(latencies), 1000 * latencies[len(latencies) // 2],
+        1000 * latencies[int(len(latencies) * 0.99)])
+
+
+if __name__ == "__main__":
+    main()
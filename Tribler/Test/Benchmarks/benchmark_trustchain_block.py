@@ -0,0 +1,71 @@
+"""
+Micro-benchmark of the encoding and hashing of TrustChain blocks.
+
+Creates a number of blocks with random keys and reports how many blocks per second are packed, unpacked and hashed,
+how fast a memoized hash is returned and how fast blocks are loaded from database rows that include the stored hash.
+Run from the root of the repository:
+
+    python Tribler/Test/Benchmarks/benchmark_trustchain_block.py --blocks 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from os.path import abspath, dirname, join
+
+sys.path.insert(0, abspath(join(dirname(__file__), "..", "..", "..")))
+
+from Tribler.community.trustchain.block import TrustChainBlock, PK_LENGTH, HASH_LENGTH, SIG_LENGTH
+
+
+def create_blocks(num_blocks, rnd):
+    blocks = []
+    for index in xrange(num_blocks):
+        block = TrustChainBlock()
+        block.transaction = {"up": rnd.randint(0, 2 ** 32), "down": rnd.randint(0, 2 ** 32),
+                             "total_up": rnd.randint(0, 2 ** 40), "total_down": rnd.randint(0, 2 ** 40)}
+        block.public_key = os.urandom(PK_LENGTH)
+        block.sequence_number = index + 1
+        block.link_public_key = os.urandom(PK_LENGTH)
+        block.link_sequence_number = rnd.randint(0, index + 1)
+        block.previous_hash = os.urandom(HASH_LENGTH)
+        block.signature = os.urandom(SIG_LENGTH)
+        blocks.append(block)
+    return blocks
+
+
+def measure(description, func, items):
+    start = time.time()
+    for item in items:
+        func(item)
+    duration = time.time() - start
+    print "%-28s %10.0f blocks/s" % (description, len(items) / duration if duration > 0 else float("inf"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the packing, unpacking and hashing of TrustChain blocks")
+    parser.add_argument("--blocks", type=int, default=100000, help="number of blocks")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    blocks = create_blocks(args.blocks, rnd)
+
+    measure("hash (first access)", lambda block: block.hash, blocks)
+    measure("hash (memoized)", lambda block: block.hash, blocks)
+    measure("pack (memoized)", lambda block: block.pack(), blocks)
+    measure("pack unsigned", lambda block: block.pack(signature=False), blocks)
+
+    packed = [block.pack() for block in blocks]
+    measure("unpack", TrustChainBlock.unpack, packed)
+    measure("unpack and hash", lambda data: TrustChainBlock.unpack(data).hash, packed)
+
+    rows = [block.pack_db_insert() for block in blocks]
+    rows = [row[:7] + (None, row[7]) for row in rows]
+    measure("load from database row", TrustChainBlock, rows)
+    measure("load and hash", lambda row: TrustChainBlock(row).hash, rows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Micro-benchmark of the encryption of tunnel packets.
+
+Encrypts and decrypts packets of a number of sizes on a single core and reports the packets per second of a new cipher
+per packet, as TunnelCrypto did before, of the cached context of a session and of the batched encrypt_many and
+decrypt_many. The onion encryption of a circuit with a number of hops is measured as well.
+Run from the root of the repository:
+
+    python Tribler/Test/Benchmarks/benchmark_tunnel_crypto.py --packets 100000 --sizes 64 512 1400
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+from os.path import abspath, dirname, join
+
+sys.path.insert(0, abspath(join(dirname(__file__), "..", "..", "..")))
+
+from Tribler.community.tunnel import EXIT_NODE
+from Tribler.community.tunnel.crypto.cryptowrapper import Cipher, algorithms, modes, default_backend
+from Tribler.community.tunnel.crypto.tunnelcrypto import TunnelCrypto
+
+
+def encrypt_new_cipher(content, key, salt, salt_explicit):
+    """
+    The encryption of TunnelCrypto before the cipher context was kept between packets.
+    """
+    cipher = Cipher(algorithms.AES(key), modes.GCM(initialization_vector=salt + str(salt_explicit)),
+                    backend=default_backend()).encryptor()
+    ciphertext = cipher.update(content) + cipher.finalize()
+    return struct.pack('!q16s', salt_explicit, cipher.tag) + ciphertext
+
+
+def decrypt_new_cipher(content, key, salt):
+    salt_explicit, gcm_tag = struct.unpack_from('!q16s', content)
+    cipher = Cipher(algorithms.AES(key), modes.GCM(initialization_vector=salt + str(salt_explicit), tag=gcm_tag),
+                    backend=default_backend()).decryptor()
+    return cipher.update(content[24:]) + cipher.finalize()
+
+
+def measure(description, func, num_packets):
+    start = time.time()
+    func()
+    duration = time.time() - start
+    print "  %-30s %10.0f packets/s" % (description, num_packets / duration if duration > 0 else float("inf"))
+
+
+def benchmark(crypto, size, num_packets, num_hops):
+    print "%d byte packets:" % size
+    packets = [os.urandom(size) for _ in xrange(num_packets)]
+    keys = crypto.generate_session_keys(os.urandom(32))
+    key, salt = keys[EXIT_NODE], keys[EXIT_NODE + 2]
+
+    encrypted = [encrypt_new_cipher(packet, key, salt, index) for index, packet in enumerate(packets, 1)]
+    measure("encrypt, new cipher", lambda: [encrypt_new_cipher(packet, key, salt, index)
+                                            for index, packet in enumerate(packets, 1)], num_packets)
+    measure("encrypt, cached context", lambda: [crypto.encrypt_packet(packet, keys, EXIT_NODE)
+                                                for packet in packets], num_packets)
+    measure("encrypt_many", lambda: crypto.encrypt_many(packets, keys, EXIT_NODE), num_packets)
+
+    measure("decrypt, new cipher", lambda: [decrypt_new_cipher(packet, key, salt) for packet in encrypted],
+            num_packets)
+    measure("decrypt, cached context", lambda: [crypto.decrypt_packet(packet, keys, EXIT_NODE)
+                                                for packet in encrypted], num_packets)
+    measure("decrypt_many", lambda: crypto.decrypt_many(encrypted, keys, EXIT_NODE), num_packets)
+
+    hop_keys = [crypto.generate_session_keys(os.urandom(32)) for _ in xrange(num_hops)]
+
+    def onion_new_cipher():
+        for packet in packets:
+            for keys in reversed(hop_keys):
+                keys[EXIT_NODE + 4] += 1
+                packet = encrypt_new_cipher(packet, keys[EXIT_NODE], keys[EXIT_NODE + 2], keys[EXIT_NODE + 4])
+
+    def onion_cached_context():
+        for packet in packets:
+            for keys in reversed(hop_keys):
+                packet = crypto.encrypt_packet(packet, keys, EXIT_NODE)
+
+    measure("%d hop onion, new cipher" % num_hops, onion_new_cipher, num_packets)
+    measure("%d hop onion, cached context" % num_hops, onion_cached_context, num_packets)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the encryption of tunnel packets")
+    parser.add_argument("--packets", type=int, default=100000, help="number of packets per measurement")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[64, 512, 1400], help="packet sizes in bytes")
+    parser.add_argument("--hops", type=int, default=3, help="number of hops of the onion encryption")
+    args = parser.parse_args()
+
+    crypto = object.__new__(TunnelCrypto)
+    for size in args.sizes:
+        benchmark(crypto, size, args.packets, args.hops)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark of the relaying of tunnel data packets by the data plane.
+
+Sets up a relay for a number of circuits on the local host and pushes encrypted data packets through it, once relayed
+by the process itself, as the reactor does without data plane, and once for every number of data plane workers. A sink
+process receives the relayed packets and reports how many packets per second came through.
+Run from the root of the repository:
+
+    python Tribler/Test/Benchmarks/benchmark_tunnel_dataplane.py --workers 1 2 4 8 --packets 200000
+"""
+import argparse
+import multiprocessing
+import os
+import select
+import socket
+import struct
+import sys
+import time
+from os.path import abspath, dirname, join
+
+sys.path.insert(0, abspath(join(dirname(__file__), "..", "..", "..")))
+
+from Tribler.community.tunnel import EXIT_NODE
+from Tribler.community.tunnel.conversion import TunnelConversion
+from Tribler.community.tunnel.crypto.tunnelcrypto import SessionKeys, TunnelCrypto
+from Tribler.community.tunnel.dataplane import DataPlane
+
+DATA_PREFIX = "fffffffe".decode("HEX")
+
+
+class Route(object):
+
+    def __init__(self, circuit_id, sock_addr):
+        self.circuit_id = circuit_id
+        self.sock_addr = sock_addr
+
+
+def sink(sock, num_packets, results):
+    count = 0
+    start = None
+    while count < num_packets:
+        if not select.select([sock], [], [], 2.0)[0]:
+            break
+        sock.recv(65536)
+        count += 1
+        if start is None:
+            start = time.time()
+    results.put((count, time.time() - start if start else 0))
+
+
+def create_packets(crypto, circuits, num_packets, size):
+    packets = []
+    for index in xrange(num_packets):
+        circuit_id, keys = circuits[index % len(circuits)]
+        # Encrypted like the originator encrypts the layer of this hop
+        packets.append(struct.pack('!I', circuit_id) + crypto.encrypt_packet(os.urandom(size), keys, EXIT_NODE))
+    return packets
+
+
+def relay_in_process(crypto, circuits, endpoint_socket, sink_address, packets):
+    keys_by_circuit = dict(circuits)
+    for packet in packets:
+        circuit_id = TunnelConversion.get_circuit_id(packet, u"data")
+        header, encrypted = TunnelConversion.split_relayed_packet(packet, u"data", circuit_id, circuit_id + 1)
+        packet = crypto.decrypt_packet(encrypted, keys_by_circuit[circuit_id], EXIT_NODE, header)
+        endpoint_socket.sendto(DATA_PREFIX + packet, sink_address)
+
+
+def relay_in_dataplane(dataplane, packets):
+    for packet in packets:
+        circuit_id = TunnelConversion.get_circuit_id(packet, u"data")
+        packet_socket = dataplane.get_worker(circuit_id).packet_socket
+        while True:
+            try:
+                packet_socket.send(packet)
+                break
+            except socket.error:
+                # Wait for the worker instead of dropping the packet, to measure the throughput of the workers
+                select.select([], [packet_socket], [])
+
+
+def benchmark(num_workers, args):
+    crypto = object.__new__(TunnelCrypto)
+    circuits = [(circuit_id, crypto.generate_session_keys(os.urandom(32)))
+                for circuit_id in xrange(2, 2 * args.circuits + 2, 2)]
+    packets = create_packets(crypto, circuits, args.packets, args.size)
+
+    endpoint_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    endpoint_socket.bind(("127.0.0.1", 0))
+    sink_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sink_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 8 * 1024 * 1024)
+    sink_socket.bind(("127.0.0.1", 0))
+    sink_address = sink_socket.getsockname()
+
+    dataplane = None
+    if num_workers:
+        dataplane = DataPlane(num_workers, crypto, endpoint_socket, DATA_PREFIX)
+        dataplane.start()
+        for circuit_id, keys in circuits:
+            dataplane.add_relay(circuit_id, Route(circuit_id + 1, sink_address), SessionKeys(keys), EXIT_NODE)
+
+    results = multiprocessing.Queue()
+    sink_process = multiprocessing.Process(target=sink, args=(sink_socket, len(packets), results))
+    sink_process.start()
+
+    if dataplane:
+        relay_in_dataplane(dataplane, packets)
+    else:
+        relay_in_process(crypto, circuits, endpoint_socket, sink_address, packets)
+
+    count, duration = results.get()
+    sink_process.join()
+    if dataplane:
+        dataplane.stop()
+
+    description = "%d workers" % num_workers if num_workers else "in process"
+    print "%-12s %8.0f packets/s (%d of %d packets relayed)" % (description, count / duration if duration else 0,
+                                                                 count, len(packets))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the relaying of tunnel data packets")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4],
+                        help="numbers of data plane workers to measure")
+    parser.add_argument("--packets", type=int, default=200000, help="number of packets per measurement")
+    parser.add_argument("--circuits", type=int, default=64, help="number of relayed circuits")
+    parser.add_argument("--size", type=int, default=1024, help="size of the packets in bytes")
+    args = parser.parse_args()
+
+    print "%d cores" % multiprocessing.cpu_count()
+    benchmark(0, args)
+    for num_workers in args.workers:
+        benchmark(num_workers, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Micro-benchmark of the handling of the packets that a relay forwards.
+
+Relays bursts of data packets through one hop on a single core, in both directions, and reports the packets per second
+and the number of times the payload of a packet is copied, apart from the output of AES-GCM itself, until the packet is
+ready to be sent with the data prefix in front of it. Measured once the way relay_packets did it before, splitting
+the packet, joining it again and swapping the circuit_id in the joined packet, and once the way it is done now, with
+the encrypted part read from a buffer into the received packet and written behind the rewritten header.
+
+Payload copies per hop, as counted from the code:
+
+    direction   before  now
+    decrypt     7       2    (buffer + tag for AESGCM, header + plaintext)
+    encrypt     7       2    (str of the buffer for AESGCM, header + tag + ciphertext)
+
+The data prefix is part of the header now. The reactor still has the Dispersy endpoint put the prefix in front, which
+is one more copy in both cases. Run from the root of the repository:
+
+    python Tribler/Test/Benchmarks/benchmark_tunnel_packets.py --packets 100000 --sizes 1024 1400
+"""
+import argparse
+import os
+import struct
+import sys
+import time
+from os.path import abspath, dirname, join
+
+sys.path.insert(0, abspath(join(dirname(__file__), "..", "..", "..")))
+
+from Tribler.community.tunnel import EXIT_NODE, ORIGINATOR
+from Tribler.community.tunnel.conversion import TunnelConversion
+from Tribler.community.tunnel.crypto.tunnelcrypto import TunnelCrypto
+
+DATA_PREFIX = "fffffffe".decode("HEX")
+
+CIRCUIT_ID = 42
+NEXT_CIRCUIT_ID = 43
+
+# Copies of the payload per hop, see the table above
+COPIES = {("before", EXIT_NODE): 7, ("before", ORIGINATOR): 7, ("now", EXIT_NODE): 2, ("now", ORIGINATOR): 2}
+
+
+def encrypt_before(context, content, salt_explicit):
+    """
+    GCMContext.encrypt before the encrypted content was written behind a header.
+    """
+    data = context.aesgcm.encrypt(context._build_nonce(salt_explicit), content, None)
+    return struct.pack('!q', salt_explicit) + data[-16:] + data[:-16]
+
+
+def decrypt_before(context, content):
+    salt_explicit, gcm_tag = struct.unpack_from('!q16s', content)
+    return context.aesgcm.decrypt(context._build_nonce(salt_explicit), content[24:] + gcm_tag, None)
+
+
+def relay_before(crypto, keys, direction, packets):
+    context = keys.get_context(direction)
+    relayed = []
+    for packet in packets:
+        plaintext, encrypted = TunnelConversion.split_encrypted_packet(packet, u"data")
+        if direction == ORIGINATOR:
+            keys[direction + 4] += 1
+            content = encrypt_before(context, encrypted, keys[direction + 4])
+        else:
+            content = decrypt_before(context, encrypted)
+        packet = TunnelConversion.swap_circuit_id(plaintext + content, u"data", CIRCUIT_ID, NEXT_CIRCUIT_ID)
+        relayed.append(DATA_PREFIX + packet)
+    return relayed
+
+
+def relay_now(crypto, keys, direction, packets):
+    headers, encrypted = zip(*[TunnelConversion.split_relayed_packet(packet, u"data", CIRCUIT_ID, NEXT_CIRCUIT_ID)
+                               for packet in packets])
+    headers = [DATA_PREFIX + header for header in headers]
+    if direction == ORIGINATOR:
+        return crypto.encrypt_many(encrypted, keys, ORIGINATOR, headers)
+    return crypto.decrypt_many(encrypted, keys, EXIT_NODE, headers)
+
+
+def benchmark(crypto, name, relay, direction, size, args):
+    keys = crypto.generate_session_keys(os.urandom(32))
+    if direction == ORIGINATOR:
+        # Packets on their way back to the originator arrive with the payload of the exit node
+        packets = [struct.pack('!I', CIRCUIT_ID) + os.urandom(size) for _ in xrange(args.burst)]
+    else:
+        # Packets on their way to the exit node arrive with a layer of encryption for this hop
+        packets = [struct.pack('!I', CIRCUIT_ID) + crypto.encrypt_packet(os.urandom(size), keys, EXIT_NODE)
+                   for _ in xrange(args.burst)]
+
+    expected = relay(crypto, keys, direction, packets)
+    assert all(packet[:8] == DATA_PREFIX + struct.pack('!I', NEXT_CIRCUIT_ID) for packet in expected)
+
+    rounds = max(1, args.packets // args.burst)
+    start = time.time()
+    for _ in xrange(rounds):
+        relay(crypto, keys, direction, packets)
+    duration = time.time() - start
+
+    print "%-8s %-8s %6d bytes %9.0f packets/s %3d payload copies per hop" % (
+        "decrypt" if direction == EXIT_NODE else "encrypt", name, size, rounds * args.burst / duration,
+        COPIES[(name, direction)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the handling of relayed tunnel packets")
+    parser.add_argument("--packets", type=int, default=100000, help="number of packets per measurement")
+    parser.add_argument("--burst", type=int, default=64, help="number of packets relayed at once")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1024, 1400], help="sizes of the packets in bytes")
+    args = parser.parse_args()
+
+    crypto = object.__new__(TunnelCrypto)
+    if not crypto.generate_session_keys("1234").get_context(EXIT_NODE).aesgcm:
+        print "AESGCM is not available, the packets are not handled the way this benchmark measures"
+        return
+
+    for size in args.sizes:
+        for direction in (EXIT_NODE, ORIGINATOR):
+            benchmark(crypto, "before", relay_before, direction, size, args)
+            benchmark(crypto, "now", relay_now, direction, size, args)
+
+
+if __name__ == "__main__":
+    main()
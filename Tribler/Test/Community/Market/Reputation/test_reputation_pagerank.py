@@ -1,4 +1,5 @@
 from Tribler.Test.Community.Market.Reputation.test_reputation_base import TestReputationBase
+from Tribler.Test.twisted_thread import deferred
 from Tribler.community.market.reputation.pagerank_manager import PagerankReputationManager
 
 
@@ -18,3 +19,75 @@ class TestReputationPagerank(TestReputationBase):
         rep_manager = PagerankReputationManager(blocks)
         rep = rep_manager.compute(own_public_key='a')
         self.assertIsInstance(rep, dict)
+
+    def test_pagerank_empty(self):
+        """
+        Test the reputation of an empty TradeChain graph
+        """
+        rep_manager = PagerankReputationManager([])
+        self.assertEqual(rep_manager.compute(own_public_key='a'), {})
+
+    def test_pagerank_two_peers(self):
+        """
+        Test the reputation of two peers that only interacted with each other
+        """
+        self.insert_transaction('a', 'b', 1, 20, 2, 20)
+        rep = PagerankReputationManager(self.tradechain_db.get_all_blocks()).compute(own_public_key='a')
+        # The random walk moves between a and b and teleports back to a
+        self.assertAlmostEqual(rep['a'], 1 / 1.85, places=4)
+        self.assertAlmostEqual(rep['b'], 0.85 / 1.85, places=4)
+
+    def test_pagerank_incremental(self):
+        """
+        Test whether adding blocks to the graph gives the same reputation as computing it from all blocks
+        """
+        self.insert_transaction('a', 'b', 1, 20, 2, 20)
+        self.insert_transaction('b', 'c', 1, 20, 2, 30)
+        blocks, cursor = self.tradechain_db.get_blocks_since(None)
+        self.assertEqual(len(blocks), 2)
+        rep_manager = PagerankReputationManager(blocks)
+        rep_manager.compute(own_public_key='a')
+
+        self.insert_transaction('b', 'd', 1, 20, 2, 20)
+        self.insert_transaction('a', 'b', 1, 20, 2, 5)
+        blocks, _ = self.tradechain_db.get_blocks_since(cursor)
+        self.assertEqual(len(blocks), 2)
+        rep_manager.add_blocks(blocks)
+        rep = rep_manager.compute(own_public_key='a')
+
+        expected_rep = PagerankReputationManager(self.tradechain_db.get_all_blocks()).compute(own_public_key='a')
+        self.assertEqual(set(rep.keys()), set(expected_rep.keys()))
+        for public_key, score in expected_rep.iteritems():
+            self.assertAlmostEqual(rep[public_key], score, places=4)
+
+    def test_get_blocks_since(self):
+        """
+        Test whether only the blocks that were added after the cursor are returned, also within the same second
+        """
+        self.insert_transaction('a', 'b', 1, 20, 2, 20)
+        blocks, cursor = self.tradechain_db.get_blocks_since(None)
+        self.assertEqual(len(blocks), 1)
+
+        self.insert_transaction('b', 'c', 1, 20, 2, 30)
+        self.tradechain_db.execute(u"UPDATE tradechain SET insert_time = ?", (cursor[0],))
+        blocks, cursor = self.tradechain_db.get_blocks_since(cursor)
+        self.assertEqual([block.public_key for block in blocks], ['b'])
+        self.assertEqual(self.tradechain_db.get_blocks_since(cursor), ([], cursor))
+
+    @deferred(timeout=10)
+    def test_compute_async(self):
+        """
+        Test whether the reputation is computed in a thread and cached
+        """
+        self.insert_transaction('a', 'b', 1, 20, 2, 20)
+        rep_manager = PagerankReputationManager(self.tradechain_db.get_all_blocks())
+        self.assertIsNone(rep_manager.get_reputation('b'))
+
+        def on_reputation(rep):
+            self.assertAlmostEqual(rep['b'], 0.85 / 1.85, places=4)
+            self.assertEqual(rep_manager.get_reputation('b'), rep['b'])
+            self.assertEqual(rep_manager.get_reputation('b', max_age=60), rep['b'])
+            self.assertIsNone(rep_manager.get_reputation('b', max_age=-1))
+            self.assertIsNone(rep_manager.get_reputation('c'))
+
+        return rep_manager.compute_async(own_public_key='a').addCallback(on_reputation)
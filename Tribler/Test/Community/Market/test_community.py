@@ -400,9 +400,10 @@ class CommunityTestSuite(AbstractTestCommunity):
         """
         self.market_community.tradechain_community = MockObject()
         self.market_community.tradechain_community.persistence = MockObject()
-        self.market_community.tradechain_community.persistence.get_all_blocks = lambda: []
+        self.market_community.tradechain_community.persistence.get_blocks_since = lambda _: ([], None)
         self.market_community.compute_reputation()
         self.assertFalse(self.market_community.reputation_dict)
+        self.assertIsNone(self.market_community.get_reputation('a'))
 
     @blocking_call_on_reactor_thread
     def test_abort_transaction(self):
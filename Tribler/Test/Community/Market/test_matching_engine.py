@@ -134,51 +134,51 @@ class PriceTimeStrategyTestSuite(AbstractServer):
         self.assertEquals(Price(200, 'BTC'), proposed_trades[0].price)
         self.assertEquals(Quantity(30, 'MC'), proposed_trades[0].quantity)
 
-    def test_search_for_quantity_in_order_book_partial_ask_low(self):
-        # Test for protected search for quantity in order book partial ask when price is too low
+    def test_search_for_quantity_in_order_book_next_ask_low(self):
+        # Test for search for quantity in the next price level of the order book for an ask when the price is too low
         self.order_book.insert_bid(self.bid)
         self.order_book.insert_bid(self.bid2)
         self.order_book.insert_bid(self.bid3)
         self.order_book.insert_bid(self.bid4)
-        quantity_to_trade, proposed_trades = self.price_time_strategy._search_for_quantity_in_order_book_partial_ask(
-            Price(100, 'BTC'), Quantity(30, 'MC'), [],
-            self.ask_order2)
+        price, price_level = self.price_time_strategy._get_next_price_level(Price(100, 'BTC'), 'MC', self.ask_order2)
+        quantity_to_trade, proposed_trades = self.price_time_strategy._search_for_quantity_in_order_book(
+            price, price_level, Quantity(30, 'MC'), self.ask_order2)
         self.assertEquals(1, len(proposed_trades))
         self.assertEquals(Quantity(0, 'MC'), quantity_to_trade)
 
-    def test_search_for_quantity_in_order_book_partial_ask(self):
-        # Test for protected search for quantity in order book partial ask
+    def test_search_for_quantity_in_order_book_next_ask(self):
+        # Test for search for quantity in the next price level of the order book for an ask
         self.order_book.insert_bid(self.bid)
         self.order_book.insert_bid(self.bid2)
         self.order_book.insert_bid(self.bid3)
         self.order_book.insert_bid(self.bid4)
-        quantity_to_trade, proposed_trades = self.price_time_strategy._search_for_quantity_in_order_book_partial_ask(
-            Price(100, 'BTC'), Quantity(30, 'MC'), [],
-            self.ask_order)
+        price, price_level = self.price_time_strategy._get_next_price_level(Price(100, 'BTC'), 'MC', self.ask_order)
+        quantity_to_trade, proposed_trades = self.price_time_strategy._search_for_quantity_in_order_book(
+            price, price_level, Quantity(30, 'MC'), self.ask_order)
         self.assertEquals(0, len(proposed_trades))
         self.assertEquals(Quantity(30, 'MC'), quantity_to_trade)
 
-    def test_search_for_quantity_in_order_book_partial_bid_high(self):
-        # Test for protected search for quantity in order book partial bid when price is too high
+    def test_search_for_quantity_in_order_book_next_bid_high(self):
+        # Test for search for quantity in the next price level of the order book for a bid when the price is too high
         self.order_book.insert_ask(self.ask)
         self.order_book.insert_ask(self.ask2)
         self.order_book.insert_ask(self.ask3)
         self.order_book.insert_ask(self.ask4)
-        quantity_to_trade, proposed_trades = self.price_time_strategy._search_for_quantity_in_order_book_partial_bid(
-            Price(100, 'BTC'), Quantity(30, 'MC'), [],
-            self.bid_order)
+        price, price_level = self.price_time_strategy._get_next_price_level(Price(100, 'BTC'), 'MC', self.bid_order)
+        quantity_to_trade, proposed_trades = self.price_time_strategy._search_for_quantity_in_order_book(
+            price, price_level, Quantity(30, 'MC'), self.bid_order)
         self.assertEquals(0, len(proposed_trades))
         self.assertEquals(Quantity(30, 'MC'), quantity_to_trade)
 
-    def test_search_for_quantity_in_order_book_partial_bid(self):
-        # Test for protected search for quantity in order book partial bid
+    def test_search_for_quantity_in_order_book_next_bid(self):
+        # Test for search for quantity in the next price level of the order book for a bid
         self.order_book.insert_ask(self.ask)
         self.order_book.insert_ask(self.ask2)
         self.order_book.insert_ask(self.ask3)
         self.order_book.insert_ask(self.ask4)
-        quantity_to_trade, proposed_trades = self.price_time_strategy._search_for_quantity_in_order_book_partial_bid(
-            Price(50, 'BTC'), Quantity(30, 'MC'), [],
-            self.bid_order)
+        price, price_level = self.price_time_strategy._get_next_price_level(Price(50, 'BTC'), 'MC', self.bid_order)
+        quantity_to_trade, proposed_trades = self.price_time_strategy._search_for_quantity_in_order_book(
+            price, price_level, Quantity(30, 'MC'), self.bid_order)
         self.assertEquals(1, len(proposed_trades))
         self.assertEquals(Quantity(0, 'MC'), quantity_to_trade)
 
@@ -202,6 +202,36 @@ class PriceTimeStrategyTestSuite(AbstractServer):
             self.order_book.get_tick(self.ask2.order_id), Quantity(10, 'MC'), self.bid_order2)
         self.assertFalse(trades)
 
+    def test_match_order_reputation(self):
+        """
+        Test whether the ticks of traders with a low reputation are skipped
+        """
+        low_ask = Ask(MessageId(TraderId('2'), MessageNumber('1')), OrderId(TraderId('2'), OrderNumber(20)),
+                      Price(100, 'BTC'), Quantity(30, 'MC'), Timeout(100), Timestamp.now(), public_key='low')
+        self.order_book.insert_ask(low_ask)
+        self.order_book.insert_ask(self.ask2)
+        price_time_strategy = PriceTimeStrategy(self.order_book, {'low': 0.1}.get, min_reputation=0.5)
+        proposed_trades = price_time_strategy.match_order(self.bid_order)
+        self.assertEquals(1, len(proposed_trades))
+        self.assertEquals(self.ask2.order_id, proposed_trades[0].recipient_order_id)
+
+    def test_match_order_deep_order_book(self):
+        """
+        Test whether an order can be matched against more price levels than the recursion limit
+        """
+        for index in xrange(2000):
+            trader_id = TraderId(str(index % 2))
+            self.order_book.insert_ask(Ask(MessageId(trader_id, MessageNumber(str(index))),
+                                           OrderId(trader_id, OrderNumber(index + 100)),
+                                           Price(1 + index, 'BTC'), Quantity(1, 'MC'), Timeout(100),
+                                           Timestamp.now()))
+        bid_order = Order(OrderId(TraderId('9'), OrderNumber(15)), Price(3000, 'BTC'), Quantity(3000, 'MC'),
+                          Timeout(100), Timestamp.now(), False)
+        proposed_trades = self.price_time_strategy.match_order(bid_order)
+        self.assertEquals(2000, len(proposed_trades))
+        self.assertEquals(Price(1, 'BTC'), proposed_trades[0].price)
+        self.assertEquals(Quantity(1000, 'MC'), bid_order.available_quantity)
+
 
 class MatchingEngineTestSuite(AbstractServer):
     """Matching engine test cases."""
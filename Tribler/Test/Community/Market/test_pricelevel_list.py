@@ -102,3 +102,21 @@ class PriceLevelListTestSuite(unittest.TestCase):
     def test_items_reverse_empty(self):
         # Test for items when empty with reverse attribute
         self.assertEquals([], self.price_level_list2.items(reverse=True))
+
+    def test_insert_unordered(self):
+        # Test for insert when the prices are not inserted in order
+        price_level_list = PriceLevelList()
+        prices = [Price(value, 'BTC') for value in [5, 1, 4, 2.5, 3, 0]]
+        for price in prices:
+            price_level_list.insert(price, PriceLevel('MC'))
+        self.assertEquals(sorted(float(price) for price in prices),
+                          [float(price) for price, _ in price_level_list.items()])
+        self.assertEquals(Price(0, 'BTC'), price_level_list.min_key())
+        self.assertEquals(Price(5, 'BTC'), price_level_list.max_key())
+        self.assertEquals(Price(3, 'BTC'), price_level_list.succ_item(Price(2.5, 'BTC'))[0])
+        self.assertEquals(6, len(price_level_list))
+
+    def test_succ_item_unknown(self):
+        # Test for succ item when the price is not in the list
+        with self.assertRaises(ValueError):
+            self.price_level_list.succ_item(Price(2.5, 'BTC'))
@@ -1,6 +1,6 @@
 import os
 from nose.tools import raises
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, succeed
 
 from Tribler.Test.Community.AbstractTestCommunity import AbstractTestCommunity
 from Tribler.Test.Core.base_test import MockObject
@@ -43,10 +43,10 @@ class TestSearchCommunity(AbstractTestCommunity):
         create_search_response.called = False
 
         def search_names(keywords, local=False, keys=None):
-            return []
+            return succeed([])
 
         self.search_community._torrent_db = MockObject()
-        self.search_community._torrent_db.searchNames = search_names
+        self.search_community._torrent_db.search_names_async = search_names
 
         fake_message = MockObject()
         fake_message.candidate = MockObject()
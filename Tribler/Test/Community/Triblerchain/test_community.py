@@ -309,7 +309,7 @@ class TestTriblerChainCommunity(BaseTestTrustChainCommunity):
         # and we don't actually want to send the crawl request since the counter party is fake, just count if it is run
         counter = [0]
 
-        def on_crawl_request(cand, pk, sequence_number=None):
+        def on_crawl_request(cand, pk, sequence_number=None, limit=None):
             # Ignore live edge request
             if sequence_number != -1:
                 counter[0] += 1
@@ -51,6 +51,10 @@ class MockDatabase(object):
         item = [i for i in self.data[blk.public_key] if i.sequence_number < blk.sequence_number]
         return item[-1] if item else None
 
+    def get_block_neighbourhood(self, blk):
+        return (self.get(blk.public_key, blk.sequence_number), self.get_linked(blk), self.get_block_before(blk),
+                self.get_block_after(blk))
+
 
 class TestBlocks(TrustChainTestCase):
     """
@@ -62,6 +66,50 @@ class TestBlocks(TrustChainTestCase):
         self.assertEqual(block.hash, '\x1f\x1bp\x90\xe3>\x83\xf6\xcd\xafd\xd9\xee\xfb"&|<ZLsyB:Z\r'
                                      '<\xc5\xb0\x97\xa3\xaf')
 
+    def test_hash_memoized(self):
+        """
+        Test whether the memoized hash of a block is dropped when a field of the block is assigned
+        """
+        block = TestBlock()
+        block_hash = block.hash
+        self.assertIs(block.hash, block_hash)
+
+        block.sequence_number += 1
+        self.assertNotEqual(block.hash, block_hash)
+        self.assertEqual(block.hash, sha256(block.pack()).digest())
+
+        block_hash = block.hash
+        block.transaction = dict(block.transaction, id=43)
+        self.assertNotEqual(block.hash, block_hash)
+        self.assertEqual(block.hash, sha256(block.pack()).digest())
+
+    def test_pack_transaction_changed_in_place(self):
+        """
+        Test whether a block is packed and signed with its transaction after the transaction was changed in place
+        """
+        block = TestBlock()
+        packed = block.pack()
+        block.transaction["id"] = 43
+        self.assertNotEqual(block.pack(), packed)
+        self.assertEqual(block.hash, sha256(block.pack()).digest())
+
+        block.sign(block.key)
+        self.assertTrue(ECCrypto().is_valid_signature(block.key, block.pack(signature=False), block.signature))
+        self.assertEqual(TrustChainBlock.unpack(block.pack()).transaction["id"], 43)
+
+    def test_hash_from_database_row(self):
+        """
+        Test whether a block created from a database row uses the stored hash
+        """
+        block = TestBlock()
+        row = block.pack_db_insert()
+        db_block = TrustChainBlock(row[:7] + (None, row[7]))
+        self.assertEqual(db_block.hash, block.hash)
+        self.assertEqual(db_block.pack(), block.pack())
+
+        db_block.signature = EMPTY_SIG
+        self.assertEqual(db_block.hash, sha256(db_block.pack()).digest())
+
     def test_sign(self):
         crypto = ECCrypto()
         block = TestBlock()
@@ -11,7 +11,8 @@ from Tribler.Test.Community.Trustchain.test_trustchain_utilities import TrustCha
 from Tribler.Test.Core.base_test import MockObject
 from Tribler.Test.test_as_server import AbstractServer
 from Tribler.community.trustchain.block import GENESIS_SEQ
-from Tribler.community.trustchain.community import (TrustChainCommunity, HALF_BLOCK, CRAWL)
+from Tribler.community.trustchain.community import (TrustChainCommunity, HALF_BLOCK, CRAWL, CRAWL_LIMIT,
+                                                    LEGACY_CRAWL_LIMIT)
 from Tribler.dispersy.candidate import Candidate
 from Tribler.dispersy.message import DelayPacketByMissingMember
 from Tribler.dispersy.requestcache import IntroductionRequestCache
@@ -43,12 +44,24 @@ class BaseTestTrustChainCommunity(TrustChainTestCase, DispersyTestFunc):
 
     @blocking_call_on_reactor_thread
     def assertBlocksAreEqual(self, node, other):
-        map(self.assertEqual_block,
-            node.community.persistence.crawl(node.community.my_member.public_key, 0),
-            other.community.persistence.crawl(node.community.my_member.public_key, 0))
-        map(self.assertEqual_block,
-            node.community.persistence.crawl(other.community.my_member.public_key, 0),
-            other.community.persistence.crawl(other.community.my_member.public_key, 0))
+        for public_key in (node.community.my_member.public_key, other.community.my_member.public_key):
+            node_blocks = self.get_chain_from_db(node, public_key)
+            other_blocks = self.get_chain_from_db(other, public_key)
+            self.assertEqual(len(node_blocks), len(other_blocks))
+            map(self.assertEqual_block, node_blocks, other_blocks)
+
+    @staticmethod
+    def get_chain_from_db(node, public_key):
+        """
+        Return the blocks of the chain of a public key and the blocks linked to it, ordered by chain and sequence number
+        """
+        persistence = node.community.persistence
+        latest = persistence.get_latest(public_key)
+        if not latest:
+            return []
+        pages = persistence.iter_crawl_range(public_key, GENESIS_SEQ, latest.sequence_number)
+        return sorted([block for page in pages for block in page],
+                      key=lambda block: (block.public_key, block.sequence_number))
 
     @blocking_call_on_reactor_thread
     def get_node_sq_from_db(self, node, sq_owner_node, sequence_number):
@@ -304,6 +317,27 @@ class TestTrustChainCommunity(BaseTestTrustChainCommunity):
         self.assertIsNotNone(self.get_node_sq_from_db(crawler, node, 3))
         self.assertIsNotNone(self.get_node_sq_from_db(crawler, other, 3))
 
+    def test_crawl_legacy_limit(self):
+        """
+        Test whether a crawl request with the limit that older peers always send is answered with CRAWL_LIMIT blocks
+        """
+        # Arrange
+        node, crawler = self.create_nodes(2)
+        crawled = []
+
+        def mocked_iter_crawl_range(_, start_seq, end_seq):
+            crawled.append((start_seq, end_seq))
+            return iter([])
+        node.community.persistence.iter_crawl_range = mocked_iter_crawl_range
+
+        # Act
+        crawler.call(crawler.community.send_crawl_request, self._create_target(crawler, node),
+                     node.my_member.public_key, GENESIS_SEQ, LEGACY_CRAWL_LIMIT)
+        node.give_message(node.receive_message(names=[CRAWL]).next()[1], crawler)
+
+        # Assert
+        self.assertEqual(crawled, [(GENESIS_SEQ, GENESIS_SEQ + CRAWL_LIMIT - 1)])
+
     def test_crawl_no_block(self):
         """
         Test crawl without a block.
@@ -100,6 +100,19 @@ class TestConversion(TrustChainTestCase):
         # Assert
         self.assertEqual(requested_sequence_number, result.requested_sequence_number)
 
+    def test_encoding_decoding_crawl_request_limit(self):
+        """
+        Test if the number of requested blocks is sent with a crawl request message.
+        """
+        meta = self.community.get_meta_message(CRAWL)
+        message = meta.impl(distribution=(self.community.claim_global_time(),), payload=(500, 42))
+
+        encoded_message = self.converter._encode_crawl_request(message)[0]
+        result = self.converter._decode_crawl_request(TestPlaceholder(meta), 0, encoded_message)[1]
+
+        self.assertEqual(500, result.requested_sequence_number)
+        self.assertEqual(42, result.limit)
+
     def test_decoding_crawl_request_wrong_size(self):
         """
         Test if a DropPacket is raised when the crawl request size is wrong.
@@ -4,7 +4,8 @@ from twisted.internet.defer import inlineCallbacks
 
 from Tribler.Test.Community.Trustchain.test_trustchain_utilities import TestBlock, TrustChainTestCase
 from Tribler.dispersy.util import blocking_call_on_reactor_thread
-from Tribler.community.trustchain.database import TrustChainDB, DATABASE_DIRECTORY
+from Tribler.community.trustchain import database as database_module
+from Tribler.community.trustchain.database import TrustChainDB, DATABASE_DIRECTORY, BlockCache
 
 
 class TestDatabase(TrustChainTestCase):
@@ -31,6 +32,41 @@ class TestDatabase(TrustChainTestCase):
         result = self.db.get_latest(self.block1.public_key)
         self.assertEqual_block(self.block1, result)
 
+    @blocking_call_on_reactor_thread
+    def test_add_blocks(self):
+        """
+        Test whether a batch of blocks is added to the database and committed later
+        """
+        self.db.add_blocks([self.block1, self.block2])
+        self.assertEqual_block(self.block1, self.db.get_latest(self.block1.public_key))
+        self.assertEqual_block(self.block2, self.db.get_latest(self.block2.public_key))
+        self.assertEqual(self.db.get_ingest_stats()["pending_blocks"], 2)
+        self.assertTrue(self.db._commit_call.active())
+
+        self.db.commit()
+        self.assertIsNone(self.db._commit_call)
+        stats = self.db.get_ingest_stats()
+        self.assertEqual(stats["pending_blocks"], 0)
+        self.assertEqual(stats["blocks"], 2)
+        self.assertEqual(stats["batches"], 1)
+
+    @blocking_call_on_reactor_thread
+    def test_add_blocks_commit_batch_size(self):
+        """
+        Test whether a batch of blocks is committed right away when enough blocks are pending
+        """
+        self.db.add_blocks([])
+        self.assertEqual(self.db.get_ingest_stats()["batches"], 0)
+
+        commit_batch_size = database_module.COMMIT_BATCH_SIZE
+        database_module.COMMIT_BATCH_SIZE = 2
+        try:
+            self.db.add_blocks([self.block1, self.block2])
+        finally:
+            database_module.COMMIT_BATCH_SIZE = commit_batch_size
+        self.assertIsNone(self.db._commit_call)
+        self.assertEqual(self.db.get_ingest_stats()["pending_blocks"], 0)
+
     @blocking_call_on_reactor_thread
     def test_get_upgrade_script(self):
         self.assertIsNone(self.db.get_upgrade_script(42))
@@ -85,6 +121,128 @@ class TestDatabase(TrustChainTestCase):
         # Assert
         self.assertEqual_block(self.block1, result)
 
+    @blocking_call_on_reactor_thread
+    def test_get_linked_not_cached(self):
+        """
+        Test whether a linked block is found in the database when it is not in the block cache
+        """
+        self.block2 = TestBlock.create({"id": 42}, self.db, self.block2.public_key, link=self.block1)
+        self.db.add_block(self.block1)
+        self.db.add_block(self.block2)
+        self.db.block_cache = BlockCache()
+        self.assertEqual_block(self.block2, self.db.get_linked(self.block1))
+        self.assertEqual_block(self.block1, self.db.get_linked(self.block2))
+        self.assertEqual(len(self.db.block_cache), 2)
+
+    @blocking_call_on_reactor_thread
+    def test_get_block_neighbourhood(self):
+        """
+        Test whether the block, its linked block, predecessor and successor are fetched together
+        """
+        block3 = TestBlock(previous=self.block1)
+        block4 = TestBlock(previous=block3)
+        link = TestBlock.create({"id": 42}, self.db, self.block2.public_key, link=block3)
+        self.db.add_block(self.block1)
+        self.db.add_block(block3)
+        self.db.add_block(block4)
+        self.db.add_block(link)
+
+        for block_cache in [self.db.block_cache, BlockCache()]:
+            self.db.block_cache = block_cache
+            blk, linked, prev_blk, next_blk = self.db.get_block_neighbourhood(block3)
+            self.assertEqual_block(block3, blk)
+            self.assertEqual_block(link, linked)
+            self.assertEqual_block(self.block1, prev_blk)
+            self.assertEqual_block(block4, next_blk)
+
+        self.assertEqual((None, None, None, None), self.db.get_block_neighbourhood(TestBlock()))
+
+    @blocking_call_on_reactor_thread
+    def test_get_block_neighbourhood_new_block(self):
+        """
+        Test whether the neighbourhood of a new block at the end of a chain is served from the block cache
+        """
+        self.db.add_block(self.block1)
+        self.db.add_block(self.block2)
+        block3 = TestBlock(previous=self.block2)
+        blk, linked, _, next_blk = self.db.get_block_neighbourhood(block3)
+        self.assertEqual((None, None, None), (blk, linked, next_blk))
+        self.db.add_block(block3)
+        link = TestBlock.create({"id": 42}, self.db, self.block2.public_key, link=self.block1)
+
+        execute = self.db.execute
+        self.db.execute = lambda *_: self.fail("The database was queried")
+        blk, linked, prev_blk, next_blk = self.db.get_block_neighbourhood(link)
+        self.assertIsNone(blk)
+        self.assertEqual_block(self.block1, linked)
+        self.assertEqual_block(block3, prev_blk)
+        self.assertIsNone(next_blk)
+
+        self.db.execute = execute
+        self.db.add_block(link)
+        self.assertEqual_block(link, self.db.get_block_neighbourhood(link)[0])
+
+    @blocking_call_on_reactor_thread
+    def test_block_cache_eviction(self):
+        """
+        Test whether the least recently used blocks are evicted from the block cache
+        """
+        self.db.block_cache = BlockCache(capacity=1)
+        self.db.add_block(self.block1)
+        self.db.add_block(self.block2)
+        self.assertEqual(len(self.db.block_cache), 1)
+        self.assertIsNone(self.db.block_cache.get(self.block1.public_key, self.block1.sequence_number))
+        self.assertEqual_block(self.block1, self.db.get(self.block1.public_key, self.block1.sequence_number))
+
+    @blocking_call_on_reactor_thread
+    def test_crawl_range(self):
+        """
+        Test whether a range crawl returns a page of a chain followed by the blocks linked to it
+        """
+        # The third block of the chain countersigns a proposal of another chain
+        request = TestBlock()
+        chain = [self.block1]
+        for _ in xrange(4):
+            chain.append(TestBlock(previous=chain[-1]))
+        request.link_public_key = chain[0].public_key
+        chain[2].link_public_key = request.public_key
+        chain[2].link_sequence_number = request.sequence_number
+        for block in chain + [request]:
+            self.db.add_block(block)
+        # A block of another chain that countersigns the second block of the chain
+        link = TestBlock.create({"id": 42}, self.db, self.block2.public_key, link=chain[1])
+        self.db.add_block(link)
+
+        start_seq = chain[0].sequence_number
+        blocks, last_seq = self.db.crawl_range(chain[0].public_key, start_seq, start_seq + 10, limit=3)
+        self.assertEqual(last_seq, chain[2].sequence_number)
+        self.assertEqual([block.hash for block in blocks[:3]], [block.hash for block in chain[:3]])
+        self.assertItemsEqual([block.hash for block in blocks[3:]], [link.hash, request.hash])
+
+        pages = list(self.db.iter_crawl_range(chain[0].public_key, start_seq, start_seq + 3, page_size=2))
+        self.assertEqual([len(page) for page in pages], [3, 3])
+        self.assertEqual(pages[1][1].sequence_number, start_seq + 3)
+        end_seq = chain[-1].sequence_number
+        self.assertEqual(list(self.db.iter_crawl_range(chain[0].public_key, end_seq + 1, end_seq + 100)), [])
+
+    @blocking_call_on_reactor_thread
+    def test_crawl_range_proposals(self):
+        """
+        Test whether the proposals to a chain that it has not countersigned are returned with exactly one page
+        """
+        chain = [self.block1]
+        for _ in xrange(4):
+            chain.append(TestBlock(previous=chain[-1]))
+        for block in chain:
+            self.db.add_block(block)
+        proposal = TestBlock.create({"id": 43}, self.db, self.block2.public_key, link_pk=chain[0].public_key)
+        self.db.add_block(proposal)
+
+        end_seq = chain[-1].sequence_number
+        pages = list(self.db.iter_crawl_range(chain[0].public_key, chain[0].sequence_number, end_seq, page_size=2))
+        self.assertEqual(len(pages), 3)
+        self.assertEqual([block.hash for page in pages for block in page].count(proposal.hash), 1)
+
     @blocking_call_on_reactor_thread
     def test_get_block_after(self):
         # Arrange
@@ -162,7 +320,10 @@ class TestDatabase(TrustChainTestCase):
     def test_database_upgrade(self):
         self.set_db_version(1)
         version, = next(self.db.execute(u"SELECT value FROM option WHERE key = 'database_version' LIMIT 1"))
-        self.assertEqual(version, u"1")
+        self.assertEqual(version, u"2")
+        index, = next(self.db.execute(u"SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? "
+                                      u"AND sql IS NOT NULL", (self.db.db_name,)))
+        self.assertEqual(index, u"trustchain_link_idx")
 
     @blocking_call_on_reactor_thread
     def test_database_no_downgrade(self):
@@ -0,0 +1,85 @@
+import socket
+import struct
+import time
+
+from Tribler.Test.Core.base_test import TriblerCoreTest
+from Tribler.community.tunnel import EXIT_NODE, ORIGINATOR
+from Tribler.community.tunnel.crypto.tunnelcrypto import TunnelCrypto
+from Tribler.community.tunnel.dataplane import DataPlane, DataPlaneWorker
+from Tribler.community.tunnel.routing import RelayRoute
+
+DATA_PREFIX = "fffffffe".decode("HEX")
+
+
+class TestDataPlane(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        super(TestDataPlane, self).setUp(annotate=annotate)
+        self.crypto = object.__new__(TunnelCrypto)
+        self.endpoint_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.endpoint_socket.bind(("127.0.0.1", 0))
+        self.next_hop = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.next_hop.bind(("127.0.0.1", 0))
+        self.next_hop.settimeout(5)
+        self.dataplane = DataPlane(2, self.crypto, self.endpoint_socket, DATA_PREFIX)
+        self.dataplane.start()
+
+    def tearDown(self, annotate=True):
+        self.dataplane.stop()
+        self.endpoint_socket.close()
+        self.next_hop.close()
+        super(TestDataPlane, self).tearDown(annotate=annotate)
+
+    def test_dispatch_unknown_circuit(self):
+        """
+        Test whether packets of circuits that the data plane does not relay are left to the reactor
+        """
+        self.assertFalse(self.dataplane.dispatch(42, struct.pack('!I', 42) + "abcd"))
+
+    def test_relay(self):
+        """
+        Test whether a worker relays a data packet from the endpoint socket to the next hop
+        """
+        session_keys = self.crypto.generate_session_keys("1234")
+        self.dataplane.add_relay(42, RelayRoute(43, self.next_hop.getsockname()), session_keys, EXIT_NODE)
+        self.dataplane.add_relay(43, RelayRoute(42, self.next_hop.getsockname()), session_keys, ORIGINATOR)
+
+        encrypted = self.crypto.encrypt_packet("abcd", self.crypto.generate_session_keys("1234"), EXIT_NODE)
+        self.assertTrue(self.dataplane.dispatch(42, struct.pack('!I', 42) + encrypted))
+
+        packet, address = self.next_hop.recvfrom(65536)
+        self.assertEqual(address, self.endpoint_socket.getsockname())
+        self.assertEqual(packet, DATA_PREFIX + struct.pack('!I', 43) + "abcd")
+
+        # The way back is encrypted by the worker of the other circuit_id
+        self.assertTrue(self.dataplane.dispatch(43, struct.pack('!I', 43) + "efgh"))
+        packet, _ = self.next_hop.recvfrom(65536)
+        self.assertEqual(packet[:8], DATA_PREFIX + struct.pack('!I', 42))
+        self.assertEqual(self.crypto.decrypt_packet(packet[8:], session_keys, ORIGINATOR), "efgh")
+
+        self.dataplane.remove_relay(42)
+        self.assertFalse(self.dataplane.dispatch(42, struct.pack('!I', 42) + encrypted))
+
+    def test_relay_before_route(self):
+        """
+        Test whether a worker relays the packets that arrive before the route of their circuit once the route arrives
+        """
+        worker = DataPlaneWorker(0, self.crypto, self.endpoint_socket, DATA_PREFIX)
+        worker.relay(44, [struct.pack('!I', 44) + "ijkl"])
+        self.assertIn(44, worker.unrouted)
+
+        session_keys = self.crypto.generate_session_keys("1234")
+        worker.on_control(("add", 44, 45, self.next_hop.getsockname(), list(session_keys), ORIGINATOR))
+        self.assertNotIn(44, worker.unrouted)
+
+        packet, _ = self.next_hop.recvfrom(65536)
+        self.assertEqual(packet[:8], DATA_PREFIX + struct.pack('!I', 45))
+
+    def test_remove_unrouted(self):
+        """
+        Test whether a worker drops the packets of circuits whose route does not arrive
+        """
+        worker = DataPlaneWorker(0, self.crypto, self.endpoint_socket, DATA_PREFIX)
+        worker.relay(44, [struct.pack('!I', 44) + "ijkl"])
+        worker.remove_unrouted(time.time() + 1)
+        self.assertEqual(worker.unrouted, {})
@@ -0,0 +1,80 @@
+from collections import defaultdict
+
+from twisted.internet.defer import Deferred
+from twisted.internet.error import DNSLookupError
+
+from Tribler.Test.Core.base_test import TriblerCoreTest
+from Tribler.community.tunnel import dns_cache
+from Tribler.community.tunnel.dns_cache import DnsCache
+
+
+class MockReactor(object):
+
+    def __init__(self):
+        self.resolving = []
+
+    def resolve(self, hostname):
+        deferred = Deferred()
+        self.resolving.append((hostname, deferred))
+        return deferred
+
+
+class TestDnsCache(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        super(TestDnsCache, self).setUp(annotate=annotate)
+        self.reactor = MockReactor()
+        self.original_reactor = dns_cache.reactor
+        dns_cache.reactor = self.reactor
+        self.stats = defaultdict(int)
+        self.dns_cache = DnsCache(self.stats, size=2, ttl=60, negative_ttl=10)
+
+    def tearDown(self, annotate=True):
+        dns_cache.reactor = self.original_reactor
+        super(TestDnsCache, self).tearDown(annotate=annotate)
+
+    def test_ip_address(self):
+        """
+        Test whether ip addresses are returned without being resolved or counted
+        """
+        self.assertEqual(self.dns_cache.get("1.2.3.4"), "1.2.3.4")
+        self.assertEqual(self.stats, {})
+
+    def test_resolve(self):
+        """
+        Test whether a hostname is resolved once for all lookups and is cached afterwards
+        """
+        self.assertRaises(KeyError, self.dns_cache.get, "localhost")
+        results = []
+        self.dns_cache.resolve("localhost").addCallback(results.append)
+        self.dns_cache.resolve("localhost").addCallback(results.append)
+        self.assertEqual(len(self.reactor.resolving), 1)
+
+        self.reactor.resolving[0][1].callback("127.0.0.1")
+        self.assertEqual(results, ["127.0.0.1", "127.0.0.1"])
+        self.assertEqual(self.dns_cache.get("localhost"), "127.0.0.1")
+        self.assertEqual(self.stats, {'dns_cache_hits': 1, 'dns_cache_misses': 2})
+
+    def test_resolve_error(self):
+        """
+        Test whether a hostname that could not be resolved is cached for a shorter time
+        """
+        failures = []
+        self.dns_cache.resolve("unknown").addErrback(failures.append)
+        self.reactor.resolving[0][1].errback(DNSLookupError("unknown"))
+        self.assertEqual(len(failures), 1)
+        self.assertIsNone(self.dns_cache.get("unknown"))
+
+        expiry, _ = self.dns_cache.entries["unknown"]
+        self.dns_cache.entries["unknown"] = (expiry - 10, None)
+        self.assertRaises(KeyError, self.dns_cache.get, "unknown")
+
+    def test_size(self):
+        """
+        Test whether the oldest hostnames are removed from a full cache
+        """
+        for index, hostname in enumerate(["a", "b", "c"]):
+            self.dns_cache.resolve(hostname)
+            self.reactor.resolving[index][1].callback("10.0.0.%d" % index)
+        self.assertRaises(KeyError, self.dns_cache.get, "a")
+        self.assertEqual(self.dns_cache.get("c"), "10.0.0.2")
@@ -0,0 +1,80 @@
+from twisted.internet.task import Clock
+
+from Tribler.Test.Core.base_test import TriblerCoreTest
+from Tribler.community.tunnel import scheduler
+from Tribler.community.tunnel.scheduler import PacketScheduler
+
+
+class TestPacketScheduler(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        super(TestPacketScheduler, self).setUp(annotate=annotate)
+        self.clock = Clock()
+        self.original_reactor = scheduler.reactor
+        scheduler.reactor = self.clock
+        self.sent = []
+
+    def tearDown(self, annotate=True):
+        scheduler.reactor = self.original_reactor
+        super(TestPacketScheduler, self).tearDown(annotate=annotate)
+
+    def send_packets(self, circuit_id):
+        return lambda packets: self.sent.extend((circuit_id, packet) for packet in packets)
+
+    def test_no_limits(self):
+        """
+        Test whether packets are sent right away without rate limits
+        """
+        packet_scheduler = PacketScheduler()
+        self.assertEqual(packet_scheduler.send(1, ["a" * 1000] * 100, self.send_packets(1)), 100)
+        self.assertEqual(len(self.sent), 100)
+        self.assertFalse(self.clock.getDelayedCalls())
+
+    def test_circuit_rate(self):
+        """
+        Test whether the packets of a circuit over its rate limit wait until the bucket is refilled
+        """
+        packet_scheduler = PacketScheduler(circuit_rate=2000)
+        packet_scheduler.send(1, ["a" * 1000] * 2, self.send_packets(1))
+        packet_scheduler.send(1, ["b" * 1000], self.send_packets(1))
+        self.assertEqual(len(self.sent), 2)
+        self.assertEqual(packet_scheduler.get_stats()[1]['queued_packets'], 1)
+
+        # Other circuits have their own bucket, but wait for their turn
+        packet_scheduler.send(2, ["c" * 1000], self.send_packets(2))
+        self.clock.advance(0.01)
+        self.assertEqual(self.sent[2:], [(2, "c" * 1000)])
+
+        self.clock.advance(0.5)
+        self.assertEqual(self.sent[3:], [(1, "b" * 1000)])
+        self.assertEqual(packet_scheduler.get_stats(), {})
+
+    def test_fair_queuing(self):
+        """
+        Test whether circuits that wait for the global rate limit take turns
+        """
+        packet_scheduler = PacketScheduler(rate=1000)
+        packet_scheduler.send(1, ["a" * 600], self.send_packets(1))
+        packet_scheduler.send(1, ["a" * 500] * 10, self.send_packets(1))
+        packet_scheduler.send(2, ["b" * 500] * 2, self.send_packets(2))
+        self.assertEqual(len(self.sent), 1)
+
+        for _ in xrange(200):
+            self.clock.advance(0.05)
+        self.assertEqual([circuit_id for circuit_id, _ in self.sent[1:7]], [1, 2, 1, 2, 1, 1])
+        self.assertEqual(len(self.sent), 13)
+
+    def test_queue_size(self):
+        """
+        Test whether packets are dropped once the queue of a circuit is full, and the queue is removed with the circuit
+        """
+        packet_scheduler = PacketScheduler(circuit_rate=1000, max_queue_size=2000)
+        packet_scheduler.send(1, ["a" * 1000], self.send_packets(1))
+        self.assertEqual(packet_scheduler.send(1, ["a" * 1000] * 3, self.send_packets(1)), 2)
+        self.assertEqual(packet_scheduler.get_stats(), {1: {'queued_packets': 2, 'queued_bytes': 2000,
+                                                            'dropped_packets': 1}})
+
+        packet_scheduler.remove_circuit(1)
+        self.assertEqual(packet_scheduler.get_stats(), {})
+        self.clock.advance(10)
+        self.assertEqual(len(self.sent), 1)
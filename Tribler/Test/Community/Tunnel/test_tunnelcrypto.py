@@ -0,0 +1,64 @@
+from Tribler.Test.Core.base_test import TriblerCoreTest
+from Tribler.community.tunnel import ORIGINATOR, EXIT_NODE
+from Tribler.community.tunnel.crypto.tunnelcrypto import GCMContext, TunnelCrypto
+
+
+class TestTunnelCrypto(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        super(TestTunnelCrypto, self).setUp(annotate=annotate)
+        self.crypto = object.__new__(TunnelCrypto)
+        self.session_keys = self.crypto.generate_session_keys("1234")
+
+    def test_encrypt_packet(self):
+        """
+        Test whether packets are encrypted with the next salt_explicit of a session and can be decrypted again
+        """
+        for _ in xrange(100):
+            encrypted = self.crypto.encrypt_packet("abcd", self.session_keys, EXIT_NODE)
+            self.assertEqual(self.crypto.decrypt_str(encrypted, self.session_keys[EXIT_NODE],
+                                                     self.session_keys[EXIT_NODE + 2]), "abcd")
+        self.assertEqual(self.session_keys[EXIT_NODE + 4], 101)
+        self.assertIs(self.session_keys.get_context(EXIT_NODE), self.session_keys.get_context(EXIT_NODE))
+
+    def test_cipher_fallback(self):
+        """
+        Test whether packets encrypted with AESGCM can be decrypted with the Cipher interface and vice versa
+        """
+        context = GCMContext(self.session_keys[ORIGINATOR], self.session_keys[ORIGINATOR + 2])
+        fallback = GCMContext(self.session_keys[ORIGINATOR], self.session_keys[ORIGINATOR + 2])
+        fallback.aesgcm = None
+        self.assertEqual(fallback.decrypt(context.encrypt("abcd", 1000)), "abcd")
+        self.assertEqual(context.decrypt(fallback.encrypt("abcd", 1001)), "abcd")
+        self.assertEqual(context.encrypt("abcd", 1002), fallback.encrypt("abcd", 1002))
+
+    def test_encrypt_many(self):
+        """
+        Test whether a burst of packets is encrypted with increasing salt_explicits and can be decrypted again
+        """
+        packets = ["packet %d" % index for index in xrange(10)]
+        encrypted = self.crypto.encrypt_many(packets, self.session_keys, ORIGINATOR)
+        self.assertEqual(self.session_keys[ORIGINATOR + 4], 11)
+        self.assertEqual(len(set(encrypted)), 10)
+        self.assertEqual(self.crypto.decrypt_many(encrypted, self.session_keys, ORIGINATOR), packets)
+
+    def test_decrypt_many_invalid(self):
+        """
+        Test whether packets that cannot be decrypted do not stop the decryption of the rest of a burst
+        """
+        encrypted = self.crypto.encrypt_many(["abcd", "efgh"], self.session_keys, ORIGINATOR)
+        corrupt = encrypted[0][:-1] + chr(ord(encrypted[0][-1]) ^ 1)
+        self.assertEqual(self.crypto.decrypt_many([corrupt, "", encrypted[1]], self.session_keys, ORIGINATOR),
+                         [None, None, "efgh"])
+
+    def test_headers(self):
+        """
+        Test whether packets are read from buffers into a received packet and written behind the given headers
+        """
+        received = "head" + self.crypto.encrypt_packet("abcd", self.session_keys, EXIT_NODE)
+        self.assertEqual(self.crypto.decrypt_packet(buffer(received, 4), self.session_keys, EXIT_NODE, "next"),
+                         "nextabcd")
+
+        encrypted = self.crypto.encrypt_many([buffer("headabcd", 4)], self.session_keys, ORIGINATOR, ["next"])
+        self.assertEqual(encrypted[0][:4], "next")
+        self.assertEqual(self.crypto.decrypt_packet(encrypted[0][4:], self.session_keys, ORIGINATOR), "abcd")
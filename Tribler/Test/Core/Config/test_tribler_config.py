@@ -192,6 +192,8 @@ class TestTriblerConfig(TriblerCoreTest):
         self.assertEqual(self.tribler_config.get_libtorrent_max_upload_rate(), True)
         self.tribler_config.set_libtorrent_max_download_rate(True)
         self.assertEqual(self.tribler_config.get_libtorrent_max_download_rate(), True)
+        self.tribler_config.set_libtorrent_max_metainfo_requests(True)
+        self.assertEqual(self.tribler_config.get_libtorrent_max_metainfo_requests(), True)
 
     def test_get_set_methods_mainline_dht(self):
         """
@@ -285,6 +287,12 @@ class TestTriblerConfig(TriblerCoreTest):
         """
         self.tribler_config.set_torrent_search_enabled(True)
         self.assertEqual(self.tribler_config.get_torrent_search_enabled(), True)
+        self.tribler_config.set_search_bm25_column_weights([1.0, 0.0, 0.0])
+        self.assertEqual(self.tribler_config.get_search_bm25_column_weights(), [1.0, 0.0, 0.0])
+        self.tribler_config.set_search_bm25_k1(2.0)
+        self.assertEqual(self.tribler_config.get_search_bm25_k1(), 2.0)
+        self.tribler_config.set_search_bm25_b(0.75)
+        self.assertEqual(self.tribler_config.get_search_bm25_b(), 0.75)
 
     def test_get_set_methods_allchannel_community(self):
         """
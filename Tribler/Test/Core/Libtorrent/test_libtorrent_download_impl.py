@@ -1,4 +1,3 @@
-import binascii
 import os
 from twisted.internet.defer import Deferred
 
@@ -168,11 +167,7 @@ class TestLibtorrentDownloadImpl(TestAsServer):
             """
             check if resume data is ready
             """
-            basename = binascii.hexlify(tdef.get_infohash()) + '.state'
-            filename = os.path.join(self.session.get_downloads_pstate_dir(), basename)
-
-            engine_data = CallbackConfigParser()
-            engine_data.read_file(filename)
+            engine_data = self.session.lm.load_download_pstate(tdef.get_infohash())
 
             self.assertEqual(tdef.get_infohash(), engine_data.get('state', 'engineresumedata').get('info-hash'))
 
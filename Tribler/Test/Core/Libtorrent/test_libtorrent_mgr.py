@@ -7,6 +7,7 @@ from twisted.internet.defer import inlineCallbacks, Deferred
 from Tribler.Core.CacheDB.Notifier import Notifier
 from Tribler.Core.Libtorrent.LibtorrentMgr import LibtorrentMgr
 from Tribler.Core.exceptions import DuplicateDownloadException, TorrentFileException
+from Tribler.Core.simpledefs import METAINFO_PRIORITY_BACKGROUND
 from Tribler.Test.Core.base_test import MockObject
 from Tribler.Test.test_as_server import AbstractServer
 from Tribler.Test.twisted_thread import deferred
@@ -37,6 +38,7 @@ class TestLibtorrentMgr(AbstractServer):
         self.tribler_session.config.set_listen_port_runtime = lambda: None
         self.tribler_session.config.get_libtorrent_max_upload_rate = lambda: 100
         self.tribler_session.config.get_libtorrent_max_download_rate = lambda: 120
+        self.tribler_session.config.get_libtorrent_max_metainfo_requests = lambda: 2
 
         self.ltmgr = LibtorrentMgr(self.tribler_session)
 
@@ -88,12 +90,13 @@ class TestLibtorrentMgr(AbstractServer):
         test_deferred = Deferred()
 
         def metainfo_cb(metainfo):
-            self.assertEqual(metainfo, "test")
+            self.assertEqual(metainfo, {'info': {'pieces': 'a' * 20}})
             test_deferred.callback(None)
 
         self.ltmgr.initialize()
-        self.ltmgr.is_dht_ready = lambda: True
-        self.ltmgr.metainfo_cache[("a" * 20).encode('hex')] = {'meta_info': 'test'}
+        # Cached metainfo does not wait for the DHT
+        self.ltmgr.is_dht_ready = lambda: False
+        self.ltmgr.metainfo_cache.add(("a" * 20).encode('hex'), {'info': {'pieces': 'a' * 20}})
         self.ltmgr.get_metainfo("a" * 20, metainfo_cb)
 
         return test_deferred
@@ -212,3 +215,245 @@ class TestLibtorrentMgr(AbstractServer):
         mock_lt_session.set_proxy = on_proxy_set
         self.ltmgr.metadata_tmpdir = tempfile.mkdtemp(suffix=u'tribler_metainfo_tmpdir')
         self.ltmgr.set_proxy_settings(mock_lt_session, 0, ('a', "1234"), ('abc', 'def'))
+
+    def test_get_download_state(self):
+        """
+        Testing whether the state of a download is cached until the download gets a new status from libtorrent
+        """
+        mock_tdef = MockObject()
+        mock_tdef.get_infohash = lambda: 'a' * 20
+
+        states = []
+
+        def mock_network_get_state(*_):
+            state = MockObject()
+            state.get_download = lambda: mock_download
+            states.append(state)
+            return state
+
+        mock_download = MockObject()
+        mock_download.get_def = lambda: mock_tdef
+        mock_download.handle = MockObject()
+        mock_download.askmoreinfo = False
+        mock_download.lt_status = MockObject()
+        mock_download.network_get_state = mock_network_get_state
+
+        self.assertIs(self.ltmgr.get_download_state(mock_download), self.ltmgr.get_download_state(mock_download))
+        self.assertEqual(len(states), 1)
+
+        mock_download.lt_status = MockObject()
+        self.assertIs(self.ltmgr.get_download_state(mock_download), states[1])
+
+        # The peers of a download are not cached
+        mock_download.askmoreinfo = True
+        self.ltmgr.get_download_state(mock_download)
+        self.assertEqual(len(states), 3)
+
+    def test_state_update_alert(self):
+        """
+        Testing whether the statuses of a state update alert are handed to their downloads
+        """
+        updates = []
+        mock_download = MockObject()
+        mock_download.on_state_update = updates.append
+        self.ltmgr.torrents[('a' * 20).encode('hex')] = (mock_download, None)
+
+        mock_status = MockObject()
+        mock_status.info_hash = ('a' * 20).encode('hex')
+        mock_unknown_status = MockObject()
+        mock_unknown_status.info_hash = ('b' * 20).encode('hex')
+
+        mock_alert = MockObject()
+        mock_alert.status = [mock_status, mock_unknown_status]
+        self.ltmgr.on_state_update_alert(mock_alert)
+        self.assertEqual(updates, [mock_status])
+
+    def test_alert_stats(self):
+        """
+        Testing whether the processed alerts are counted per type
+        """
+        class torrent_added_alert(object):
+            handle = None
+
+        self.ltmgr.process_alert(torrent_added_alert())
+        self.ltmgr.process_alert(torrent_added_alert())
+        alert_stats = self.ltmgr.get_alert_stats()
+        self.assertEqual(alert_stats.keys(), ['torrent_added_alert'])
+        self.assertEqual(alert_stats['torrent_added_alert']['count'], 2)
+
+    def test_process_alert_batch(self):
+        """
+        Testing whether waiting alerts are processed in batches, and the session is popped once they are all processed
+        """
+        processed = []
+        self.ltmgr.process_alert = processed.append
+        mock_ltsession = MockObject()
+        mock_ltsession.pop_alerts = lambda: range(250)
+        self.ltmgr.ltsessions = {0: mock_ltsession}
+
+        self.ltmgr._process_alerts()
+        self.assertEqual(processed, range(200))
+        self.assertTrue(self.ltmgr.process_alerts_call.active())
+
+        # Alerts that arrive in the meantime wait until the current alerts are processed
+        self.ltmgr._on_alerts_waiting()
+        self.assertEqual(len(processed), 200)
+
+        self.ltmgr.process_alerts_call.cancel()
+        self.ltmgr._process_alerts()
+        self.assertEqual(processed, range(250))
+        self.assertIsNone(self.ltmgr.process_alerts_call)
+
+    def mock_metainfo_session(self):
+        added = []
+        mock_ltsession = MockObject()
+        mock_ltsession.add_torrent = lambda atp: added.append(atp) or MockObject()
+        mock_ltsession.remove_torrent = lambda *_: None
+        self.ltmgr.get_session = lambda *_: mock_ltsession
+        self.ltmgr.metadata_tmpdir = tempfile.mkdtemp(suffix=u'tribler_metainfo_tmpdir')
+        self.ltmgr.dht_ready = True
+        return added
+
+    def test_metainfo_request_window(self):
+        """
+        Testing whether background lookups wait for room in the window and GUI lookups do not
+        """
+        added = self.mock_metainfo_session()
+        self.ltmgr.max_metainfo_requests = 2
+
+        for infohash in ['a', 'b', 'c']:
+            self.ltmgr.get_metainfo(infohash * 20, lambda _: None, notify=False,
+                                    priority=METAINFO_PRIORITY_BACKGROUND)
+        self.assertEqual(len(added), 2)
+        self.ltmgr.get_metainfo('d' * 20, lambda _: None, notify=False)
+        self.assertEqual(len(added), 3)
+        self.assertEqual(self.ltmgr.get_metainfo_stats()['queued'], 1)
+
+        # GUI lookups take room in the window as well
+        self.ltmgr.got_metainfo(('a' * 20).encode('hex'), timeout=True)
+        self.assertEqual(len(added), 3)
+        self.ltmgr.got_metainfo(('d' * 20).encode('hex'), timeout=True)
+        self.assertEqual(len(added), 4)
+        self.assertEqual(self.ltmgr.get_metainfo_stats()['queued'], 0)
+
+    def test_metainfo_request_retry(self):
+        """
+        Testing whether a lookup that takes long makes room for a waiting lookup, and is tried again later
+        """
+        added = self.mock_metainfo_session()
+        self.ltmgr.max_metainfo_requests = 1
+
+        self.ltmgr.get_metainfo('a' * 20, lambda _: None, notify=False, priority=METAINFO_PRIORITY_BACKGROUND)
+        self.ltmgr.get_metainfo('b' * 20, lambda _: None, notify=False, priority=METAINFO_PRIORITY_BACKGROUND)
+        request = self.ltmgr.metainfo_requests[('a' * 20).encode('hex')]
+        request['attempt_deadline'] = 0
+        self.ltmgr._task_check_metainfo_requests()
+        self.assertEqual(len(added), 2)
+        self.assertIsNone(request['handle'])
+
+        request['retry_time'] = 1
+        self.ltmgr._task_check_metainfo_requests()
+        self.assertEqual(len(added), 2)
+        self.ltmgr.got_metainfo(('b' * 20).encode('hex'), timeout=True)
+        self.assertEqual(len(added), 3)
+        self.assertEqual(request['attempts'], 2)
+        self.assertEqual(self.ltmgr.get_metainfo_stats()['retries'], 1)
+
+    def test_metainfo_request_retry_not_waiting(self):
+        """
+        Testing whether a lookup that takes long is not put aside for lookups that are waiting to be tried again
+        """
+        added = self.mock_metainfo_session()
+        self.ltmgr.max_metainfo_requests = 1
+
+        self.ltmgr.get_metainfo('a' * 20, lambda _: None, notify=False, priority=METAINFO_PRIORITY_BACKGROUND)
+        self.ltmgr.get_metainfo('b' * 20, lambda _: None, notify=False, priority=METAINFO_PRIORITY_BACKGROUND)
+        self.ltmgr.metainfo_requests[('a' * 20).encode('hex')]['attempt_deadline'] = 0
+        self.ltmgr._task_check_metainfo_requests()
+
+        request = self.ltmgr.metainfo_requests[('b' * 20).encode('hex')]
+        request['attempt_deadline'] = 0
+        self.ltmgr._task_check_metainfo_requests()
+        self.assertEqual(len(added), 2)
+        self.assertTrue(request['handle'])
+        self.assertEqual(self.ltmgr.get_metainfo_stats()['retries'], 1)
+
+    def test_metainfo_request_add_torrent_error(self):
+        """
+        Testing whether a lookup times out when its torrent cannot be added, and the next lookup is started
+        """
+        added = self.mock_metainfo_session()
+        self.ltmgr.max_metainfo_requests = 1
+        add_torrent = self.ltmgr.get_session().add_torrent
+        timeouts = []
+
+        def mocked_add_torrent(atp):
+            if not timeouts:
+                raise RuntimeError("torrent already exists in session")
+            return add_torrent(atp)
+        self.ltmgr.get_session().add_torrent = mocked_add_torrent
+
+        self.ltmgr.get_metainfo('a' * 20, lambda _: None, timeout_callback=timeouts.append, notify=False,
+                                priority=METAINFO_PRIORITY_BACKGROUND)
+        self.ltmgr.get_metainfo('b' * 20, lambda _: None, notify=False, priority=METAINFO_PRIORITY_BACKGROUND)
+        self.assertEqual(timeouts, ['a' * 20])
+        self.assertNotIn(('a' * 20).encode('hex'), self.ltmgr.metainfo_requests)
+        self.assertEqual(len(added), 1)
+        self.assertEqual(self.ltmgr.get_metainfo_stats()['active'], 1)
+
+    def test_metainfo_request_timeout(self):
+        """
+        Testing whether joined lookups share a request, and all their timeout callbacks are called
+        """
+        self.mock_metainfo_session()
+        timeouts = []
+
+        self.ltmgr.get_metainfo('a' * 20, lambda _: None, timeout=0, timeout_callback=timeouts.append, notify=False)
+        self.ltmgr.get_metainfo('a' * 20, lambda _: None, timeout=0, timeout_callback=lambda ih: timeouts.append(ih),
+                                notify=False)
+        self.assertEqual(self.ltmgr.get_metainfo_stats()['joined'], 1)
+
+        self.ltmgr._task_check_metainfo_requests()
+        self.assertEqual(timeouts, ['a' * 20, 'a' * 20])
+        self.assertFalse(self.ltmgr.metainfo_requests)
+
+    def test_metainfo_request_stale_alert(self):
+        """
+        Testing whether metadata received by a handle that was removed to try a lookup again later is ignored, and the
+        callers of a lookup without a handle are not left waiting
+        """
+        self.mock_metainfo_session()
+        self.ltmgr.max_metainfo_requests = 1
+        timeouts = []
+
+        self.ltmgr.get_metainfo('a' * 20, lambda _: None, timeout_callback=timeouts.append, notify=False,
+                                priority=METAINFO_PRIORITY_BACKGROUND)
+        self.ltmgr.get_metainfo('b' * 20, lambda _: None, notify=False, priority=METAINFO_PRIORITY_BACKGROUND)
+        request = self.ltmgr.metainfo_requests[('a' * 20).encode('hex')]
+        removed_handle = request['handle']
+        removed_handle.is_valid = lambda: True
+        removed_handle.info_hash = lambda: ('a' * 20).encode('hex')
+        request['attempt_deadline'] = 0
+        self.ltmgr._task_check_metainfo_requests()
+
+        class metadata_received_alert(object):
+            handle = removed_handle
+        self.ltmgr.process_alert(metadata_received_alert())
+        self.assertIn(('a' * 20).encode('hex'), self.ltmgr.metainfo_requests)
+
+        self.ltmgr.got_metainfo(('a' * 20).encode('hex'))
+        self.assertEqual(timeouts, ['a' * 20])
+
+    def test_metainfo_request_timeout_not_ready(self):
+        """
+        Testing whether a background lookup that is queued while the DHT is not ready times out
+        """
+        added = self.mock_metainfo_session()
+        self.ltmgr.dht_ready = False
+        timeouts = []
+
+        self.ltmgr.get_metainfo('a' * 20, lambda _: None, timeout=0, timeout_callback=timeouts.append, notify=False,
+                                priority=METAINFO_PRIORITY_BACKGROUND)
+        self.ltmgr._task_check_metainfo_requests()
+        self.assertFalse(added)
+        self.assertEqual(timeouts, ['a' * 20])
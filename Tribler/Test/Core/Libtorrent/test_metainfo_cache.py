@@ -0,0 +1,67 @@
+from libtorrent import bencode
+
+from Tribler.Core.Libtorrent import metainfo_cache
+from Tribler.Core.Libtorrent.metainfo_cache import MetainfoCache
+from Tribler.Test.Core.base_test import TriblerCoreTest
+
+
+class TestMetainfoCache(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        super(TestMetainfoCache, self).setUp(annotate=annotate)
+        self.store = {}
+        self.metainfo_cache = MetainfoCache(self.store, size=200)
+        self.metainfo = {'info': {'name': 'test', 'pieces': 'a' * 20}, 'nodes': [],
+                         'initial peers': [('1.2.3.4', 5)], 'seeders': 1, 'leechers': 2}
+
+    def test_add(self):
+        """
+        Test whether callers share a read-only view of the metainfo, and only the torrent part is stored
+        """
+        view = self.metainfo_cache.add('aa', self.metainfo)
+        self.assertEqual(view, self.metainfo)
+        self.assertIs(self.metainfo_cache.get('aa'), view)
+        self.assertRaises(TypeError, view.__setitem__, 'seeders', 3)
+        self.assertRaises(TypeError, view['info'].pop, 'pieces')
+        self.assertEqual(self.store, {'aa': bencode({'info': {'name': 'test', 'pieces': 'a' * 20}, 'nodes': []})})
+
+    def test_store(self):
+        """
+        Test whether metainfo is read from the store, but not for callers that need up to date swarm info
+        """
+        self.store['bb'] = bencode({'info': {'name': 'test', 'pieces': 'b' * 20}, 'seeders': 10})
+        self.assertIsNone(self.metainfo_cache.get('bb', max_age=60))
+        self.assertEqual(self.metainfo_cache.get('bb'), {'info': {'name': 'test', 'pieces': 'b' * 20}})
+        self.assertIsNone(self.metainfo_cache.get('bb', max_age=60))
+        self.assertIsNone(self.metainfo_cache.get('cc'))
+        self.assertEqual(self.metainfo_cache.get_stats()['store_hits'], 1)
+        self.assertEqual(self.metainfo_cache.get_stats()['misses'], 3)
+
+    def test_max_age(self):
+        """
+        Test whether swarm info that is too old is not returned
+        """
+        self.metainfo_cache.add('aa', self.metainfo)
+        self.assertTrue(self.metainfo_cache.get('aa', max_age=60))
+
+        original_time = metainfo_cache.time
+        metainfo_cache.time = type('MockTime', (object,), {'time': staticmethod(lambda: original_time.time() + 61)})
+        try:
+            self.assertIsNone(self.metainfo_cache.get('aa', max_age=60))
+            self.assertTrue(self.metainfo_cache.get('aa'))
+        finally:
+            metainfo_cache.time = original_time
+
+    def test_eviction(self):
+        """
+        Test whether the least recently used metainfo is evicted from memory once the cache is full
+        """
+        for infohash in ['aa', 'bb', 'cc']:
+            self.metainfo_cache.add(infohash, dict(self.metainfo, info={'name': infohash, 'pieces': 'a' * 60}))
+            self.metainfo_cache.get('aa')
+        self.assertIn('aa', self.metainfo_cache)
+        self.assertNotIn('bb', self.metainfo_cache)
+        self.assertLessEqual(self.metainfo_cache.get_stats()['bytes'], 200)
+
+        # Evicted metainfo is still in the store
+        self.assertEqual(self.metainfo_cache.get('bb')['info']['name'], 'bb')
@@ -57,6 +57,7 @@ class TestCircuitDebugEndpoint(AbstractApiTest):
         mock_circuit.hops = [mock_hop]
 
         self.tunnel_community.circuits = {'abc': mock_circuit}
+        self.tunnel_community.scheduler.dropped[42] = 3
 
         def verify_response(response):
             response_json = json.loads(response)
@@ -66,6 +67,8 @@ class TestCircuitDebugEndpoint(AbstractApiTest):
             self.assertEqual(response_json['circuits'][0]['bytes_down'], 400)
             self.assertEqual(len(response_json['circuits'][0]['hops']), 1)
             self.assertEqual(response_json['circuits'][0]['hops'][0]['host'], 'somewhere:4242')
+            self.assertEqual(response_json['queues'], [{'id': 42, 'type': 'relay', 'queued_packets': 0,
+                                                        'queued_bytes': 0, 'dropped_packets': 3}])
 
         self.should_check_equality = False
         return self.do_request('debug/circuits', expected_code=200).addCallback(verify_response)
@@ -1,4 +1,4 @@
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import fail, inlineCallbacks, succeed
 
 from Tribler.Core.simpledefs import NTFY_CHANNELCAST, NTFY_TORRENTS, SIGNAL_CHANNEL, SIGNAL_ON_SEARCH_RESULTS, \
     SIGNAL_TORRENT
@@ -114,6 +114,31 @@ class TestSearchEndpoint(AbstractApiTest):
         return self.do_request('search?q=test', expected_code=200, expected_json=expected_json)\
             .addCallback(self.verify_search_results)
 
+    @deferred(timeout=10)
+    def test_search_paginated(self):
+        """
+        Testing whether the API only returns the requested page of local torrent results
+        """
+        self.insert_channels_in_db(5)
+        self.insert_torrents_in_db(6)
+        self.expected_num_results_list = [5, 2, 0, 0]
+
+        self.session.config.get_torrent_search_enabled = lambda: True
+        self.session.config.get_channel_search_enabled = lambda: True
+        self.session.lm.search_manager = FakeSearchManager(self.session.notifier)
+
+        expected_json = {"queried": True}
+        return self.do_request('search?q=test&offset=3&limit=2', expected_code=200, expected_json=expected_json)\
+            .addCallback(self.verify_search_results)
+
+    @deferred(timeout=10)
+    def test_search_invalid_limit(self):
+        """
+        Testing whether the API returns an error 400 if the passed limit is not an integer
+        """
+        expected_json = {"error": "offset and limit should be integers"}
+        return self.do_request('search?q=test&limit=abc', expected_code=400, expected_json=expected_json)
+
     @deferred(timeout=10)
     def test_completions_no_query(self):
         """
@@ -128,9 +153,21 @@ class TestSearchEndpoint(AbstractApiTest):
         Testing whether the API returns the right terms when getting search completion terms
         """
         torrent_db_handler = self.session.open_dbhandler(NTFY_TORRENTS)
-        torrent_db_handler.getAutoCompleteTerms = lambda keyword, max_terms: ["%s %d" % (keyword, ind)
-                                                                              for ind in xrange(max_terms)]
+        torrent_db_handler.get_autocomplete_terms_async = lambda keyword, max_terms: \
+            succeed(["%s %d" % (keyword, ind) for ind in xrange(max_terms)])
 
         expected_json = {"completions": ["tribler %d" % ind for ind in xrange(5)]}
 
         return self.do_request('search/completions?q=tribler', expected_code=200, expected_json=expected_json)
+
+    @deferred(timeout=10)
+    def test_completions_error(self):
+        """
+        Testing whether the API returns an error 500 if the search completion terms cannot be looked up
+        """
+        torrent_db_handler = self.session.open_dbhandler(NTFY_TORRENTS)
+        torrent_db_handler.get_autocomplete_terms_async = lambda *_, **__: fail(RuntimeError("database error"))
+
+        expected_json = {"error": "database error"}
+
+        return self.do_request('search/completions?q=tribler', expected_code=500, expected_json=expected_json)
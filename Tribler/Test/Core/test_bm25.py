@@ -0,0 +1,68 @@
+import math
+from struct import pack
+
+from Tribler.Core.CacheDB.bm25 import BM25Scorer, top_k_indices
+from Tribler.Test.Core.base_test import TriblerCoreTest
+
+
+def create_matchinfo(num_rows, hits, lengths=(1, 1, 1), avg_lengths=(1, 1, 1)):
+    """
+    Create a matchinfo('pcnalx') blob for three columns. The hits are a list with, for every phrase, a list of
+    (term frequency, doc frequency) tuples for every column.
+    """
+    values = [len(hits), 3, num_rows] + list(avg_lengths) + list(lengths)
+    for phrase_hits in hits:
+        for term_freq, doc_freq in phrase_hits:
+            values += [term_freq, term_freq, doc_freq]
+    return buffer(pack('I' * len(values), *values))
+
+
+class TriblerCoreTestBM25(TriblerCoreTest):
+
+    def test_score_single_row(self):
+        """
+        Test whether the score of a single row matches the BM25 formula
+        """
+        matchinfo = create_matchinfo(100, [[(1, 10), (2, 5), (0, 50)]])
+        score = BM25Scorer().score([matchinfo])[0]
+
+        def column_score(term_freq, doc_freq):
+            return math.log((100 - doc_freq + 0.5) / (doc_freq + 0.5), 2) * (term_freq * 2.2) / (term_freq + 1.2)
+
+        expected = 0.8 * column_score(1, 10) + 0.1 * column_score(2, 5) + 0.1 * column_score(0, 50)
+        self.assertAlmostEqual(score, expected)
+
+    def test_score_multiple_rows(self):
+        """
+        Test whether rows with more matches in the name get a higher score
+        """
+        matchinfos = [create_matchinfo(100, [[(0, 10), (1, 5), (0, 1)]]),
+                      create_matchinfo(100, [[(1, 10), (0, 5), (0, 1)]])]
+        scores = BM25Scorer().score(matchinfos)
+        self.assertEqual(len(scores), 2)
+        self.assertGreater(scores[1], scores[0])
+
+    def test_score_no_rows(self):
+        """
+        Test whether scoring an empty result set returns no scores
+        """
+        self.assertEqual(len(BM25Scorer().score([])), 0)
+
+    def test_score_document_length(self):
+        """
+        Test whether longer documents get a lower score when document length normalization is enabled
+        """
+        matchinfos = [create_matchinfo(100, [[(1, 10), (0, 5), (0, 1)]], lengths=(2, 1, 1)),
+                      create_matchinfo(100, [[(1, 10), (0, 5), (0, 1)]], lengths=(8, 1, 1))]
+        scores = BM25Scorer(b=0.75).score(matchinfos)
+        self.assertGreater(scores[0], scores[1])
+
+    def test_top_k_indices(self):
+        """
+        Test whether the indices of the highest scores are returned in the requested page
+        """
+        scores = [0.5, 3.0, 1.0, 2.0, 0.0]
+        self.assertEqual(top_k_indices(scores), [1, 3, 2, 0, 4])
+        self.assertEqual(top_k_indices(scores, limit=2), [1, 3])
+        self.assertEqual(top_k_indices(scores, limit=2, offset=1), [3, 2])
+        self.assertEqual(top_k_indices(scores, limit=2, offset=4), [4])
@@ -3,11 +3,12 @@ from nose.tools import raises
 from twisted.internet.defer import Deferred
 
 from Tribler.Core import NoDispersyRLock
-from Tribler.Core.APIImplementation.LaunchManyCore import TriblerLaunchMany
+from Tribler.Core.APIImplementation.LaunchManyCore import TriblerLaunchMany, RESUME_PAGE_SIZE
 from Tribler.Core.DownloadConfig import DefaultDownloadStartupConfig
 from Tribler.Core.TorrentDef import TorrentDef
 from Tribler.Core.Utilities.configparser import CallbackConfigParser
 from Tribler.Core.exceptions import DuplicateDownloadException
+from Tribler.Core.leveldbstore import LevelDbStore
 from Tribler.Core.simpledefs import DLSTATUS_STOPPED_ON_ERROR, DLSTATUS_SEEDING
 from Tribler.Test.Core.base_test import TriblerCoreTest, MockObject
 from Tribler.Test.common import TESTS_DATA_DIR
@@ -41,6 +42,15 @@ class TestLaunchManyCore(TriblerCoreTest):
         mock_notifier.notify = lambda *_: None
         self.lm.session.notifier = mock_notifier
 
+    def tearDown(self, annotate=True):
+        if self.lm.resume_store:
+            self.lm.resume_store.close()
+        TriblerCoreTest.tearDown(self, annotate=annotate)
+
+    def create_resume_store(self):
+        self.lm.session.get_downloads_pstate_dir = lambda: self.session_base_dir
+        self.lm.resume_store = LevelDbStore(os.path.join(self.session_base_dir, 'resumestore'))
+
     @raises(ValueError)
     def test_add_tdef_not_finalized(self):
         """
@@ -62,12 +72,73 @@ class TestLaunchManyCore(TriblerCoreTest):
 
     def test_load_download_pstate(self):
         """
-        Testing whether a pstate is successfully loaded
+        Testing whether a pstate is successfully loaded from the resume store
         """
+        self.create_resume_store()
         config_file_path = os.path.abspath(os.path.join(self.DATA_DIR, u"config_files", u"config1.conf"))
-        config = self.lm.load_download_pstate(config_file_path)
+        with open(config_file_path, 'rb') as config_file:
+            self.lm.resume_store['abcd'] = config_file.read()
+
+        config = self.lm.load_download_pstate('\xab\xcd')
         self.assertIsInstance(config, CallbackConfigParser)
         self.assertEqual(config.get('general', 'version'), 11)
+        self.assertIsNone(self.lm.load_download_pstate_noexc('\xab\xce'))
+
+    def test_save_download_pstate(self):
+        """
+        Testing whether a pstate is written to disk right away, unless all downloads are being checkpointed
+        """
+        self.create_resume_store()
+        pstate = CallbackConfigParser()
+        pstate.add_section('state')
+        pstate.set('state', 'engineresumedata', {'info-hash': '\xab\xcd'})
+        self.lm.save_download_pstate('\xab\xcd', pstate)
+
+        self.lm.checkpoints_in_progress = 1
+        self.lm.save_download_pstate('\xab\xce', pstate)
+
+        # Reopening the store only finds what has been written to disk
+        self.lm.resume_store.close()
+        self.create_resume_store()
+        self.assertEqual(self.lm.load_download_pstate('\xab\xcd').get('state', 'engineresumedata'),
+                         {'info-hash': '\xab\xcd'})
+        self.assertNotIn('abce', self.lm.resume_store)
+
+    def test_checkpoint_downloads_flush(self):
+        """
+        Testing whether the pstates saved while checkpointing all downloads are written to disk once it is done
+        """
+        self.create_resume_store()
+        pstate = CallbackConfigParser()
+        pstate.add_section('state')
+        checkpoint_deferred = Deferred()
+        download = MockObject()
+        download.checkpoint = lambda: checkpoint_deferred
+        self.lm.downloads = {'\xab\xcd': download}
+
+        self.lm.checkpoint_downloads()
+        self.lm.save_download_pstate('\xab\xcd', pstate)
+        self.assertIn('abcd', self.lm.resume_store._pending_torrents)
+
+        checkpoint_deferred.callback(None)
+        self.assertFalse(self.lm.resume_store._pending_torrents)
+        self.assertEqual(self.lm.checkpoints_in_progress, 0)
+
+    def test_shutdown_downloads(self):
+        """
+        Testing whether shutting down the downloads waits for the resume data of the stopped downloads
+        """
+        resume_deferred = Deferred()
+        download = MockObject()
+        download.stop = lambda: None
+        download.deferreds_resume = [resume_deferred]
+        download.save_resume_data = lambda: resume_deferred
+        self.lm.downloads = {'\xab\xcd': download}
+
+        shutdown_deferred = self.lm.shutdown_downloads()
+        self.assertFalse(shutdown_deferred.called)
+        resume_deferred.callback({})
+        self.assertTrue(shutdown_deferred.called)
 
     @deferred(timeout=10)
     def test_dlstates_cb_error(self):
@@ -139,15 +210,15 @@ class TestLaunchManyCore(TriblerCoreTest):
 
     def test_load_checkpoint(self):
         """
-        Test whether we are resuming downloads after loading checkpoint
+        Test whether we are resuming downloads after loading checkpoint, and .state files are moved to the store
         """
-        def mocked_resume_download(filename, setupDelay=3):
-            self.assertTrue(filename.endswith('abcd.state'))
-            self.assertEqual(setupDelay, 0)
+        def mocked_resume_download(infohash, setupDelay=3):
+            self.assertEqual(infohash, '\xab\xcd')
+            self.assertEqual(setupDelay, 3)
             mocked_resume_download.called = True
 
         mocked_resume_download.called = False
-        self.lm.session.get_downloads_pstate_dir = lambda: self.session_base_dir
+        self.create_resume_store()
 
         with open(os.path.join(self.lm.session.get_downloads_pstate_dir(), 'abcd.state'), 'wb') as state_file:
             state_file.write("hi")
@@ -156,6 +227,19 @@ class TestLaunchManyCore(TriblerCoreTest):
         self.lm.resume_download = mocked_resume_download
         self.lm.load_checkpoint()
         self.assertTrue(mocked_resume_download.called)
+        self.assertEqual(self.lm.resume_store['abcd'], "hi")
+        self.assertFalse(os.path.exists(os.path.join(self.session_base_dir, 'abcd.state')))
+
+    def test_resume_downloads_paged(self):
+        """
+        Test whether checkpointed downloads are resumed a page at a time
+        """
+        resumed = []
+        self.lm.resume_download = resumed.append
+        self.lm.resume_downloads(iter(range(RESUME_PAGE_SIZE + 1)))
+        self.assertEqual(resumed, range(RESUME_PAGE_SIZE))
+        self.assertTrue(self.lm.is_pending_task_active("resume_downloads"))
+        self.lm.cancel_all_pending_tasks()
 
     def test_resume_download(self):
         with open(os.path.join(TESTS_DATA_DIR, "bak_single.torrent"), mode='rb') as torrent_file:
@@ -177,7 +261,7 @@ class TestLaunchManyCore(TriblerCoreTest):
         self.lm.add = mocked_add
         self.lm.mypref_db = MockObject()
         self.lm.mypref_db.getMyPrefStatsInfohash = lambda _: TESTS_DATA_DIR
-        self.lm.resume_download('%s.state' % ('a' * 20))
+        self.lm.resume_download('a' * 20)
         self.assertTrue(mocked_add.called)
 
 
@@ -1,4 +1,6 @@
 from twisted.internet.defer import inlineCallbacks, Deferred
+from twisted.internet.threads import deferToThread
+from twisted.python.threadable import isInIOThread
 
 from Tribler.Core.CacheDB.Notifier import Notifier
 from Tribler.Core.simpledefs import NTFY_TORRENTS, NTFY_STARTED, NTFY_FINISHED
@@ -70,3 +72,82 @@ class TriblerCoreTestNotifier(TriblerCoreTest):
         notifier.notify(NTFY_TORRENTS, NTFY_STARTED, None)
         notifier.remove_observers()
         self.assertEqual(len(notifier.observertimers), 0)
+
+    def test_notifier_object_id(self):
+        notifier = Notifier()
+        notifier.add_observer(self.callback_func, NTFY_TORRENTS, [NTFY_STARTED], id="a")
+        notifier.notify(NTFY_TORRENTS, NTFY_STARTED, "b")
+        self.assertFalse(self.called_callback)
+        self.assertEqual(notifier.get_stats()["notifications"], 1)
+
+    def test_notifier_remove_observer_subscriptions(self):
+        notifier = Notifier()
+        notifier.add_observer(self.callback_func, NTFY_TORRENTS, [NTFY_STARTED, NTFY_FINISHED])
+        self.assertEqual(len(notifier.subscriptions), 2)
+        notifier.remove_observer(self.callback_func)
+        self.assertFalse(notifier.subscriptions)
+        self.assertFalse(notifier.observers)
+
+    @deferred(timeout=10)
+    def test_notifier_queued(self):
+        """
+        Test whether events notified outside the reactor thread are dispatched on the reactor thread to asynchronous
+        observers
+        """
+        def on_event(*_):
+            self.assertTrue(isInIOThread())
+            self.test_deferred.callback(None)
+
+        notifier = Notifier()
+        notifier.add_observer(on_event, NTFY_TORRENTS, [NTFY_STARTED], asynchronous=True)
+        deferToThread(notifier.notify, NTFY_TORRENTS, NTFY_STARTED, None)
+        return self.test_deferred.addCallback(lambda _: self.assertEqual(notifier.get_stats()["dispatched"], 1))
+
+    @deferred(timeout=10)
+    def test_notifier_synchronous(self):
+        """
+        Test whether events notified outside the reactor thread are delivered in the notifying thread by default
+        """
+        called = []
+
+        def on_event(*_):
+            called.append(isInIOThread())
+
+        def notify():
+            notifier.notify(NTFY_TORRENTS, NTFY_STARTED, None)
+            return called
+
+        notifier = Notifier()
+        notifier.add_observer(on_event, NTFY_TORRENTS, [NTFY_STARTED])
+        return deferToThread(notify).addCallback(lambda result: self.assertEqual(result, [False]))
+
+    def test_notifier_queue_full(self):
+        """
+        Test whether events are dropped when the queue stays full
+        """
+        notifier = Notifier(max_queue_size=1, max_queue_wait=0)
+        notifier.add_observer(self.callback_func, NTFY_TORRENTS, [NTFY_STARTED])
+        with notifier.observerLock:
+            notifier._drain_scheduled = True
+            notifier._enqueue([self.callback_func], [NTFY_TORRENTS, NTFY_STARTED, None])
+            notifier._enqueue([self.callback_func], [NTFY_TORRENTS, NTFY_STARTED, None])
+
+        stats = notifier.get_stats()
+        self.assertEqual(stats["queue_depth"], 1)
+        self.assertEqual(stats["dropped"], 1)
+
+    @deferred(timeout=10)
+    def test_notifier_cache_coalesced(self):
+        """
+        Test whether events for a cached observer are delivered together in a single call
+        """
+        def on_events(events):
+            self.assertEqual(len(events), 3)
+            self.test_deferred.callback(None)
+
+        notifier = Notifier()
+        notifier.add_observer(on_events, NTFY_TORRENTS, [NTFY_STARTED], cache=0.1)
+        for _ in xrange(3):
+            notifier.notify(NTFY_TORRENTS, NTFY_STARTED, None)
+        self.assertEqual(notifier.get_stats()["coalesced"], 2)
+        return self.test_deferred
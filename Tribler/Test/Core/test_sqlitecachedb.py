@@ -5,10 +5,14 @@ from unittest import skipIf
 
 from apsw import SQLError, CantOpenError
 from nose.tools import raises
+from twisted.internet import reactor
 from twisted.internet.defer import inlineCallbacks
+from twisted.internet.task import deferLater
 
-from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB, DB_SCRIPT_ABSOLUTE_PATH, CorruptedDatabaseError
+from Tribler.Core.CacheDB.sqlitecachedb import SQLiteCacheDB, DB_SCRIPT_ABSOLUTE_PATH, CorruptedDatabaseError, \
+    StatementCache, WRITER_CHUNK_SIZE
 from Tribler.Test.Core.base_test import TriblerCoreTest
+from Tribler.Test.twisted_thread import deferred
 from Tribler.dispersy.util import blocking_call_on_reactor_thread
 
 
@@ -219,3 +223,184 @@ class TestSqliteCacheDB(TriblerCoreTest):
         self.sqlite_test.delete("person", lastname=("LIKE", "a"))
         one = self.sqlite_test.fetchone(u"SELECT * FROM person")
         self.assertEqual(one, ('x', 'z'))
+
+    @deferred(timeout=10)
+    def test_fetchall_async(self):
+        """
+        Test whether rows can be fetched asynchronously from an in-memory database
+        """
+        self.test_insertmany()
+
+        def on_rows(rows):
+            self.assertEqual(len(rows), 100)
+
+        return self.sqlite_test.fetchall_async(u"SELECT * FROM person").addCallback(on_rows)
+
+    @deferred(timeout=10)
+    def test_write_and_read_async(self):
+        """
+        Test whether an asynchronous read sees the result of a preceding asynchronous write
+        """
+        self.test_create_db()
+
+        def on_written(_):
+            return self.sqlite_test.fetchone_async(u"SELECT firstname FROM person WHERE lastname = ?", ('a',))
+
+        def on_row(row):
+            self.assertEqual(row, 'b')
+
+        return self.sqlite_test.execute_write_async(u"INSERT INTO person VALUES (?, ?)", ('a', 'b'))\
+            .addCallback(on_written).addCallback(on_row)
+
+    @deferred(timeout=10)
+    def test_read_pool_async(self):
+        """
+        Test whether committed data is read through the read-only connection pool of a database file
+        """
+        sqlite_test_2 = SQLiteCacheDB(os.path.join(self.session_base_dir, "test_db.db"), DB_SCRIPT_ABSOLUTE_PATH)
+        sqlite_test_2.initialize()
+
+        def on_version(version):
+            self.assertIsNotNone(sqlite_test_2._read_pool)
+            self.assertEqual(int(version), sqlite_test_2.version)
+            sqlite_test_2.close()
+
+        return sqlite_test_2.get_one_async(u"MyInfo", u"value", entry=u"version").addCallback(on_version)
+
+    @deferred(timeout=10)
+    def test_group_commit_row_budget(self):
+        """
+        Test whether the open transaction is committed as soon as the row budget is exhausted
+        """
+        sqlite_test_2 = SQLiteCacheDB(os.path.join(self.session_base_dir, "test_db.db"), DB_SCRIPT_ABSOLUTE_PATH,
+                                      commit_max_rows=10, commit_max_delay=60)
+        sqlite_test_2.initialize()
+        sqlite_test_2.initial_begin()
+        sqlite_test_2.insertMany('MyInfo', [(u"entry%d" % i, u"value") for i in xrange(10)])
+
+        def verify_commit(_):
+            stats = sqlite_test_2.get_commit_stats()
+            self.assertEqual(stats["commits"], 1)
+            self.assertEqual(stats["rows_committed"], 10)
+            self.assertEqual(stats["pending_rows"], 0)
+            sqlite_test_2.close()
+
+        return deferLater(reactor, 0.1, lambda: None).addCallback(verify_commit)
+
+    @deferred(timeout=10)
+    def test_async_write_commit(self):
+        """
+        Test whether an asynchronous write ends up in the database as a whole when a commit happens while it is queued
+        """
+        sqlite_test_2 = SQLiteCacheDB(os.path.join(self.session_base_dir, "test_db.db"), DB_SCRIPT_ABSOLUTE_PATH,
+                                      commit_max_delay=60)
+        sqlite_test_2.initialize()
+        sqlite_test_2.initial_begin()
+        write_deferred = sqlite_test_2.executemany_async(u"INSERT INTO MyInfo VALUES (?, ?)",
+                                                         [(u"entry%d" % i, u"value") for i in xrange(100)])
+        self.assertTrue(sqlite_test_2._should_commit)
+        sqlite_test_2.commit_now()
+
+        def verify_write(_):
+            sqlite_test_2.commit_now()
+            self.assertEqual(sqlite_test_2.fetchone(u"SELECT COUNT(*) FROM MyInfo WHERE value = 'value'"), 100)
+            sqlite_test_2.close()
+
+        return write_deferred.addCallback(verify_write)
+
+    @deferred(timeout=10)
+    def test_async_write_chunks(self):
+        """
+        Test whether an asynchronous write that is executed in chunks ends up in the database as a whole
+        """
+        sqlite_test_2 = SQLiteCacheDB(os.path.join(self.session_base_dir, "test_db.db"), DB_SCRIPT_ABSOLUTE_PATH,
+                                      commit_max_delay=60)
+        sqlite_test_2.initialize()
+        sqlite_test_2.initial_begin()
+        num_rows = 2 * WRITER_CHUNK_SIZE + 1
+
+        def verify_write(_):
+            sqlite_test_2.commit_now()
+            self.assertEqual(sqlite_test_2.fetchone(u"SELECT COUNT(*) FROM MyInfo WHERE value = 'value'"), num_rows)
+            sqlite_test_2.close()
+
+        return sqlite_test_2.executemany_async(u"INSERT INTO MyInfo VALUES (?, ?)",
+                                               [(u"entry%d" % i, u"value") for i in xrange(num_rows)])\
+            .addCallback(verify_write)
+
+    @blocking_call_on_reactor_thread
+    def test_commit_during_writer_batch(self):
+        """
+        Test whether a commit waits until the writer thread has executed all chunks of a batch
+        """
+        sqlite_test_2 = SQLiteCacheDB(os.path.join(self.session_base_dir, "test_db.db"), DB_SCRIPT_ABSOLUTE_PATH)
+        sqlite_test_2.initialize()
+        sqlite_test_2.initial_begin()
+        sqlite_test_2.execute_write(u"UPDATE MyInfo SET value = ? WHERE entry == 'version'", (5,))
+
+        sqlite_test_2._writer_batch_running = True
+        sqlite_test_2.commit_now()
+        self.assertEqual(sqlite_test_2.get_commit_stats()["commits"], 0)
+        self.assertTrue(sqlite_test_2.is_pending_task_active(u"group commit"))
+
+        sqlite_test_2._writer_batch_running = False
+        sqlite_test_2.commit_now()
+        self.assertEqual(sqlite_test_2.get_commit_stats()["commits"], 1)
+        sqlite_test_2.close()
+
+    @blocking_call_on_reactor_thread
+    def test_group_commit_deadline(self):
+        """
+        Test whether a commit is scheduled at the latency deadline when the row budget is not exhausted
+        """
+        sqlite_test_2 = SQLiteCacheDB(os.path.join(self.session_base_dir, "test_db.db"), DB_SCRIPT_ABSOLUTE_PATH)
+        sqlite_test_2.initialize()
+        sqlite_test_2.initial_begin()
+        sqlite_test_2.write_version(4)
+        self.assertEqual(sqlite_test_2.get_commit_stats()["commits"], 1)
+
+        sqlite_test_2.execute_write(u"UPDATE MyInfo SET value = ? WHERE entry == 'version'", (5,))
+        self.assertTrue(sqlite_test_2.is_pending_task_active(u"group commit"))
+        sqlite_test_2.close()
+
+    @blocking_call_on_reactor_thread
+    def test_statement_cache(self):
+        """
+        Test whether the helper methods emit the same statement regardless of the order of the keyword arguments
+        """
+        self.test_create_db()
+
+        self.sqlite_test.insert('person', lastname='a', firstname='b')
+        self.sqlite_test.insert('person', firstname='d', lastname='c')
+        self.assertEqual(self.sqlite_test.getAll('person', 'firstname', lastname='c', limit=1), [('d',)])
+        self.assertEqual(self.sqlite_test.getAll('person', 'firstname', lastname='a', limit=1), [('b',)])
+
+        stats = self.sqlite_test.get_statement_cache_stats()
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["hit_rate"], 0.5)
+
+    def test_statement_cache_eviction(self):
+        """
+        Test whether the least recently used statement is evicted from a full statement cache
+        """
+        cache = StatementCache(size=2)
+        cache.get('a', lambda: u"SELECT 1")
+        cache.get('b', lambda: u"SELECT 2")
+        cache.get('a', lambda: u"SELECT 1")
+        cache.get('c', lambda: u"SELECT 3")
+
+        self.assertEqual(cache.get('a', lambda: None), u"SELECT 1")
+        self.assertEqual(cache.get_stats()["evictions"], 1)
+        self.assertEqual(cache.get('b', lambda: u"SELECT 4"), u"SELECT 4")
+
+    @blocking_call_on_reactor_thread
+    def test_update_where_args(self):
+        """
+        Test whether the parameters of the where clause of an update can be passed separately
+        """
+        self.test_insertmany()
+
+        self.sqlite_test.update('person', "lastname == ?", ('5',), firstname='x')
+        one = self.sqlite_test.fetchone("select firstname from person where lastname == '5'")
+        self.assertEqual(one, 'x')
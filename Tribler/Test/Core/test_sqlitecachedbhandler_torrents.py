@@ -3,7 +3,8 @@ from binascii import unhexlify
 from shutil import copy as copyfile
 from twisted.internet.defer import inlineCallbacks
 
-from Tribler.Core.CacheDB.SqliteCacheDBHandler import TorrentDBHandler, MyPreferenceDBHandler, ChannelCastDBHandler
+from Tribler.Core.CacheDB.SqliteCacheDBHandler import TorrentDBHandler, MyPreferenceDBHandler, ChannelCastDBHandler, \
+    REMOTE_SEARCH_NAMES_LIMIT
 from Tribler.Core.CacheDB.sqlitecachedb import str2bin
 from Tribler.Core.Category.Category import Category
 from Tribler.Core.TorrentDef import TorrentDef
@@ -209,6 +210,24 @@ class TestTorrentDBHandler(AbstractDB):
                                          [], 1234)
         self.assertFalse(self.tdb.getTorrentID(infohash))
 
+    @blocking_call_on_reactor_thread
+    def test_add_external_torrents_no_def_batch(self):
+        """
+        Test whether a batch of torrents is deduplicated and added, and whether the ingest is counted
+        """
+        existing_infohash = str2bin('AA8cTG7ZuPsyblbRE7CyxsrKUCg=')
+        infohashes = [unhexlify('%040x' % i) for i in xrange(1, 11)]
+        torrents = [(infohash, u"bulk torrent %d" % i, [("file%d" % i, 42)], ['http://localhost/announce'], 1234, {})
+                    for i, infohash in enumerate(infohashes)]
+        torrents += torrents[:3]
+        torrents.append((existing_infohash, u"test torrent", [("file1", 42)], [], 1234, {}))
+
+        torrent_ids = self.tdb.add_external_torrents_no_def(torrents)
+        self.assertEqual(sorted(torrent_ids.keys()), sorted(infohashes))
+        self.assertEqual(torrent_ids[infohashes[0]], self.tdb.getTorrentID(infohashes[0]))
+        self.assertEqual(self.tdb.get_ingest_stats()["torrents"], 10)
+        self.assertEqual(len(self.tdb.searchNames(["bulk"], keys=["infohash"])), 10)
+
     @blocking_call_on_reactor_thread
     def test_add_get_torrent_id(self):
         infohash = str2bin('AA8cTG7ZuPsyblbRE7CyxsrKUCg=')
@@ -245,13 +264,42 @@ class TestTorrentDBHandler(AbstractDB):
         self.assertEqual(res, old_res-20)
 
     @blocking_call_on_reactor_thread
+    @inlineCallbacks
     def test_get_search_suggestions(self):
+        yield self.tdb._load_term_index_async()
         self.assertEqual(self.tdb.getSearchSuggestion(["content", "cont"]), ["content 1"])
 
     @blocking_call_on_reactor_thread
+    @inlineCallbacks
     def test_get_autocomplete_terms(self):
+        yield self.tdb._load_term_index_async()
         self.assertEqual(len(self.tdb.getAutoCompleteTerms("content", 100)), 0)
 
+    @blocking_call_on_reactor_thread
+    @inlineCallbacks
+    def test_term_index_loaded_in_background(self):
+        """
+        Test whether the term index is loaded in the background on first use, without suggestions until it is loaded
+        """
+        self.assertEqual(self.tdb.getSearchSuggestion(["content", "cont"]), [])
+        self.assertTrue(self.tdb._term_index_lock.locked)
+        yield self.tdb._load_term_index_async()
+        self.assertTrue(self.tdb.term_index.loaded)
+        self.assertEqual(self.tdb.getSearchSuggestion(["content", "cont"]), ["content 1"])
+
+    @blocking_call_on_reactor_thread
+    @inlineCallbacks
+    def test_index_torrent_updates_suggestions(self):
+        """
+        Test whether indexing a torrent makes its terms available for search suggestions and autocompletion
+        """
+        yield self.tdb._load_term_index_async()
+        self.assertEqual(self.tdb.getAutoCompleteTerms("content", 100), [])
+        self.tdb._indexTorrent(1, "contents of the ubuntu iso", [])
+        self.assertEqual(self.tdb.getAutoCompleteTerms("cont", 100), ["content", "contents"])
+        self.assertEqual(self.tdb.getAutoCompleteTerms("my conte", 1), ["my content"])
+        self.assertEqual(self.tdb.getSearchSuggestion(["ubunto"]), ["contents of the ubuntu iso"])
+
     @blocking_call_on_reactor_thread
     def test_get_recently_randomly_collected_torrents(self):
         self.assertEqual(len(self.tdb.getRecentlyCollectedTorrents(limit=10)), 10)
@@ -291,6 +339,49 @@ class TestTorrentDBHandler(AbstractDB):
         self.assertEqual(len(results), 4848)
         self.assertEqual(results[0][3], 493785)
 
+    @blocking_call_on_reactor_thread
+    def test_search_names_paginated(self):
+        """
+        Test whether searching for torrents in pages with a continuation token returns all torrents once, in order
+        """
+        columns = ['T.torrent_id', 'infohash', 'status', 'num_seeders']
+        self.tdb.channelcast_db = ChannelCastDBHandler(self.session)
+        all_results = self.tdb.searchNames(['content'], keys=columns)
+
+        paged_results = []
+        continuation_token = None
+        while True:
+            results, continuation_token = self.tdb.search_names_page(['content'], keys=columns, limit=1000,
+                                                                     continuation_token=continuation_token)
+            self.assertLessEqual(len(results), 1000)
+            paged_results += results
+            if not continuation_token:
+                break
+
+        self.assertEqual([result[0] for result in paged_results], [result[0] for result in all_results])
+        self.assertEqual(len(self.tdb.searchNames(['content'], keys=columns, offset=4840, limit=25)), 8)
+
+    @blocking_call_on_reactor_thread
+    def test_search_names_remote(self):
+        """
+        Test whether searching on behalf of a remote peer returns a limited number of torrents and no continuation token
+        """
+        columns = ['T.torrent_id', 'infohash', 'status', 'num_seeders']
+        self.tdb.channelcast_db = ChannelCastDBHandler(self.session)
+        results, continuation_token = self.tdb.search_names_page(['content'], local=False, keys=columns)
+        self.assertEqual(len(results), REMOTE_SEARCH_NAMES_LIMIT)
+        self.assertIsNone(continuation_token)
+
+    @blocking_call_on_reactor_thread
+    def test_search_names_invalid_continuation_token(self):
+        """
+        Test whether an invalid continuation token is refused when searching for torrents
+        """
+        columns = ['T.torrent_id', 'infohash', 'status', 'num_seeders']
+        self.tdb.channelcast_db = ChannelCastDBHandler(self.session)
+        self.assertRaises(ValueError, self.tdb.searchNames, ['content'], keys=columns, limit=10,
+                          continuation_token='invalid')
+
     @blocking_call_on_reactor_thread
     def test_search_local_torrents(self):
         """
@@ -301,3 +392,15 @@ class TestTorrentDBHandler(AbstractDB):
         self.assertNotEqual(results[0][-1], 0.0)  # Relevance score of result should not be zero
         results = self.tdb.search_in_local_torrents_db('fdsafasfds', ['infohash'])
         self.assertEqual(len(results), 0)
+
+    @blocking_call_on_reactor_thread
+    def test_search_local_torrents_paginated(self):
+        """
+        Test whether searching the local database for torrents returns the requested page, ordered by relevance
+        """
+        all_results = self.tdb.search_in_local_torrents_db('content', ['infohash'])
+        results = self.tdb.search_in_local_torrents_db('content', ['infohash'], offset=10, limit=20)
+        self.assertEqual(len(results), 20)
+        self.assertEqual([result[-1] for result in results], [result[-1] for result in all_results[10:30]])
+        self.assertEqual(sorted([result[-1] for result in all_results], reverse=True),
+                         [result[-1] for result in all_results])
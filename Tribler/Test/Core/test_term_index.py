@@ -0,0 +1,95 @@
+from Tribler.Core.CacheDB.term_index import TermIndex, levenshtein_distance, rank_suggestions
+from Tribler.Test.Core.base_test import TriblerCoreTest
+
+
+class TriblerCoreTestTermIndex(TriblerCoreTest):
+
+    def setUp(self, annotate=True):
+        TriblerCoreTest.setUp(self, annotate=annotate)
+        self.term_index = TermIndex()
+        self.term_index.load([(u"04", 2), (u"16", 2), (u"debian", 1), (u"desktop", 1), (u"netinstall", 1),
+                              (u"one", 1), (u"pioneer", 1), (u"server", 1), (u"ubuntu", 2)])
+
+    def test_levenshtein_distance(self):
+        """
+        Test the computation of the edit distance between two terms
+        """
+        self.assertEqual(levenshtein_distance("kitten", "sitting"), 3)
+        self.assertEqual(levenshtein_distance("", "abc"), 3)
+        self.assertEqual(levenshtein_distance("abc", "abc"), 0)
+
+    def test_load_once(self):
+        """
+        Test whether the index is only loaded once and updated incrementally afterwards
+        """
+        self.term_index.load([(u"ubuntu", 1)])
+        self.assertEqual(self.term_index.get_frequency(u"ubuntu"), 2)
+        self.term_index.add_swarmname(u"ubuntu core")
+        self.assertEqual(self.term_index.get_frequency(u"ubuntu"), 3)
+        self.assertEqual(self.term_index.get_frequency(u"core"), 1)
+
+    def test_add_swarmname_while_loading(self):
+        """
+        Test whether names of torrents indexed while the index is loading are added once it is loaded
+        """
+        term_index = TermIndex()
+        term_index.begin_loading()
+        term_index.add_swarmname(u"ubuntu core")
+        self.assertEqual(term_index.get_frequency(u"ubuntu"), 0)
+        term_index.load([(u"debian", 1), (u"desktop", 1), (u"ubuntu", 1)])
+        self.assertEqual(term_index.get_frequency(u"ubuntu"), 2)
+        self.assertEqual(term_index.get_completions(u"", 10), [u"ubuntu", u"core", u"debian", u"desktop"])
+
+    def test_abort_loading(self):
+        """
+        Test whether the index can be loaded again after loading it failed
+        """
+        term_index = TermIndex()
+        term_index.begin_loading()
+        term_index.add_swarmname(u"ubuntu")
+        self.assertRaises(ValueError, term_index.load, [(u"ubuntu",)])
+        term_index.add_swarmname(u"debian")
+        term_index.load([(u"ubuntu", 1)])
+        self.assertTrue(term_index.loaded)
+        self.assertEqual(term_index.get_frequency(u"ubuntu"), 1)
+        self.assertEqual(term_index.get_frequency(u"debian"), 0)
+
+    def test_add_swarmname_not_loaded(self):
+        """
+        Test whether names of torrents are ignored before the index is loaded
+        """
+        term_index = TermIndex()
+        term_index.add_swarmname(u"ubuntu")
+        self.assertEqual(term_index.get_frequency(u"ubuntu"), 0)
+
+    def test_get_completions(self):
+        """
+        Test whether terms are completed with the most frequent terms first
+        """
+        self.term_index.add_swarmname(u"debate")
+        self.term_index.add_swarmname(u"debate club")
+        self.assertEqual(self.term_index.get_completions(u"deb", 10), [u"debate", u"debian"])
+        self.assertEqual(self.term_index.get_completions(u"deb", 1), [u"debate"])
+        self.assertEqual(self.term_index.get_completions(u"debian", 10), [])
+
+    def test_get_similar_terms(self):
+        """
+        Test whether terms within a few edits of a keyword are found
+        """
+        self.assertEqual(self.term_index.get_similar_terms(u"ubunto"), {u"ubuntu": 1})
+        self.assertEqual(self.term_index.get_similar_terms(u"servr"), {u"server": 1})
+        self.assertEqual(self.term_index.get_similar_terms(u"xyzzy"), {})
+
+    def test_get_suggestion_terms(self):
+        """
+        Test whether both misspelled and incomplete keywords result in suggestions
+        """
+        self.assertEqual(self.term_index.get_suggestion_terms([u"ubunto", u"desk"], 10), [u"ubuntu", u"desktop"])
+
+    def test_rank_suggestions(self):
+        """
+        Test whether torrent names are ranked by their edit distance to the keywords, keeping the order of ties
+        """
+        swarmnames = [u"ubuntu server 16 04", u"ubuntu desktop 16 04", u"debian netinstall"]
+        self.assertEqual(rank_suggestions(swarmnames, [u"ubunto", u"desktop"], 1), [u"ubuntu desktop 16 04"])
+        self.assertEqual(rank_suggestions(swarmnames, [u"ubunto"], 2), swarmnames[:2])
@@ -2,7 +2,7 @@ import time
 from base64 import b64decode
 
 from twisted.internet import reactor
-from twisted.internet.defer import inlineCallbacks
+from twisted.internet.defer import inlineCallbacks, succeed
 from twisted.internet.task import LoopingCall, deferLater
 
 from Tribler.Core.simpledefs import NTFY_MARKET_ON_ASK, NTFY_MARKET_ON_BID, NTFY_MARKET_ON_TRANSACTION_COMPLETE, \
@@ -47,6 +47,9 @@ from Tribler.dispersy.message import Message, DelayMessageByProof, DropMessage
 from Tribler.dispersy.requestcache import IntroductionRequestCache, NumberCache
 from Tribler.dispersy.resolution import PublicResolution
 
+# Maximum age in seconds of the reputation scores returned by get_reputation.
+REPUTATION_MAX_AGE = 600
+
 
 class ProposedTradeRequestCache(NumberCache):
     """
@@ -112,6 +115,9 @@ class MarketCommunity(Community):
         self.wallets = None
         self.transaction_manager = None
         self.reputation_dict = {}
+        self.reputation_manager = PagerankReputationManager()
+        self.reputation_cursor = None
+        self.min_reputation = 0.0
         self.use_local_address = False
         self.matching_enabled = True
         self.use_incremental_payments = False
@@ -138,7 +144,8 @@ class MarketCommunity(Community):
             transaction_repository = MemoryTransactionRepository(self.mid)
 
         self.order_manager = OrderManager(order_repository)
-        self.matching_engine = MatchingEngine(PriceTimeStrategy(self.order_book))
+        self.matching_engine = MatchingEngine(PriceTimeStrategy(self.order_book, self.get_reputation,
+                                                                self.min_reputation))
         self.tribler_session = tribler_session
         self.tradechain_community = tradechain_community
         self.wallets = wallets or {}
@@ -1244,8 +1251,24 @@ class MarketCommunity(Community):
 
     def compute_reputation(self):
         """
-        Compute the reputation of peers in the community
+        Add the new TradeChain blocks to the reputation graph and compute the reputation of peers in the community in
+        a thread. The previous reputation stays available in reputation_dict until the computation is done.
         """
-        if self.tradechain_community:
-            rep_manager = PagerankReputationManager(self.tradechain_community.persistence.get_all_blocks())
-            self.reputation_dict = rep_manager.compute(self.my_member.public_key)
+        if not self.tradechain_community:
+            return succeed(None)
+
+        blocks, self.reputation_cursor = self.tradechain_community.persistence.get_blocks_since(
+            self.reputation_cursor)
+        self.reputation_manager.add_blocks(blocks)
+
+        def on_reputation(reputation):
+            self.reputation_dict = reputation
+
+        return self.reputation_manager.compute_async(self.my_member.public_key).addCallback(on_reputation)
+
+    def get_reputation(self, public_key):
+        """
+        Return the reputation of the peer with the given public key, or None if it is unknown or older than
+        REPUTATION_MAX_AGE seconds.
+        """
+        return self.reputation_manager.get_reputation(public_key, max_age=REPUTATION_MAX_AGE)
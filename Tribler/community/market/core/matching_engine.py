@@ -4,10 +4,7 @@ from time import time
 
 from Tribler.community.market.core.order import Order
 from Tribler.community.market.core.orderbook import OrderBook
-from Tribler.community.market.core.price import Price
-from Tribler.community.market.core.pricelevel import PriceLevel
 from Tribler.community.market.core.quantity import Quantity
-from Tribler.community.market.core.tickentry import TickEntry
 from Tribler.community.market.core.timestamp import Timestamp
 from Tribler.community.market.core.trade import Trade
 
@@ -40,7 +37,27 @@ class MatchingStrategy(object):
 
 
 class PriceTimeStrategy(MatchingStrategy):
-    """Strategy that uses the price time method for picking ticks"""
+    """
+    Strategy that uses the price time method for picking ticks.
+
+    The price levels and the ticks within a price level are walked iteratively, so deep order books do not hit the
+    recursion limit. No objects are allocated while walking, only when a trade is proposed.
+
+    Ticks of traders whose reputation is known and lower than min_reputation are skipped. Traders without a recent
+    reputation are matched as usual.
+    """
+
+    def __init__(self, order_book, get_reputation=None, min_reputation=0.0):
+        """
+        :param order_book: The order book to search in
+        :param get_reputation: function that returns the reputation of a public key, or None if it is not known
+        :param min_reputation: The minimum reputation of the traders to match with
+        :type order_book: OrderBook
+        :type min_reputation: float
+        """
+        super(PriceTimeStrategy, self).__init__(order_book)
+        self.get_reputation = get_reputation
+        self.min_reputation = min_reputation
 
     def match_order(self, order):
         """
@@ -56,7 +73,7 @@ class PriceTimeStrategy(MatchingStrategy):
         else:
             quantity_to_trade, proposed_trades = self._match_bid(order)
 
-        if quantity_to_trade > Quantity(0, quantity_to_trade.wallet_id):
+        if float(quantity_to_trade) > 0:
             self._logger.debug("Quantity not matched: %i", int(quantity_to_trade))
 
         return proposed_trades
@@ -64,12 +81,12 @@ class PriceTimeStrategy(MatchingStrategy):
     def _match_ask(self, order):
         proposed_trades = []
         quantity_to_trade = order.available_quantity
+        bid_price = self.order_book.get_bid_price(order.price.wallet_id, order.total_quantity.wallet_id)
 
-        if order.price <= self.order_book.get_bid_price(order.price.wallet_id, order.total_quantity.wallet_id) \
-                and quantity_to_trade > Quantity(0, quantity_to_trade.wallet_id):
+        if order.price <= bid_price and float(quantity_to_trade) > 0:
             # Scan the price levels in the order book
             quantity_to_trade, proposed_trades = self._search_for_quantity_in_order_book(
-                self.order_book.get_bid_price(order.price.wallet_id, order.total_quantity.wallet_id),
+                bid_price,
                 self.order_book.get_bid_price_level(order.price.wallet_id, order.total_quantity.wallet_id),
                 quantity_to_trade,
                 order)
@@ -78,12 +95,12 @@ class PriceTimeStrategy(MatchingStrategy):
     def _match_bid(self, order):
         proposed_trades = []
         quantity_to_trade = order.available_quantity
+        ask_price = self.order_book.get_ask_price(order.price.wallet_id, order.total_quantity.wallet_id)
 
-        if order.price >= self.order_book.get_ask_price(order.price.wallet_id, order.total_quantity.wallet_id) \
-                and quantity_to_trade > Quantity(0, quantity_to_trade.wallet_id):
+        if order.price >= ask_price and float(quantity_to_trade) > 0:
             # Scan the price levels in the order book
             quantity_to_trade, proposed_trades = self._search_for_quantity_in_order_book(
-                self.order_book.get_ask_price(order.price.wallet_id, order.total_quantity.wallet_id),
+                ask_price,
                 self.order_book.get_ask_price_level(order.price.wallet_id, order.total_quantity.wallet_id),
                 quantity_to_trade,
                 order)
@@ -91,10 +108,10 @@ class PriceTimeStrategy(MatchingStrategy):
 
     def _search_for_quantity_in_order_book(self, price, price_level, quantity_to_trade, order):
         """
-        Search through the price levels in the order book
+        Search through the price levels in the order book, starting at the given price level
 
         :param price: The price of the price level
-        :param price_level: The price level to search in
+        :param price_level: The price level to start searching in
         :param quantity_to_trade: The quantity still to be matched
         :param order: The order to match for
         :type price: Price
@@ -104,82 +121,75 @@ class PriceTimeStrategy(MatchingStrategy):
         :return: The quantity to trade and the proposed trades
         :rtype: Quantity, [ProposedTrade]
         """
-        if price_level is None:  # Last price level
-            return quantity_to_trade, []
+        proposed_trades = []
 
-        assert isinstance(price, Price), type(price)
-        assert isinstance(price_level, PriceLevel), type(price_level)
-        assert isinstance(quantity_to_trade, Quantity), type(quantity_to_trade)
-        assert isinstance(order, Order), type(order)
+        while price_level is not None:
+            self._logger.debug("Searching in price level: %s", price)
 
-        self._logger.debug("Searching in price level: %f", float(price))
-
-        if quantity_to_trade <= price_level.depth:  # All the quantity can be matched in this price level
-            quantity_to_trade, proposed_trades = self._search_for_quantity_in_price_level(price_level.first_tick,
-                                                                                          quantity_to_trade,
-                                                                                          order)
-        else:  # Not all the quantity can be matched in this price level
-            quantity_to_trade, proposed_trades = self._search_for_quantity_in_order_book_partial(price,
-                                                                                                 price_level,
-                                                                                                 quantity_to_trade,
-                                                                                                 order)
-        return quantity_to_trade, proposed_trades
+            # If all the quantity can be matched in this price level, we do not continue to the next one
+            matched_in_price_level = quantity_to_trade <= self._get_depth(price_level)
+            quantity_to_trade, trades = self._search_for_quantity_in_price_level(price_level.first_tick,
+                                                                                 quantity_to_trade, order)
+            proposed_trades.extend(trades)
+            if matched_in_price_level:
+                break
 
-    def _search_for_quantity_in_order_book_partial(self, price, price_level, quantity_to_trade, order):
-        # Not all the quantity can be matched in this price level
-        quantity_to_trade, proposed_trades = self._search_for_quantity_in_price_level(price_level.first_tick,
-                                                                                      quantity_to_trade,
-                                                                                      order)
-        if order.is_ask():
-            return self._search_for_quantity_in_order_book_partial_ask(price, quantity_to_trade,
-                                                                       proposed_trades, order)
-        else:
-            return self._search_for_quantity_in_order_book_partial_bid(price, quantity_to_trade,
-                                                                       proposed_trades, order)
+            price, price_level = self._get_next_price_level(price, quantity_to_trade.wallet_id, order)
 
-    def _search_for_quantity_in_order_book_partial_ask(self, price, quantity_to_trade, proposed_trades,
-                                                       order):
-        # Select the next price level
-        try:
-            # Search the next price level
-            next_price, next_price_level = self.order_book.bids.\
-                get_price_level_list(price.wallet_id, quantity_to_trade.wallet_id).prev_item(price)
-        except IndexError:
-            return quantity_to_trade, proposed_trades
+        return quantity_to_trade, proposed_trades
+
+    def _is_trusted(self, tick_entry):
+        """
+        Return whether the reputation of the trader of the tick entry allows matching with it.
+        """
+        if not self.get_reputation or not self.min_reputation:
+            return True
+        reputation = self.get_reputation(tick_entry.tick.public_key)
+        return reputation is None or reputation >= self.min_reputation
 
-        if order.price > next_price:  # Price is too low
-            return quantity_to_trade, proposed_trades
+    def _get_depth(self, price_level):
+        """
+        Return the quantity in the price level that may be matched.
 
-        quantity_to_trade, trades = self._search_for_quantity_in_order_book(next_price,
-                                                                            next_price_level,
-                                                                            quantity_to_trade,
-                                                                            order)
-        proposed_trades = proposed_trades + trades
-        return quantity_to_trade, proposed_trades
+        :rtype: Quantity
+        """
+        if not self.get_reputation or not self.min_reputation:
+            return price_level.depth
+
+        depth = Quantity(0, price_level.depth.wallet_id)
+        tick_entry = price_level.first_tick
+        while tick_entry is not None:
+            if self._is_trusted(tick_entry):
+                depth += tick_entry.quantity
+            tick_entry = tick_entry.next_tick
+        return depth
+
+    def _get_next_price_level(self, price, quantity_wallet_id, order):
+        """
+        Return the next price level to search in for the given order, going down for asks and up for bids.
 
-    def _search_for_quantity_in_order_book_partial_bid(self, price, quantity_to_trade, proposed_trades,
-                                                       order):
-        # Select the next price level
+        :return: The price and the price level, or (None, None) if there is no price level at an acceptable price
+        :rtype: (Price, PriceLevel)
+        """
         try:
-            # Search the next price level
-            next_price, next_price_level = self.order_book.asks.\
-                get_price_level_list(price.wallet_id, quantity_to_trade.wallet_id).succ_item(price)
+            if order.is_ask():
+                next_price, next_price_level = self.order_book.bids.\
+                    get_price_level_list(price.wallet_id, quantity_wallet_id).prev_item(price)
+            else:
+                next_price, next_price_level = self.order_book.asks.\
+                    get_price_level_list(price.wallet_id, quantity_wallet_id).succ_item(price)
         except IndexError:
-            return quantity_to_trade, proposed_trades
-
-        if order.price < next_price:  # Price is too high
-            return quantity_to_trade, proposed_trades
+            return None, None
 
-        quantity_to_trade, trades = self._search_for_quantity_in_order_book(next_price,
-                                                                            next_price_level,
-                                                                            quantity_to_trade,
-                                                                            order)
-        proposed_trades = proposed_trades + trades
-        return quantity_to_trade, proposed_trades
+        if order.is_ask() and order.price > next_price:  # Price is too low
+            return None, None
+        if not order.is_ask() and order.price < next_price:  # Price is too high
+            return None, None
+        return next_price, next_price_level
 
     def _search_for_quantity_in_price_level(self, tick_entry, quantity_to_trade, order):
         """
-        Search through the tick entries in the price levels
+        Search through the tick entries in the price level, starting at the given tick entry
 
         :param tick_entry: The tick entry to match against
         :param quantity_to_trade: The quantity still to be matched
@@ -190,74 +200,48 @@ class PriceTimeStrategy(MatchingStrategy):
         :return: The quantity to trade and the proposed trades
         :rtype: Quantity, [ProposedTrade]
         """
-        if tick_entry is None:  # Last tick
-            return quantity_to_trade, []
+        proposed_trades = []
+        trader_id = order.order_id.trader_id
+        reserved_ticks = order.reserved_ticks
 
-        # Check if order and tick entry have the same trader id / origin
-        if order.order_id.trader_id == tick_entry.order_id.trader_id:
-            return quantity_to_trade, []
+        while tick_entry is not None:
+            # Stop when the tick entry has the same trader id / origin as the order
+            if trader_id == tick_entry.order_id.trader_id:
+                break
 
-        assert isinstance(tick_entry, TickEntry), type(tick_entry)
-        assert isinstance(quantity_to_trade, Quantity), type(quantity_to_trade)
-        assert isinstance(order, Order), type(order)
+            # Skip ticks already reserved for this order and ticks of traders with a low reputation
+            if tick_entry.order_id not in reserved_ticks and self._is_trusted(tick_entry):
+                if quantity_to_trade <= tick_entry.quantity:  # All the quantity can be matched in this tick
+                    proposed_trades.append(self._propose_trade(tick_entry, quantity_to_trade, order))
+                    quantity_to_trade = Quantity(0, quantity_to_trade.wallet_id)
+                    break
 
-        if tick_entry.order_id in order.reserved_ticks:  # Tick is already reserved for this order
-            return self._search_for_quantity_in_price_level(tick_entry.next_tick, quantity_to_trade, order)
+                # Not all the quantity can be matched in this tick
+                quantity_to_trade -= tick_entry.quantity
+                proposed_trades.append(self._propose_trade(tick_entry, tick_entry.quantity, order))
 
-        if quantity_to_trade <= tick_entry.quantity:  # All the quantity can be matched in this tick
-            quantity_to_trade, proposed_trades = self._search_for_quantity_in_price_level_total(tick_entry,
-                                                                                                quantity_to_trade,
-                                                                                                order)
-        else:  # Not all the quantity can be matched in this tick
-            quantity_to_trade, proposed_trades = self._search_for_quantity_in_price_level_partial(tick_entry,
-                                                                                                  quantity_to_trade,
-                                                                                                  order)
+            tick_entry = tick_entry.next_tick
 
         return quantity_to_trade, proposed_trades
 
-    def _search_for_quantity_in_price_level_total(self, tick_entry, quantity_to_trade, order):
-        trading_quantity = quantity_to_trade
-        quantity_to_trade = Quantity(0, quantity_to_trade.wallet_id)
+    def _propose_trade(self, tick_entry, trading_quantity, order):
+        """
+        Reserve the given quantity of the order for the tick entry and propose a trade for it.
 
-        self._logger.debug("Match with the id (%s) was found for order (%s). Price: %i, Quantity: %i)",
-                           str(tick_entry.order_id), str(order.order_id),
-                           float(tick_entry.price), int(trading_quantity))
+        :rtype: ProposedTrade
+        """
+        self._logger.debug("Match with the id (%s) was found for order (%s). Price: %s, Quantity: %s)",
+                           tick_entry.order_id, order.order_id, tick_entry.price, trading_quantity)
         order.reserve_quantity_for_tick(tick_entry.tick.order_id, trading_quantity)
 
-        proposed_trades = [Trade.propose(
+        return Trade.propose(
             self.order_book.message_repository.next_identity(),
             order.order_id,
             tick_entry.order_id,
             tick_entry.price,
             trading_quantity,
             Timestamp.now()
-        )]
-
-        return quantity_to_trade, proposed_trades
-
-    def _search_for_quantity_in_price_level_partial(self, tick_entry, quantity_to_trade, order):
-        quantity_to_trade -= tick_entry.quantity
-
-        self._logger.debug("Match with the id (%s) was found for order (%s) ", str(tick_entry.order_id),
-                           str(order.order_id))
-        order.reserve_quantity_for_tick(tick_entry.tick.order_id, tick_entry.quantity)
-
-        proposed_trades = [Trade.propose(
-            self.order_book.message_repository.next_identity(),
-            order.order_id,
-            tick_entry.order_id,
-            tick_entry.price,
-            tick_entry.quantity,
-            Timestamp.now()
-        )]
-
-        # Search the next tick
-        quantity_to_trade, trades = self._search_for_quantity_in_price_level(tick_entry.next_tick,
-                                                                             quantity_to_trade,
-                                                                             order)
-
-        proposed_trades = proposed_trades + trades
-        return quantity_to_trade, proposed_trades
+        )
 
 
 class MatchingEngine(object):
@@ -4,6 +4,8 @@ from Tribler.community.market.wallet import ASSET_MAP
 class Price(object):
     """Price is used for having a consistent comparable and usable class that deals with floats."""
 
+    __slots__ = ['_price', '_wallet_id']
+
     def __init__(self, price, wallet_id):
         """
         :param price: Integer representation of a price that is positive or zero
@@ -50,49 +52,49 @@ class Price(object):
         return "%f %s" % (self._price, self.wallet_id)
 
     def __add__(self, other):
-        if isinstance(other, Price) and self.wallet_id == other.wallet_id:
+        if isinstance(other, Price) and self._wallet_id == other._wallet_id:
             return Price(self._price + float(other), self._wallet_id)
         else:
             return NotImplemented
 
     def __sub__(self, other):
-        if isinstance(other, Price) and self.wallet_id == other.wallet_id:
+        if isinstance(other, Price) and self._wallet_id == other._wallet_id:
             return Price(self._price - float(other), self._wallet_id)
         else:
             return NotImplemented
 
     def __lt__(self, other):
-        if isinstance(other, Price) and self.wallet_id == other.wallet_id:
-            return self._price < float(other)
+        if isinstance(other, Price) and self._wallet_id == other._wallet_id:
+            return self._price < other._price
         else:
             return NotImplemented
 
     def __le__(self, other):
-        if isinstance(other, Price) and self.wallet_id == other.wallet_id:
-            return self._price <= float(other)
+        if isinstance(other, Price) and self._wallet_id == other._wallet_id:
+            return self._price <= other._price
         else:
             return NotImplemented
 
     def __eq__(self, other):
-        if not isinstance(other, Price) or self.wallet_id != other.wallet_id:
+        if not isinstance(other, Price) or self._wallet_id != other._wallet_id:
             return NotImplemented
         elif self is other:
             return True
         else:
-            return self._price == float(other)
+            return self._price == other._price
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
     def __gt__(self, other):
-        if isinstance(other, Price) and self.wallet_id == other.wallet_id:
-            return self._price > float(other)
+        if isinstance(other, Price) and self._wallet_id == other._wallet_id:
+            return self._price > other._price
         else:
             return NotImplemented
 
     def __ge__(self, other):
-        if isinstance(other, Price) and self.wallet_id == other.wallet_id:
-            return self._price >= float(other)
+        if isinstance(other, Price) and self._wallet_id == other._wallet_id:
+            return self._price >= other._price
         else:
             return NotImplemented
 
@@ -1,17 +1,40 @@
+from bisect import bisect_left, bisect_right
+
 from Tribler.community.market.core.price import Price
 from Tribler.community.market.core.pricelevel import PriceLevel
 
 
 class PriceLevelList(object):
     """
-    Sorted doubly linked dictionary implementation.
+    Sorted dictionary of price levels, ordered by price.
+
+    The prices are kept in a sorted list, next to a list with their float values that is searched with bisect. Lookups
+    of a price and its neighbours take O(log n) and the lowest and highest price are available in O(1).
     """
 
     def __init__(self):
         super(PriceLevelList, self).__init__()
         self._price_list = []
+        self._price_values = []
         self._price_level_dictionary = {}
 
+    def __len__(self):
+        return len(self._price_list)
+
+    def _index(self, price):
+        """
+        Return the index of the given price in the sorted list of prices.
+
+        :type price: Price
+        :rtype: int
+        :raises ValueError: Thrown when the price is not in the list
+        """
+        value = float(price)
+        index = bisect_left(self._price_values, value)
+        if index == len(self._price_values) or self._price_values[index] != value:
+            raise ValueError("%s is not in the price level list" % price)
+        return index
+
     def insert(self, price, price_level):
         """
         :type price: Price
@@ -20,8 +43,10 @@ class PriceLevelList(object):
         assert isinstance(price, Price), type(price)
         assert isinstance(price_level, PriceLevel), type(price_level)
 
-        self._price_list.append(price)
-        self._price_list.sort()
+        value = float(price)
+        index = bisect_right(self._price_values, value)
+        self._price_values.insert(index, value)
+        self._price_list.insert(index, price)
         self._price_level_dictionary[price] = price_level
 
     def remove(self, price):
@@ -30,7 +55,9 @@ class PriceLevelList(object):
         """
         assert isinstance(price, Price), type(price)
 
-        self._price_list.remove(price)
+        index = self._index(price)
+        del self._price_values[index]
+        del self._price_list[index]
         del self._price_level_dictionary[price]
 
     def succ_item(self, price):
@@ -42,7 +69,7 @@ class PriceLevelList(object):
         """
         assert isinstance(price, Price), type(price)
 
-        index = self._price_list.index(price) + 1
+        index = self._index(price) + 1
         if index >= len(self._price_list):
             raise IndexError
         succ_price = self._price_list[index]
@@ -57,7 +84,7 @@ class PriceLevelList(object):
         """
         assert isinstance(price, Price), type(price)
 
-        index = self._price_list.index(price) - 1
+        index = self._index(price) - 1
         if index < 0:
             raise IndexError
         prev_price = self._price_list[index]
@@ -87,13 +114,8 @@ class PriceLevelList(object):
         :type reverse: bool
         :rtype: List[(Price, PriceLevel)]
         """
-        items = []
-        for price in self._price_list:
-            if reverse:
-                items.insert(0, (price, self._price_level_dictionary[price]))
-            else:
-                items.append((price, self._price_level_dictionary[price]))
-        return items
+        prices = reversed(self._price_list) if reverse else self._price_list
+        return [(price, self._price_level_dictionary[price]) for price in prices]
 
     def get_ticks_list(self):
         """
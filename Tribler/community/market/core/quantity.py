@@ -4,6 +4,8 @@ from Tribler.community.market.wallet import ASSET_MAP
 class Quantity(object):
     """Quantity is used for having a consistent comparable and usable class."""
 
+    __slots__ = ['_quantity', '_wallet_id']
+
     def __init__(self, quantity, wallet_id):
         """
         :param quantity: float representation of a quantity that is positive or zero
@@ -50,49 +52,49 @@ class Quantity(object):
         return "%f %s" % (self._quantity, self.wallet_id)
 
     def __add__(self, other):
-        if isinstance(other, Quantity) and self.wallet_id == other.wallet_id:
+        if isinstance(other, Quantity) and self._wallet_id == other._wallet_id:
             return Quantity(self._quantity + float(other), self._wallet_id)
         else:
             return NotImplemented
 
     def __sub__(self, other):
-        if isinstance(other, Quantity) and self.wallet_id == other.wallet_id:
+        if isinstance(other, Quantity) and self._wallet_id == other._wallet_id:
             return Quantity(self._quantity - float(other), self._wallet_id)
         else:
             return NotImplemented
 
     def __lt__(self, other):
-        if isinstance(other, Quantity) and self.wallet_id == other.wallet_id:
-            return self._quantity < float(other)
+        if isinstance(other, Quantity) and self._wallet_id == other._wallet_id:
+            return self._quantity < other._quantity
         else:
             return NotImplemented
 
     def __le__(self, other):
-        if isinstance(other, Quantity) and self.wallet_id == other.wallet_id:
-            return self._quantity <= float(other)
+        if isinstance(other, Quantity) and self._wallet_id == other._wallet_id:
+            return self._quantity <= other._quantity
         else:
             return NotImplemented
 
     def __eq__(self, other):
-        if not isinstance(other, Quantity) or self.wallet_id != other.wallet_id:
+        if not isinstance(other, Quantity) or self._wallet_id != other._wallet_id:
             return NotImplemented
         elif self is other:
             return True
         else:
-            return self._quantity == float(other)
+            return self._quantity == other._quantity
 
     def __ne__(self, other):
         return not self.__eq__(other)
 
     def __gt__(self, other):
-        if isinstance(other, Quantity) and self.wallet_id == other.wallet_id:
-            return self._quantity > float(other)
+        if isinstance(other, Quantity) and self._wallet_id == other._wallet_id:
+            return self._quantity > other._quantity
         else:
             return NotImplemented
 
     def __ge__(self, other):
-        if isinstance(other, Quantity) and self.wallet_id == other.wallet_id:
-            return self._quantity >= float(other)
+        if isinstance(other, Quantity) and self._wallet_id == other._wallet_id:
+            return self._quantity >= other._quantity
         else:
             return NotImplemented
 
@@ -134,6 +134,14 @@ class Tick(Message):
         assert isinstance(quantity, Quantity), type(quantity)
         self._quantity = quantity
 
+    @property
+    def public_key(self):
+        """
+        Return the public key of the originator of this tick
+        :rtype: str
+        """
+        return self._public_key
+
     @property
     def timeout(self):
         """
@@ -1,29 +1,185 @@
-import networkx as nx
+import logging
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from twisted.internet.defer import Deferred, succeed
+from twisted.internet.threads import deferToThread
 
 from Tribler.community.market.reputation.reputation_manager import ReputationManager
 
 
+def personalized_pagerank(matrix, dangling_nodes, personalization, start, alpha, max_iter, tol):
+    """
+    Run the PageRank power iteration.
+    :param matrix: the transposed, row normalized adjacency matrix of the graph in CSR format
+    :param dangling_nodes: the indices of the nodes without outgoing weight
+    :param personalization: the normalized personalization vector, also used to distribute the rank of dangling nodes
+    :param start: the normalized vector to start iterating from
+    :return: a tuple with the scores and the number of iterations, or None as number if the iteration did not converge
+    """
+    num_nodes = matrix.shape[0]
+    scores = start
+    for iteration in xrange(max_iter):
+        last_scores = scores
+        scores = alpha * (matrix.dot(last_scores) + last_scores[dangling_nodes].sum() * personalization) + \
+            (1 - alpha) * personalization
+        if np.abs(scores - last_scores).sum() < num_nodes * tol:
+            return scores, iteration + 1
+    return scores, None
+
+
 class PagerankReputationManager(ReputationManager):
+    """
+    Computes the personalized PageRank of the peers in the TradeChain graph.
+
+    The graph is kept between computations as a sparse matrix and is updated with add_blocks, so only new blocks have
+    to be processed. Every computation starts from the scores of the previous one, which lets the power iteration
+    converge in a few steps when the graph changed little. Like the graph that was built with networkx before, an edge
+    between two peers is undirected and weighted with the asset2_amount of the last block between them.
+    """
+
+    def __init__(self, blocks=None, alpha=0.85, max_iter=100, tol=1.0e-6):
+        super(PagerankReputationManager, self).__init__(None)
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.alpha = alpha
+        self.max_iter = max_iter
+        self.tol = tol
+
+        self.public_keys = []
+        self.node_indices = {}
+        self._edge_indices = {}
+        self._sources = []
+        self._targets = []
+        self._weights = []
+        self._transition_matrix = None
+
+        self.reputation = {}
+        self.last_computed = None
+        self._scores = None
+        self._computation = None
+
+        self.add_blocks(blocks or [])
+
+    def _get_node_index(self, public_key):
+        index = self.node_indices.get(public_key)
+        if index is None:
+            index = self.node_indices[public_key] = len(self.public_keys)
+            self.public_keys.append(public_key)
+        return index
+
+    def add_blocks(self, blocks):
+        """
+        Add the interactions of the given TradeChain blocks to the graph.
+        """
+        for block in blocks:
+            source = self._get_node_index(block.public_key)
+            target = self._get_node_index(block.link_public_key)
+            edge = (source, target) if source <= target else (target, source)
+            weight = block.transaction["asset2_amount"]
+
+            edge_index = self._edge_indices.get(edge)
+            if edge_index is None:
+                self._edge_indices[edge] = len(self._weights)
+                self._sources.append(edge[0])
+                self._targets.append(edge[1])
+                self._weights.append(weight)
+            else:
+                self._weights[edge_index] = weight
+            self._transition_matrix = None
+
+    def get_transition_matrix(self):
+        """
+        Return the transposed, row normalized adjacency matrix of the graph and the indices of its dangling nodes.
+        The matrix is only built again after the graph has changed.
+        """
+        if self._transition_matrix is None:
+            num_nodes = len(self.public_keys)
+            sources = np.array(self._sources, dtype=np.int64)
+            targets = np.array(self._targets, dtype=np.int64)
+            weights = np.array(self._weights, dtype=np.float64)
+
+            # Every undirected edge becomes two directed edges, except for self loops
+            no_loops = sources != targets
+            rows = np.concatenate((sources, targets[no_loops]))
+            columns = np.concatenate((targets, sources[no_loops]))
+            data = np.concatenate((weights, weights[no_loops]))
+
+            out_weights = np.bincount(rows, weights=data, minlength=num_nodes)
+            dangling = out_weights == 0
+            out_weights[dangling] = 1.0
+            matrix = csr_matrix((data / out_weights[rows], (columns, rows)), shape=(num_nodes, num_nodes))
+            self._transition_matrix = matrix, np.flatnonzero(dangling)
+        return self._transition_matrix
+
+    def _prepare(self, own_public_key):
+        matrix, dangling_nodes = self.get_transition_matrix()
+        num_nodes = matrix.shape[0]
+
+        own_index = self.node_indices.get(own_public_key)
+        if own_index is not None:
+            personalization = np.zeros(num_nodes)
+            personalization[own_index] = 1.0  # You trust yourself the most
+        else:
+            personalization = np.repeat(1.0 / num_nodes, num_nodes)
+
+        start = np.repeat(1.0 / num_nodes, num_nodes)
+        if self._scores is not None:
+            start[:len(self._scores)] = self._scores
+            start /= start.sum()
+
+        return matrix, dangling_nodes, personalization, start, self.alpha, self.max_iter, self.tol
+
+    def _on_computed(self, result):
+        scores, iterations = result
+        if iterations is None:
+            self._logger.warning("PageRank did not converge in %d iterations", self.max_iter)
+
+        self._scores = scores
+        # Peers added while computing in a thread have no score yet
+        self.reputation = dict(zip(self.public_keys[:len(scores)], scores.tolist()))
+        self.last_computed = time.time()
+        return self.reputation
 
     def compute(self, own_public_key):
         """
-        Compute the reputation based on the data in the TradeChain database using the PageRank algorithm.
+        Compute the reputation of all peers in the graph using the personalized PageRank algorithm.
+        """
+        if not self.public_keys:
+            return {}
+        return self._on_computed(personalized_pagerank(*self._prepare(own_public_key)))
+
+    def compute_async(self, own_public_key):
+        """
+        Compute the reputation of all peers in the graph in the thread pool of the reactor.
+        When a computation is already running, no new computation is started and its result is returned instead.
+        :return: a Deferred that fires with the reputation dictionary
         """
+        if not self.public_keys:
+            return succeed({})
 
-        nodes = set()
-        G = nx.Graph()
-        for block in self.blocks:
-            nodes.add(block.public_key)
-            nodes.add(block.link_public_key)
+        result = Deferred()
+        if self._computation is None:
+            def on_done(reputation):
+                self._computation = None
+                return reputation
 
-            G.add_edge(block.public_key, block.link_public_key,
-                       attr_dict={'weight': block.transaction["asset1_amount"]})
-            G.add_edge(block.link_public_key, block.public_key,
-                       attr_dict={'weight': block.transaction["asset2_amount"]})
+            self._computation = deferToThread(personalized_pagerank, *self._prepare(own_public_key))
+            self._computation.addCallback(self._on_computed).addBoth(on_done)
 
-        personalization_vector = {}
-        for node in nodes:
-            personalization_vector[node] = 0
-        personalization_vector[own_public_key] = 1  # You trust yourself the most
+        def forward(reputation):
+            result.callback(reputation)
+            return reputation
 
-        return nx.pagerank_scipy(G, personalization=personalization_vector)
+        self._computation.addBoth(forward)
+        return result
+
+    def get_reputation(self, public_key, max_age=None):
+        """
+        Return the reputation of a peer from the last computation.
+        :param max_age: the maximum age in seconds of the computation, None to accept any age
+        :return: the reputation, or None if it is not known or the last computation is too old
+        """
+        if self.last_computed is None or max_age is not None and time.time() - self.last_computed > max_age:
+            return None
+        return self.reputation.get(public_key)
@@ -5,4 +5,4 @@ class TradeChainBlock(TrustChainBlock):
     """
     Container for TradeChain block information
     """
-    pass
+    __slots__ = ()
@@ -5,7 +5,7 @@ class TradeChainDB(TrustChainDB):
     """
     Persistence layer for the TradeChain Community.
     """
-    LATEST_DB_VERSION = 1
+    LATEST_DB_VERSION = 3
 
     def get_all_blocks(self):
         """
@@ -13,6 +13,39 @@ class TradeChainDB(TrustChainDB):
         """
         return self._getall(u"", ())
 
+    def get_blocks_since(self, cursor):
+        """
+        Return the blocks that were added after the given cursor, in the order they were added.
+
+        The blocks are paged by their insert time, which unlike the row id does not change when the database is
+        vacuumed. The insert time only has a resolution of a second, so the cursor also holds the hashes of the blocks
+        of its last second that were returned already.
+        :param cursor: the cursor returned by the previous call, None to get all blocks
+        :return: a tuple with the blocks and the cursor to pass to the next call
+        """
+        if cursor is None:
+            blocks = self._getall(u"ORDER BY insert_time", ())
+        else:
+            insert_time, known_hashes = cursor
+            blocks = [block for block in self._getall(u"WHERE insert_time >= ? ORDER BY insert_time", (insert_time,))
+                      if block.insert_time != insert_time or block.hash not in known_hashes]
+        if not blocks:
+            return blocks, cursor
+
+        last_insert_time = blocks[-1].insert_time
+        known_hashes = frozenset(block.hash for block in blocks if block.insert_time == last_insert_time)
+        if cursor is not None and cursor[0] == last_insert_time:
+            known_hashes |= cursor[1]
+        return blocks, (last_insert_time, known_hashes)
+
+    def get_index_script(self):
+        """
+        Return the script that creates the secondary indices of the blocks, including the one on the insert time that
+        get_blocks_since pages by.
+        """
+        return super(TradeChainDB, self).get_index_script() + \
+            u"\nCREATE INDEX IF NOT EXISTS %s_insert_time_idx ON %s(insert_time);" % (self.db_name, self.db_name)
+
     def get_upgrade_script(self, current_version):
         """
         Return the upgrade script for a specific version.
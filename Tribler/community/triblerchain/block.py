@@ -5,6 +5,7 @@ class TriblerChainBlock(TrustChainBlock):
     """
     Container for TriblerChain block information
     """
+    __slots__ = ()
 
     @classmethod
     def create(cls, transaction, database, public_key, link=None, link_pk=None):
@@ -69,10 +70,7 @@ class TriblerChainBlock(TrustChainBlock):
         if self.transaction["total_down"] < 0:
             err("Total down field is negative")
 
-        blk = database.get(self.public_key, self.sequence_number)
-        link = database.get_linked(self)
-        prev_blk = database.get_block_before(self)
-        next_blk = database.get_block_after(self)
+        blk, link, prev_blk, next_blk = database.get_block_neighbourhood(self)
 
         is_genesis = self.sequence_number == GENESIS_SEQ or self.previous_hash == GENESIS_HASH
         if is_genesis:
@@ -5,7 +5,7 @@ from twisted.internet.task import LoopingCall
 from Tribler.Core.simpledefs import NTFY_TUNNEL, NTFY_REMOVE
 from Tribler.community.triblerchain.block import TriblerChainBlock
 from Tribler.community.triblerchain.database import TriblerChainDB
-from Tribler.community.trustchain.community import TrustChainCommunity
+from Tribler.community.trustchain.community import TrustChainCommunity, MAX_CRAWL_LIMIT
 from Tribler.dispersy.util import blocking_call_on_reactor_thread
 
 MIN_TRANSACTION_SIZE = 1024*1024
@@ -228,7 +228,15 @@ class TriblerChainCommunityCrawler(TriblerChainCommunity):
     def on_introduction_response(self, messages):
         super(TriblerChainCommunityCrawler, self).on_introduction_response(messages)
         for message in messages:
-            self.send_crawl_request(message.candidate, message.candidate.get_member().public_key)
+            self.send_crawl_request(message.candidate, message.candidate.get_member().public_key,
+                                    limit=MAX_CRAWL_LIMIT)
 
     def start_walking(self):
         self.register_task("take step", LoopingCall(self.take_step)).start(self.CrawlerDelay, now=False)
+
+    def take_step(self):
+        super(TriblerChainCommunityCrawler, self).take_step()
+        stats = self.persistence.get_ingest_stats()
+        self.logger.info("Ingested %d blocks (%.1f blocks/s), %d pending, average commit latency %.3f s",
+                         stats["blocks"], stats["blocks_per_second"], stats["pending_blocks"],
+                         stats["avg_commit_latency"])
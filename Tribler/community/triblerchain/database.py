@@ -5,7 +5,7 @@ class TriblerChainDB(TrustChainDB):
     """
     Persistence layer for the TriblerChain Community.
     """
-    LATEST_DB_VERSION = 4
+    LATEST_DB_VERSION = 5
 
     def get_num_unique_interactors(self, public_key):
         """
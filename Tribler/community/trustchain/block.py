@@ -18,14 +18,53 @@ EMPTY_PK = '0'*PK_LENGTH
 block_pack_format = "! {0}s I {0}s I {1}s {2}s".format(PK_LENGTH, HASH_LENGTH, SIG_LENGTH)
 block_pack_size = calcsize(block_pack_format)
 
+# The fields of a block that are exposed when a block is converted to a dictionary.
+BLOCK_FIELDS = ("transaction", "public_key", "sequence_number", "link_public_key", "link_sequence_number",
+                "previous_hash", "signature", "insert_time")
+
+
+def _packed_field(name):
+    """
+    Return a property for a field of a block that is packed, which drops the memoized encodings and hash of the block
+    when the field is assigned.
+    """
+    slot = "_" + name
+
+    def get_field(self):
+        return getattr(self, slot)
+
+    def set_field(self, value):
+        setattr(self, slot, value)
+        if name == "transaction":
+            self._encoded_transaction = None
+        self._packed = self._hash = None
+
+    return property(get_field, set_field)
+
 
 class TrustChainBlock(object):
     """
     Container for TrustChain block information
     """
+    # The packed encoding and hash of a block are memoized. They are dropped when one of the fields they are computed
+    # from is assigned. A transaction may also be changed in place, so pack, sign and pack_db_insert encode it again
+    # and drop the memos if it changed, only the hash of a block that is not packed again relies on the memos.
+    __slots__ = ("_transaction", "_public_key", "_sequence_number", "_link_public_key", "_link_sequence_number",
+                 "_previous_hash", "_signature", "insert_time", "_encoded_transaction", "_packed", "_hash")
+
+    transaction = _packed_field("transaction")
+    public_key = _packed_field("public_key")
+    sequence_number = _packed_field("sequence_number")
+    link_public_key = _packed_field("link_public_key")
+    link_sequence_number = _packed_field("link_sequence_number")
+    previous_hash = _packed_field("previous_hash")
+    signature = _packed_field("signature")
 
     def __init__(self, data=None):
         super(TrustChainBlock, self).__init__()
+        self._encoded_transaction = None
+        self._packed = None
+        self._hash = None
         if data is None:
             # data
             self.transaction = {}
@@ -52,6 +91,10 @@ class TrustChainBlock(object):
                 self.previous_hash = str(self.previous_hash)
             if isinstance(self.signature, buffer):
                 self.signature = str(self.signature)
+            if len(data) > 8:
+                # The database stores the encoded transaction and the hash of the block, no need to compute them again
+                self._encoded_transaction = str(data[0])
+                self._hash = str(data[8])
 
     def __str__(self):
         # This makes debugging and logging easier
@@ -65,7 +108,25 @@ class TrustChainBlock(object):
 
     @property
     def hash(self):
-        return sha256(self.pack()).digest()
+        if self._hash is None:
+            self._hash = sha256(self._pack(True)).digest()
+        return self._hash
+
+    def _get_encoded_transaction(self):
+        if self._encoded_transaction is None:
+            self._encoded_transaction = encode(self.transaction)
+        return self._encoded_transaction
+
+    def _encode_transaction(self):
+        """
+        Encode the transaction again, in case it was changed in place, and drop the memoized packed block and hash if
+        its encoding changed.
+        """
+        encoded_transaction = encode(self.transaction)
+        if encoded_transaction != self._encoded_transaction:
+            self._encoded_transaction = encoded_transaction
+            self._packed = self._hash = None
+        return encoded_transaction
 
     def validate_transaction(self, database):
         """
@@ -99,10 +160,7 @@ class TrustChainBlock(object):
         # cases subsequent blocks can get validation errors and will not get inserted into the database. Thus we can
         # assume that all retrieved blocks are not invalid themselves. Blocks can get inserted into the database in any
         # order, so we need to find successors, predecessors as well as the block itself and its linked block.
-        blk = database.get(self.public_key, self.sequence_number)
-        link = database.get_linked(self)
-        prev_blk = database.get_block_before(self)
-        next_blk = database.get_block_after(self)
+        blk, link, prev_blk, next_blk = database.get_block_neighbourhood(self)
 
         # Step 2: determine the maximum validation level
         # Depending on the blocks we get from the database, we can decide to reduce the validation level. We must do
@@ -283,12 +341,21 @@ class TrustChainBlock(object):
         :param signature: False to pack EMPTY_SIG in the signature location, true to pack the signature field
         :return: the buffer the data was packed into
         """
-        encoded_tx = encode(self.transaction)
+        self._encode_transaction()
+        return self._pack(signature)
+
+    def _pack(self, signature):
+        if signature and self._packed is not None:
+            return self._packed
 
+        encoded_tx = self._get_encoded_transaction()
         buff = bytearray(block_pack_size)
         pack_into(block_pack_format, buff, 0, self.public_key, self.sequence_number, self.link_public_key,
                   self.link_sequence_number, self.previous_hash, self.signature if signature else EMPTY_SIG)
-        return str(buff) + struct.pack("!I", len(encoded_tx)) + encoded_tx
+        packed = str(buff) + struct.pack("!I", len(encoded_tx)) + encoded_tx
+        if signature:
+            self._packed = packed
+        return packed
 
     @classmethod
     def unpack(cls, data, offset=0):
@@ -314,18 +381,19 @@ class TrustChainBlock(object):
         Prepare a tuple to use for inserting into the database
         :return: A database insertable tuple
         """
-        return (buffer(encode(self.transaction)), buffer(self.public_key), self.sequence_number,
+        self._encode_transaction()
+        block_hash = self.hash
+        return (buffer(self._get_encoded_transaction()), buffer(self.public_key), self.sequence_number,
                 buffer(self.link_public_key), self.link_sequence_number, buffer(self.previous_hash),
-                buffer(self.signature), buffer(self.hash))
+                buffer(self.signature), buffer(block_hash))
 
     def __iter__(self):
         """
         This override allows one to take the dict(<block>) of a block.
         :return: generator to iterate over all properties of this block
         """
-        for key, value in self.__dict__.iteritems():
-            if key == 'key':
-                continue
+        for key in BLOCK_FIELDS:
+            value = getattr(self, key)
             if isinstance(value, basestring) and key != "insert_time":
                 yield key, value.encode("hex")
             else:
@@ -26,6 +26,24 @@ from Tribler.dispersy.resolution import PublicResolution
 HALF_BLOCK = u"half_block"
 CRAWL = u"crawl"
 
+# Number of blocks of a chain that is requested by a crawl request by default, as many as a crawl returned before
+# the number of blocks could be requested.
+CRAWL_LIMIT = 100
+
+# The limit that peers without support for requesting a number of blocks always send. It is answered with CRAWL_LIMIT
+# blocks, like before.
+LEGACY_CRAWL_LIMIT = 10
+
+# Maximum number of blocks of a chain that is sent in response to a single crawl request, which bounds the work a single
+# request causes.
+MAX_CRAWL_LIMIT = 100
+
+# Number of bytes of blocks that is sent at once in response to a crawl request.
+CRAWL_CHUNK_SIZE = 64 * 1024
+
+# Number of seconds between the chunks of a crawl response.
+CRAWL_CHUNK_INTERVAL = 0.1
+
 
 class TrustChainCommunity(Community):
     """
@@ -52,6 +70,7 @@ class TrustChainCommunity(Community):
         self.expected_intro_responses = {}
         self.expected_sig_requests = {}
         self.received_block_ids = set()
+        self._crawl_response_id = 0
 
     @classmethod
     def get_master_members(cls, dispersy):
@@ -128,6 +147,21 @@ class TrustChainCommunity(Community):
         except DelayPacketByMissingMember:
             self.logger.warn("Missing member in TrustChain community to send signature request to")
 
+    def send_blocks(self, candidate, blocks):
+        """
+        Send a number of blocks to a candidate at once.
+        """
+        self.logger.debug("Sending %d blocks to %s", len(blocks), candidate)
+        meta = self.get_meta_message(HALF_BLOCK)
+        messages = [meta.impl(authentication=tuple(),
+                              distribution=(self.claim_global_time(),),
+                              destination=(candidate,),
+                              payload=(block,)) for block in blocks]
+        try:
+            self.dispersy.store_update_forward(messages, False, False, True)
+        except DelayPacketByMissingMember:
+            self.logger.warn("Missing member in TrustChain community to send blocks to")
+
     def on_introduction_response(self, messages):
         super(TrustChainCommunity, self).on_introduction_response(messages)
         for message in messages:
@@ -189,17 +223,32 @@ class TrustChainCommunity(Community):
         :param messages The half block messages
         """
         self.logger.debug("Received %d half block messages.", len(messages))
+        validated = []
+        new_blocks = []
+        new_block_keys = set()
         for message in messages:
             blk = message.payload.block
+            # A block is validated against its predecessor, successor and linked block. If one of those could be
+            # among the new blocks of this batch, the new blocks are persisted first so the validation can see them.
+            if blk.public_key in new_block_keys or blk.link_public_key in new_block_keys:
+                self.persistence.add_blocks(new_blocks)
+                new_blocks = []
+                new_block_keys.clear()
+
             validation = blk.validate(self.persistence)
             self.logger.debug("Block validation result %s, %s, (%s)", validation[0], validation[1], blk)
             if validation[0] == ValidationResult.invalid:
                 continue
             elif not self.persistence.contains(blk):
-                self.persistence.add_block(blk)
+                new_blocks.append(blk)
+                new_block_keys.update((blk.public_key, blk.link_public_key))
             else:
                 self.logger.debug("Received already known block (%s)", blk)
+            validated.append((message, blk, validation))
+
+        self.persistence.add_blocks(new_blocks)
 
+        for message, blk, validation in validated:
             # Check if we are waiting for this block
             block_id = "%s.%s" % (blk.public_key.encode('hex'), blk.sequence_number)
             if block_id in self.expected_sig_requests:
@@ -246,18 +295,25 @@ class TrustChainCommunity(Community):
                     self.cancel_pending_task(crawl_task)
                     continue
 
-    def send_crawl_request(self, candidate, public_key, sequence_number=None):
+    def send_crawl_request(self, candidate, public_key, sequence_number=None, limit=CRAWL_LIMIT):
+        """
+        Request the blocks of the chain of a candidate with a sequence number in sequence_number..sequence_number +
+        limit - 1, together with the blocks linked to them.
+        :param sequence_number: the first sequence number to crawl, the latest known block if None or the number of
+        blocks before the latest block of the candidate if negative
+        :param limit: the number of blocks of the chain to crawl, at most MAX_CRAWL_LIMIT
+        """
         sq = sequence_number
         if sequence_number is None:
             blk = self.persistence.get_latest(public_key)
             sq = blk.sequence_number if blk else GENESIS_SEQ
         sq = max(GENESIS_SEQ, sq) if sq >= 0 else sq
-        self.logger.info("Requesting crawl of node %s:%d", public_key.encode("hex")[-8:], sq)
+        self.logger.info("Requesting crawl of node %s:%d (%d blocks)", public_key.encode("hex")[-8:], sq, limit)
         message = self.get_meta_message(CRAWL).impl(
             authentication=(self.my_member,),
             distribution=(self.claim_global_time(),),
             destination=(candidate,),
-            payload=(sq,))
+            payload=(sq, limit))
         self.dispersy.store_update_forward([message], False, False, True)
 
     def received_crawl_request(self, messages):
@@ -273,11 +329,31 @@ class TrustChainCommunity(Community):
                 # The -2 element is the last_block.seq_nr - 1
                 # Etc. until the genesis seq_nr
                 sq = max(GENESIS_SEQ, last_block.sequence_number + (sq + 1)) if last_block else GENESIS_SEQ
-            blocks = self.persistence.crawl(self.my_member.public_key, sq)
-            count = len(blocks)
-            for blk in blocks:
-                self.send_block(message.candidate, blk)
-            self.logger.info("Sent %d blocks", count)
+            sq = max(GENESIS_SEQ, sq)
+            limit = message.payload.limit
+            if limit == LEGACY_CRAWL_LIMIT:
+                limit = CRAWL_LIMIT
+            limit = max(1, min(limit, MAX_CRAWL_LIMIT))
+            pages = self.persistence.iter_crawl_range(self.my_member.public_key, sq, sq + limit - 1)
+            self.send_crawl_response(message.candidate, pages)
+
+    def send_crawl_response(self, candidate, pages):
+        """
+        Send the pages of blocks of a crawl response to a candidate. The pages are sent in chunks of about
+        CRAWL_CHUNK_SIZE bytes with CRAWL_CHUNK_INTERVAL seconds in between, so a large response does not overflow the
+        socket buffers.
+        :param pages: an iterator over lists of blocks, as returned by iter_crawl_range
+        """
+        chunk_size = 0
+        for blocks in pages:
+            self.send_blocks(candidate, blocks)
+            self.logger.info("Sent %d blocks", len(blocks))
+            chunk_size += sum(len(blk.pack()) for blk in blocks)
+            if chunk_size >= CRAWL_CHUNK_SIZE:
+                self._crawl_response_id += 1
+                self.register_task("crawl response %d" % self._crawl_response_id,
+                                   reactor.callLater(CRAWL_CHUNK_INTERVAL, self.send_crawl_response, candidate, pages))
+                return
 
     @inlineCallbacks
     def unload_community(self):
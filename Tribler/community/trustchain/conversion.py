@@ -62,7 +62,8 @@ class TrustChainConversion(BinaryConversion):
         :param message: Message.impl of CrawlRequestPayload.impl
         :return encoding ready to be sent of the network of the message
         """
-        return pack(crawl_request_format, EMPTY_PK, message.payload.requested_sequence_number, 10),
+        return pack(crawl_request_format, EMPTY_PK, message.payload.requested_sequence_number,
+                    message.payload.limit),
 
     @staticmethod
     def _decode_crawl_request(placeholder, offset, data):
@@ -79,4 +80,4 @@ class TrustChainConversion(BinaryConversion):
         who, seq, limit = unpack_from(crawl_request_format, data, offset)
 
         return offset + crawl_request_size, \
-            placeholder.meta.payload.implement(seq)
+            placeholder.meta.payload.implement(seq, limit)
@@ -2,13 +2,159 @@
 This file contains everything related to persistence for TrustChain.
 """
 import os
+from collections import OrderedDict
+from time import gmtime, strftime, time
+
+from twisted.internet import reactor
 
 from Tribler.dispersy.database import Database
-from Tribler.community.trustchain.block import TrustChainBlock
+from Tribler.community.trustchain.block import TrustChainBlock, GENESIS_SEQ, UNKNOWN_SEQ
 
 
 DATABASE_DIRECTORY = os.path.join(u"sqlite")
 
+# Maximum number of blocks kept in the block cache of a database.
+BLOCK_CACHE_SIZE = 10000
+
+# Number of blocks added with add_blocks after which the database is committed.
+COMMIT_BATCH_SIZE = 1000
+
+# Maximum number of seconds blocks added with add_blocks stay uncommitted.
+COMMIT_INTERVAL = 1.0
+
+# Number of blocks of a chain that are fetched per page by iter_crawl_range.
+CRAWL_PAGE_SIZE = 50
+
+
+class BlockCache(object):
+    """
+    LRU cache of the database rows of blocks, indexed by (public_key, sequence_number) and by
+    (link_public_key, link_sequence_number). Blocks are never changed once they are in the database, so cached rows
+    never become stale.
+
+    The cache also remembers which lookups found nothing: blocks that are not in the database, blocks that no block
+    links to and the highest sequence number after which a chain has no more blocks. Every block that is added to the
+    database is put in the cache, which drops the knowledge that it invalidates.
+    """
+
+    def __init__(self, capacity=BLOCK_CACHE_SIZE):
+        self.capacity = capacity
+        self._rows = OrderedDict()
+        self._links = {}
+        # (public_key, sequence_number) of blocks that are not in the database
+        self._absent = OrderedDict()
+        # (public_key, sequence_number) of blocks that no block in the database links to
+        self._unlinked = OrderedDict()
+        # public_key -> sequence number after which the chain has no blocks in the database
+        self._chain_ends = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def put(self, row):
+        """
+        Add a database row, in the column order of TrustChainDB.get_sql_header, to the cache.
+        """
+        key = (str(row[1]), row[2])
+        if key in self._rows:
+            del self._rows[key]
+        elif len(self._rows) >= self.capacity:
+            self._evict()
+        self._rows[key] = row
+
+        if row[4] != UNKNOWN_SEQ:
+            self._links[(str(row[3]), row[4])] = key
+            self._unlinked.pop((str(row[3]), row[4]), None)
+
+        self._absent.pop(key, None)
+        public_key, sequence_number = key
+        if self._chain_ends.get(public_key, sequence_number) < sequence_number:
+            self._chain_ends[public_key] = sequence_number
+
+    def _put_bounded(self, entries, key, value):
+        entries.pop(key, None)
+        if len(entries) >= self.capacity:
+            entries.popitem(last=False)
+        entries[key] = value
+
+    def put_absent(self, public_key, sequence_number):
+        """
+        Remember that the block with the given public key and sequence number is not in the database.
+        """
+        self._put_bounded(self._absent, (public_key, sequence_number), True)
+
+    def put_unlinked(self, block):
+        """
+        Remember that the database has no block linked to the given block.
+        """
+        self._put_bounded(self._unlinked, (block.public_key, block.sequence_number), True)
+        if block.link_sequence_number != UNKNOWN_SEQ:
+            self.put_absent(block.link_public_key, block.link_sequence_number)
+
+    def put_chain_end(self, public_key, sequence_number):
+        """
+        Remember that the chain of the given public key has no blocks after the given sequence number.
+        """
+        self._put_bounded(self._chain_ends, public_key, min(self._chain_ends.get(public_key, sequence_number),
+                                                            sequence_number))
+
+    def is_absent(self, public_key, sequence_number):
+        """
+        Return whether the block with the given public key and sequence number is known not to be in the database.
+        """
+        return (public_key, sequence_number) in self._absent or self.is_chain_end(public_key, sequence_number - 1)
+
+    def is_unlinked(self, block):
+        """
+        Return whether the database is known to have no block linked to the given block.
+        """
+        return (block.public_key, block.sequence_number) in self._unlinked and \
+            (block.link_sequence_number == UNKNOWN_SEQ or
+             self.is_absent(block.link_public_key, block.link_sequence_number))
+
+    def is_chain_end(self, public_key, sequence_number):
+        """
+        Return whether the chain of the given public key is known to have no blocks after the given sequence number.
+        """
+        return self._chain_ends.get(public_key, sequence_number + 1) <= sequence_number
+
+    def _evict(self):
+        key, row = self._rows.popitem(last=False)
+        link_key = (str(row[3]), row[4])
+        if self._links.get(link_key) == key:
+            del self._links[link_key]
+
+    def get(self, public_key, sequence_number):
+        """
+        Return the row of the block with the given public key and sequence number, or None if it is not cached.
+        """
+        row = self._rows.pop((public_key, sequence_number), None)
+        if row is None:
+            self.misses += 1
+            return None
+        self._rows[(public_key, sequence_number)] = row
+        self.hits += 1
+        return row
+
+    def get_linked(self, block):
+        """
+        Return the row of the block linked to the given block, or None if it is not cached.
+        """
+        row = self._rows.get((block.link_public_key, block.link_sequence_number))
+        if row is None:
+            key = self._links.get((block.public_key, block.sequence_number))
+            row = self._rows.get(key) if key else None
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row
+
+    def get_stats(self):
+        return {"size": len(self._rows), "capacity": self.capacity, "hits": self.hits, "misses": self.misses}
+
 
 class TrustChainDB(Database):
     """
@@ -16,7 +162,7 @@ class TrustChainDB(Database):
     Connection layer to SQLiteDB.
     Ensures a proper DB schema on startup.
     """
-    LATEST_DB_VERSION = 1
+    LATEST_DB_VERSION = 2
 
     def __init__(self, working_directory, db_name):
         """
@@ -29,25 +175,100 @@ class TrustChainDB(Database):
         super(TrustChainDB, self).__init__(db_path)
         self._logger.debug("TrustChain database path: %s", db_path)
         self.db_name = db_name
+        self.block_cache = BlockCache()
+
+        self._commit_call = None
+        self._pending_blocks = 0
+        self._ingest_stats = {"blocks": 0, "batches": 0, "time": 0.0}
+        self._num_commits = 0
+        self._total_commit_latency = 0.0
+        self._max_commit_latency = 0.0
         self.open()
 
+    def get_insert_query(self):
+        return u"INSERT INTO %s (tx, public_key, sequence_number, link_public_key, link_sequence_number, " \
+               u"previous_hash, signature, block_hash, insert_time) VALUES(?,?,?,?,?,?,?,?,?)" % self.db_name
+
     def add_block(self, block):
         """
-        Persist a block
+        Persist a block and commit it right away.
         :param block: The data that will be saved.
         """
-        self.execute(
-            u"INSERT INTO %s (tx, public_key, sequence_number, link_public_key,"
-            u"link_sequence_number, previous_hash, signature, block_hash) VALUES(?,?,?,?,?,?,?,?)" % self.db_name,
-            block.pack_db_insert())
+        # The insert time is set here instead of by the database, so the block can be cached with it
+        insert_time = strftime("%Y-%m-%d %H:%M:%S", gmtime())
+        db_insert = block.pack_db_insert()
+        self.execute(self.get_insert_query(), db_insert + (insert_time,))
         self.commit()
+        self.block_cache.put(db_insert[:7] + (insert_time, db_insert[7]))
+
+    def add_blocks(self, blocks):
+        """
+        Persist a batch of validated blocks, for instance a crawl response, in a single statement.
+        The blocks are committed once COMMIT_BATCH_SIZE blocks are pending or after COMMIT_INTERVAL seconds, whichever
+        comes first. Uncommitted blocks are visible to all queries on this database.
+        :param blocks: The blocks that will be saved.
+        """
+        if not blocks:
+            return
+
+        start = time()
+        insert_time = strftime("%Y-%m-%d %H:%M:%S", gmtime())
+        db_inserts = [block.pack_db_insert() + (insert_time,) for block in blocks]
+        self.executemany(self.get_insert_query(), db_inserts)
+        for db_insert in db_inserts:
+            self.block_cache.put(db_insert[:7] + (insert_time, db_insert[7]))
+
+        self._pending_blocks += len(db_inserts)
+        if self._pending_blocks >= COMMIT_BATCH_SIZE:
+            self.commit()
+        elif not self._commit_call:
+            self._commit_call = reactor.callLater(COMMIT_INTERVAL, self.commit)
+
+        self._ingest_stats["blocks"] += len(db_inserts)
+        self._ingest_stats["batches"] += 1
+        self._ingest_stats["time"] += time() - start
+
+    def commit(self, exiting=False):
+        if self._commit_call:
+            if self._commit_call.active():
+                self._commit_call.cancel()
+            self._commit_call = None
+
+        start = time()
+        result = super(TrustChainDB, self).commit(exiting=exiting)
+        latency = time() - start
+
+        self._pending_blocks = 0
+        self._num_commits += 1
+        self._total_commit_latency += latency
+        self._max_commit_latency = max(self._max_commit_latency, latency)
+        return result
+
+    def get_ingest_stats(self):
+        """
+        Return statistics about the blocks added in batches and the commits of this database, including the ingest
+        rate in blocks per second.
+        """
+        stats = dict(self._ingest_stats)
+        stats["blocks_per_second"] = stats["blocks"] / stats["time"] if stats["time"] > 0 else 0.0
+        stats["pending_blocks"] = self._pending_blocks
+        stats["commits"] = self._num_commits
+        stats["avg_commit_latency"] = self._total_commit_latency / self._num_commits if self._num_commits else 0.0
+        stats["max_commit_latency"] = self._max_commit_latency
+        stats["block_cache"] = self.block_cache.get_stats()
+        return stats
 
     def _get(self, query, params):
         db_result = self.execute(self.get_sql_header() + query, params).fetchone()
-        return TrustChainBlock(db_result) if db_result else None
+        if not db_result:
+            return None
+        self.block_cache.put(db_result)
+        return TrustChainBlock(db_result)
 
     def _getall(self, query, params):
         db_result = self.execute(self.get_sql_header() + query, params).fetchall()
+        for db_item in db_result:
+            self.block_cache.put(db_item)
         return [TrustChainBlock(db_item) for db_item in db_result]
 
     def get(self, public_key, sequence_number):
@@ -57,7 +278,15 @@ class TrustChainDB(Database):
         :param sequence_number: The specific block to get
         :return: the block or None if it is not known
         """
-        return self._get(u"WHERE public_key = ? AND sequence_number = ?", (buffer(public_key), sequence_number))
+        row = self.block_cache.get(public_key, sequence_number)
+        if row:
+            return TrustChainBlock(row)
+        if self.block_cache.is_absent(public_key, sequence_number):
+            return None
+        block = self._get(u"WHERE public_key = ? AND sequence_number = ?", (buffer(public_key), sequence_number))
+        if block is None:
+            self.block_cache.put_absent(public_key, sequence_number)
+        return block
 
     def contains(self, block):
         """
@@ -103,28 +332,130 @@ class TrustChainDB(Database):
         :param block: The block for which to get the linked block
         :return: the latest block or None if it is not known
         """
-        return self._get(u"WHERE public_key = ? AND sequence_number = ? OR link_public_key = ? AND "
-                         u"link_sequence_number = ?", (buffer(block.link_public_key), block.link_sequence_number,
-                                                       buffer(block.public_key), block.sequence_number))
+        row = self.block_cache.get_linked(block)
+        if row:
+            return TrustChainBlock(row)
+        # A union instead of an OR, so both parts can use an index
+        return self._get(u"WHERE public_key = ? AND sequence_number = ? UNION ALL %s"
+                         u"WHERE link_public_key = ? AND link_sequence_number = ?" % self.get_sql_header(),
+                         (buffer(block.link_public_key), block.link_sequence_number,
+                          buffer(block.public_key), block.sequence_number))
+
+    def get_block_neighbourhood(self, block):
+        """
+        Get the blocks needed to validate the given block: the block with the same public key and sequence number,
+        the block linked to it and its predecessor and successor in the chain of its public key.
+        Each of them is looked up in the block cache first, which may also know that it does not exist. The others are
+        fetched from the database with a single query.
+        :param block: The block for which to get the neighbourhood
+        :return: A tuple with the block, the linked block, the predecessor and the successor, each None if unknown
+        """
+        cache = self.block_cache
+        public_key = block.public_key
+        sequence_number = block.sequence_number
+
+        # For every slot the cached row, or True if the slot is known to be empty
+        rows = [cache.get(public_key, sequence_number) or cache.is_absent(public_key, sequence_number),
+                cache.get_linked(block) or cache.is_unlinked(block),
+                cache.get(public_key, sequence_number - 1) or sequence_number <= GENESIS_SEQ,
+                cache.get(public_key, sequence_number + 1) or cache.is_chain_end(public_key, sequence_number)]
+
+        header = self.get_sql_header()
+        queries = (u"%(header)s WHERE public_key = ? AND sequence_number = ?",
+                   u"%(header)s WHERE public_key = ? AND sequence_number = ? "
+                   u"UNION ALL %(header)s WHERE link_public_key = ? AND link_sequence_number = ? LIMIT 1",
+                   u"%(header)s WHERE public_key = ? AND sequence_number < ? ORDER BY sequence_number DESC LIMIT 1",
+                   u"%(header)s WHERE public_key = ? AND sequence_number > ? ORDER BY sequence_number ASC LIMIT 1")
+        params = ((buffer(public_key), sequence_number),
+                  (buffer(block.link_public_key), block.link_sequence_number, buffer(public_key), sequence_number),
+                  (buffer(public_key), sequence_number),
+                  (buffer(public_key), sequence_number))
+
+        missing = [slot for slot, row in enumerate(rows) if not row]
+        if missing:
+            query = u" UNION ALL ".join(u"SELECT %d, * FROM (%s)" % (slot, queries[slot]) for slot in missing)
+            for db_result in self.execute(query % {"header": header},
+                                          sum((params[slot] for slot in missing), ())).fetchall():
+                cache.put(db_result[1:])
+                rows[db_result[0]] = db_result[1:]
+
+            # Remember the slots that turned out to be empty
+            if not rows[0]:
+                cache.put_absent(public_key, sequence_number)
+            if not rows[1]:
+                cache.put_unlinked(block)
+            if not rows[3]:
+                cache.put_chain_end(public_key, sequence_number)
+
+        return tuple(TrustChainBlock(row) if isinstance(row, tuple) else None for row in rows)
+
+    def crawl_range(self, public_key, start_seq, end_seq, limit=CRAWL_PAGE_SIZE):
+        """
+        Get a page of the chain of a public key: the first blocks with a sequence number in start_seq..end_seq, ordered
+        by sequence number, followed by the blocks linked to them and the proposals to the public key that it has not
+        countersigned, which were received while the blocks in the page were the latest of the chain.
+        :param public_key: The public key of the chain
+        :param start_seq: The lowest sequence number of the page
+        :param end_seq: The highest sequence number of the page
+        :param limit: The maximum number of blocks of the chain in the page, linked blocks not included
+        :return: A tuple with the blocks in the page and the sequence number of the last block of the chain in it
+        """
+        # One more block is fetched, since its insert time ends the window of the proposals in this page
+        chain = self._getall(u"WHERE public_key = ? AND sequence_number >= ? ORDER BY sequence_number ASC LIMIT ?",
+                             (buffer(public_key), start_seq, limit + 1))
+        blocks = [block for block in chain[:limit] if block.sequence_number <= end_seq]
+        if not blocks:
+            return [], None
+
+        last_seq = blocks[-1].sequence_number
+        # The blocks that countersign blocks in the page and the blocks that are countersigned by blocks in the page
+        sql = u"WHERE link_public_key = ? AND link_sequence_number BETWEEN ? AND ? UNION ALL " \
+              u"%(header)sWHERE rowid IN (SELECT linked.rowid FROM %(db_name)s AS blk " \
+              u"JOIN %(db_name)s AS linked ON linked.public_key = blk.link_public_key AND " \
+              u"linked.sequence_number = blk.link_sequence_number " \
+              u"WHERE blk.public_key = ? AND blk.sequence_number BETWEEN ? AND ?) UNION ALL " \
+              u"%(header)sWHERE link_public_key = ? AND link_sequence_number = ? AND NOT EXISTS (" \
+              u"SELECT 1 FROM %(db_name)s AS agreement WHERE agreement.link_public_key = %(db_name)s.public_key AND " \
+              u"agreement.link_sequence_number = %(db_name)s.sequence_number AND agreement.public_key = ?)" \
+              % {"header": self.get_sql_header(), "db_name": self.db_name}
+        args = [buffer(public_key), start_seq, last_seq, buffer(public_key), start_seq, last_seq,
+                buffer(public_key), UNKNOWN_SEQ, buffer(public_key)]
+        # The windows of consecutive pages are adjacent, so every proposal is sent with exactly one page
+        if start_seq > GENESIS_SEQ:
+            sql += u" AND insert_time >= ?"
+            args.append(blocks[0].insert_time)
+        if len(chain) > len(blocks):
+            sql += u" AND insert_time < ?"
+            args.append(chain[len(blocks)].insert_time)
 
-    def crawl(self, public_key, sequence_number, limit=100):
-        assert limit <= 100, "Don't fetch too much"
-        return self._getall(u"WHERE insert_time >= (SELECT MAX(insert_time) FROM %s WHERE public_key = ? AND "
-                            u"sequence_number <= ?) AND (public_key = ? OR link_public_key = ?) "
-                            u"ORDER BY insert_time ASC LIMIT ?" % self.db_name,
-                            (buffer(public_key), sequence_number, buffer(public_key), buffer(public_key), limit))
+        blocks += self._getall(sql, tuple(args))
+        return blocks, last_seq
+
+    def iter_crawl_range(self, public_key, start_seq, end_seq, page_size=CRAWL_PAGE_SIZE):
+        """
+        Iterate over the chain of a public key in pages of crawl_range. Every page continues after the last sequence
+        number of the previous one, so no blocks are fetched twice and no offsets have to be skipped.
+        :return: A generator of lists of blocks
+        """
+        while start_seq <= end_seq:
+            blocks, last_seq = self.crawl_range(public_key, start_seq, end_seq, page_size)
+            if not blocks:
+                return
+            yield blocks
+            start_seq = last_seq + 1
 
     def get_sql_header(self):
         """
         Return the first part of a generic sql select query.
         """
         _columns = u"tx, public_key, sequence_number, link_public_key, link_sequence_number, " \
-                   u"previous_hash, signature, insert_time"
+                   u"previous_hash, signature, insert_time, block_hash"
         return u"SELECT " + _columns + u" FROM %s " % self.db_name
 
     def get_schema(self):
         """
-        Return the schema for the database.
+        Return the schema for the database. The schema is also applied after every upgrade, so an existing database
+        gets the indices of a newer version.
         """
         return u"""
         CREATE TABLE IF NOT EXISTS %s(
@@ -142,9 +473,18 @@ class TrustChainDB(Database):
          PRIMARY KEY (public_key, sequence_number)
          );
 
-        CREATE TABLE option(key TEXT PRIMARY KEY, value BLOB);
-        INSERT INTO option(key, value) VALUES('database_version', '%s');
-        """ % (self.db_name, str(self.LATEST_DB_VERSION))
+        %s
+
+        CREATE TABLE IF NOT EXISTS option(key TEXT PRIMARY KEY, value BLOB);
+        INSERT OR REPLACE INTO option(key, value) VALUES('database_version', '%s');
+        """ % (self.db_name, self.get_index_script(), str(self.LATEST_DB_VERSION))
+
+    def get_index_script(self):
+        """
+        Return the script that creates the secondary indices of the blocks.
+        """
+        return u"CREATE INDEX IF NOT EXISTS %s_link_idx ON %s(link_public_key, link_sequence_number);" \
+               % (self.db_name, self.db_name)
 
     def get_upgrade_script(self, current_version):
         """
@@ -157,6 +497,9 @@ class TrustChainDB(Database):
         return super(TrustChainDB, self).open(initial_statements, prepare_visioning)
 
     def close(self, commit=True):
+        if self._commit_call and self._commit_call.active():
+            self._commit_call.cancel()
+        self._commit_call = None
         return super(TrustChainDB, self).close(commit)
 
     def check_database(self, database_version):
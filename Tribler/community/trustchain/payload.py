@@ -3,12 +3,13 @@ from Tribler.dispersy.payload import Payload
 
 class CrawlRequestPayload(Payload):
     """
-    Request a crawl of blocks starting with a specific sequence number or the first if 0.
+    Request a crawl of at most limit blocks starting with a specific sequence number or the first if 0.
     """
     class Implementation(Payload.Implementation):
-        def __init__(self, meta, requested_sequence_number):
+        def __init__(self, meta, requested_sequence_number, limit=10):
             super(CrawlRequestPayload.Implementation, self).__init__(meta)
             self.requested_sequence_number = requested_sequence_number
+            self.limit = limit
 
 
 class HalfBlockPayload(Payload):
@@ -455,6 +455,17 @@ class TunnelConversion(BinaryConversion):
         encryped_pos = 4 if message_type == u"data" else 36
         return packet[:encryped_pos], packet[encryped_pos:]
 
+    @staticmethod
+    def split_relayed_packet(packet, message_type, old_circuit_id, new_circuit_id):
+        # Only the unencrypted part is copied, with the circuit_id of the next hop. The encrypted
+        # part is returned as a buffer into the packet, for the crypto to read it in place.
+        if message_type == u"data":
+            circuit_id, = unpack_from('!I', packet)
+            assert circuit_id == old_circuit_id, circuit_id
+            return pack('!I', new_circuit_id), buffer(packet, 4)
+        header = TunnelConversion.swap_circuit_id(packet[:36], message_type, old_circuit_id, new_circuit_id)
+        return header, buffer(packet, 36)
+
     @staticmethod
     def encode_data(circuit_id, dest_address, org_address, data):
         assert org_address
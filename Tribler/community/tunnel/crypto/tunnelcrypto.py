@@ -1,14 +1,83 @@
 import struct
+from itertools import izip, repeat
+
+from cryptography.exceptions import InvalidTag
 
 from Tribler.dispersy.crypto import ECCrypto, LibNaCLPK
 from Tribler.community.tunnel.crypto.cryptowrapper import crypto_box_beforenm, crypto_auth, crypto_auth_verify, Cipher,\
-    algorithms, modes, HKDFExpand, hashes, default_backend
+    algorithms, modes, HKDFExpand, hashes, default_backend, AESGCM
 
 
 class CryptoException(Exception):
     pass
 
 
+class GCMContext(object):
+    """
+    AES-GCM context for one direction of a session. The AESGCM object is created once, instead of a new cipher with
+    a new key schedule for every packet. Without AESGCM, which needs cryptography 2.0, the Cipher interface is used.
+    """
+    __slots__ = ('key', 'salt', 'aesgcm')
+
+    def __init__(self, key, salt):
+        self.key = key
+        self.salt = salt
+        self.aesgcm = AESGCM(key) if AESGCM else None
+
+    def _build_nonce(self, salt_explicit):
+        if salt_explicit == 0:
+            raise CryptoException("salt_explicit wrapped")
+        return self.salt + str(salt_explicit)
+
+    def encrypt(self, content, salt_explicit, header=''):
+        # return the header followed by the encrypted content prepended with the
+        # gcm tag and salt_explicit. content may be a buffer into a received packet.
+        nonce = self._build_nonce(salt_explicit)
+        if self.aesgcm:
+            # AESGCM only takes str and appends the tag to the ciphertext, which is moved
+            # to the front without slicing the ciphertext out of it first
+            data = self.aesgcm.encrypt(nonce, content if isinstance(content, str) else str(content), None)
+            return buffer(header + struct.pack('!q', salt_explicit) + data[-16:]) + buffer(data, 0, len(data) - 16)
+
+        cipher = Cipher(algorithms.AES(self.key), modes.GCM(initialization_vector=nonce),
+                        backend=default_backend()).encryptor()
+        ciphertext = cipher.update(content) + cipher.finalize()
+        return header + struct.pack('!q16s', salt_explicit, cipher.tag) + ciphertext
+
+    def decrypt(self, content, header=''):
+        # content contains the gcm tag and salt_explicit in plaintext, it may be a buffer into a
+        # received packet. The decrypted content is returned prepended with the header.
+        if len(content) < 24:
+            raise CryptoException("truncated content")
+
+        salt_explicit, gcm_tag = struct.unpack_from('!q16s', content)
+        nonce = self._build_nonce(salt_explicit)
+        if self.aesgcm:
+            return header + self.aesgcm.decrypt(nonce, buffer(content, 24) + gcm_tag, None)
+
+        cipher = Cipher(algorithms.AES(self.key), modes.GCM(initialization_vector=nonce, tag=gcm_tag),
+                        backend=default_backend()).decryptor()
+        return header + cipher.update(buffer(content, 24)) + cipher.finalize()
+
+
+class SessionKeys(list):
+    """
+    The session keys of a hop: [key forward, key backward, salt forward, salt backward, salt_explicit forward,
+    salt_explicit backward]. The GCMContext of both directions is created on first use and kept with the keys, so
+    it lives as long as the Hop, circuit or relay that uses them.
+    """
+
+    def __init__(self, keys):
+        super(SessionKeys, self).__init__(keys)
+        self.contexts = [None, None]
+
+    def get_context(self, direction):
+        context = self.contexts[direction]
+        if context is None:
+            context = self.contexts[direction] = GCMContext(self[direction], self[direction + 2])
+        return context
+
+
 class TunnelCrypto(ECCrypto):
 
     def initialize(self, community):
@@ -51,38 +120,57 @@ class TunnelCrypto(ECCrypto):
         kb = key[16:32]
         sf = key[32:36]
         sb = key[36:40]
-        return [kf, kb, sf, sb, 1, 1]
+        return SessionKeys([kf, kb, sf, sb, 1, 1])
 
-    def _bulid_iv(self, salt, salt_explicit):
+    def encrypt_str(self, content, key, salt, salt_explicit):
         assert isinstance(salt, (basestring)), type(salt)
         assert isinstance(salt_explicit, (int, long)), type(salt_explicit)
-
-        if salt_explicit == 0:
-            raise CryptoException("salt_explicit wrapped")
-
-        return salt + str(salt_explicit)
-
-    def encrypt_str(self, content, key, salt, salt_explicit):
-        # return the encrypted content prepended with the
-        # gcm tag and salt_explicit
-        cipher = Cipher(algorithms.AES(key),
-                        modes.GCM(initialization_vector=self._bulid_iv(salt, salt_explicit)),
-                        backend=default_backend()
-                        ).encryptor()
-        ciphertext = cipher.update(content) + cipher.finalize()
-        return struct.pack('!q16s', salt_explicit, cipher.tag) + ciphertext
+        return GCMContext(key, salt).encrypt(content, salt_explicit)
 
     def decrypt_str(self, content, key, salt):
-        # content contains the gcm tag and salt_explicit in plaintext
-        if len(content) < 24:
-            raise CryptoException("truncated content")
-
-        salt_explicit, gcm_tag = struct.unpack_from('!q16s', content)
-        cipher = Cipher(algorithms.AES(key),
-                        modes.GCM(initialization_vector=self._bulid_iv(salt, salt_explicit), tag=gcm_tag),
-                        backend=default_backend()
-                        ).decryptor()
-        return cipher.update(content[24:]) + cipher.finalize()
+        return GCMContext(key, salt).decrypt(content)
+
+    def encrypt_packet(self, content, session_keys, direction, header=''):
+        """
+        Encrypt a packet with the cached context of a direction of a session, using the next salt_explicit.
+        :param header: unencrypted bytes to put in front of the encrypted packet
+        """
+        session_keys[direction + 4] += 1
+        return session_keys.get_context(direction).encrypt(content, session_keys[direction + 4], header)
+
+    def decrypt_packet(self, content, session_keys, direction, header=''):
+        """
+        Decrypt a packet with the cached context of a direction of a session.
+        :param header: unencrypted bytes to put in front of the decrypted packet
+        """
+        return session_keys.get_context(direction).decrypt(content, header)
+
+    def encrypt_many(self, contents, session_keys, direction, headers=None):
+        """
+        Encrypt a burst of packets with the cached context of a direction of a session.
+        :param headers: optional list of unencrypted bytes to put in front of each encrypted packet
+        :return: the list of encrypted packets, in the same order
+        """
+        context = session_keys.get_context(direction)
+        salt_explicit = session_keys[direction + 4]
+        session_keys[direction + 4] += len(contents)
+        return [context.encrypt(content, salt_explicit + index, header)
+                for index, (content, header) in enumerate(izip(contents, headers or repeat('')), 1)]
+
+    def decrypt_many(self, contents, session_keys, direction, headers=None):
+        """
+        Decrypt a burst of packets with the cached context of a direction of a session.
+        :param headers: optional list of unencrypted bytes to put in front of each decrypted packet
+        :return: the list of decrypted packets, in the same order, with None for packets that could not be decrypted
+        """
+        context = session_keys.get_context(direction)
+        decrypted = []
+        for content, header in izip(contents, headers or repeat('')):
+            try:
+                decrypted.append(context.decrypt(content, header))
+            except (CryptoException, InvalidTag):
+                decrypted.append(None)
+        return decrypted
 
 class NoTunnelCrypto(TunnelCrypto):
 
@@ -103,7 +191,7 @@ class NoTunnelCrypto(TunnelCrypto):
         return ''
 
     def generate_session_keys(self, shared_secret):
-        return '\0' * 16, '\0' * 16, '\0' * 4, '\0' * 4, 1, 1
+        return SessionKeys(['\0' * 16, '\0' * 16, '\0' * 4, '\0' * 4, 1, 1])
 
     def encrypt_str(self, content, key, salt, salt_explicit):
         return content
@@ -111,5 +199,17 @@ class NoTunnelCrypto(TunnelCrypto):
     def decrypt_str(self, content, key, salt):
         return content
 
+    def encrypt_packet(self, content, session_keys, direction, header=''):
+        return header + str(content)
+
+    def decrypt_packet(self, content, session_keys, direction, header=''):
+        return header + str(content)
+
+    def encrypt_many(self, contents, session_keys, direction, headers=None):
+        return [header + str(content) for content, header in izip(contents, headers or repeat(''))]
+
+    def decrypt_many(self, contents, session_keys, direction, headers=None):
+        return [header + str(content) for content, header in izip(contents, headers or repeat(''))]
+
 if __name__ == "__main__":
     tc = TunnelCrypto()
@@ -0,0 +1,264 @@
+"""
+Data plane of the tunnel community, which relays data packets in worker processes.
+
+The reactor of the TunnelCommunity keeps receiving all packets and handles the control messages (create, extend,
+destroy, ...). Data packets of relays are handed to one of the workers, which are assigned by circuit_id. A worker owns
+the routes and session keys of its circuits, does the onion crypto and sends the packets to the next hop itself,
+through the socket of the Dispersy endpoint that it inherits, so the next hop still sees the usual address and port.
+
+The reactor passes the data packets to the workers within the rate limits of its PacketScheduler and accounts the
+traffic that the workers report, so the rate limits and the statistics cover the relayed traffic as usual.
+
+Limitations:
+- The workers are forked from the reactor process, which runs other threads as well. A worker only uses its sockets,
+  its pipe and the session keys of its circuits, it never touches the locks, databases or the reactor that it inherits.
+- The routes reach a worker over a pipe and the packets over a socket, so the first packets of a circuit may arrive
+  before its route. A worker holds on to such packets for a while and relays them once the route arrives.
+- The data plane needs fork and AF_UNIX datagram sockets, so it is not available on Windows.
+"""
+import errno
+import logging
+import multiprocessing
+import select
+import signal
+import socket
+import sys
+import time
+from collections import defaultdict
+
+from Tribler.community.tunnel import ORIGINATOR, EXIT_NODE
+from Tribler.community.tunnel.conversion import TunnelConversion
+from Tribler.community.tunnel.crypto.tunnelcrypto import SessionKeys
+
+# Maximum number of packets a worker reads before it relays them as a burst
+BURST_SIZE = 64
+
+# Number of seconds between the traffic statistics that the workers report
+STATS_INTERVAL = 1.0
+
+# A worker encrypts with salt_explicits from this offset onwards, so they never collide with the salt_explicits that
+# the reactor uses for the cells it relays over the same circuit with the same keys.
+SALT_EXPLICIT_OFFSET = 1 << 40
+
+MAX_PACKET_SIZE = 65536
+
+# Size of the socket buffers between the reactor and a worker. The buffer of the sending side limits the number of
+# packets that can be queued for a worker, the kernel may cap it.
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024
+
+# Maximum number of packets of a circuit that a worker holds on to until the route of the circuit arrives, and the
+# number of seconds after which it drops them
+MAX_UNROUTED_PACKETS = 64
+UNROUTED_TIMEOUT = 5.0
+
+# Whether this platform supports the data plane
+DATAPLANE_SUPPORTED = sys.platform != "win32" and hasattr(socket, "AF_UNIX")
+
+
+class DataPlaneWorker(multiprocessing.Process):
+    """
+    Process that relays the data packets of a shard of the circuits.
+    """
+
+    def __init__(self, index, crypto, endpoint_socket, data_prefix):
+        super(DataPlaneWorker, self).__init__(name="TunnelDataPlane-%d" % index)
+        self.daemon = True
+        self.crypto = crypto
+        self.endpoint_socket = endpoint_socket
+        self.data_prefix = data_prefix
+
+        self.packet_socket, self.worker_packet_socket = socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.packet_socket.setblocking(False)
+        self.packet_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+        self.worker_packet_socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+        self.control, self.worker_control = multiprocessing.Pipe()
+
+        # circuit_id -> (next circuit_id, next sock_addr, session keys, direction)
+        self.routes = {}
+        # circuit_id -> (time of the first packet, packets that arrived before the route)
+        self.unrouted = {}
+        self.stats = defaultdict(lambda: [0, 0, 0, 0.0])
+
+    def run(self):
+        # Shutting down is up to the parent process
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        self.worker_packet_socket.setblocking(False)
+
+        last_report = time.time()
+        while True:
+            readable, _, _ = select.select([self.worker_control, self.worker_packet_socket], [], [], STATS_INTERVAL)
+
+            if self.worker_control in readable:
+                while self.worker_control.poll():
+                    if not self.on_control(self.worker_control.recv()):
+                        return
+
+            if self.worker_packet_socket in readable:
+                bursts = defaultdict(list)
+                for _ in xrange(BURST_SIZE):
+                    try:
+                        packet = self.worker_packet_socket.recv(MAX_PACKET_SIZE)
+                    except socket.error as e:
+                        if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                            break
+                        raise
+                    bursts[TunnelConversion.get_circuit_id(packet, u"data")].append(packet)
+
+                for circuit_id, packets in bursts.iteritems():
+                    self.relay(circuit_id, packets)
+
+            if time.time() - last_report >= STATS_INTERVAL:
+                if self.stats:
+                    self.worker_control.send(("stats", dict(self.stats)))
+                    self.stats.clear()
+                self.remove_unrouted(time.time() - UNROUTED_TIMEOUT)
+                last_report = time.time()
+
+    def on_control(self, message):
+        """
+        Handle a message of the parent process.
+        :return: False if the worker should stop, True otherwise
+        """
+        if message[0] == "add":
+            _, circuit_id, next_circuit_id, sock_addr, keys, direction = message
+            keys = SessionKeys(keys)
+            keys[ORIGINATOR + 4] += SALT_EXPLICIT_OFFSET
+            keys[EXIT_NODE + 4] += SALT_EXPLICIT_OFFSET
+            self.routes[circuit_id] = (next_circuit_id, sock_addr, keys, direction)
+            if circuit_id in self.unrouted:
+                self.relay(circuit_id, self.unrouted.pop(circuit_id)[1])
+        elif message[0] == "remove":
+            self.routes.pop(message[1], None)
+            self.unrouted.pop(message[1], None)
+        elif message[0] == "stop":
+            return False
+        return True
+
+    def remove_unrouted(self, before):
+        """
+        Drop the packets of circuits whose route did not arrive in time.
+        """
+        for circuit_id in [circuit_id for circuit_id, (first, _) in self.unrouted.iteritems() if first < before]:
+            del self.unrouted[circuit_id]
+
+    def relay(self, circuit_id, packets):
+        route = self.routes.get(circuit_id)
+        if route is None:
+            # The route is still on its way over the pipe
+            _, unrouted = self.unrouted.setdefault(circuit_id, (time.time(), []))
+            unrouted.extend(packets[:MAX_UNROUTED_PACKETS - len(unrouted)])
+            return
+        next_circuit_id, sock_addr, keys, direction = route
+
+        # The headers carry the data prefix and the circuit_id of the next hop, the crypto writes the packets right
+        # behind them so they can be sent as they are
+        headers, encrypted = zip(*[TunnelConversion.split_relayed_packet(packet, u"data", circuit_id, next_circuit_id)
+                                   for packet in packets])
+        headers = [self.data_prefix + header for header in headers]
+        if direction == ORIGINATOR:
+            relayed = self.crypto.encrypt_many(encrypted, keys, ORIGINATOR, headers)
+        else:
+            relayed = self.crypto.decrypt_many(encrypted, keys, EXIT_NODE, headers)
+
+        stats = self.stats[circuit_id]
+        stats[0] += sum(len(packet) for packet in packets)
+        stats[3] = time.time()
+        for packet in relayed:
+            if packet is None:
+                continue
+            try:
+                self.endpoint_socket.sendto(packet, sock_addr)
+                stats[1] += len(packet) - len(self.data_prefix)
+                stats[2] += 1
+            except socket.error:
+                pass
+
+
+class DataPlane(object):
+    """
+    Starts the worker processes of the data plane and keeps them up to date with the relays they are responsible for.
+    """
+
+    def __init__(self, num_workers, crypto, endpoint_socket, data_prefix):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.workers = [DataPlaneWorker(index, crypto, endpoint_socket, data_prefix) for index in xrange(num_workers)]
+        self.circuit_ids = set()
+        self.dropped = 0
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+        self._logger.info("Started %d data plane workers", len(self.workers))
+
+    def stop(self):
+        for worker in self.workers:
+            worker.control.send(("stop",))
+        for worker in self.workers:
+            worker.join(1.0)
+            if worker.is_alive():
+                worker.terminate()
+
+    def get_worker(self, circuit_id):
+        return self.workers[circuit_id % len(self.workers)]
+
+    def add_relay(self, circuit_id, relay, session_keys, direction):
+        """
+        Hand the data packets of a relay over to its worker.
+        :param circuit_id: the circuit_id of the incoming packets
+        :param relay: the RelayRoute to the next hop
+        :param session_keys: the session keys of the relay
+        :param direction: ORIGINATOR to encrypt the packets, EXIT_NODE to decrypt them
+        """
+        self.circuit_ids.add(circuit_id)
+        self.get_worker(circuit_id).control.send(("add", circuit_id, relay.circuit_id, relay.sock_addr,
+                                                  list(session_keys), direction))
+
+    def remove_relay(self, circuit_id):
+        if circuit_id in self.circuit_ids:
+            self.circuit_ids.remove(circuit_id)
+            self.get_worker(circuit_id).control.send(("remove", circuit_id))
+
+    def is_relayed(self, circuit_id):
+        return circuit_id in self.circuit_ids
+
+    def dispatch(self, circuit_id, packet):
+        """
+        Pass a data packet to the worker of its circuit.
+        :return: True if a worker relays the circuit, False if the packet should be handled by the reactor
+        """
+        return self.dispatch_many(circuit_id, [packet])
+
+    def dispatch_many(self, circuit_id, packets):
+        """
+        Pass data packets of a circuit to the worker of the circuit.
+        :return: True if a worker relays the circuit, False if the packets should be handled by the reactor
+        """
+        if circuit_id not in self.circuit_ids:
+            return False
+        packet_socket = self.get_worker(circuit_id).packet_socket
+        for packet in packets:
+            try:
+                packet_socket.send(packet)
+            except socket.error:
+                # The worker is not keeping up, drop the packet like a full socket buffer would
+                self.dropped += 1
+        return True
+
+    def get_stats(self):
+        """
+        Collect the traffic statistics that the workers reported since the last call.
+        :return: a dictionary of circuit_id to a list of the bytes received, bytes sent, packets sent and time of the
+        last packet
+        """
+        stats = {}
+        for worker in self.workers:
+            while worker.control.poll():
+                message = worker.control.recv()
+                if message[0] == "stats":
+                    for circuit_id, (received, sent, packets_sent, last_incoming) in message[1].iteritems():
+                        totals = stats.setdefault(circuit_id, [0, 0, 0, 0.0])
+                        totals[0] += received
+                        totals[1] += sent
+                        totals[2] += packets_sent
+                        totals[3] = max(totals[3], last_incoming)
+        return stats
@@ -0,0 +1,84 @@
+import logging
+import time
+from collections import OrderedDict
+
+from twisted.internet import reactor
+from twisted.internet.abstract import isIPAddress
+from twisted.internet.defer import Deferred
+
+# Maximum number of hostnames in the cache
+DNS_CACHE_SIZE = 1000
+
+# Number of seconds a resolved hostname is kept
+DNS_CACHE_TTL = 300
+
+# Number of seconds a hostname that could not be resolved is kept
+DNS_CACHE_NEGATIVE_TTL = 30
+
+
+class DnsCache(object):
+    """
+    Cache of the ip addresses of hostnames that exit sockets send to, shared by all exit sockets of the community.
+
+    Failed resolutions are cached as well, for a shorter time. While a hostname is being resolved, further lookups of
+    it wait for the same resolution. The number of hits and misses is counted in the stats dictionary of the community.
+    """
+
+    def __init__(self, stats, size=DNS_CACHE_SIZE, ttl=DNS_CACHE_TTL, negative_ttl=DNS_CACHE_NEGATIVE_TTL):
+        self._logger = logging.getLogger(self.__class__.__name__)
+        self.stats = stats
+        self.size = size
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        # hostname -> (expiry time, ip address or None if the hostname could not be resolved)
+        self.entries = OrderedDict()
+        # hostname -> list of Deferreds waiting for the resolution
+        self.pending = {}
+
+    def get(self, hostname):
+        """
+        Return the ip address of a hostname without resolving it. An ip address is returned as is.
+        :return: the ip address, or None if the hostname could not be resolved recently
+        :raises KeyError: if the hostname is not in the cache
+        """
+        if isIPAddress(hostname):
+            return hostname
+
+        expiry, ip_address = self.entries[hostname]
+        if expiry < time.time():
+            del self.entries[hostname]
+            raise KeyError(hostname)
+
+        self.stats['dns_cache_hits'] += 1
+        return ip_address
+
+    def resolve(self, hostname):
+        """
+        Resolve a hostname that is not in the cache and add the result to the cache.
+        :return: a Deferred that fires with the ip address, or errbacks if the hostname could not be resolved
+        """
+        self.stats['dns_cache_misses'] += 1
+        deferred = Deferred()
+        if hostname in self.pending:
+            self.pending[hostname].append(deferred)
+            return deferred
+        self.pending[hostname] = [deferred]
+
+        def on_ip_address(ip_address):
+            self._add(hostname, ip_address, self.ttl)
+            for waiting in self.pending.pop(hostname):
+                waiting.callback(ip_address)
+
+        def on_error(failure):
+            self._add(hostname, None, self.negative_ttl)
+            for waiting in self.pending.pop(hostname):
+                waiting.errback(failure)
+
+        reactor.resolve(hostname).addCallbacks(on_ip_address, on_error)
+        return deferred
+
+    def _add(self, hostname, ip_address, ttl):
+        self.entries.pop(hostname, None)
+        self.entries[hostname] = (time.time() + ttl, ip_address)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
@@ -0,0 +1,196 @@
+"""
+Scheduler of the packets that relays and exits send on behalf of circuits.
+
+Without rate limits packets are sent right away. With a global or a per-circuit rate limit, packets that exceed a limit
+wait in a queue per circuit. The queues are served by deficit round-robin, so a circuit that sends a lot cannot starve
+the others, and a circuit whose queue grows too long drops its newest packets.
+"""
+from collections import defaultdict, deque
+
+from twisted.internet import reactor
+
+# Number of bytes a circuit may send per round of the deficit round-robin, about the size of a full data packet
+QUANTUM = 1500
+
+# Number of seconds between the rounds while packets are waiting for the rate limits
+SCHEDULE_INTERVAL = 0.01
+
+# Number of seconds of traffic that a token bucket allows in a burst
+BURST_TIME = 0.5
+
+# Maximum number of bytes that wait in the queue of a circuit
+MAX_QUEUE_SIZE = 512 * 1024
+
+
+class TokenBucket(object):
+    """
+    Allows a number of bytes per second. A packet may be sent as long as there are tokens left, the bucket goes into
+    debt for the rest of the packet, so packets larger than the bucket still get through.
+    """
+
+    def __init__(self, rate):
+        self.rate = rate
+        self.size = rate * BURST_TIME
+        self.tokens = self.size
+        self.last_refill = reactor.seconds()
+
+    def refill(self, now):
+        self.tokens = min(self.size, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    @property
+    def empty(self):
+        return self.tokens < 0
+
+
+class PacketScheduler(object):
+    """
+    Sends the packets of circuits within the global and per-circuit rate limits, fairly across the circuits.
+    """
+
+    def __init__(self, rate=0, circuit_rate=0, max_queue_size=MAX_QUEUE_SIZE, quantum=QUANTUM):
+        """
+        :param rate: maximum number of bytes per second of all circuits, 0 for no limit
+        :param circuit_rate: maximum number of bytes per second of a circuit, 0 for no limit
+        :param max_queue_size: maximum number of bytes that wait in the queue of a circuit
+        :param quantum: number of bytes a circuit may send per round
+        """
+        self.bucket = TokenBucket(rate) if rate else None
+        self.circuit_rate = circuit_rate
+        self.max_queue_size = max_queue_size
+        self.quantum = quantum
+
+        self.buckets = {}
+        # circuit_id -> deque of (packet, function that sends a list of packets)
+        self.queues = {}
+        self.queue_sizes = defaultdict(int)
+        self.deficits = defaultdict(int)
+        self.dropped = defaultdict(int)
+        # The circuits with queued packets, in the order in which they are served
+        self.active = deque()
+        self.pending_call = None
+
+    def send(self, circuit_id, packets, send_packets):
+        """
+        Send packets of a circuit, or queue them if a rate limit is reached or other circuits are waiting already.
+        :param send_packets: function that sends a list of packets
+        :return: the number of packets that were sent or queued, the rest was dropped
+        """
+        now = reactor.seconds()
+        bucket = self.get_bucket(circuit_id, now)
+        if self.bucket:
+            self.bucket.refill(now)
+        if not self.active and not (bucket and bucket.empty) and not (self.bucket and self.bucket.empty):
+            self.consume(bucket, sum(len(packet) for packet in packets))
+            send_packets(packets)
+            return len(packets)
+
+        queue = self.queues.get(circuit_id)
+        if queue is None:
+            queue = self.queues[circuit_id] = deque()
+            self.active.append(circuit_id)
+
+        queued = 0
+        for packet in packets:
+            if self.queue_sizes[circuit_id] + len(packet) > self.max_queue_size:
+                self.dropped[circuit_id] += 1
+                continue
+            queue.append((packet, send_packets))
+            self.queue_sizes[circuit_id] += len(packet)
+            queued += 1
+
+        self.schedule()
+        return queued
+
+    def get_bucket(self, circuit_id, now):
+        if not self.circuit_rate:
+            return None
+        bucket = self.buckets.get(circuit_id)
+        if bucket is None:
+            bucket = self.buckets[circuit_id] = TokenBucket(self.circuit_rate)
+        bucket.refill(now)
+        return bucket
+
+    def consume(self, bucket, size):
+        if bucket:
+            bucket.tokens -= size
+        if self.bucket:
+            self.bucket.tokens -= size
+
+    def schedule(self):
+        if self.pending_call is None and self.active:
+            self.pending_call = reactor.callLater(SCHEDULE_INTERVAL, self.process)
+
+    def process(self):
+        """
+        Serve the queues of the circuits by deficit round-robin, until they are empty or the rate limits are reached.
+        """
+        self.pending_call = None
+        now = reactor.seconds()
+        if self.bucket:
+            self.bucket.refill(now)
+
+        # Stop once every circuit in the round is waiting for its own rate limit
+        waiting = 0
+        while self.active and waiting < len(self.active) and not (self.bucket and self.bucket.empty):
+            circuit_id = self.active.popleft()
+            bucket = self.get_bucket(circuit_id, now)
+            if bucket and bucket.empty:
+                self.active.append(circuit_id)
+                waiting += 1
+                continue
+            waiting = 0
+
+            queue = self.queues[circuit_id]
+            self.deficits[circuit_id] += self.quantum
+            batch = []
+            batch_send = None
+            while queue and len(queue[0][0]) <= self.deficits[circuit_id] \
+                    and not (bucket and bucket.empty) and not (self.bucket and self.bucket.empty):
+                packet, send_packets = queue.popleft()
+                if batch and send_packets is not batch_send:
+                    batch_send(batch)
+                    batch = []
+                batch.append(packet)
+                batch_send = send_packets
+                self.deficits[circuit_id] -= len(packet)
+                self.queue_sizes[circuit_id] -= len(packet)
+                self.consume(bucket, len(packet))
+            if batch:
+                batch_send(batch)
+
+            if queue:
+                self.active.append(circuit_id)
+            else:
+                self.remove_queue(circuit_id)
+
+        self.schedule()
+
+    def remove_queue(self, circuit_id):
+        self.queues.pop(circuit_id, None)
+        self.queue_sizes.pop(circuit_id, None)
+        self.deficits.pop(circuit_id, None)
+
+    def remove_circuit(self, circuit_id):
+        """
+        Drop the queued packets and the state of a circuit that is removed.
+        """
+        if circuit_id in self.queues:
+            self.active.remove(circuit_id)
+            self.remove_queue(circuit_id)
+        self.buckets.pop(circuit_id, None)
+        self.dropped.pop(circuit_id, None)
+
+    def get_stats(self):
+        """
+        :return: a dictionary of circuit_id to the number of queued packets, queued bytes and dropped packets
+        """
+        return {circuit_id: {'queued_packets': len(self.queues[circuit_id]) if circuit_id in self.queues else 0,
+                             'queued_bytes': self.queue_sizes.get(circuit_id, 0),
+                             'dropped_packets': self.dropped.get(circuit_id, 0)}
+                for circuit_id in set(self.queues) | set(self.dropped)}
+
+    def stop(self):
+        if self.pending_call and self.pending_call.active():
+            self.pending_call.cancel()
+        self.pending_call = None
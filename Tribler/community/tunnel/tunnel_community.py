@@ -21,15 +21,18 @@ from twisted.python.threadable import isInIOThread
 from Tribler.Core.Utilities.encoding import decode, encode
 from Tribler.community.tunnel import (CIRCUIT_ID_PORT, CIRCUIT_STATE_EXTENDING, CIRCUIT_STATE_READY, CIRCUIT_TYPE_DATA,
                                       CIRCUIT_TYPE_RENDEZVOUS, CIRCUIT_TYPE_RP, EXIT_NODE, EXIT_NODE_SALT, ORIGINATOR,
-                                      ORIGINATOR_SALT, PING_INTERVAL)
+                                      PING_INTERVAL)
 from Tribler.community.tunnel.Socks5.server import Socks5Server
 from Tribler.community.tunnel.conversion import TunnelConversion
 from Tribler.community.tunnel.crypto.tunnelcrypto import CryptoException, TunnelCrypto
+from Tribler.community.tunnel.dataplane import DATAPLANE_SUPPORTED, DataPlane, STATS_INTERVAL
+from Tribler.community.tunnel.dns_cache import DnsCache
 from Tribler.community.tunnel.payload import (CellPayload, CreatePayload, CreatedPayload, DestroyPayload, ExtendPayload,
                                               ExtendedPayload, PingPayload, PongPayload, StatsRequestPayload,
                                               StatsResponsePayload, TunnelIntroductionRequestPayload,
                                               TunnelIntroductionResponsePayload)
 from Tribler.community.tunnel.routing import Circuit, Hop, RelayRoute
+from Tribler.community.tunnel.scheduler import MAX_QUEUE_SIZE, PacketScheduler
 from Tribler.dispersy.authentication import MemberAuthentication, NoAuthentication
 from Tribler.dispersy.candidate import Candidate
 from Tribler.dispersy.community import Community
@@ -141,27 +144,43 @@ class TunnelExitSocket(DatagramProtocol, TaskManager):
     def sendto(self, data, destination):
         if self.check_num_packets(destination, False):
             if TunnelConversion.is_allowed(data):
-                def on_error(failure):
-                    self.tunnel_logger.error("Can't resolve ip address for hostname %s. Failure: %s",
-                                             destination[0], failure)
-
-                def on_ip_address(ip_address):
-                    self.tunnel_logger.debug("Resolved hostname %s to ip_address %s", destination[0], ip_address)
-                    try:
-                        self.transport.write(data, (ip_address, destination[1]))
-                        self.community.increase_bytes_sent(self, len(data))
-                    except (AttributeError, MessageLengthError, socket.error) as exception:
-                        self.tunnel_logger.error(
-                            "Failed to write data to transport: %s. Destination: %r error was: %r",
-                            exception, destination, exception)
-
-                resolve_ip_address_deferred = reactor.resolve(destination[0])
-                resolve_ip_address_deferred.addCallbacks(on_ip_address, on_error)
-                self.register_task("resolving_%r" % destination[0], resolve_ip_address_deferred)
+                try:
+                    ip_address = self.community.dns_cache.get(destination[0])
+                except KeyError:
+                    def on_error(failure):
+                        self.tunnel_logger.error("Can't resolve ip address for hostname %s. Failure: %s",
+                                                 destination[0], failure)
+
+                    def on_ip_address(ip_address):
+                        self.tunnel_logger.debug("Resolved hostname %s to ip_address %s", destination[0], ip_address)
+                        self.write(data, (ip_address, destination[1]))
+
+                    resolve_ip_address_deferred = self.community.dns_cache.resolve(destination[0])
+                    resolve_ip_address_deferred.addCallbacks(on_ip_address, on_error)
+                    self.register_task("resolving_%r" % destination[0], resolve_ip_address_deferred)
+                else:
+                    if ip_address:
+                        self.write(data, (ip_address, destination[1]))
+                    else:
+                        self.tunnel_logger.debug("Dropping packet for hostname %s that could not be resolved",
+                                                 destination[0])
             else:
                 self.tunnel_logger.error("dropping forbidden packets from exit socket with circuit_id %d",
                                          self.circuit_id)
 
+    def write(self, data, address):
+        def write_packets(packets):
+            for packet in packets:
+                try:
+                    self.transport.write(packet, address)
+                    self.community.increase_bytes_sent(self, len(packet))
+                except (AttributeError, MessageLengthError, socket.error) as exception:
+                    self.tunnel_logger.error(
+                        "Failed to write data to transport: %s. Destination: %r error was: %r",
+                        exception, address, exception)
+
+        self.community.scheduler.send(self.circuit_id, [data], write_packets)
+
     def datagramReceived(self, data, source):
         self.community.increase_bytes_received(self, len(data))
         if self.check_num_packets(source, True):
@@ -232,6 +251,16 @@ class TunnelSettings(object):
         self.max_packets_without_reply = 50
         self.dht_lookup_interval = 30
 
+        # Number of worker processes that relay data packets, 0 to relay them in the reactor. The workers are forked
+        # from the reactor process and are not available on Windows, see the dataplane module for the details.
+        self.dataplane_workers = 0
+
+        # Maximum number of bytes per second that relays and exits send in total and per circuit, 0 for no limit
+        self.max_relay_rate = 0
+        self.max_circuit_rate = 0
+        # Maximum number of bytes of a circuit that wait for the rate limits, further packets are dropped
+        self.max_circuit_queue_size = MAX_QUEUE_SIZE
+
         if tribler_session:
             self.socks_listen_ports = tribler_session.config.get_tunnel_community_socks5_listen_ports()
             self.become_exitnode = tribler_session.config.get_tunnel_community_exitnode_enabled()
@@ -293,6 +322,9 @@ class TunnelCommunity(Community):
                              '43e8807e6f86ef2f0a784fbc8fa21f8bc49a82ae'.decode('hex'),
                              'e79efd8853cef1640b93c149d7b0f067f6ccf221'.decode('hex')]
         self.bittorrent_peers = {}
+        self.dataplane = None
+        self.dns_cache = DnsCache(self.stats)
+        self.scheduler = PacketScheduler()
 
         self.tribler_session = self.settings = self.socks_server = None
 
@@ -307,8 +339,12 @@ class TunnelCommunity(Community):
         assert isinstance(self.settings.crypto, TunnelCrypto), self.settings.crypto
 
         self.crypto.initialize(self)
+        self.scheduler = PacketScheduler(self.settings.max_relay_rate, self.settings.max_circuit_rate,
+                                         self.settings.max_circuit_queue_size)
 
         self.dispersy.endpoint.listen_to(self.data_prefix, self.on_data)
+        if self.settings.dataplane_workers > 0:
+            self.start_dataplane()
 
         self.register_task("do_circuits", LoopingCall(self.do_circuits)).start(5, now=True)
         self.register_task("do_ping", LoopingCall(self.do_ping)).start(PING_INTERVAL)
@@ -320,6 +356,46 @@ class TunnelCommunity(Community):
             self.notifier = self.tribler_session.notifier
             self.tribler_session.lm.tunnel_community = self
 
+    def start_dataplane(self):
+        """
+        Start the worker processes that relay the data packets of the circuits of this peer.
+        """
+        if not DATAPLANE_SUPPORTED:
+            self.tunnel_logger.error("Cannot start the data plane on this platform, relaying data in the reactor")
+            return
+
+        endpoint_socket = getattr(self.dispersy.endpoint, "_socket", None)
+        if endpoint_socket is None:
+            self.tunnel_logger.error("Cannot start the data plane, the endpoint does not have a socket")
+            return
+
+        self.dataplane = DataPlane(self.settings.dataplane_workers, self.crypto, endpoint_socket, self.data_prefix)
+        self.dataplane.start()
+        self.register_task("dataplane stats", LoopingCall(self.update_dataplane_stats)).start(STATS_INTERVAL,
+                                                                                              now=False)
+
+    def update_dataplane_stats(self):
+        """
+        Account the traffic that the data plane relayed to the relays and the endpoint, like relay_packets does.
+        """
+        endpoint = self.dispersy.endpoint
+        for circuit_id, (received, sent, packets_sent, last_incoming) in self.dataplane.get_stats().iteritems():
+            # The workers send through the socket of the endpoint, past its own accounting
+            if hasattr(endpoint, "_total_up"):
+                endpoint._total_up += sent + packets_sent * len(self.data_prefix)
+                endpoint._total_send += packets_sent
+            self.statistics.increase_msg_count(u"outgoing", u"data", packets_sent)
+
+            next_relay = self.relay_from_to.get(circuit_id, None)
+            if not next_relay:
+                continue
+
+            this_relay = self.relay_from_to.get(next_relay.circuit_id, None)
+            if this_relay:
+                this_relay.last_incoming = max(this_relay.last_incoming, last_incoming)
+                self.increase_bytes_received(this_relay, received)
+            self.increase_bytes_sent(next_relay, sent)
+
     def self_is_connectable(self):
         return self._dispersy._connection_type == u"public"
 
@@ -406,6 +482,10 @@ class TunnelCommunity(Community):
         for circuit_id in self.exit_sockets.keys():
             self.remove_exit_socket(circuit_id, 'unload', destroy=True)
 
+        if self.dataplane:
+            self.dataplane.stop()
+        self.scheduler.stop()
+
         yield super(TunnelCommunity, self).unload_community()
 
     @property
@@ -664,6 +744,9 @@ class TunnelCommunity(Community):
                 # Remove old session key
                 if cid in self.relay_session_keys:
                     del self.relay_session_keys[cid]
+                if self.dataplane:
+                    self.dataplane.remove_relay(cid)
+                self.scheduler.remove_circuit(cid)
             else:
                 self.tunnel_logger.error("Could not remove relay %d %s", circuit_id, additional_info)
 
@@ -677,6 +760,7 @@ class TunnelCommunity(Community):
 
             # Close socket
             exit_socket = self.exit_sockets.pop(circuit_id)
+            self.scheduler.remove_circuit(circuit_id)
             if self.notifier:
                 peer = (exit_socket.sock_addr[0], exit_socket.sock_addr[1])
                 from Tribler.Core.simpledefs import NTFY_TUNNEL, NTFY_REMOVE
@@ -772,10 +856,14 @@ class TunnelCommunity(Community):
         return self.send_packet(candidates, message_type, packet)
 
     def send_packet(self, candidates, message_type, packet):
-        if self.dispersy.endpoint.send(candidates, [packet], prefix=self.data_prefix if message_type == u"data" else None):
-            self.statistics.increase_msg_count(u"outgoing", message_type, len(candidates))
-            self.tunnel_logger.debug("send %s to %s candidates: %s", message_type, len(candidates), map(str, candidates))
-            return len(packet)
+        return self.send_packets(candidates, message_type, [packet])
+
+    def send_packets(self, candidates, message_type, packets):
+        if self.dispersy.endpoint.send(candidates, packets, prefix=self.data_prefix if message_type == u"data" else None):
+            self.statistics.increase_msg_count(u"outgoing", message_type, len(candidates) * len(packets))
+            self.tunnel_logger.debug("send %d %s to %s candidates: %s", len(packets), message_type, len(candidates),
+                                     map(str, candidates))
+            return sum(len(packet) for packet in packets)
         return 0
 
     def send_destroy(self, candidate, circuit_id, reason):
@@ -788,31 +876,50 @@ class TunnelCommunity(Community):
         return self.relay_packet(circuit_id, message_type, message.packet)
 
     def relay_packet(self, circuit_id, message_type, packet):
+        return self.relay_packets(circuit_id, message_type, [packet]) == 1
+
+    def relay_packets(self, circuit_id, message_type, packets):
+        """
+        Relay a burst of packets of the same type that arrived for a circuit. All packets are encrypted or decrypted
+        with the cached crypto context of the relay and sent at once.
+        :return: the number of packets that were relayed
+        """
         next_relay = self.relay_from_to[circuit_id]
         this_relay = self.relay_from_to.get(next_relay.circuit_id, None)
 
-        self.tunnel_logger.debug("Relay %s from %d to %d", message_type, circuit_id, next_relay.circuit_id)
+        self.tunnel_logger.debug("Relay %d %s from %d to %d", len(packets), message_type, circuit_id,
+                                 next_relay.circuit_id)
 
         if this_relay:
             this_relay.last_incoming = time.time()
-            self.increase_bytes_received(this_relay, len(packet))
+            self.increase_bytes_received(this_relay, sum(len(packet) for packet in packets))
 
-        plaintext, encrypted = TunnelConversion.split_encrypted_packet(packet, message_type)
+        # The headers already carry the circuit_id of the next hop and the crypto writes its output right behind
+        # them, so the encrypted part of a packet is not copied before it is encrypted or decrypted
+        headers, encrypted = zip(*[TunnelConversion.split_relayed_packet(packet, message_type, circuit_id,
+                                                                         next_relay.circuit_id)
+                                   for packet in packets])
         try:
             if next_relay.rendezvous_relay:
-                decrypted = self.crypto_in(circuit_id, encrypted)
-                encrypted = self.crypto_out(next_relay.circuit_id, decrypted)
+                packets = [header + self.crypto_out(next_relay.circuit_id, self.crypto_in(circuit_id, content))
+                           for header, content in zip(headers, encrypted)]
             else:
-                encrypted = self.crypto_relay(circuit_id, encrypted)
-            packet = plaintext + encrypted
+                packets = self.crypto_relay_many(circuit_id, encrypted, headers)
 
         except CryptoException, e:
             self.tunnel_logger.error(str(e))
-            return False
+            return 0
 
-        packet = TunnelConversion.swap_circuit_id(packet, message_type, circuit_id, next_relay.circuit_id)
-        self.increase_bytes_sent(next_relay, self.send_packet([Candidate(next_relay.sock_addr, False)], message_type, packet))
-        return True
+        packets = [packet for packet in packets if packet is not None]
+        if not packets:
+            return 0
+
+        candidates = [Candidate(next_relay.sock_addr, False)]
+
+        def send_packets(packets):
+            self.increase_bytes_sent(next_relay, self.send_packets(candidates, message_type, packets))
+
+        return self.scheduler.send(circuit_id, packets, send_packets)
 
     def check_create(self, messages):
         for message in messages:
@@ -1100,6 +1207,12 @@ class TunnelCommunity(Community):
                 self.directions[request.from_circuit_id] = EXIT_NODE
                 self.remove_exit_socket(request.from_circuit_id)
 
+                if self.dataplane:
+                    session_keys = self.relay_session_keys[request.to_circuit_id]
+                    self.dataplane.add_relay(request.from_circuit_id, self.relay_from_to[request.from_circuit_id],
+                                             session_keys, EXIT_NODE)
+                    self.dataplane.add_relay(request.to_circuit_id, forwarding_relay, session_keys, ORIGINATOR)
+
                 self.send_cell([Candidate(forwarding_relay.sock_addr, False)], u"extended", (forwarding_relay.circuit_id,
                                                                                   message.payload.key,
                                                                                   message.payload.auth,
@@ -1168,20 +1281,24 @@ class TunnelCommunity(Community):
 
         self.tunnel_logger.debug("Got data (%d) from %s", circuit_id, sock_addr)
 
+        if self.dataplane and self.dataplane.is_relayed(circuit_id):
+            # The packets go to the workers within the rate limits, like the packets that the reactor relays
+            self.scheduler.send(circuit_id, [packet], lambda packets: self.dataplane.dispatch_many(circuit_id, packets))
+            return
+
         if self.is_relay(circuit_id):
             self.relay_packet(circuit_id, message_type, packet)
 
         else:
-            plaintext, encrypted = TunnelConversion.split_encrypted_packet(packet, message_type)
-
             try:
-                encrypted = self.crypto_in(circuit_id, encrypted, is_data=True)
+                # The first layer is decrypted from a buffer into the packet, without copying it out first
+                encrypted = self.crypto_in(circuit_id, buffer(packet, 4), is_data=True)
 
             except CryptoException, e:
                 self.tunnel_logger.warning(str(e))
                 return
 
-            packet = plaintext + encrypted
+            packet = packet[:4] + encrypted
             circuit_id, destination, origin, data = TunnelConversion.decode_data(packet)
 
             circuit = self.circuits.get(circuit_id, None)
@@ -1293,15 +1410,14 @@ class TunnelCommunity(Community):
         if circuit:
             if circuit and is_data and circuit.ctype in [CIRCUIT_TYPE_RENDEZVOUS, CIRCUIT_TYPE_RP]:
                 direction = int(circuit.ctype == CIRCUIT_TYPE_RP)
-                content = self.crypto.encrypt_str(content, *self.get_session_keys(circuit.hs_session_keys, direction))
+                content = self.crypto.encrypt_packet(content, circuit.hs_session_keys, direction)
 
             for hop in reversed(circuit.hops):
-                content = self.crypto.encrypt_str(content, *self.get_session_keys(hop.session_keys, EXIT_NODE))
+                content = self.crypto.encrypt_packet(content, hop.session_keys, EXIT_NODE)
             return content
 
         elif circuit_id in self.relay_session_keys:
-            return self.crypto.encrypt_str(content,
-                                           *self.get_session_keys(self.relay_session_keys[circuit_id], ORIGINATOR))
+            return self.crypto.encrypt_packet(content, self.relay_session_keys[circuit_id], ORIGINATOR)
 
         raise CryptoException("Don't know how to encrypt outgoing message for circuit_id %d" % circuit_id)
 
@@ -1314,9 +1430,7 @@ class TunnelCommunity(Community):
                 for hop in self.circuits[circuit_id].hops:
                     layer += 1
                     try:
-                        content = self.crypto.decrypt_str(content,
-                                                          hop.session_keys[ORIGINATOR],
-                                                          hop.session_keys[ORIGINATOR_SALT])
+                        content = self.crypto.decrypt_packet(content, hop.session_keys, ORIGINATOR)
                     except InvalidTag as e:
                         raise CryptoException("Got exception %r when trying to remove encryption layer %s "
                                               "for message: %r received for circuit_id: %s, is_data: %i, circuit_hops:"
@@ -1324,10 +1438,7 @@ class TunnelCommunity(Community):
 
                 if is_data and circuit.ctype in [CIRCUIT_TYPE_RENDEZVOUS, CIRCUIT_TYPE_RP]:
                     direction = int(circuit.ctype != CIRCUIT_TYPE_RP)
-                    direction_salt = direction + 2
-                    content = self.crypto.decrypt_str(content,
-                                                      circuit.hs_session_keys[direction],
-                                                      circuit.hs_session_keys[direction_salt])
+                    content = self.crypto.decrypt_packet(content, circuit.hs_session_keys, direction)
                 return content
 
             else:
@@ -1335,9 +1446,7 @@ class TunnelCommunity(Community):
 
         elif circuit_id in self.relay_session_keys:
             try:
-                return self.crypto.decrypt_str(content,
-                                               self.relay_session_keys[circuit_id][EXIT_NODE],
-                                               self.relay_session_keys[circuit_id][EXIT_NODE_SALT])
+                return self.crypto.decrypt_packet(content, self.relay_session_keys[circuit_id], EXIT_NODE)
             except InvalidTag as e:
                 raise CryptoException("Got exception %r when trying to decrypt relay message: "
                                       "%r received for circuit_id: %s, is_data: %i, " %
@@ -1345,17 +1454,18 @@ class TunnelCommunity(Community):
 
         raise CryptoException("Received message for unknown circuit ID: %d" % circuit_id)
 
-    def crypto_relay(self, circuit_id, content):
+    def crypto_relay_many(self, circuit_id, contents, headers=None):
+        """
+        Encrypt or decrypt a burst of packets of a relay, depending on the direction of the circuit.
+        :param headers: optional list of unencrypted bytes to put in front of each packet
+        :return: the list of packets, with None for packets that could not be decrypted
+        """
         direction = self.directions[circuit_id]
         if direction == ORIGINATOR:
-            return self.crypto.encrypt_str(content,
-                                           *self.get_session_keys(self.relay_session_keys[circuit_id], ORIGINATOR))
+            return self.crypto.encrypt_many(contents, self.relay_session_keys[circuit_id], ORIGINATOR, headers)
         elif direction == EXIT_NODE:
-            try:
-                return self.crypto.decrypt_str(content,
-                                               self.relay_session_keys[circuit_id][EXIT_NODE],
-                                               self.relay_session_keys[circuit_id][EXIT_NODE_SALT])
-            except InvalidTag:
+            decrypted = self.crypto.decrypt_many(contents, self.relay_session_keys[circuit_id], EXIT_NODE, headers)
+            if None in decrypted:
                 # Reasons that can cause this:
                 # - The introductionpoint circuit is extended with a candidate
                 # that is already part of the circuit, causing a crypto error.
@@ -1371,12 +1481,12 @@ class TunnelCommunity(Community):
                 # possible. :)
                 # (from https://github.com/Tribler/tribler/issues/1932#issuecomment-182035383)
 
-                self._logger.warning("Could not decrypt message:\n"
+                self._logger.warning("Could not decrypt %d of %d messages:\n"
                                      "  direction %s\n"
                                      "  circuit_id: %r\n"
-                                     "  content: : %r\n"
                                      "  Possibly corrupt data?",
-                                     direction, circuit_id, content)
+                                     decrypted.count(None), len(decrypted), direction, circuit_id)
+            return decrypted
 
         raise CryptoException("Direction must be either ORIGINATOR or EXIT_NODE")
 
@@ -79,6 +79,14 @@ def check_json_port(val):
 check_json_port.coerceDoc = "Json API port must be greater than 0."
 
 
+def check_workers(val):
+    workers = int(val)
+    if workers < 0:
+        raise ValueError("Invalid number of workers")
+    return workers
+check_workers.coerceDoc = "Number of workers must be 0 or greater."
+
+
 class Options(usage.Options):
     optFlags = [
         ["exit", "x", "Allow being an exit-node"],
@@ -92,6 +100,8 @@ class Options(usage.Options):
         ["dispersy", "d", -1, 'Dispersy port', check_dispersy_port],
         ["crawl", "c", None, 'Enable crawler and use the keypair specified in the given filename', check_crawler_keypair],
         ["tunnelapi", "j", 0, 'Enable JSON api, which will run on the provided port number', check_json_port],
+        ["workers", "w", 0, 'Number of processes that relay data packets, 0 to relay them in the main process',
+         check_workers],
     ]
 
 
@@ -436,6 +446,10 @@ class TunnelHelperServiceMaker(object):
         else:
             logger.info("Exit-node disabled")
 
+        settings.dataplane_workers = options["workers"]
+        if settings.dataplane_workers:
+            logger.info("Relaying data packets in %d processes", settings.dataplane_workers)
+
         settings.enable_trustchain = bool(options["trustchain"])
         if settings.enable_trustchain:
             logger.info("Trustchain enabled")